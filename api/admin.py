@@ -1,12 +1,32 @@
-from flask import Blueprint, request, session, current_app
-from datetime import datetime, timedelta
+import csv
+import io
+import json
+import time
+from flask import Blueprint, Response, request, session, current_app, stream_with_context
+from datetime import timedelta
+from sqlalchemy import func
 from utils.response import success_response, error_response, validation_error_response
-from utils.validators import validate_required_fields
+from utils.validators import validate_required_fields, validate_pile_id
 from functools import wraps
+from models.user import db
+from models.billing import ChargingPile
+from models.charging import ChargingSession, ChargingStatus
+from services.billing_service import BillingService
+from services.queue_report import QueueReport, SECTIONS as QUEUE_SECTIONS
+import scheduler_core
+from scheduler_core import PileType, PileStatus, Pile as EnginePile, clock
 
 # 创建蓝图
 admin_bp = Blueprint('admin', __name__)
 
+# 队列信息接口每个分区的返回条数限制
+QUEUE_INFO_DEFAULT_LIMIT = 200
+QUEUE_INFO_MAX_LIMIT = 1000
+QUEUE_INFO_STREAM_LIMIT = 10000
+
+# 批量导入充电桩的单次行数上限
+PILE_IMPORT_MAX_ROWS = 5000
+
 # 移除管理员验证装饰器，直接返回原函数
 def admin_required(f):
     return f
@@ -28,9 +48,6 @@ def start_pile():
         if not pile_id:
             return error_response("充电桩ID不能为空")
         
-        from models.billing import ChargingPile
-        from models.user import db
-        
         # 检查充电桩是否存在
         pile = ChargingPile.query.get(pile_id)
         if not pile:
@@ -47,8 +64,8 @@ def start_pile():
         
         # 尝试添加到调度引擎
         try:
-            import scheduler_core
-            from scheduler_core import PileType, PileStatus, Pile as EnginePile
+            charging_service = current_app.extensions.get('charging_service')
+            engine = charging_service.engine if charging_service else scheduler_core
             
             # 根据scheduler_core定义：D=直流(快充), A=交流(慢充)
             engine_pile_type = PileType.D if pile.pile_type == 'fast' else PileType.A
@@ -56,10 +73,15 @@ def start_pile():
                 pile_id=pile.id,
                 type=engine_pile_type,
                 max_kw=float(pile.power_rating),
-                status=PileStatus.IDLE
+                status=PileStatus.IDLE,
+                queue_len=charging_service.pile_queue_len if charging_service else 0
             )
             
-            scheduler_core.add_pile(pile_for_engine)
+            # 已注册的充电桩只更新配置、保留运行状态；仍处于故障的恢复调度
+            result = engine.add_piles([pile_for_engine])
+            if result and pile_id in result['updated'] and any(
+                    p.pile_id == pile_id and p.status == PileStatus.FAULT for p in engine.get_all_piles()):
+                engine.recover_pile(pile_id)
             print(f"✅ 充电桩 {pile_id} 已添加到调度引擎")
             
         except Exception as e:
@@ -70,8 +92,7 @@ def start_pile():
         try:
             charging_service = current_app.extensions.get('charging_service')
             if charging_service:
-                from scheduler_core import PileStatus as EnginePileStatus
-                charging_service.update_pile_redis_status(pile_id, EnginePileStatus.IDLE.value, None)
+                charging_service.update_pile_redis_status(pile_id, PileStatus.IDLE.value, None)
                 charging_service.broadcast_status_update()
         except Exception as e:
             print(f"⚠️ 更新Redis状态失败: {e}")
@@ -84,7 +105,6 @@ def start_pile():
         }, message=f'充电桩 {pile_id} 已启动')
     
     except Exception as e:
-        from models.user import db
         db.session.rollback()
         print(f"❌ 启动充电桩错误: {e}")
         import traceback
@@ -106,10 +126,6 @@ def stop_pile():
         if not pile_id:
             return error_response("充电桩ID不能为空")
         
-        from models.billing import ChargingPile
-        from models.charging import ChargingSession, ChargingStatus
-        from models.user import db
-        
         print(f"🔧 开始关闭充电桩: {pile_id}, 强制: {force}")
         
         # 检查充电桩状态
@@ -144,11 +160,16 @@ def stop_pile():
         ended_sessions = 0
         if active_sessions and force:
             print(f"🛑 强制关闭 {len(active_sessions)} 个活跃会话")
+            charging_service = current_app.extensions.get('charging_service')
             for session in active_sessions:
                 try:
-                    # 更新会话状态为取消
-                    session.status = ChargingStatus.CANCELLED
-                    session.end_time = datetime.now()
+                    # 更新会话状态为取消（经会话状态机记录事件，随组提交写入）
+                    if charging_service and charging_service.sessions:
+                        charging_service.sessions.transition(session, ChargingStatus.CANCELLED,
+                                                             reason='admin_force_stop', end_time=clock.now())
+                    else:
+                        session.status = ChargingStatus.CANCELLED
+                        session.end_time = clock.now()
                     ended_sessions += 1
                     print(f"   ✅ 已取消会话: {session.session_id}")
                     
@@ -161,15 +182,17 @@ def stop_pile():
         
         # 尝试从调度引擎移除
         try:
-            import scheduler_core
+            charging_service = current_app.extensions.get('charging_service')
+            engine = charging_service.engine if charging_service else scheduler_core
             
             # 检查调度引擎是否有对应方法
-            if hasattr(scheduler_core, 'remove_pile'):
-                scheduler_core.remove_pile(pile_id)
+            if hasattr(engine, 'remove_pile'):
+                # 活跃会话已取消（或没有），不再转移正在充电的请求；本地队列中的请求优先转给其它充电桩
+                engine.remove_pile(pile_id, requeue_current=False)
                 print(f"✅ 从调度引擎移除充电桩: {pile_id}")
-            elif hasattr(scheduler_core, 'mark_fault'):
+            elif hasattr(engine, 'mark_fault'):
                 # 如果没有remove_pile，使用mark_fault来停用
-                scheduler_core.mark_fault(pile_id)
+                engine.mark_fault(pile_id)
                 print(f"✅ 在调度引擎中标记充电桩故障: {pile_id}")
             else:
                 print(f"⚠️ 调度引擎没有相关移除方法，跳过")
@@ -189,6 +212,9 @@ def stop_pile():
             print(f"⚠️ 更新Redis状态失败: {e}")
         
         db.session.commit()
+        charging_service = current_app.extensions.get('charging_service')
+        if charging_service and charging_service.sessions:
+            charging_service.sessions.flush()
         print(f"✅ 数据库更改已提交")
         
         return success_response(data={
@@ -198,7 +224,6 @@ def stop_pile():
         }, message=f'充电桩 {pile_id} 已关闭' + (f'，强制停止了 {ended_sessions} 个会话' if ended_sessions > 0 else ''))
     
     except Exception as e:
-        from models.user import db
         db.session.rollback()
         print(f"❌ 关闭充电桩错误: {e}")
         import traceback
@@ -210,64 +235,59 @@ def stop_pile():
 def get_all_piles_status():
     """获取所有充电桩的详细状态信息"""
     try:
-        from models.billing import ChargingPile
-        from models.charging import ChargingSession, ChargingStatus
-        
         # 获取所有充电桩
         piles = ChargingPile.query.order_by(ChargingPile.id).all()
-        
-        piles_status = []
         charging_service = current_app.extensions.get('charging_service')
         
-        for pile in piles:
-            pile_id = pile.id
-            
-            # 获取Redis中的实时状态
-            redis_status = {}
-            if charging_service and charging_service.redis_client:
-                try:
-                    redis_status = charging_service.redis_client.hgetall(f"pile_status:{pile_id}")
-                except Exception as e:
-                    print(f"⚠️ 获取Redis状态失败: {e}")
-            
-            current_session_id = redis_status.get('current_charging_session_id', '')
-            
-            # 获取当前充电会话信息
-            current_session = None
-            if current_session_id:
-                current_session = ChargingSession.query.filter_by(session_id=current_session_id).first()
-            
-            # 获取引擎状态
-            engine_status = None
-            engine_estimated_end = None
+        # Redis实时状态：所有充电桩的哈希在一个管道中读取
+        redis_statuses = [{} for _ in piles]
+        if charging_service and charging_service.redis_client and piles:
             try:
-                import scheduler_core
-                all_engine_piles = scheduler_core.get_all_piles()
-                for engine_pile in all_engine_piles:
-                    if engine_pile.pile_id == pile_id:
-                        engine_status = engine_pile.status.value
-                        engine_estimated_end = engine_pile.estimated_end.isoformat() if engine_pile.estimated_end else None
-                        break
+                pipe = charging_service.redis_client.pipeline(transaction=False)
+                for pile in piles:
+                    pipe.hgetall(f"pile_status:{pile.id}")
+                redis_statuses = pipe.execute()
             except Exception as e:
-                print(f"⚠️ 获取引擎状态失败: {e}")
+                print(f"⚠️ 获取Redis状态失败: {e}")
+        
+        # 当前充电会话：缓存未命中的部分一次 IN 查询
+        session_ids = [status.get('current_charging_session_id') for status in redis_statuses]
+        current_sessions = {}
+        if charging_service and any(session_ids):
+            current_sessions = charging_service.find_sessions([sid for sid in session_ids if sid])
+        
+        # 引擎状态：取一次快照并按 pile_id 建索引
+        engine_piles = {}
+        try:
+            engine_piles = {engine_pile.pile_id: engine_pile for engine_pile in charging_service.engine.get_all_piles()}
+        except Exception as e:
+            print(f"⚠️ 获取引擎状态失败: {e}")
+        
+        piles_status = []
+        for pile, redis_status, current_session_id in zip(piles, redis_statuses, session_ids):
+            engine_pile = engine_piles.get(pile.id)
+            current_session = current_sessions.get(current_session_id) if current_session_id else None
             
             pile_info = {
-                'id': pile_id,
+                'id': pile.id,
                 'name': pile.name,
                 'type': pile.pile_type,
                 'power': float(pile.power_rating),
                 'db_status': pile.status,
                 'redis_status': redis_status.get('status', 'unknown'),
-                'engine_status': engine_status,
+                'engine_status': engine_pile.status.value if engine_pile else None,
                 'location': pile.location or '',
                 'statistics': {
-                    'total_charges': pile.total_charges,
-                    'total_power': float(pile.total_power),
-                    'total_revenue': float(pile.total_revenue)
+                    'total_charges': pile.total_charges or 0,
+                    'total_power': float(pile.total_power or 0),
+                    'total_revenue': float(pile.total_revenue or 0)
                 },
                 'current_session': None,
                 'engine_info': {
-                    'estimated_end': engine_estimated_end
+                    'estimated_end': engine_pile.estimated_end.isoformat()
+                                     if engine_pile and engine_pile.estimated_end else None,
+                    'local_queue': [req.req_id for req in engine_pile.queue] if engine_pile else [],
+                    'local_queue_len': engine_pile.queue_len if engine_pile else 0
                 }
             }
             
@@ -287,7 +307,7 @@ def get_all_piles_status():
         return success_response(data={
             'piles': piles_status,
             'total_piles': len(piles_status),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': clock.now().isoformat()
         }, message="获取充电桩状态成功")
     
     except Exception as e:
@@ -296,137 +316,224 @@ def get_all_piles_status():
         traceback.print_exc()
         return error_response(f"获取充电桩状态失败: {str(e)}", code=500)
 
+@admin_bp.route('/piles/reconcile-counters', methods=['POST'])
+@admin_required
+def reconcile_pile_counters():
+    """按计费记录核对并修正充电桩累计统计（充电次数 / 电量 / 收入）"""
+    try:
+        result = BillingService.reconcile_pile_counters()
+        return success_response(data=result, message=f"核对完成，修正了 {len(result['fixed'])} 个充电桩")
+    
+    except Exception as e:
+        print(f"❌ 核对充电桩统计失败: {e}")
+        return error_response(f"核对充电桩统计失败: {str(e)}", code=500)
+
+@admin_bp.route('/piles/import', methods=['POST'])
+@admin_required
+def import_piles():
+    """批量导入充电桩（JSON 列表 / {"piles": [...]} 或 CSV 正文 / 上传文件）
+
+    字段: id, name, pile_type(fast/slow), power_rating, location。已存在的充电桩更新名称 / 类型 / 功率 / 位置，
+    引擎中整批注册或热更新（一次加锁）；任一行校验失败或引擎拒绝时整批不生效。
+    """
+    try:
+        started = time.perf_counter()
+        rows = _read_pile_rows()
+        if rows is None:
+            return error_response("请求数据不能为空，支持 JSON 或 CSV")
+        if len(rows) > PILE_IMPORT_MAX_ROWS:
+            return error_response(f"单次最多导入 {PILE_IMPORT_MAX_ROWS} 个充电桩")
+        
+        piles, errors = _validate_pile_rows(rows)
+        if errors:
+            return validation_error_response(errors, message=f"{len(errors)} 行数据有误，未导入")
+        
+        # 数据库：按 ID 分批查出已有的充电桩，其余新建
+        existing = {}
+        ids = [pile['id'] for pile in piles]
+        for i in range(0, len(ids), 500):
+            for pile_db in ChargingPile.query.filter(ChargingPile.id.in_(ids[i:i + 500])).all():
+                existing[pile_db.id] = pile_db
+        
+        created = []
+        for pile in piles:
+            pile_db = existing.get(pile['id'])
+            if pile_db is None:
+                pile_db = ChargingPile(id=pile['id'], status='available')
+                created.append(pile_db)
+            pile_db.name = pile['name']
+            pile_db.pile_type = pile['pile_type']
+            pile_db.power_rating = pile['power_rating']
+            if pile['location'] is not None:
+                pile_db.location = pile['location']
+            existing[pile['id']] = pile_db
+        db.session.add_all(created)
+        db.session.flush()
+        
+        # 引擎：停用中的充电桩只更新数据库，启动时再注册
+        charging_service = current_app.extensions.get('charging_service')
+        engine = charging_service.engine if charging_service else scheduler_core
+        queue_len = charging_service.pile_queue_len if charging_service else 0
+        engine_piles = [EnginePile(
+            pile_id=pile['id'],
+            type=PileType.D if pile['pile_type'] == 'fast' else PileType.A,
+            max_kw=pile['power_rating'],
+            status=PileStatus.FAULT if existing[pile['id']].status == 'fault' else PileStatus.IDLE,
+            queue_len=queue_len
+        ) for pile in piles if existing[pile['id']].status not in ('maintenance', 'offline')]
+        
+        try:
+            result = engine.add_piles(engine_piles) if engine_piles else {'added': [], 'updated': []}
+        except (ValueError, RuntimeError) as e:
+            db.session.rollback()
+            return error_response(f"调度引擎拒绝导入: {e}", code=409)
+        db.session.commit()
+        
+        if charging_service and result and result['added']:
+            statuses = {pile.pile_id: pile.status.value for pile in engine_piles if pile.pile_id in set(result['added'])}
+            charging_service.update_piles_redis_status(statuses)
+            charging_service.broadcast_status_update()
+        
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        print(f"📥 批量导入充电桩: 新增 {len(created)}，更新 {len(piles) - len(created)}，耗时 {elapsed_ms} ms")
+        return success_response(data={
+            'created': len(created),
+            'updated': len(piles) - len(created),
+            'engine': {
+                'added': len(result['added']) if result else 0,
+                'updated': len(result['updated']) if result else 0,
+            },
+            'elapsed_ms': elapsed_ms
+        }, message=f"导入完成：新增 {len(created)} 个，更新 {len(piles) - len(created)} 个充电桩")
+    
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 批量导入充电桩失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return error_response(f"批量导入充电桩失败: {str(e)}", code=500)
+
+def _read_pile_rows():
+    """按上传文件 / CSV 正文 / JSON 读取导入行，没有数据返回 None"""
+    upload = request.files.get('file')
+    if upload is not None:
+        text = upload.read().decode('utf-8-sig')
+    elif request.mimetype == 'text/csv':
+        text = request.get_data(as_text=True)
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get('piles')
+        return data if isinstance(data, list) and data else None
+    rows = list(csv.DictReader(io.StringIO(text)))
+    return rows or None
+
+def _validate_pile_rows(rows):
+    """逐行校验并规范化，返回 (充电桩列表, {行号: 错误})；行号从 1 开始"""
+    piles, errors, seen = [], {}, set()
+    for index, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors[str(index)] = "每行应为对象"
+            continue
+        pile_id = str(row.get('id') or '').strip()
+        valid, message = validate_pile_id(pile_id)
+        pile_type = str(row.get('pile_type') or '').strip()
+        try:
+            power = float(row.get('power_rating'))
+        except (TypeError, ValueError):
+            power = None
+        
+        if not valid:
+            errors[str(index)] = message
+        elif pile_id in seen:
+            errors[str(index)] = f"充电桩ID {pile_id} 重复"
+        elif pile_type not in ('fast', 'slow'):
+            errors[str(index)] = "充电桩类型只能是 fast 或 slow"
+        elif power is None or not 0 < power < 1000:
+            errors[str(index)] = "额定功率应在 0-1000 kW 之间"
+        else:
+            seen.add(pile_id)
+            piles.append({
+                'id': pile_id,
+                'name': str(row.get('name') or '').strip() or pile_id,
+                'pile_type': pile_type,
+                'power_rating': round(power, 2),
+                'location': row.get('location'),
+            })
+    return piles, errors
+
 @admin_bp.route('/queue/info', methods=['GET'])
 @admin_required
 def get_queue_info():
-    """获取所有等候队列中的车辆信息"""
+    """
+    获取所有等候队列中的车辆信息（分区分页，可选 NDJSON 流式输出）
+    
+    查询参数:
+        limit: 每个分区最多返回条数（默认 200，最大 1000；NDJSON 默认且最大 10000）
+        offset: 每个分区跳过的条数
+        section: 只返回某一分区（station_fast / station_trickle / engine_fast / engine_trickle / charging）
+        format: ndjson 时逐行输出 summary、各条目与结束标记
+    """
     try:
-        import json
-        
         charging_service = current_app.extensions.get('charging_service')
         if not charging_service:
             return error_response("充电服务不可用", code=503)
         
+        stream = request.args.get('format') == 'ndjson'
+        max_limit = QUEUE_INFO_STREAM_LIMIT if stream else QUEUE_INFO_MAX_LIMIT
+        limit = request.args.get('limit', default=max_limit if stream else QUEUE_INFO_DEFAULT_LIMIT, type=int)
+        offset = request.args.get('offset', default=0, type=int)
+        section = request.args.get('section')
+        if limit is None or limit < 1 or offset is None or offset < 0:
+            return error_response("limit 必须为正整数，offset 不能为负数")
+        if section and section not in QUEUE_SECTIONS:
+            return error_response(f"未知的分区: {section}")
+        limit = min(limit, max_limit)
+        sections = [section] if section else list(QUEUE_SECTIONS)
+        
+        report = QueueReport(charging_service)
+        totals = report.totals()
+        
+        if stream:
+            def generate():
+                yield json.dumps({'type': 'summary', 'summary': report.summary(totals), 'totals': totals,
+                                  'timestamp': report.now.isoformat()}, ensure_ascii=False) + '\n'
+                for name in sections:
+                    for item in report.iter_section(name, offset, limit):
+                        yield json.dumps(dict(item, type='item', section=name), ensure_ascii=False) + '\n'
+                yield json.dumps({'type': 'end'}) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        pages = {}
+        for name in sections:
+            try:
+                pages[name] = report.page(name, offset, limit, totals[name])
+            except Exception as e:
+                print(f"⚠️ 获取队列分区 {name} 失败: {e}")
+                pages[name] = {'items': [], 'offset': offset, 'limit': limit, 'total': totals[name], 'has_more': False}
+        
+        def items(name):
+            return pages[name]['items'] if name in pages else []
+        
         queue_info = {
             'station_waiting_area': {
-                'fast': [],
-                'trickle': []
+                'fast': items('station_fast'),
+                'trickle': items('station_trickle')
             },
             'engine_dispatch_queues': {
-                'fast': [],
-                'trickle': []
+                'fast': items('engine_fast'),
+                'trickle': items('engine_trickle')
             },
-            'charging_sessions': []
-        }
-        
-        # 1. 获取充电站等候区信息
-        try:
-            for mode in ['fast', 'trickle']:
-                station_queue_key = f"station_waiting_area:{mode}"
-                queue_items = charging_service.redis_client.lrange(station_queue_key, 0, -1)
-                
-                for idx, item_json in enumerate(queue_items):
-                    item = json.loads(item_json)
-                    queue_info['station_waiting_area'][mode].append({
-                        'position': idx + 1,
-                        'session_id': item['session_id'],
-                        'user_id': item['user_id'],
-                        'requested_amount': float(item['requested_amount']),
-                        'created_at': item['created_at'],
-                        'waiting_time_minutes': (datetime.now() - datetime.fromisoformat(item['created_at'])).total_seconds() / 60
-                    })
-        except Exception as e:
-            print(f"⚠️ 获取充电站等候区信息失败: {e}")
-        
-        # 2. 获取引擎调度队列信息
-        try:
-            import scheduler_core
-            from scheduler_core import PileType
-            
-            fast_engine_queue = scheduler_core.get_waiting_list(PileType.D.value, n=-1)
-            trickle_engine_queue = scheduler_core.get_waiting_list(PileType.A.value, n=-1)
-            
-            for idx, req in enumerate(fast_engine_queue):
-                queue_info['engine_dispatch_queues']['fast'].append({
-                    'position': idx + 1,
-                    'queue_number': req.queue_no,
-                    'session_id': req.req_id,
-                    'user_id': req.user_id,
-                    'requested_amount': float(req.kwh),
-                    'generated_at': req.generated_at.isoformat() if req.generated_at else None,
-                    'waiting_time_minutes': (datetime.now() - req.generated_at).total_seconds() / 60 if req.generated_at else 0
-                })
-            
-            for idx, req in enumerate(trickle_engine_queue):
-                queue_info['engine_dispatch_queues']['trickle'].append({
-                    'position': idx + 1,
-                    'queue_number': req.queue_no,
-                    'session_id': req.req_id,
-                    'user_id': req.user_id,
-                    'requested_amount': float(req.kwh),
-                    'generated_at': req.generated_at.isoformat() if req.generated_at else None,
-                    'waiting_time_minutes': (datetime.now() - req.generated_at).total_seconds() / 60 if req.generated_at else 0
-                })
-        
-        except Exception as e:
-            print(f"⚠️ 获取引擎队列信息失败: {e}")
-        
-        # 3. 获取正在充电的会话信息
-        try:
-            from models.charging import ChargingSession, ChargingStatus
-            from models.billing import ChargingPile
-            from models.user import db
-            
-            charging_sessions = db.session.query(ChargingSession)\
-                .join(ChargingPile, ChargingSession.pile_id == ChargingPile.id)\
-                .filter(ChargingSession.status.in_([ChargingStatus.CHARGING, ChargingStatus.COMPLETING]))\
-                .order_by(ChargingSession.start_time.desc()).all()
-            
-            for session in charging_sessions:
-                session_info = {
-                    'session_id': session.session_id,
-                    'user_id': session.user_id,
-                    'pile_id': session.pile_id,
-                    'pile_type': session.pile.pile_type,
-                    'pile_power': float(session.pile.power_rating),
-                    'requested_amount': float(session.requested_amount),
-                    'actual_amount': float(session.actual_amount or 0),
-                    'progress_percentage': (float(session.actual_amount or 0) / float(session.requested_amount)) * 100,
-                    'start_time': session.start_time.isoformat() if session.start_time else None,
-                    'charging_duration_hours': float(session.charging_duration or 0),
-                    'status': session.status.value
-                }
-                
-                # 计算预估剩余时间
-                if session.start_time and session.status == ChargingStatus.CHARGING:
-                    remaining_kwh = float(session.requested_amount) - float(session.actual_amount or 0)
-                    pile_power = float(session.pile.power_rating)
-                    if pile_power > 0 and remaining_kwh > 0:
-                        estimated_remaining_hours = remaining_kwh / pile_power
-                        session_info['estimated_remaining_hours'] = round(estimated_remaining_hours, 2)
-                    else:
-                        session_info['estimated_remaining_hours'] = 0
-                
-                queue_info['charging_sessions'].append(session_info)
-        
-        except Exception as e:
-            print(f"⚠️ 获取充电会话信息失败: {e}")
-        
-        # 4. 汇总统计
-        summary = {
-            'total_waiting_station': len(queue_info['station_waiting_area']['fast']) + len(queue_info['station_waiting_area']['trickle']),
-            'total_waiting_engine': len(queue_info['engine_dispatch_queues']['fast']) + len(queue_info['engine_dispatch_queues']['trickle']),
-            'total_charging': len(queue_info['charging_sessions']),
-            'fast_waiting_station': len(queue_info['station_waiting_area']['fast']),
-            'fast_waiting_engine': len(queue_info['engine_dispatch_queues']['fast']),
-            'trickle_waiting_station': len(queue_info['station_waiting_area']['trickle']),
-            'trickle_waiting_engine': len(queue_info['engine_dispatch_queues']['trickle'])
+            'charging_sessions': items('charging')
         }
         
         return success_response(data={
             'queue_info': queue_info,
-            'summary': summary,
-            'timestamp': datetime.now().isoformat()
+            'summary': report.summary(totals),
+            'pagination': {name: {key: value for key, value in page.items() if key != 'items'}
+                           for name, page in pages.items()},
+            'timestamp': report.now.isoformat()
         }, message="获取队列信息成功")
     
     except Exception as e:
@@ -440,11 +547,6 @@ def get_queue_info():
 def get_system_overview():
     """获取系统概览统计信息"""
     try:
-        from models.billing import ChargingPile
-        from models.charging import ChargingSession, ChargingStatus
-        from models.user import db, User
-        from sqlalchemy import func
-        
         # 充电桩状态统计
         pile_status_stats = db.session.query(
             ChargingPile.status,
@@ -454,7 +556,7 @@ def get_system_overview():
         pile_status_counts = {row.status: row.count for row in pile_status_stats}
         
         # 今日统计
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        today_start = clock.now().replace(hour=0, minute=0, second=0, microsecond=0)
         tomorrow_start = today_start + timedelta(days=1)
         
         today_stats = db.session.query(
@@ -468,7 +570,7 @@ def get_system_overview():
         ).first()
         
         # 本月统计
-        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        month_start = clock.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         if month_start.month == 12:
             next_month_start = month_start.replace(year=month_start.year + 1, month=1)
         else:
@@ -495,13 +597,12 @@ def get_system_overview():
         
         if charging_service and charging_service.redis_client:
             try:
-                queue_stats['station_waiting_fast'] = charging_service.redis_client.llen('station_waiting_area:fast')
-                queue_stats['station_waiting_trickle'] = charging_service.redis_client.llen('station_waiting_area:trickle')
+                station_sizes = charging_service.waiting_area.sizes()
+                queue_stats['station_waiting_fast'] = station_sizes['fast']
+                queue_stats['station_waiting_trickle'] = station_sizes['trickle']
                 
-                import scheduler_core
-                from scheduler_core import PileType
-                queue_stats['engine_fast_queue'] = len(scheduler_core.get_waiting_list(PileType.D.value))
-                queue_stats['engine_trickle_queue'] = len(scheduler_core.get_waiting_list(PileType.A.value))
+                queue_stats['engine_fast_queue'] = charging_service.engine.get_queue_length(PileType.D.value)
+                queue_stats['engine_trickle_queue'] = charging_service.engine.get_queue_length(PileType.A.value)
             except Exception as e:
                 print(f"⚠️ 获取队列统计失败: {e}")
         
@@ -543,4 +644,64 @@ def get_system_overview():
         print(f"❌ 获取系统概览失败: {e}")
         import traceback
         traceback.print_exc()
-        return error_response(f"获取系统概览失败: {str(e)}", code=500)
\ No newline at end of file
+        return error_response(f"获取系统概览失败: {str(e)}", code=500)
+
+
+@admin_bp.route('/lock-stats', methods=['GET'])
+@admin_required
+def get_lock_stats():
+    """获取充电服务各类锁的等待 / 持有时间统计"""
+    try:
+        charging_service = current_app.extensions.get('charging_service')
+        if not charging_service:
+            return error_response("充电服务未初始化", code=503)
+        
+        return success_response(data=charging_service.get_lock_stats(), message="获取锁统计成功")
+    
+    except Exception as e:
+        print(f"❌ 获取锁统计失败: {e}")
+        return error_response(f"获取锁统计失败: {str(e)}", code=500)
+
+@admin_bp.route('/engine/policy', methods=['GET', 'PUT'])
+@admin_required
+def engine_policy():
+    """查看 / 切换调度引擎的调度策略（PUT {"policy": "sjf"}）"""
+    try:
+        charging_service = current_app.extensions.get('charging_service')
+        if not charging_service:
+            return error_response("充电服务未初始化", code=503)
+        engine = charging_service.engine
+        
+        if request.method == 'PUT':
+            data = request.get_json() or {}
+            name = data.get('policy')
+            if name not in scheduler_core.POLICIES:
+                return validation_error_response(
+                    {'policy': f"可选策略: {', '.join(scheduler_core.POLICIES)}"})
+            previous = engine.set_policy(name)
+            print(f"🧭 调度策略已切换: {previous.name} -> {name}")
+        
+        return success_response(data={
+            'current': engine.get_policy().describe(),
+            'available': list(scheduler_core.POLICIES)
+        }, message="获取调度策略成功" if request.method == 'GET' else "调度策略已切换")
+    
+    except Exception as e:
+        print(f"❌ 调度策略操作失败: {e}")
+        return error_response(f"调度策略操作失败: {str(e)}", code=500)
+
+@admin_bp.route('/engine/fault-recovery', methods=['GET'])
+@admin_required
+def engine_fault_recovery():
+    """故障转移统计：等待重新调度的请求数与最近的恢复时长"""
+    try:
+        charging_service = current_app.extensions.get('charging_service')
+        if not charging_service:
+            return error_response("充电服务未初始化", code=503)
+        
+        return success_response(data=charging_service.engine.get_fault_recovery_stats(),
+                                message="获取故障转移统计成功")
+    
+    except Exception as e:
+        print(f"❌ 获取故障转移统计失败: {e}")
+        return error_response(f"获取故障转移统计失败: {str(e)}", code=500)
@@ -1,7 +1,10 @@
 from flask import Blueprint, request, session, current_app
+from datetime import datetime, timedelta
 from utils.response import success_response, error_response, validation_error_response
 from utils.validators import validate_required_fields
 from functools import wraps
+from models.charging import ChargingSession, ChargingStatus, ChargingMode
+from utils.pagination import keyset_paginate, cursor_pagination_info, InvalidCursor
 
 # 创建蓝图
 charging_bp = Blueprint('charging', __name__)
@@ -281,8 +284,6 @@ def get_user_charging_sessions():
         # 限制每页数量
         per_page = min(per_page, 50)
         
-        from models.charging import ChargingSession, ChargingStatus
-        
         # 构建查询
         query = ChargingSession.query.filter_by(user_id=user_id)
         
@@ -294,6 +295,20 @@ def get_user_charging_sessions():
             except ValueError:
                 return error_response("无效的状态值")
         
+        # 游标分页：传入 cursor 参数（首页为空字符串）时按 (created_at, id) 倒序取数，不做 COUNT / OFFSET
+        if 'cursor' in request.args:
+            with_total = request.args.get('with_total', 'false').lower() == 'true'
+            try:
+                page_data = keyset_paginate(query, [ChargingSession.created_at, ChargingSession.id], per_page,
+                                            cursor=request.args.get('cursor'), with_total=with_total)
+            except InvalidCursor as e:
+                return error_response(str(e))
+            
+            return success_response(data={
+                'sessions': [session.to_dict() for session in page_data['items']],
+                'pagination': cursor_pagination_info(page_data, per_page)
+            }, message="获取充电会话列表成功")
+        
         # 按创建时间倒序排列
         query = query.order_by(ChargingSession.created_at.desc())
         
@@ -340,8 +355,6 @@ def get_charging_session_detail(session_id):
     try:
         user_id = session.get('user_id')
         
-        from models.charging import ChargingSession
-        
         # 查询会话详情
         charging_session = ChargingSession.query.filter_by(
             session_id=session_id,
@@ -457,30 +470,24 @@ def stop_charging():
         if not session_id:
             return error_response("会话ID不能为空")
         
-        # 验证会话归属
-        from models.charging import ChargingSession, ChargingStatus
+        # 获取充电服务实例
+        charging_service = current_app.extensions.get('charging_service')
+        if not charging_service:
+            return error_response("充电服务不可用", code=503)
         
-        charging_session = ChargingSession.query.filter_by(
-            session_id=session_id,
-            user_id=user_id
-        ).first()
+        # 验证会话归属（活跃会话直接读缓存）
+        charging_session = charging_service.find_session(session_id)
         
-        if not charging_session:
+        if not charging_session or charging_session.user_id != user_id:
             return error_response("充电会话不存在或无权访问", code=404)
         
         if charging_session.status not in [ChargingStatus.CHARGING, ChargingStatus.COMPLETING]:
             return error_response("当前会话状态不允许停止充电", code=400)
         
-        # 获取充电服务实例
-        charging_service = current_app.extensions.get('charging_service')
-        if not charging_service:
-            return error_response("充电服务不可用", code=503)
-        
         # 停止充电
         if charging_session.pile_id:
             try:
-                import scheduler_core
-                scheduler_core.end_charging(charging_session.pile_id)
+                charging_service.engine.end_charging(charging_session.pile_id)
                 
                 return success_response(
                     data={
@@ -514,9 +521,6 @@ def get_charging_history():
         # 限制每页数量
         per_page = min(per_page, 50)
         
-        from models.charging import ChargingSession, ChargingStatus, ChargingMode
-        from datetime import datetime, timedelta
-        
         # 构建查询
         query = ChargingSession.query.filter_by(user_id=user_id)
         
@@ -548,17 +552,38 @@ def get_charging_history():
             except ValueError:
                 return error_response("结束日期格式错误")
         
-        # 按结束时间倒序排列
-        query = query.order_by(ChargingSession.end_time.desc())
-        
-        # 分页查询
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
-        
-        sessions = pagination.items
+        # 游标分页：传入 cursor 参数（首页为空字符串）时按 (end_time, id) 倒序取数，不做 COUNT / OFFSET
+        page_data = None
+        if 'cursor' in request.args:
+            with_total = request.args.get('with_total', 'false').lower() == 'true'
+            try:
+                page_data = keyset_paginate(query, [ChargingSession.end_time, ChargingSession.id], per_page,
+                                            cursor=request.args.get('cursor'), with_total=with_total)
+            except InvalidCursor as e:
+                return error_response(str(e))
+            sessions = page_data['items']
+        else:
+            # 按结束时间倒序排列
+            query = query.order_by(ChargingSession.end_time.desc())
+            
+            # 分页查询
+            pagination = query.paginate(
+                page=page,
+                per_page=per_page,
+                error_out=False
+            )
+            
+            sessions = pagination.items
+        
+        if page_data is not None:
+            # 游标模式只给近似总数，不给只覆盖本页、容易被误读为总计的电量 / 费用统计
+            return success_response(data={
+                'history': [session.to_detail_dict() for session in sessions],
+                'pagination': cursor_pagination_info(page_data, per_page),
+                'statistics': {
+                    'total_sessions': page_data.get('total')
+                }
+            }, message="获取充电历史成功")
         
         # 计算统计信息
         total_amount = sum(float(session.actual_amount or 0) for session in sessions)
@@ -2,8 +2,11 @@ from flask import Blueprint, request, session
 from models.user import db, User
 from services.billing_service import BillingService
 from utils.response import success_response, error_response, validation_error_response
+from utils.pagination import keyset_paginate, cursor_pagination_info, InvalidCursor
 from utils.validators import validate_car_id, validate_username, validate_password, validate_car_capacity, validate_required_fields
 from functools import wraps
+from datetime import timedelta
+from scheduler_core import clock
 
 # 创建蓝图
 user_bp = Blueprint('user', __name__)
@@ -312,14 +315,20 @@ def get_charging_records():
         # 限制每页数量
         per_page = min(per_page, 50)
         
-        # 获取充电记录
-        result = BillingService.get_user_charging_records(
-            user_id=user_id,
-            page=page,
-            per_page=per_page,
-            start_date=start_date,
-            end_date=end_date
-        )
+        # 获取充电记录（传入 cursor 参数时使用游标分页，首页为空字符串）
+        cursor = request.args.get('cursor') if 'cursor' in request.args else None
+        try:
+            result = BillingService.get_user_charging_records(
+                user_id=user_id,
+                page=page,
+                per_page=per_page,
+                start_date=start_date,
+                end_date=end_date,
+                cursor=cursor,
+                with_total=request.args.get('with_total', 'false').lower() == 'true'
+            )
+        except InvalidCursor as e:
+            return error_response(str(e))
         
         return success_response(data=result, message="获取充电记录成功")
         
@@ -351,40 +360,24 @@ def get_charging_summary():
     try:
         user_id = session.get('user_id')
         
-        # 获取不同时间范围的汇总
-        # 本月汇总
-        from datetime import datetime, timedelta
-        now = datetime.now()
+        # 获取不同时间范围的汇总（本月、近30天），一条聚合查询完成
+        now = clock.now()
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        month_result = BillingService.get_user_charging_records(
-            user_id=user_id,
-            page=1,
-            per_page=1000,  # 获取所有记录用于统计
-            start_date=month_start.isoformat()
-        )
-        
-        # 近30天汇总
         thirty_days_ago = now - timedelta(days=30)
-        thirty_days_result = BillingService.get_user_charging_records(
-            user_id=user_id,
-            page=1,
-            per_page=1000,
-            start_date=thirty_days_ago.isoformat()
-        )
+        
+        totals = BillingService.get_user_charging_summary(user_id, {
+            'current_month': month_start,
+            'last_30_days': thirty_days_ago
+        })
         
         summary_data = {
             'current_month': {
                 'period': f"{month_start.strftime('%Y-%m')}-01 至今",
-                'total_records': month_result['summary']['total_records'],
-                'total_power_consumed': month_result['summary']['total_power_consumed'],
-                'total_cost': month_result['summary']['total_cost']
+                **totals['current_month']
             },
             'last_30_days': {
                 'period': f"近30天",
-                'total_records': thirty_days_result['summary']['total_records'],
-                'total_power_consumed': thirty_days_result['summary']['total_power_consumed'],
-                'total_cost': thirty_days_result['summary']['total_cost']
+                **totals['last_30_days']
             }
         }
         
@@ -440,6 +433,30 @@ def admin_get_all_users():
                 )
             )
         
+        # 统计信息
+        total_users = User.query.count()
+        active_users = User.query.filter_by(status='active').count()
+        admin_users = User.query.filter_by(user_type='admin').count()
+        
+        # 游标分页：传入 cursor 参数（首页为空字符串）时按 (created_at, id) 倒序取数，不做 COUNT / OFFSET
+        if 'cursor' in request.args:
+            with_total = request.args.get('with_total', 'false').lower() == 'true'
+            try:
+                page_data = keyset_paginate(query, [User.created_at, User.id], per_page,
+                                            cursor=request.args.get('cursor'), with_total=with_total)
+            except InvalidCursor as e:
+                return error_response(str(e))
+            
+            return success_response(data={
+                'users': [user.to_dict() for user in page_data['items']],
+                'pagination': cursor_pagination_info(page_data, per_page),
+                'statistics': {
+                    'total_users': total_users,
+                    'active_users': active_users,
+                    'admin_users': admin_users
+                }
+            }, message="获取用户列表成功")
+        
         # 按创建时间倒序排列
         query = query.order_by(User.created_at.desc())
         
@@ -452,11 +469,6 @@ def admin_get_all_users():
         
         users = pagination.items
         
-        # 统计信息
-        total_users = User.query.count()
-        active_users = User.query.filter_by(status='active').count()
-        admin_users = User.query.filter_by(user_type='admin').count()
-        
         return success_response(data={
             'users': [user.to_dict() for user in users],
             'pagination': {
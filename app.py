@@ -2,6 +2,7 @@ from flask import Flask
 from flask_socketio import SocketIO
 from flask_cors import CORS
 from dotenv import load_dotenv
+import atexit
 import os
 
 # 加载环境变量
@@ -9,47 +10,58 @@ load_dotenv()
 
 from config import get_config
 from models.user import db
+from utils.startup import StartupPipeline, wait_until
 
-def init_database(app):
-    """初始化数据库"""
-    with app.app_context():
-        try:
-            # 检查数据库连接
-            with db.engine.connect() as connection:
-                from sqlalchemy import text
-                connection.execute(text('SELECT 1'))
-            print("✅ 数据库连接成功！")
-            
-            # 创建所有表
-            db.create_all()
-            print("✅ 数据表创建成功！")
-            
-            # 创建默认管理员账户
-            from models.user import User
-            admin = User.query.filter_by(username='admin').first()
-            if not admin:
-                admin = User(
-                    car_id='ADMIN001',
-                    username='admin',
-                    car_capacity=0,
-                    user_type='admin'
-                )
-                admin.set_password('admin123')
-                db.session.add(admin)
-                db.session.commit()
-                print("✅ 默认管理员账户已创建: username=admin, password=admin123")
-            
-            # 初始化计费配置
-            init_billing_config()
-            
-            # 创建示例充电桩
-            init_sample_piles()
-            
-            print("✅ 数据库初始化完成！")
-            
-        except Exception as e:
-            print(f"❌ 数据库初始化失败: {str(e)}")
-            raise
+def check_database():
+    """数据库就绪检查（轮询代替固定等待）"""
+    from sqlalchemy import text
+    
+    def ping():
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        return True
+    
+    wait_until(ping, timeout=10, name='数据库')
+    print("✅ 数据库连接成功！")
+
+def create_tables():
+    """创建所有表"""
+    # 确保所有模型都已注册到元数据（充电会话模型此前可能尚未被导入）
+    import models.charging, models.billing
+    from sqlalchemy import inspect, text
+    from sqlalchemy.schema import CreateColumn
+    db.create_all()
+    # create_all 也不会给已存在的表补列（如故障续充的 resumed_amount），新增的可空列逐个补上
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+                    print(f"✅ 数据表 {table.name} 补建列 {column.name}")
+    # create_all 不会给已存在的表补建索引（如分页用的联合索引），逐个检查补建
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    print("✅ 数据表创建成功！")
+
+def init_admin_account():
+    """创建默认管理员账户"""
+    from models.user import User
+    admin = User.query.filter_by(username='admin').first()
+    if not admin:
+        admin = User(
+            car_id='ADMIN001',
+            username='admin',
+            car_capacity=0,
+            user_type='admin'
+        )
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+        print("✅ 默认管理员账户已创建: username=admin, password=admin123")
 
 def init_billing_config():
     """初始化计费配置"""
@@ -132,16 +144,15 @@ def create_app():
     # 注册API蓝图
     register_blueprints(app)
     
-    # 初始化数据库
-    init_database(app)
-    
-    # 初始化充电服务（延迟初始化模式）
-    init_charging_service(app, socketio)
+    # 初始化数据库与充电服务（并行 / 延后执行，输出各阶段耗时）
+    startup = build_startup_pipeline(app, socketio)
+    app.extensions['startup_timings'] = startup.run()
     
     # 健康检查路由
     @app.route('/health')
     def health_check():
-        return {'status': 'healthy', 'message': '充电桩管理系统运行正常'}
+        return {'status': 'healthy', 'message': '充电桩管理系统运行正常',
+                'startup_ms': app.extensions.get('startup_timings', {})}
     
     @app.route('/')
     def home():
@@ -180,6 +191,19 @@ def create_app():
     
     return app, socketio
 
+def build_startup_pipeline(app, socketio):
+    """应用启动流水线：无依赖的阶段并行执行，全部完成后对外服务"""
+    pipeline = StartupPipeline('应用启动', context=app.app_context)
+    pipeline.add('database_ready', check_database)
+    pipeline.add('create_tables', create_tables, depends=('database_ready',))
+    # 充电服务注册充电桩前需要示例充电桩
+    pipeline.add('sample_piles', init_sample_piles, depends=('create_tables',))
+    pipeline.add('charging_service', lambda: init_charging_service(app, socketio), depends=('sample_piles',))
+    # 管理员账户与计费配置在对外服务前就绪：首个请求就可能登录管理端或按配置计费
+    pipeline.add('admin_account', init_admin_account, depends=('create_tables',))
+    pipeline.add('billing_config', init_billing_config, depends=('create_tables',))
+    return pipeline
+
 def register_blueprints(app):
     """注册所有API蓝图"""
     
@@ -218,6 +242,8 @@ def init_charging_service(app, socketio):
         # 在应用上下文中延迟初始化
         with app.app_context():
             charging_service.init_app(app, socketio)
+        # 进程退出时停止后台线程并写完待提交的会话变更
+        atexit.register(charging_service.shutdown)
         
         print("✅ 充电服务初始化完成")
         
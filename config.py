@@ -62,6 +62,21 @@ class Config:
     FAST_CHARGING_PILE_NUM = 2  # 快充桩数量
     TRICKLE_CHARGING_PILE_NUM = 3  # 慢充桩数量
     CHARGING_QUEUE_LEN = 2  # 充电桩排队队列长度
+    SESSION_CACHE_SIZE = 10000  # 活跃会话缓存容量（按会话数，集群模式下不启用缓存）
+    PILE_UTILIZATION_RETENTION_DAYS = 31  # 充电桩利用率统计保留的忙碌区间天数
+    
+    # 调度引擎集群模式：多个应用进程共享一个引擎，租约选主，仅主节点调度
+    ENGINE_CLUSTER_MODE = os.environ.get('ENGINE_CLUSTER_MODE', 'false').lower() == 'true'
+    ENGINE_LEASE_TTL = 5  # 主节点租约有效期（秒）
+    
+    # 调度策略：fifo（先到先服务）/ sjf（短作业优先）/ batch（批量排程）/ fault_priority（故障请求优先），运行时可在管理端切换
+    SCHEDULING_POLICY = os.environ.get('SCHEDULING_POLICY', 'fifo')
+    
+    # 倍速时钟：开启后充电进度、调度预计时间、计费时段与统计窗口都按 CHARGING_SPEED_FACTOR 加速（演示 / 联调用），默认关闭
+    SCALED_CLOCK_ENABLED = os.environ.get('SCALED_CLOCK_ENABLED', 'false').lower() == 'true'
+    
+    # 调度引擎预写日志目录（单进程模式下重启可恢复队列与充电桩分配），默认不持久化，需显式指定数据目录
+    ENGINE_WAL_DIR = os.environ.get('ENGINE_WAL_DIR') or None
     
     # 充电功率配置
     FAST_CHARGING_POWER = 30  # 快充功率：30度/小时
@@ -113,7 +128,7 @@ class DevelopmentConfig(Config):
     
     # 测试模式配置（用于加速充电测试）
     TESTING_MODE = True
-    CHARGING_SPEED_FACTOR = 100  # 充电速度倍数（测试用）
+    CHARGING_SPEED_FACTOR = 100  # 充电速度倍数（测试用，需开启 SCALED_CLOCK_ENABLED）
 
 class TestingConfig(Config):
     """测试环境配置"""
@@ -132,7 +147,10 @@ class TestingConfig(Config):
     
     # 测试模式配置
     TESTING_MODE = True
-    CHARGING_SPEED_FACTOR = 1000  # 测试环境下更快的充电速度
+    CHARGING_SPEED_FACTOR = 1000  # 测试环境下更快的充电速度（需开启 SCALED_CLOCK_ENABLED）
+    
+    # 测试环境每次从空白引擎开始
+    ENGINE_WAL_DIR = None
 
 class ProductionConfig(Config):
     """生产环境配置"""
@@ -6,6 +6,12 @@ from models.user import db
 class ChargingRecord(db.Model):
     """充电记录模型"""
     __tablename__ = 'charging_records'
+    __table_args__ = (
+        # 用户充电详单的游标分页：WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        db.Index('ix_charging_records_user_created', 'user_id', 'created_at', 'id'),
+        # 充电桩使用统计的最近充电时间：WHERE status = 'completed' GROUP BY pile_id 取 MAX(created_at)
+        db.Index('ix_charging_records_pile_created', 'pile_id', 'status', 'created_at'),
+    )
     
     # 基本信息
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
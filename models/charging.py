@@ -27,6 +27,11 @@ class PileStatus(Enum):
 class ChargingSession(db.Model):
     """充电会话模型"""
     __tablename__ = 'charging_sessions'
+    __table_args__ = (
+        # 会话列表 / 充电历史的游标分页
+        db.Index('ix_charging_sessions_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_charging_sessions_user_end', 'user_id', 'end_time', 'id'),
+    )
     
     # 基本信息
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -42,6 +47,7 @@ class ChargingSession(db.Model):
     requested_amount = db.Column(db.Numeric(10, 2), nullable=False, comment='请求充电量(kWh)')
     actual_amount = db.Column(db.Numeric(10, 2), default=0.0, comment='实际充电量(kWh)')
     charging_duration = db.Column(db.Numeric(10, 4), default=0.0, comment='充电时长(小时)')
+    resumed_amount = db.Column(db.Numeric(10, 2), default=0.0, comment='故障转移前已充并已计费的电量(kWh)')
     
     # 时间信息
     start_time = db.Column(db.DateTime, comment='开始充电时间')
@@ -76,6 +82,7 @@ class ChargingSession(db.Model):
             'requested_amount': float(self.requested_amount) if self.requested_amount else 0.0,
             'actual_amount': float(self.actual_amount) if self.actual_amount else 0.0,
             'charging_duration': float(self.charging_duration) if self.charging_duration else 0.0,
+            'resumed_amount': float(self.resumed_amount) if self.resumed_amount else 0.0,
             'start_time': self.start_time.isoformat() if self.start_time else None,
             'end_time': self.end_time.isoformat() if self.end_time else None,
             'charging_fee': float(self.charging_fee) if self.charging_fee else 0.0,
@@ -103,4 +110,31 @@ class ChargingSession(db.Model):
         return data
     
     def __repr__(self):
-        return f'<ChargingSession {self.session_id}>'
\ No newline at end of file
+        return f'<ChargingSession {self.session_id}>'
+
+class ChargingSessionEvent(db.Model):
+    """充电会话状态变更事件（只追加，不修改）"""
+    __tablename__ = 'charging_session_events'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    session_id = db.Column(db.String(50), nullable=False, index=True, comment='会话ID')
+    from_status = db.Column(db.String(32), nullable=True, comment='变更前状态（新建时为空）')
+    to_status = db.Column(db.String(32), nullable=False, comment='变更后状态')
+    reason = db.Column(db.String(64), comment='变更原因')
+    payload = db.Column(db.JSON, comment='同时修改的字段')
+    created_at = db.Column(db.DateTime, default=datetime.now, comment='发生时间')
+    
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            'id': self.id,
+            'session_id': self.session_id,
+            'from_status': self.from_status,
+            'to_status': self.to_status,
+            'reason': self.reason,
+            'payload': self.payload,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ChargingSessionEvent {self.session_id} {self.from_status}->{self.to_status}>'
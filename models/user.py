@@ -7,6 +7,10 @@ db = SQLAlchemy()
 class User(db.Model):
     """用户模型"""
     __tablename__ = 'users'
+    __table_args__ = (
+        # 管理员用户列表的游标分页
+        db.Index('ix_users_created', 'created_at', 'id'),
+    )
     
     # 基本信息
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
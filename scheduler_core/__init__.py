@@ -9,20 +9,39 @@ from .core import (
     generate_queue_number,
     enqueue_request,
     fetch_next_request,
+    cancel_request,
+    update_request,
     get_waiting_list,
+    get_queue_length,
+    get_queue_kwh,
+    get_queue_position,
+    get_preassigned_position,
+    get_charging_pile,
     # 调度
+    get_queue_capacity,
     assign_request,
+    dispatch_next,
     estimate_finish_time,
     start_dispatch_loop,
     stop_dispatch_loop,
+    set_policy,
+    get_policy,
     # 故障
     mark_fault,
     recover_pile,
+    get_fault_recovery_stats,
     #暂停
     pause_charging,
     end_charging,
 
     get_all_piles,
+    # 充电桩管理
+    add_piles,
+    remove_pile,
+    update_pile,
+    # 持久化
+    enable_persistence,
+    disable_persistence,
 )
 from .models import (
     PileType,
@@ -33,21 +52,38 @@ from .models import (
 )
 # 关键：将 store.py 内 add_pile / pop_events 暴露给外部
 from .store import add_pile, pop_events
+from .clock import Clock, SystemClock, ScaledClock, ManualClock, get_clock, set_clock
+from .policies import SchedulingPolicy, POLICIES
 
 __all__ = [
     # 队列
     "generate_queue_number",
     "enqueue_request",
     "fetch_next_request",
+    "cancel_request",
+    "update_request",
     "get_waiting_list",
+    "get_queue_length",
+    "get_queue_kwh",
+    "get_queue_position",
+    "get_preassigned_position",
+    "get_charging_pile",
     # 调度
+    "get_queue_capacity",
     "assign_request",
+    "dispatch_next",
     "estimate_finish_time",
     "start_dispatch_loop",
     "stop_dispatch_loop",
+    # 调度策略
+    "set_policy",
+    "get_policy",
+    "SchedulingPolicy",
+    "POLICIES",
     # 故障
     "mark_fault",
     "recover_pile",
+    "get_fault_recovery_stats",
     # 事件（测试 / WebSocket）
     "pop_events",
     # 数据模型
@@ -62,4 +98,18 @@ __all__ = [
     "end_charging",
 
     "get_all_piles",
+    # 充电桩管理
+    "add_piles",
+    "remove_pile",
+    "update_pile",
+    # 持久化
+    "enable_persistence",
+    "disable_persistence",
+    # 时钟
+    "Clock",
+    "SystemClock",
+    "ScaledClock",
+    "ManualClock",
+    "get_clock",
+    "set_clock",
 ]
@@ -0,0 +1,113 @@
+"""
+scheduler_core/clock.py
+
+可注入的时钟：引擎、充电服务与计费的"当前时间"都从这里取。默认为真实时间；
+开启 SCALED_CLOCK_ENABLED 时按 CHARGING_SPEED_FACTOR 换成倍速时钟，仿真 / 单元测试换成手动时钟，
+调度结果（开始时间、预计结束时间、排队号日期）、充电进度与计费时段随之使用同一条时间轴。
+"""
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+
+class Clock:
+    """时钟接口：utcnow() 为无时区的 UTC 时间（引擎内部使用），now() 为本地时间"""
+
+    def utcnow(self) -> datetime:
+        raise NotImplementedError
+
+    def now(self) -> datetime:
+        return self.utcnow() + _local_offset()
+
+
+class SystemClock(Clock):
+    """真实时间"""
+
+    def utcnow(self) -> datetime:
+        return datetime.utcnow()
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+
+class ManualClock(Clock):
+    """手动推进的时钟（仿真 / 测试用），只有调用 advance() / set() 时间才会变化"""
+
+    def __init__(self, start: Optional[datetime] = None,
+                 utc_offset: Optional[timedelta] = None) -> None:
+        self._lock = threading.Lock()
+        self._utc = start or datetime.utcnow()
+        self.utc_offset = _local_offset() if utc_offset is None else utc_offset
+
+    def utcnow(self) -> datetime:
+        with self._lock:
+            return self._utc
+
+    def now(self) -> datetime:
+        return self.utcnow() + self.utc_offset
+
+    def set(self, utc: datetime) -> None:
+        with self._lock:
+            self._utc = utc
+
+    def advance(self, delta: Union[timedelta, float]) -> datetime:
+        """向前推进 delta（timedelta 或秒数），返回推进后的 UTC 时间"""
+        if not isinstance(delta, timedelta):
+            delta = timedelta(seconds=delta)
+        with self._lock:
+            self._utc += delta
+            return self._utc
+
+
+class ScaledClock(Clock):
+    """倍速时钟（开发 / 测试用）：从创建时刻起，真实时间每过 1 秒时钟前进 factor 秒
+
+    时间轴从 start（默认为创建时的真实时间）开始，进程重启后重新从真实时间起算，
+    上次运行留下的会话时间戳可能在"未来"，需等时钟追上后才继续累计充电量。
+    """
+
+    def __init__(self, factor: float, start: Optional[datetime] = None) -> None:
+        if factor <= 0:
+            raise ValueError(f"时钟倍速必须大于 0: {factor}")
+        self.factor = factor
+        self._start = start or datetime.utcnow()
+        self._origin = time.monotonic()
+
+    def utcnow(self) -> datetime:
+        return self._start + timedelta(seconds=(time.monotonic() - self._origin) * self.factor)
+
+
+def for_speed_factor(factor: float) -> Clock:
+    """按倍速创建时钟：1 为真实时间"""
+    return SystemClock() if factor == 1 else ScaledClock(factor)
+
+
+def _local_offset() -> timedelta:
+    offset = datetime.now().astimezone().utcoffset()
+    return offset or timedelta(0)
+
+
+_clock: Clock = SystemClock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(clock: Optional[Clock]) -> Clock:
+    """替换引擎时钟（None 恢复为真实时间），返回之前的时钟"""
+    global _clock
+    previous, _clock = _clock, clock or SystemClock()
+    return previous
+
+
+def utcnow() -> datetime:
+    return _clock.utcnow()
+
+
+def now() -> datetime:
+    """本地时间（充电服务 / 计费使用）"""
+    return _clock.now()
@@ -0,0 +1,519 @@
+"""
+多进程 / 多节点部署：租约选主的调度引擎。
+
+  * 引擎状态（充电桩、队列、计数器）以快照形式保存在共享存储中；
+  * 同一时刻只有持有租约的主节点运行调度循环，并在本地内存中执行所有写操作；
+    每次新获得租约时任期号（fencing token）加一，主节点在本地执行写操作前续约并核对任期号，
+    租约已过期或被接管时不再本地执行，改为转发；
+  * 其他节点把 enqueue / end / fault 等写操作作为命令转发给主节点，同步等待结果
+    （超时抛 TimeoutError）；主节点直接读本地内存，其余节点读共享快照，
+    快照按版本号解码一次后缓存；
+  * 引擎事件由主节点写入共享事件队列，任意节点取出、每个事件只被处理一次。
+
+ClusterNode 提供与 scheduler_core 模块同名的函数，业务层可以无差别使用。
+共享存储有两种实现：RedisSharedStore（生产）与 LocalSharedStore（测试 / 单机）。
+"""
+from __future__ import annotations
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from .models import PileType, PileStatus, Pile, ChargeRequest, DispatchResult
+from . import clock, core, store
+
+
+# =====================================================================
+#                           共享存储
+# =====================================================================
+class LocalSharedStore:
+    """进程内共享存储：多个 ClusterNode 共用同一个实例即可模拟多节点"""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._holder: Optional[str] = None
+        self._expires_at = 0.0
+        self._commands: deque = deque()
+        self._replies: Dict[str, str] = {}
+        self._events: deque = deque()
+        self._snapshot: Optional[str] = None
+        self._version = 0
+        self._epoch = 0
+
+    # ---------------- 租约 ----------------
+    def acquire_lease(self, node_id: str, ttl: float) -> Optional[int]:
+        """获取或续约，返回任期号（续约不变，重新获得时加一）；租约被他人持有且未过期时返回 None"""
+        with self._cond:
+            now = time.monotonic()
+            if self._holder is not None and self._expires_at > now:
+                if self._holder != node_id:
+                    return None
+            else:
+                self._holder = node_id
+                self._epoch += 1
+            self._expires_at = now + ttl
+            return self._epoch
+
+    def release_lease(self, node_id: str) -> None:
+        with self._cond:
+            if self._holder == node_id:
+                self._holder = None
+
+    def lease_holder(self) -> Optional[str]:
+        with self._cond:
+            if self._holder and self._expires_at > time.monotonic():
+                return self._holder
+            return None
+
+    # ---------------- 命令 / 应答 ----------------
+    def push_command(self, command: dict) -> None:
+        with self._cond:
+            self._commands.append(json.dumps(command))
+
+    def pop_commands(self, max_n: int = 100) -> List[dict]:
+        with self._cond:
+            out = []
+            while self._commands and len(out) < max_n:
+                out.append(json.loads(self._commands.popleft()))
+            return out
+
+    def put_reply(self, reply_id: str, reply: dict) -> None:
+        with self._cond:
+            self._replies[reply_id] = json.dumps(reply)
+            self._cond.notify_all()
+
+    def wait_reply(self, reply_id: str, timeout: float) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while reply_id not in self._replies:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return json.loads(self._replies.pop(reply_id))
+
+    # ---------------- 快照 / 事件 ----------------
+    def save_snapshot(self, data: dict) -> None:
+        with self._cond:
+            self._snapshot = json.dumps(data)
+            self._version += 1
+
+    def snapshot_version(self) -> int:
+        with self._cond:
+            return self._version
+
+    def load_snapshot(self) -> Optional[dict]:
+        with self._cond:
+            return json.loads(self._snapshot) if self._snapshot else None
+
+    def push_events(self, events: List[dict]) -> None:
+        with self._cond:
+            self._events.extend(json.dumps(e) for e in events)
+
+    def pop_events(self) -> List[dict]:
+        with self._cond:
+            out = [json.loads(e) for e in self._events]
+            self._events.clear()
+            return out
+
+
+class RedisSharedStore:
+    """基于 Redis 的共享存储，所有节点连接同一个 Redis"""
+
+    # 租约属于自己时续约并返回当前任期号；租约空闲（含已过期）时获得租约、任期号加一；被他人持有返回 0
+    _ACQUIRE_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if holder == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return tonumber(redis.call('GET', KEYS[2]) or '0')
+end
+if holder then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return redis.call('INCR', KEYS[2])
+"""
+    # 仅当租约仍属于自己时释放
+    _RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, redis_client, prefix: str = "engine") -> None:
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self._acquire = redis_client.register_script(self._ACQUIRE_SCRIPT)
+        self._release = redis_client.register_script(self._RELEASE_SCRIPT)
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    # ---------------- 租约 ----------------
+    def acquire_lease(self, node_id: str, ttl: float) -> Optional[int]:
+        token = self._acquire(keys=[self._key("leader"), self._key("leader_epoch")],
+                              args=[node_id, int(ttl * 1000)])
+        return int(token) or None
+
+    def release_lease(self, node_id: str) -> None:
+        self._release(keys=[self._key("leader")], args=[node_id])
+
+    def lease_holder(self) -> Optional[str]:
+        return self.redis_client.get(self._key("leader"))
+
+    # ---------------- 命令 / 应答 ----------------
+    def _pop_list(self, key: str, max_n: int) -> List[dict]:
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, max_n - 1)
+            pipe.ltrim(key, max_n, -1)
+            items, _ = pipe.execute()
+        return [json.loads(item) for item in items]
+
+    def push_command(self, command: dict) -> None:
+        self.redis_client.rpush(self._key("commands"), json.dumps(command))
+
+    def pop_commands(self, max_n: int = 100) -> List[dict]:
+        return self._pop_list(self._key("commands"), max_n)
+
+    def put_reply(self, reply_id: str, reply: dict) -> None:
+        key = self._key(f"reply:{reply_id}")
+        with self.redis_client.pipeline() as pipe:
+            pipe.rpush(key, json.dumps(reply))
+            pipe.expire(key, 60)
+            pipe.execute()
+
+    def wait_reply(self, reply_id: str, timeout: float) -> Optional[dict]:
+        item = self.redis_client.blpop(self._key(f"reply:{reply_id}"), timeout=timeout)
+        return json.loads(item[1]) if item else None
+
+    # ---------------- 快照 / 事件 ----------------
+    def save_snapshot(self, data: dict) -> None:
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(self._key("snapshot"), json.dumps(data))
+            pipe.incr(self._key("snapshot_version"))
+            pipe.execute()
+
+    def snapshot_version(self) -> int:
+        return int(self.redis_client.get(self._key("snapshot_version")) or 0)
+
+    def load_snapshot(self) -> Optional[dict]:
+        raw = self.redis_client.get(self._key("snapshot"))
+        return json.loads(raw) if raw else None
+
+    def push_events(self, events: List[dict]) -> None:
+        if events:
+            self.redis_client.rpush(self._key("events"), *[json.dumps(e) for e in events])
+
+    def pop_events(self) -> List[dict]:
+        return self._pop_list(self._key("events"), 1000)
+
+
+# =====================================================================
+#                           事件编解码
+# =====================================================================
+def _encode_event(event: dict) -> dict:
+    data = event.get("data")
+    if hasattr(data, "to_dict"):
+        data = data.to_dict()
+    return {"type": event.get("type"), "data": data}
+
+
+def _decode_event(event: dict) -> dict:
+    if event.get("type") in ("dispatch", "pre_assign") and isinstance(event.get("data"), dict):
+        return {"type": event["type"], "data": DispatchResult.from_dict(event["data"])}
+    return event
+
+
+# =====================================================================
+#                   主节点上执行的命令（参数 / 结果均可 JSON 序列化）
+# =====================================================================
+def _op_update_request(req_id: str, kwh=None, pile_type=None) -> Optional[dict]:
+    req = core.update_request(req_id, kwh=kwh, pile_type=pile_type)
+    return req.to_dict() if req else None
+
+
+class _View:
+    """从共享快照解码出的只读视图，附带按 req_id 的位置索引"""
+
+    def __init__(self, data: dict) -> None:
+        self.piles = [Pile.from_dict(p) for p in data.get("piles", [])]
+        self.queues = {t: [ChargeRequest.from_dict(r) for r in reqs]
+                       for t, reqs in data.get("queues", {}).items()}
+        self.positions = {req.req_id: (ptype, pos) for ptype, queue in self.queues.items()
+                          for pos, req in enumerate(queue, start=1)}
+        self.preassigned = {req.req_id: (p.pile_id, pos) for p in self.piles
+                            for pos, req in enumerate(p.queue, start=1)}
+        self.charging = {p.current_req_id: p.pile_id for p in self.piles if p.current_req_id}
+        self.kwh = {t: round(sum(req.kwh for req in reqs), 4) for t, reqs in self.queues.items()}
+
+
+_OPS = {
+    "generate_queue_number": core.generate_queue_number,
+    "enqueue_request": lambda req: core.enqueue_request(ChargeRequest.from_dict(req)),
+    "cancel_request": core.cancel_request,
+    "update_request": _op_update_request,
+    "mark_fault": core.mark_fault,
+    "recover_pile": core.recover_pile,
+    "pause_charging": core.pause_charging,
+    "end_charging": core.end_charging,
+    "add_pile": lambda pile: store.add_pile(Pile.from_dict(pile)),
+    "add_piles": lambda piles: core.add_piles([Pile.from_dict(p) for p in piles]),
+    "remove_pile": core.remove_pile,
+    "update_pile": lambda pile_id, max_kw=None, pile_type=None, queue_len=None:
+        core.update_pile(pile_id, max_kw, pile_type, queue_len).to_dict(),
+    "set_policy": lambda name: core.set_policy(name).name,
+}
+
+
+class ClusterNode:
+    """
+    集群中的一个引擎节点。
+
+    tick() 周期性执行：续约 / 抢占租约；成为主节点时从共享快照恢复状态，
+    然后执行转发来的命令、运行一轮调度、发布事件和最新快照。
+    """
+
+    def __init__(self, shared, node_id: Optional[str] = None,
+                 lease_ttl: float = 5.0, interval: float = 0.5,
+                 call_timeout: float = 3.0) -> None:
+        self.shared = shared
+        self.node_id = node_id or uuid.uuid4().hex
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.call_timeout = call_timeout
+        self.is_leader = False
+        self._token: Optional[int] = None       # 当前任期号，本地执行写操作前与共享存储核对
+        self._tick_lock = threading.Lock()
+        self._stop_flag = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._saved: Optional[dict] = None
+        self._view_cache: Tuple[Optional[int], Optional[_View]] = (None, None)
+
+    # ---------------- 主循环 ----------------
+    def tick(self) -> None:
+        with self._tick_lock:
+            was_leader = self.is_leader
+            token = self.shared.acquire_lease(self.node_id, self.lease_ttl)
+            self.is_leader = token is not None
+            if not self.is_leader:
+                if was_leader:
+                    print(f"⚠️ 引擎节点 {self.node_id} 失去主节点租约")
+                return
+
+            if not was_leader or token != self._token:
+                # 新任期（包括租约过期后重新获得）：其间可能有其他主节点修改过状态，从共享快照恢复
+                data = self.shared.load_snapshot()
+                if data:
+                    store.restore(data)
+                self._saved = None
+                self._token = token
+                print(f"👑 引擎节点 {self.node_id} 成为主节点（任期 {token}）")
+
+            for command in self.shared.pop_commands():
+                self.shared.put_reply(command["reply_id"], self._apply(command))
+
+            for tp in (PileType.D.value, PileType.A.value):
+                while core.dispatch_next(tp):
+                    pass
+
+            events = store.pop_events()
+            if events:
+                self.shared.push_events([_encode_event(e) for e in events])
+            self._save_snapshot()
+
+    def _save_snapshot(self) -> None:
+        """状态无变化时不重复写快照，从节点的解码缓存保持有效"""
+        data = store.snapshot()
+        if data != self._saved:
+            self.shared.save_snapshot(data)
+            self._saved = data
+
+    def _renew(self) -> bool:
+        """续约并核对任期号（调用方持有 _tick_lock）；租约已过期或被接管时退为从节点"""
+        token = self.shared.acquire_lease(self.node_id, self.lease_ttl)
+        if token is not None and token == self._token:
+            return True
+        if self.is_leader:
+            print(f"⚠️ 引擎节点 {self.node_id} 的租约已过期，写操作改为转发")
+        self.is_leader = False
+        return False
+
+    def _apply(self, command: dict) -> dict:
+        try:
+            return {"result": _OPS[command["op"]](*command.get("args", []))}
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    def _run(self) -> None:
+        while not self._stop_flag.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"❌ 引擎节点 {self.node_id} 执行失败: {e}")
+            self._stop_flag.wait(self.interval)
+
+    def start_dispatch_loop(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_flag.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ClusterDispatchLoop")
+        self._thread.start()
+
+    def stop_dispatch_loop(self, timeout: float = 2.0) -> None:
+        self._stop_flag.set()
+        if self._thread:
+            self._thread.join(timeout)
+        with self._tick_lock:
+            if self.is_leader and self._renew():
+                # 主动让出租约，其他节点无需等待过期即可接管
+                self._save_snapshot()
+                self.shared.release_lease(self.node_id)
+            self.is_leader = False
+
+    # ---------------- 写操作：主节点本地执行，其余节点转发 ----------------
+    def _call(self, op: str, *args) -> Any:
+        if self.is_leader:
+            with self._tick_lock:
+                # 仍持有本任期的租约才在本地执行，否则新主节点看不到这次修改
+                if self.is_leader and self._renew():
+                    reply = self._apply({"op": op, "args": list(args)})
+                    if "error" in reply:
+                        raise RuntimeError(reply["error"])
+                    return reply["result"]
+
+        reply_id = uuid.uuid4().hex
+        self.shared.push_command({"op": op, "args": list(args), "reply_id": reply_id})
+        reply = self.shared.wait_reply(reply_id, self.call_timeout)
+        if reply is None:
+            # 命令仍在共享队列中，主节点稍后仍可能执行，由调用方决定如何处理
+            raise TimeoutError(f"等待引擎主节点执行 {op} 超时")
+        if "error" in reply:
+            raise RuntimeError(f"引擎主节点执行 {op} 失败: {reply['error']}")
+        return reply["result"]
+
+    def generate_queue_number(self, pile_type: str) -> Optional[str]:
+        return self._call("generate_queue_number", PileType(pile_type).value)
+
+    def enqueue_request(self, req: ChargeRequest) -> None:
+        self._call("enqueue_request", req.to_dict())
+
+    def cancel_request(self, req_id: str) -> bool:
+        return bool(self._call("cancel_request", req_id))
+
+    def update_request(self, req_id: str, kwh: Optional[float] = None,
+                       pile_type: Optional[str] = None) -> Optional[ChargeRequest]:
+        data = self._call("update_request", req_id, kwh, pile_type)
+        return ChargeRequest.from_dict(data) if data else None
+
+    def mark_fault(self, pile_id: str) -> None:
+        self._call("mark_fault", pile_id)
+
+    def recover_pile(self, pile_id: str) -> None:
+        self._call("recover_pile", pile_id)
+
+    def pause_charging(self, pile_id: str) -> None:
+        self._call("pause_charging", pile_id)
+
+    def end_charging(self, pile_id: str) -> None:
+        self._call("end_charging", pile_id)
+
+    def add_pile(self, pile: Pile) -> None:
+        self._call("add_pile", pile.to_dict())
+
+    def add_piles(self, piles: List[Pile]) -> Optional[dict]:
+        return self._call("add_piles", [pile.to_dict() for pile in piles])
+
+    def remove_pile(self, pile_id: str, requeue_current: bool = True) -> bool:
+        return bool(self._call("remove_pile", pile_id, requeue_current))
+
+    def update_pile(self, pile_id: str, max_kw: Optional[float] = None,
+                    pile_type: Optional[str] = None, queue_len: Optional[int] = None) -> Optional[Pile]:
+        data = self._call("update_pile", pile_id, max_kw,
+                          PileType(pile_type).value if pile_type else None, queue_len)
+        return Pile.from_dict(data) if data else None
+
+    def set_policy(self, name: str):
+        """按名称切换调度策略：本节点立即生效（成为主节点后沿用），并转发给当前主节点"""
+        previous = core.set_policy(name)
+        if not self.is_leader:
+            self._call("set_policy", name)
+        return previous
+
+    def get_policy(self):
+        return core.get_policy()
+
+    # ---------------- 读操作：主节点读本地，其余节点读共享快照 ----------------
+    def _view(self) -> _View:
+        """从节点视图：快照版本号不变时复用上次解码的结果"""
+        version = self.shared.snapshot_version()
+        cached_version, view = self._view_cache
+        if view is None or version != cached_version:
+            view = _View(self.shared.load_snapshot() or {})
+            self._view_cache = (version, view)
+        return view
+
+    def get_all_piles(self) -> List[Pile]:
+        if self.is_leader:
+            return core.get_all_piles()
+        return self._view().piles
+
+    def get_waiting_list(self, ptype: str, n: int = 20, offset: int = 0) -> List[ChargeRequest]:
+        if self.is_leader:
+            return core.get_waiting_list(ptype, n, offset)
+        queue = self._view().queues.get(ptype, [])
+        return queue[offset:] if n < 0 else queue[offset:offset + n]
+
+    def get_queue_length(self, ptype: str) -> int:
+        if self.is_leader:
+            return core.get_queue_length(ptype)
+        return len(self._view().queues.get(ptype, []))
+
+    def get_queue_kwh(self, ptype: str) -> float:
+        if self.is_leader:
+            return core.get_queue_kwh(ptype)
+        return self._view().kwh.get(ptype, 0.0)
+
+    def get_queue_position(self, req_id: str) -> Optional[Tuple[str, int]]:
+        if self.is_leader:
+            return core.get_queue_position(req_id)
+        return self._view().positions.get(req_id)
+
+    def get_preassigned_position(self, req_id: str) -> Optional[Tuple[str, int]]:
+        if self.is_leader:
+            return core.get_preassigned_position(req_id)
+        return self._view().preassigned.get(req_id)
+
+    def get_charging_pile(self, req_id: str) -> Optional[str]:
+        if self.is_leader:
+            return core.get_charging_pile(req_id)
+        return self._view().charging.get(req_id)
+
+    def get_queue_capacity(self, ptype: str, slots_per_pile: int = 1) -> int:
+        if self.is_leader:
+            return core.get_queue_capacity(ptype, slots_per_pile)
+        view = self._view()
+        usable = [p for p in view.piles if p.type == ptype and p.status != PileStatus.FAULT]
+        occupied = sum(1 for p in usable if p.current_req_id) + sum(len(p.queue) for p in usable)
+        return max(0, len(usable) * slots_per_pile - occupied - len(view.queues.get(ptype, [])))
+
+    def get_fault_recovery_stats(self) -> dict:
+        """主节点返回本地统计；其余节点只能从共享快照统计等待重新调度的请求数"""
+        if self.is_leader:
+            return core.get_fault_recovery_stats()
+        view = self._view()
+        pending = sum(1 for reqs in view.queues.values() for req in reqs if req.redispatched)
+        pending += sum(1 for p in view.piles for req in p.queue if req.faulted_at is not None)
+        return {"pending": pending, "recovered": 0, "mean_seconds": 0.0, "max_seconds": 0.0}
+
+    def estimate_finish_time(self, pile_id: str):
+        for p in self.get_all_piles():
+            if p.pile_id == pile_id:
+                return p.estimated_end or clock.utcnow()
+        raise KeyError(pile_id)
+
+    # ---------------- 事件 ----------------
+    def pop_events(self) -> List[dict]:
+        return [_decode_event(e) for e in self.shared.pop_events()]
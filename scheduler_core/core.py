@@ -5,7 +5,8 @@ from __future__ import annotations
 from datetime import datetime, timedelta
 import threading
 import time
-from typing import List, Optional
+from collections import deque
+from typing import Deque, List, Optional, Tuple
 
 from .models import (
     PileType,
@@ -14,11 +15,11 @@ from .models import (
     ChargeRequest,
     DispatchResult,
 )
-from . import store
+from . import clock, policies, store
 
 # ------------- 排队号 ------------------------------------------------
 def generate_queue_number(pile_type: str) -> str:
-    today = datetime.utcnow().strftime("%Y%m%d")
+    today = clock.utcnow().strftime("%Y%m%d")
     idx   = store.inc_counter(today, pile_type)
     return f"{pile_type}{today}{idx:06d}"
 
@@ -33,94 +34,446 @@ def fetch_next_request(ptype: str) -> Optional[ChargeRequest]:
     return store.pop_queue(ptype)
 
 
-def get_waiting_list(ptype: str, n: int = 20) -> List[ChargeRequest]:
-    return store.peek_queue(ptype, n)
+def cancel_request(req_id: str) -> bool:
+    """
+    从等候队列（O(1) 墓碑删除）或充电桩本地队列中摘除请求，被摘除的请求不会再被调度。
+    返回 False 表示请求已不在队列中（可能已开始充电）。
+    """
+    req = store.remove_from_queue(req_id)
+    if req is None:
+        with _assign_lock:
+            pile = store.find_preassigned(req_id)
+            if pile is None:
+                return False
+            req = _take_preassigned(pile, req_id)
+    store.push_event({"type": "queue_update", "data": req.pile_type})
+    return True
+
+
+def update_request(req_id: str, kwh: Optional[float] = None,
+                   pile_type: Optional[str] = None) -> Optional[ChargeRequest]:
+    """
+    修改排队中的请求（电量 / 桩类型），不出队、不丢失排队次序。
+    换类型时重新生成对应类型的排队号。返回修改后的请求；不在队列中返回 None。
+    """
+    queue_no = None
+    if pile_type is not None:
+        pile_type = PileType(pile_type).value
+        current = store.queue_position(req_id)
+        if current and current[0] != pile_type:
+            queue_no = generate_queue_number(pile_type)
+    req = store.update_queued(req_id, kwh=kwh, pile_type=pile_type, queue_no=queue_no)
+    if req is None:
+        req = _update_preassigned(req_id, kwh, pile_type)
+    if req is not None:
+        store.push_event({"type": "queue_update", "data": req.pile_type})
+    return req
+
+
+def _update_preassigned(req_id: str, kwh: Optional[float],
+                        pile_type: Optional[str]) -> Optional[ChargeRequest]:
+    """修改已预分配到充电桩本地队列的请求；换类型时退回目标类型的等候队列末尾"""
+    with _assign_lock, store.atomic():
+        pile = store.find_preassigned(req_id)
+        if pile is None:
+            return None
+        if pile_type is not None and pile_type != PileType(pile.type).value:
+            req = _take_preassigned(pile, req_id)
+            req.pile_type = PileType(pile_type)
+            req.queue_no = generate_queue_number(pile_type)
+            if kwh is not None:
+                req.kwh = kwh
+            store.push_queue(req)
+            return req
+        req = next(r for r in pile.queue if r.req_id == req_id)
+        if kwh is not None:
+            req.kwh = kwh
+            store.save_pile(pile)
+        return req
+
+
+def _take_preassigned(pile: Pile, req_id: str) -> ChargeRequest:
+    """持 _assign_lock 调用：从充电桩本地队列中取出请求"""
+    index = next(i for i, r in enumerate(pile.queue) if r.req_id == req_id)
+    req = pile.queue.pop(index)
+    store.save_pile(pile)
+    return req
+
+
+def get_waiting_list(ptype: str, n: int = 20, offset: int = 0) -> List[ChargeRequest]:
+    """跳过前 offset 个后的 n 个请求（n < 0 返回其后全部），用于分页读取长队列"""
+    return store.peek_queue(ptype, n, offset)
+
+
+def get_queue_length(ptype: str) -> int:
+    return store.queue_len(ptype)
+
+
+def get_queue_kwh(ptype: str) -> float:
+    """等候队列中请求电量之和（由队列随入队 / 出队 / 修改维护，不遍历队列）"""
+    return store.queue_kwh(ptype)
+
+
+def get_queue_position(req_id: str) -> Optional[Tuple[str, int]]:
+    """
+    按 req_id 查询等候队列中的位置 -> (pile_type, position)，O(log n)；
+    不在等候队列中（已预分配或已开始充电）返回 None，与 get_queue_length 的口径一致。
+    """
+    return store.queue_position(req_id)
+
+
+def get_preassigned_position(req_id: str) -> Optional[Tuple[str, int]]:
+    """已预分配到充电桩本地队列的请求 -> (pile_id, 在本地队列中的位置)，其它情况返回 None"""
+    pile = store.find_preassigned(req_id)
+    if pile is None:
+        return None
+    position = next((i for i, r in enumerate(pile.queue, start=1) if r.req_id == req_id), None)
+    return (pile.pile_id, position) if position else None
+
+
+def get_charging_pile(req_id: str) -> Optional[str]:
+    """正在为该请求充电的充电桩编号"""
+    pile = store.find_charging(req_id)
+    return pile.pile_id if pile else None
 
 
 # ------------- 调度 --------------------------------------------------
 _assign_lock = threading.Lock()          # 确保调度 + 故障互斥
+_policy: policies.SchedulingPolicy = policies.FifoPolicy()
 
 
-def _eta(pile: Pile, req: ChargeRequest) -> float:
-    now = datetime.utcnow()
-    remained = (
-        max((pile.estimated_end - now).total_seconds(), 0)
-        if pile.estimated_end
-        else 0
-    )
-    this_job = req.kwh / pile.max_kw * 3600
-    return remained + this_job
+def set_policy(policy) -> policies.SchedulingPolicy:
+    """切换调度策略（策略对象或内置策略名），返回之前的策略"""
+    global _policy
+    if isinstance(policy, str):
+        policy = policies.create(policy)
+    with _assign_lock:
+        previous, _policy = _policy, policy
+    store.push_event({"type": "policy_changed", "data": policy.name})
+    return previous
+
+
+def get_policy() -> policies.SchedulingPolicy:
+    return _policy
+
+
+def get_queue_capacity(ptype: str, slots_per_pile: int = 1) -> int:
+    """引擎还能接收的该类型请求数（每桩 slots_per_pile 个位置，含正在充电的一个和本地队列）"""
+    return store.free_slots(ptype, slots_per_pile)
 
 
 def assign_request(req: ChargeRequest) -> Optional[DispatchResult]:
     """
-    最短完成时间算法：找 ETA 最小的空闲桩，原子更新状态并返回调度结果。
+    按当前策略为请求选桩（默认累计 ETA 最小的有空位的桩），原子更新状态并返回调度结果。
     """
     with _assign_lock:
-        cands = [p for p in store.all_piles(req.pile_type) if p.status == PileStatus.IDLE]
-        if not cands:
+        return _assign_locked(req)
+
+
+def _assign_locked(req: ChargeRequest, chosen: Optional[Pile] = None) -> Optional[DispatchResult]:
+    now = clock.utcnow()
+    if chosen is None:
+        chosen = _policy.choose_pile(req, store.all_piles(req.pile_type), now)
+        if chosen is None:
             return None
+    if chosen.status != PileStatus.IDLE:
+        return _preassign_locked(req, chosen, now)
+    return _start_locked(req, chosen, now)
+
+
+def _preassign_locked(req: ChargeRequest, pile: Pile, now: datetime) -> DispatchResult:
+    """放入忙碌充电桩的本地队列，当前充电结束时由 end_charging 直接接续"""
+    start = now + timedelta(seconds=pile.backlog_seconds(now))
+    pile.queue.append(req)
+    store.save_pile(pile)
+
+    result = DispatchResult(
+        req_id=req.req_id,
+        pile_id=pile.pile_id,
+        queue_no=req.queue_no,
+        start_time=start,
+        estimated_end=start + timedelta(hours=req.kwh / pile.max_kw),
+        position=len(pile.queue),
+    )
+    store.push_event({"type": "pre_assign", "data": result})
+    return result
+
+
+def _start_locked(req: ChargeRequest, chosen: Pile, now: datetime) -> DispatchResult:
+    finish = now + timedelta(hours=req.kwh / chosen.max_kw)
+
+    # 更新桩状态
+    chosen.status = PileStatus.BUSY
+    chosen.current_req_id = req.req_id
+    chosen.current = req
+    chosen.estimated_end  = finish
+    if req.faulted_at is not None:
+        _record_recovery(req, chosen, now)
+    store.save_pile(chosen)
+
+    result = DispatchResult(
+        req_id=req.req_id,
+        pile_id=chosen.pile_id,
+        queue_no=req.queue_no,
+        start_time=now,
+        estimated_end=finish,
+    )
+    store.push_event({"type": "dispatch", "data": result})
+    return result
 
-        chosen = min(cands, key=lambda p: _eta(p, req))
-        now    = datetime.utcnow()
-        finish = now + timedelta(hours=req.kwh / chosen.max_kw)
-
-        # 更新桩状态
-        chosen.status = PileStatus.BUSY
-        chosen.current_req_id = req.req_id
-        chosen.estimated_end  = finish
-
-        result = DispatchResult(
-            req_id=req.req_id,
-            pile_id=chosen.pile_id,
-            queue_no=req.queue_no,
-            start_time=now,
-            estimated_end=finish,
-        )
-        store.push_event({"type": "dispatch", "data": result})
-        return result
+
+def dispatch_next(ptype: str) -> Optional[DispatchResult]:
+    """
+    有空位的桩（空闲，或本地队列未满）时由当前策略从队首窗口中选出 (请求, 桩)：
+    空闲桩立即开始充电，忙碌桩预分配到本地队列。选定后才出队，避免取出后无桩可用而丢失请求。
+    队首有故障转移的请求时只在这些请求中选择。
+    """
+    with _assign_lock:
+        piles = store.all_piles(ptype)
+        if not any(p.has_room() for p in piles):
+            return None
+        # 出队与占桩作为一条日志记录，崩溃恢复时不会出现"已出队却未上桩"
+        with store.atomic():
+            window = store.peek_queue(ptype, _policy.window)
+            if not window:
+                return None
+            if window[0].redispatched:
+                # 故障转移的请求都在队首：先于普通请求服务，策略只在它们之间选择
+                window = [req for req in window if req.redispatched]
+            choice = _policy.select(window, piles, clock.utcnow())
+            if choice is None:
+                return None
+            req, pile = choice
+            store.remove_from_queue(req.req_id)
+            return _assign_locked(req, pile)
 
 
 def estimate_finish_time(pile_id: str) -> datetime:
-    return store._piles[pile_id].estimated_end or datetime.utcnow()
+    return store._piles[pile_id].estimated_end or clock.utcnow()
 
 
 # ------------- 故障 --------------------------------------------------
+_recoveries: Deque[float] = deque(maxlen=1000)     # 最近的故障恢复时长（秒）：中断 -> 在其它桩重新开始充电
+
+
 def mark_fault(pile_id: str) -> None:
-    with _assign_lock:
+    """
+    充电桩故障：正在充电的请求按剩余电量、本地队列中的请求原样转入优先重调度队列，
+    保留原排队号、用户与到达时间，排在同类型普通请求之前；随即整体分配到其余可用的充电桩上。
+    """
+    with _assign_lock, store.atomic():
         p = store._piles[pile_id]
         p.status = PileStatus.FAULT
         store.push_event({"type": "pile_fault", "data": pile_id})
+        _release_locked(p, clock.utcnow())
+
+
+def _release_locked(p: Pile, now: datetime, requeue_current: bool = True) -> None:
+    """持 _assign_lock 调用：清空已停用充电桩上的请求，转入优先重调度队列并立即重新分配"""
+    interrupted = []
+    if p.current_req_id and requeue_current:
+        req = _remaining_request(p, now)
+        if req is not None:
+            interrupted.append(req)
+    interrupted.extend(p.queue)
+    p.current_req_id = None
+    p.current = None
+    p.estimated_end = None
+    p.queue = []
+    store.save_pile(p)
+
+    for req in interrupted:
+        req.redispatched = True
+        req.faulted_at = now
+        store.push_queue(req)
+    if interrupted:
+        store.push_event({"type": "queue_update", "data": PileType(p.type).value})
+        _redispatch_locked(PileType(p.type).value, now)
+
+
+def _remaining_request(p: Pile, now: datetime) -> Optional[ChargeRequest]:
+    """故障桩上正在充电的请求，电量改为尚未充入的部分；已充满（只差结束事件）时返回 None"""
+    remaining = max((p.estimated_end - now).total_seconds(), 0) / 3600 * p.max_kw if p.estimated_end else 0.0
+    if remaining <= 0:
+        return None
+    req = p.current
+    if req is None:
+        # 旧版本快照中没有正在充电的请求，只能按剩余时长重建
+        return ChargeRequest(
+            req_id     = p.current_req_id,
+            queue_no   = generate_queue_number(p.type),
+            user_id    = "SYSTEM",
+            pile_type  = p.type,
+            kwh        = round(remaining, 4),
+        )
+    req.kwh = round(min(req.kwh, remaining), 4)
+    return req
 
-        # 把正在充电的任务放回队列
-        if p.current_req_id:
-            req = ChargeRequest(
-                req_id     = p.current_req_id,
-                queue_no   = generate_queue_number(p.type),
-                user_id    = "SYSTEM",
-                pile_type  = p.type,
-                kwh        = 0,
-            )
-            enqueue_request(req)
-            p.current_req_id = None
-            p.estimated_end  = None
+
+def _redispatch_locked(ptype: str, now: datetime) -> List[DispatchResult]:
+    """
+    持 _assign_lock 调用：把队首全部故障转移请求按批量排程（完成时间之和最小）分到有空位的充电桩，
+    每台桩按排程顺序占满空闲位置与本地队列，放不下的留在队首等下一轮调度。
+    """
+    pending = store.peek_redispatched(ptype)
+    piles = [p for p in store.all_piles(ptype) if p.has_room()]
+    if not pending or not piles:
+        return []
+    results = []
+    plan = policies.BatchOptimalPolicy(window=len(pending)).plan(pending, piles, now)
+    for pile in piles:
+        for req in plan[pile.pile_id]:
+            if not pile.has_room():
+                break
+            store.remove_from_queue(req.req_id)
+            results.append(_assign_locked(req, pile))
+    return results
+
+
+def _record_recovery(req: ChargeRequest, pile: Pile, now: datetime) -> None:
+    seconds = (now - req.faulted_at).total_seconds()
+    req.faulted_at = None
+    _recoveries.append(seconds)
+    store.push_event({"type": "fault_recovered",
+                      "data": {"req_id": req.req_id, "pile_id": pile.pile_id, "seconds": seconds}})
+
+
+def get_fault_recovery_stats() -> dict:
+    """故障转移统计：等待重新调度的请求数，以及最近恢复的次数与平均 / 最长恢复时长（秒）"""
+    pending = sum(len(store.peek_redispatched(t.value)) for t in PileType)
+    pending += sum(1 for p in get_all_piles() for req in p.queue if req.faulted_at is not None)
+    recoveries = list(_recoveries)
+    return {
+        "pending": pending,
+        "recovered": len(recoveries),
+        "mean_seconds": round(sum(recoveries) / len(recoveries), 3) if recoveries else 0.0,
+        "max_seconds": round(max(recoveries), 3) if recoveries else 0.0,
+    }
 
 
 def recover_pile(pile_id: str) -> None:
     p = store._piles[pile_id]
     p.status = PileStatus.IDLE
+    store.save_pile(p)
     store.push_event({"type": "pile_recover", "data": pile_id})
 
 
+# ------------- 充电桩管理 --------------------------------------------
+def add_piles(piles: List[Pile]) -> dict:
+    """
+    批量注册充电桩：整批只加一次锁、写一条日志记录。未注册的直接加入；已注册的只更新
+    功率 / 类型 / 本地队列容量，保留运行状态（正在充电的请求、本地队列、故障状态）。
+    返回 {"added": [pile_id...], "updated": [pile_id...]}；任何一台不能更新时整批不生效。
+    """
+    with _assign_lock, store.atomic():
+        existing = {pile.pile_id: store.get_pile(pile.pile_id) for pile in piles}
+        for pile in piles:
+            if existing[pile.pile_id] is not None:
+                _check_reconfigure(existing[pile.pile_id], pile.type)
+
+        now = clock.utcnow()
+        added = [pile for pile in piles if existing[pile.pile_id] is None]
+        updated = [pile for pile in piles if existing[pile.pile_id] is not None]
+        if added:
+            store.add_piles(added)
+        for pile in updated:
+            _reconfigure_locked(existing[pile.pile_id], pile.max_kw, pile.type, pile.queue_len, now)
+        if added:
+            store.push_event({"type": "piles_added", "data": [pile.pile_id for pile in added]})
+        return {"added": [pile.pile_id for pile in added], "updated": [pile.pile_id for pile in updated]}
+
+
+def remove_pile(pile_id: str, requeue_current: bool = True) -> bool:
+    """
+    注销充电桩：本地队列中的请求（requeue_current 时连同正在充电请求的剩余电量）
+    与故障时一样优先转给其余充电桩。返回 False 表示充电桩未注册。
+    """
+    with _assign_lock, store.atomic():
+        p = store.get_pile(pile_id)
+        if p is None:
+            return False
+        p.status = PileStatus.FAULT         # 不再参与本次重新分配
+        _release_locked(p, clock.utcnow(), requeue_current)
+        store.remove_pile(pile_id)
+        store.push_event({"type": "pile_removed", "data": pile_id})
+        return True
+
+
+def update_pile(pile_id: str, max_kw: Optional[float] = None, pile_type: Optional[str] = None,
+                queue_len: Optional[int] = None) -> Pile:
+    """
+    热更新充电桩配置。改功率时正在充电的请求按剩余电量重算预计结束时间；
+    有请求在充电或预分配时不能改类型（ValueError），未注册抛 KeyError。
+    """
+    with _assign_lock, store.atomic():
+        p = store.get_pile(pile_id)
+        if p is None:
+            raise KeyError(pile_id)
+        _check_reconfigure(p, pile_type)
+        _reconfigure_locked(p, max_kw, pile_type, queue_len, clock.utcnow())
+        return p
+
+
+def _check_reconfigure(p: Pile, pile_type: Optional[str]) -> None:
+    if pile_type is not None and PileType(pile_type) != PileType(p.type) and (p.current_req_id or p.queue):
+        raise ValueError(f"充电桩 {p.pile_id} 上有正在充电或预分配的请求，不能修改类型")
+
+
+def _reconfigure_locked(p: Pile, max_kw: Optional[float], pile_type: Optional[str],
+                        queue_len: Optional[int], now: datetime) -> None:
+    """持 _assign_lock 调用（已通过 _check_reconfigure），配置没有变化时不写日志"""
+    changed = False
+    if max_kw is not None and max_kw != p.max_kw:
+        if p.estimated_end and p.status == PileStatus.BUSY:
+            remaining = max((p.estimated_end - now).total_seconds(), 0) / 3600 * p.max_kw
+            p.estimated_end = now + timedelta(hours=remaining / max_kw)
+        p.max_kw = max_kw
+        changed = True
+    if queue_len is not None and queue_len != p.queue_len:
+        p.queue_len = queue_len          # 调小时已预分配的请求保留，排完后不再接收
+        changed = True
+    if pile_type is not None and PileType(pile_type) != PileType(p.type):
+        p.type = PileType(pile_type)
+        changed = True
+    if changed:
+        store.add_pile(p)                # 类型变化时同时迁移类型索引
+        store.push_event({"type": "pile_updated", "data": p.pile_id})
+
+
+# ------------- 持久化 -----------------------------------------------
+def enable_persistence(directory: str, fsync_interval: float = 0.05,
+                       snapshot_every: int = 1000) -> dict:
+    """
+    开启预写日志：先从 directory 中的快照 + 日志重建队列 / 充电桩 / 计数器，
+    之后的每次变更都追加到日志。返回恢复信息。
+    """
+    from .wal import WriteAheadLog
+
+    started = time.perf_counter()
+    wal = WriteAheadLog(directory, fsync_interval=fsync_interval, snapshot_every=snapshot_every)
+    replayed = store.enable_wal(wal)
+    piles = get_all_piles()
+    return {
+        "recovered": bool(piles),
+        "replayed_records": replayed,
+        "piles": len(piles),
+        "queued": sum(store.queue_len(t.value) for t in PileType),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def disable_persistence() -> None:
+    store.disable_wal()
+
+
 # ------------- 后台循环 ---------------------------------------------
 _stop_flag = threading.Event()
 
 def _loop(interval: float = 0.5) -> None:
     while not _stop_flag.is_set():
         for tp in (PileType.D.value, PileType.A.value):
-            req = fetch_next_request(tp)
-            if req:
-                assign_request(req)
+            while dispatch_next(tp):
+                pass
         time.sleep(interval)
 
 
@@ -148,20 +501,25 @@ def pause_charging(pile_id: str) -> None:
             return
         if pile.status == PileStatus.BUSY:
             pile.status = PileStatus.PAUSED
+            store.save_pile(pile)
             store.push_event({"type": "charging_paused", "data": pile_id})
 
 
 def end_charging(pile_id: str) -> None:
-    """手动结束充电，置为 IDLE，清空任务"""
-    with _assign_lock:
+    """结束充电，置为 IDLE；本地队列中有预分配的请求时立即接续充电，不等下一轮调度"""
+    with _assign_lock, store.atomic():
         pile = store._piles.get(pile_id)
         if not pile:
             return
         if pile.status in [PileStatus.BUSY, PileStatus.PAUSED]:
             pile.status = PileStatus.IDLE
             pile.current_req_id = None
+            pile.current = None
             pile.estimated_end = None
+            store.save_pile(pile)
             store.push_event({"type": "charging_end", "data": pile_id})
+            if pile.queue:
+                _start_locked(pile.queue.pop(0), pile, clock.utcnow())
 
 def get_all_piles() -> list:
     """
@@ -0,0 +1,201 @@
+"""
+带 ID 索引的 FIFO 队列 —— 单调递增票号 + 头指针。
+
+入队 / 出队 / 按 req_id 删除均摊 O(1) ~ O(log n)，定位与按偏移量读取 O(log n)，不需要遍历整个队列。
+删除只留下墓碑（票号仍在 _tickets 中），墓碑按 _tickets 下标记在树状数组里，出队时跳过，
+墓碑过多时整体压缩。非线程安全，由 store 层的锁保护。
+"""
+from __future__ import annotations
+from bisect import bisect_left, insort
+from itertools import count
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .models import ChargeRequest
+
+# 已出队前缀 / 墓碑超过该数量且占一半以上时才真正压缩，避免频繁搬移
+_COMPACT_MIN = 64
+
+# 按票号插队时，插入点前至多这么多个请求整体左移一格；再远则整体重建
+_SHIFT_MAX = 64
+
+
+class _Tombstones:
+    """按下标记录墓碑的树状数组：前缀墓碑数、第 k 个非墓碑下标都是 O(log n)"""
+
+    def __init__(self, flags: Iterable[bool] = ()) -> None:
+        tree = [0] + [int(flag) for flag in flags]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def append(self) -> None:
+        """末尾追加一个非墓碑下标"""
+        i = len(self._tree)
+        self._tree.append(self.count(i - 1) - self.count(i - (i & -i)))
+
+    def add(self, slot: int, delta: int) -> None:
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def count(self, slot: int) -> int:
+        """下标 < slot 的墓碑数"""
+        total = 0
+        while slot > 0:
+            total += self._tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def is_set(self, slot: int) -> bool:
+        return self.count(slot + 1) - self.count(slot) > 0
+
+    def live_slot(self, k: int) -> int:
+        """从下标 0 起第 k 个（从 0 计）非墓碑下标；不足 k + 1 个时返回总长度"""
+        pos, step = 0, 1 << len(self._tree).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and step - self._tree[nxt] <= k:
+                pos = nxt
+                k -= step - self._tree[nxt]
+            step >>= 1
+        return pos
+
+
+class IndexedQueue:
+    def __init__(self, tickets: Optional[Iterator[int]] = None) -> None:
+        """tickets: 票号发生器；多个队列共享同一个发生器时票号全局有序，可跨队列保序迁移"""
+        self._tickets: List[int] = []             # 票号，[_head:] 为有效段且升序
+        self._head = 0
+        self._items: Dict[int, ChargeRequest] = {}   # 票号 -> 请求
+        self._index: Dict[str, int] = {}             # req_id -> 票号
+        self._dead = _Tombstones()                   # 按 _tickets 下标标记墓碑
+        self._dead_count = 0                         # 有效段内的墓碑数
+        self._kwh = 0.0                              # 队列中请求电量之和
+        self._ticket_source = tickets if tickets is not None else count()
+
+    # ---------------- 基本操作 ----------------
+    def append(self, req: ChargeRequest, ticket: Optional[int] = None) -> int:
+        """入队；指定 ticket 时按票号插入到对应次序（用于跨队列迁移 / 故障请求优先）"""
+        if ticket is None:
+            ticket = next(self._ticket_source)
+        self._items[ticket] = req
+        self._index[req.req_id] = ticket
+        self._kwh += req.kwh
+        if not self._tickets or ticket > self._tickets[-1]:
+            self._tickets.append(ticket)
+            self._dead.append()
+        else:
+            self._insert(ticket)
+        return ticket
+
+    def popleft(self) -> Optional[ChargeRequest]:
+        while self._head < len(self._tickets):
+            ticket = self._tickets[self._head]
+            self._head += 1
+            req = self._items.pop(ticket, None)
+            if req is None:                  # 墓碑
+                self._dead_count -= 1
+                continue
+            del self._index[req.req_id]
+            self._take_kwh(req)
+            self._maybe_compact()
+            return req
+        return None
+
+    def remove(self, req_id: str) -> Optional[ChargeRequest]:
+        """按 req_id 删除（惰性墓碑），不存在返回 None"""
+        ticket = self._index.pop(req_id, None)
+        if ticket is None:
+            return None
+        req = self._items.pop(ticket)
+        self._take_kwh(req)
+        self._dead.add(bisect_left(self._tickets, ticket, lo=self._head), 1)
+        self._dead_count += 1
+        self._maybe_compact()
+        return req
+
+    def peek(self, n: int = -1, offset: int = 0) -> List[ChargeRequest]:
+        """跳过前 offset 个后的 n 个请求；n < 0 返回其后全部。定位起点 O(log n)"""
+        out: List[ChargeRequest] = []
+        i = self._dead.live_slot(self._head - self._dead.count(self._head) + offset)
+        while i < len(self._tickets) and (n < 0 or len(out) < n):
+            req = self._items.get(self._tickets[i])
+            if req is not None:
+                out.append(req)
+            i += 1
+        return out
+
+    def set_kwh(self, req_id: str, kwh: float) -> None:
+        """修改排队中请求的电量，同步维护电量之和"""
+        req = self.get(req_id)
+        self._kwh += kwh - req.kwh
+        req.kwh = kwh
+
+    @property
+    def total_kwh(self) -> float:
+        return round(self._kwh, 4)
+
+    # ---------------- 索引查询 ----------------
+    def get(self, req_id: str) -> Optional[ChargeRequest]:
+        ticket = self._index.get(req_id)
+        return self._items[ticket] if ticket is not None else None
+
+    def ticket_of(self, req_id: str) -> Optional[int]:
+        return self._index.get(req_id)
+
+    def position(self, req_id: str) -> Optional[int]:
+        """从 1 开始的排队位置，不在队列中返回 None"""
+        ticket = self._index.get(req_id)
+        if ticket is None:
+            return None
+        slot = bisect_left(self._tickets, ticket, lo=self._head)
+        dead_ahead = self._dead.count(slot) - self._dead.count(self._head)
+        return slot - self._head - dead_ahead + 1
+
+    # ---------------- 内部 ----------------
+    def _insert(self, ticket: int) -> None:
+        """按票号插入有效段中间：插入点离队首不远时把前面几个下标左移一格，借用已出队的位置"""
+        slot = bisect_left(self._tickets, ticket, lo=self._head)
+        if self._head == 0 or slot - self._head > _SHIFT_MAX:
+            insort(self._tickets, ticket, lo=self._head)
+            self._rebuild()
+            return
+        for i in range(self._head, slot):
+            self._tickets[i - 1] = self._tickets[i]
+            self._set_dead(i - 1, self._dead.is_set(i))
+        self._tickets[slot - 1] = ticket
+        self._set_dead(slot - 1, False)
+        self._head -= 1
+
+    def _take_kwh(self, req: ChargeRequest) -> None:
+        # 队列取空时归零，避免浮点累加误差长期残留
+        self._kwh = self._kwh - req.kwh if self._items else 0.0
+
+    def _set_dead(self, slot: int, dead: bool) -> None:
+        delta = int(dead) - int(self._dead.is_set(slot))
+        if delta:
+            self._dead.add(slot, delta)
+
+    def _rebuild(self) -> None:
+        """丢掉已出队前缀与墓碑，重建下标"""
+        self._tickets = [t for t in self._tickets[self._head:] if t in self._items]
+        self._head = 0
+        self._dead = _Tombstones([False] * len(self._tickets))
+        self._dead_count = 0
+
+    def _maybe_compact(self) -> None:
+        garbage = self._head + self._dead_count
+        if garbage >= _COMPACT_MIN and garbage * 2 >= len(self._tickets):
+            self._rebuild()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, req_id: object) -> bool:
+        return req_id in self._index
+
+    def __iter__(self) -> Iterator[ChargeRequest]:
+        return iter(self.peek())
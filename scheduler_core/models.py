@@ -2,7 +2,9 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
+
+from . import clock
 
 
 class PileType(str, Enum):
@@ -17,6 +19,14 @@ class PileStatus(str, Enum):
     PAUSED = "PAUSED"
 
 
+def _dt_out(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _dt_in(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
 @dataclass
 class Pile:
     pile_id: str
@@ -25,6 +35,47 @@ class Pile:
     status: PileStatus = PileStatus.IDLE
     current_req_id: Optional[str] = None
     estimated_end: Optional[datetime] = None
+    queue_len: int = 0                  # 本地队列容量（正在充电的之外还可预分配的请求数）
+    queue: List["ChargeRequest"] = field(default_factory=list)   # 已预分配、等待本桩的请求
+    current: Optional["ChargeRequest"] = None   # 正在充电的请求（故障时据此转移剩余电量）
+
+    def has_room(self) -> bool:
+        """空闲，或正在充电且本地队列未满"""
+        if self.status == PileStatus.IDLE:
+            return True
+        return self.status == PileStatus.BUSY and len(self.queue) < self.queue_len
+
+    def backlog_seconds(self, now: datetime) -> float:
+        """本桩剩余工作量（秒）：正在充电的剩余时长 + 本地队列中请求的充电时长"""
+        remained = max((self.estimated_end - now).total_seconds(), 0) if self.estimated_end else 0
+        return remained + sum(req.kwh for req in self.queue) / self.max_kw * 3600
+
+    def to_dict(self) -> dict:
+        return {
+            "pile_id": self.pile_id,
+            "type": PileType(self.type).value,
+            "max_kw": self.max_kw,
+            "status": PileStatus(self.status).value,
+            "current_req_id": self.current_req_id,
+            "estimated_end": _dt_out(self.estimated_end),
+            "queue_len": self.queue_len,
+            "queue": [req.to_dict() for req in self.queue],
+            "current": self.current.to_dict() if self.current else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Pile":
+        return cls(
+            pile_id=d["pile_id"],
+            type=PileType(d["type"]),
+            max_kw=float(d["max_kw"]),
+            status=PileStatus(d.get("status", PileStatus.IDLE.value)),
+            current_req_id=d.get("current_req_id"),
+            estimated_end=_dt_in(d.get("estimated_end")),
+            queue_len=int(d.get("queue_len", 0)),
+            queue=[ChargeRequest.from_dict(r) for r in d.get("queue", [])],
+            current=ChargeRequest.from_dict(d["current"]) if d.get("current") else None,
+        )
 
 
 @dataclass
@@ -34,7 +85,34 @@ class ChargeRequest:
     user_id: str
     pile_type: PileType
     kwh: float
-    generated_at: datetime = field(default_factory=datetime.utcnow)
+    generated_at: datetime = field(default_factory=clock.utcnow)
+    redispatched: bool = False          # 充电桩故障后转回队列的请求（排在普通请求之前）
+    faulted_at: Optional[datetime] = None   # 最近一次因故障中断的时间，重新开始充电时统计恢复时长
+
+    def to_dict(self) -> dict:
+        return {
+            "req_id": self.req_id,
+            "queue_no": self.queue_no,
+            "user_id": self.user_id,
+            "pile_type": PileType(self.pile_type).value,
+            "kwh": self.kwh,
+            "generated_at": _dt_out(self.generated_at),
+            "redispatched": self.redispatched,
+            "faulted_at": _dt_out(self.faulted_at),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ChargeRequest":
+        return cls(
+            req_id=d["req_id"],
+            queue_no=d["queue_no"],
+            user_id=d["user_id"],
+            pile_type=PileType(d["pile_type"]),
+            kwh=float(d["kwh"]),
+            generated_at=_dt_in(d.get("generated_at")) or clock.utcnow(),
+            redispatched=d.get("redispatched", False),
+            faulted_at=_dt_in(d.get("faulted_at")),
+        )
 
 
 @dataclass
@@ -44,3 +122,25 @@ class DispatchResult:
     queue_no: str
     start_time: datetime
     estimated_end: datetime
+    position: int = 0                   # 0 表示已开始充电；k 表示预分配在该桩本地队列第 k 位（时间为预计值）
+
+    def to_dict(self) -> dict:
+        return {
+            "req_id": self.req_id,
+            "pile_id": self.pile_id,
+            "queue_no": self.queue_no,
+            "start_time": _dt_out(self.start_time),
+            "estimated_end": _dt_out(self.estimated_end),
+            "position": self.position,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "DispatchResult":
+        return cls(
+            req_id=d["req_id"],
+            pile_id=d["pile_id"],
+            queue_no=d["queue_no"],
+            start_time=_dt_in(d["start_time"]),
+            estimated_end=_dt_in(d["estimated_end"]),
+            position=d.get("position", 0),
+        )
@@ -0,0 +1,161 @@
+"""
+scheduler_core/policies.py
+
+可插拔调度策略：dispatch_next 每次调度时询问当前策略"先服务队首窗口里的哪个请求、上哪台桩"。
+策略只做选择、不修改状态，出队与占桩仍由 core 在同一把锁、同一条日志记录里完成。
+
+内置策略（create(name) 按名称创建，core.set_policy 运行时切换）:
+    fifo            先到先服务，选完成时间最早的空闲桩（默认，即原有行为）
+    sjf             窗口内电量最小的先服务；队首等待超过 max_wait 时优先队首，避免大电量请求饿死
+    batch           把窗口内的请求整体排到各充电桩上，使全部请求的完成时间之和最小，按排程派发
+    fault_priority  故障转移回队列的请求优先，其余交给内层策略（默认 fifo）
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .models import ChargeRequest, Pile, PileStatus
+
+Choice = Tuple[ChargeRequest, Pile]
+
+
+def eta(pile: Pile, req: ChargeRequest, now: datetime) -> float:
+    """请求在该桩上的完成时间（秒）：桩上剩余充电时长 + 本地队列中的请求 + 本次充电时长"""
+    return pile.backlog_seconds(now) + req.kwh / pile.max_kw * 3600
+
+
+class SchedulingPolicy:
+    """调度策略接口
+
+    window 为每次调度查看的队首请求数。select 收到按到达顺序排列的窗口请求和该类型全部充电桩
+    （含忙碌 / 故障），返回 (请求, 有空位的桩)：空闲桩立即开始充电，忙碌桩放入其本地队列；
+    返回 None 表示本轮不调度，请求继续排队。
+    """
+
+    name = "base"
+    window = 1
+
+    def select(self, queue: List[ChargeRequest], piles: List[Pile],
+               now: datetime) -> Optional[Choice]:
+        raise NotImplementedError
+
+    def choose_pile(self, req: ChargeRequest, piles: List[Pile], now: datetime) -> Optional[Pile]:
+        """有空位（空闲或本地队列未满）的桩中完成时间最早的一台"""
+        open_piles = [p for p in piles if p.has_room()]
+        if not open_piles:
+            return None
+        return min(open_piles, key=lambda p: eta(p, req, now))
+
+    def _serve(self, req: ChargeRequest, piles: List[Pile], now: datetime) -> Optional[Choice]:
+        pile = self.choose_pile(req, piles, now)
+        return (req, pile) if pile else None
+
+    def describe(self) -> dict:
+        return {"name": self.name, "window": self.window}
+
+
+class FifoPolicy(SchedulingPolicy):
+    """先到先服务 + 最短完成时间选桩"""
+
+    name = "fifo"
+
+    def select(self, queue, piles, now):
+        return self._serve(queue[0], piles, now) if queue else None
+
+
+class ShortestJobFirstPolicy(SchedulingPolicy):
+    """窗口内电量最小的请求先服务（电量相同按到达顺序），队首等待超过 max_wait 时先服务队首"""
+
+    name = "sjf"
+
+    def __init__(self, window: int = 20, max_wait: timedelta = timedelta(minutes=30)) -> None:
+        self.window = window
+        self.max_wait = max_wait
+
+    def select(self, queue, piles, now):
+        if not queue:
+            return None
+        head = queue[0]
+        if head.generated_at and now - head.generated_at >= self.max_wait:
+            return self._serve(head, piles, now)
+        return self._serve(min(queue, key=lambda r: r.kwh), piles, now)
+
+    def describe(self):
+        return {**super().describe(), "max_wait_minutes": self.max_wait.total_seconds() / 60}
+
+
+class BatchOptimalPolicy(SchedulingPolicy):
+    """窗口内请求整体排程，使完成时间之和最小
+
+    把请求按电量从大到小依次放到"边际代价"最小的位置：放到桩 i 当前序列的最前面，
+    代价为 桩 i 剩余充电时长 + (桩 i 已排请求数 + 1) × 充电时长。
+    所有桩都空闲时这就是 Q||ΣC 的最优解（大请求排在靠后、快桩优先），各桩上最终为短作业优先。
+    各桩的就绪时间包含本地队列中已预分配的请求。排程后有空位的桩上第一个位置的请求即本轮派发的请求；
+    排程认为等满载的快桩更划算时本轮不派发。
+    """
+
+    name = "batch"
+
+    def __init__(self, window: int = 20) -> None:
+        self.window = window
+
+    def plan(self, queue: List[ChargeRequest], piles: List[Pile],
+             now: datetime) -> Dict[str, List[ChargeRequest]]:
+        """返回 {pile_id: 按充电先后排列的请求}"""
+        usable = [p for p in piles if p.status in (PileStatus.IDLE, PileStatus.BUSY)]
+        ready = {p.pile_id: p.backlog_seconds(now) for p in usable}
+        plan: Dict[str, List[ChargeRequest]] = {p.pile_id: [] for p in usable}
+        # 电量相同时后到的先放（排在后面），保持到达顺序
+        ranked = sorted(enumerate(queue), key=lambda item: (item[1].kwh, item[0]), reverse=True)
+        for _, req in ranked:
+            pile = min(usable, key=lambda p: ready[p.pile_id]
+                       + (len(plan[p.pile_id]) + 1) * req.kwh / p.max_kw * 3600)
+            plan[pile.pile_id].insert(0, req)
+        return plan
+
+    def select(self, queue, piles, now):
+        if not queue:
+            return None
+        plan = self.plan(queue, piles, now)
+        order = {req.req_id: i for i, req in enumerate(queue)}
+        choices = [(plan[p.pile_id][0], p) for p in piles
+                   if p.has_room() and plan.get(p.pile_id)]
+        if not choices:
+            return None
+        return min(choices, key=lambda choice: order[choice[0].req_id])
+
+
+class FaultPriorityPolicy(SchedulingPolicy):
+    """故障转移回队列的请求（redispatched）先服务，其余交给内层策略"""
+
+    name = "fault_priority"
+
+    def __init__(self, inner: Optional[SchedulingPolicy] = None, window: int = 50) -> None:
+        self.inner = inner or FifoPolicy()
+        self.window = max(window, self.inner.window)
+
+    def select(self, queue, piles, now):
+        for req in queue:
+            if req.redispatched:
+                return self._serve(req, piles, now)
+        return self.inner.select(queue[:self.inner.window], piles, now)
+
+    def describe(self):
+        return {**super().describe(), "inner": self.inner.describe()}
+
+
+POLICIES = {
+    FifoPolicy.name: FifoPolicy,
+    ShortestJobFirstPolicy.name: ShortestJobFirstPolicy,
+    BatchOptimalPolicy.name: BatchOptimalPolicy,
+    FaultPriorityPolicy.name: FaultPriorityPolicy,
+}
+
+
+def create(name: str, **kwargs) -> SchedulingPolicy:
+    """按名称创建内置策略，未知名称抛 ValueError"""
+    try:
+        return POLICIES[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"未知的调度策略: {name}（可选: {', '.join(POLICIES)}）") from None
@@ -4,27 +4,78 @@
 from __future__ import annotations
 import threading
 from collections import defaultdict, deque
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, Deque, List
+from itertools import count, takewhile
+from typing import Dict, Deque, List, Optional, Tuple
 
-from .models import Pile, ChargeRequest, PileType
+from .models import Pile, ChargeRequest, PileType, PileStatus
+from .indexed_queue import IndexedQueue
 
 _lock = threading.RLock()
 
 # —— 计数器 { (yyyyMMdd, pile_type) : int } ——
 _counters: Dict[tuple[str, str], int] = defaultdict(int)
 
-# —— 等候区 { pile_type : deque[ChargeRequest] } ——
-_queues: Dict[str, Deque[ChargeRequest]] = {
-    "D": deque(),
-    "A": deque(),
+# —— 等候区 { pile_type : IndexedQueue }，共享票号以便跨类型保序迁移 ——
+# 故障转移的请求（redispatched）使用负数票号，排在全部普通请求之前，彼此之间按转入先后
+_tickets = count()
+_priority_tickets = count(-(1 << 62))
+_queues: Dict[str, IndexedQueue] = {
+    "D": IndexedQueue(_tickets),
+    "A": IndexedQueue(_tickets),
 }
 
-# —— 充电桩 { pile_id : Pile } ——
+# —— 充电桩 { pile_id : Pile }，另按类型索引 { pile_type : { pile_id : Pile } } 供调度只扫同类型的桩 ——
 _piles: Dict[str, Pile] = {}
+_piles_by_type: Dict[str, Dict[str, Pile]] = {"D": {}, "A": {}}
+
+# —— 桩上请求索引 { req_id : pile_id }（正在充电与本地队列中的请求），随 save_pile / add_pile 刷新 ——
+_on_pile: Dict[str, str] = {}
+_on_pile_ids: Dict[str, List[str]] = {}     # pile_id -> 上次索引的 req_id，刷新时先撤销
+
+# —— 事件队列 (供测试 / WS 转发)；不设上限，丢掉调度事件会让会话停在排队状态而充电桩已占用 ——
+_events: Deque[dict] = deque()   # append & pop
+
+# —— 预写日志（enable_wal 之后才记录）——
+_wal = None
+_batch: Optional[List[dict]] = None     # atomic() 内收集的记录
+
+
+def _log(record: dict) -> None:
+    """持锁调用：追加一条变更记录，记录数够了顺便触发后台快照"""
+    if _wal is None:
+        return
+    if _batch is not None:
+        _batch.append(record)
+        return
+    _wal.append(record)
+    if _wal.needs_snapshot():
+        # 持锁只导出状态，序列化与落盘在 WAL 的后台线程中完成
+        _wal.start_snapshot(snapshot())
+
+
+@contextmanager
+def atomic():
+    """
+    多步变更作为一条日志记录写入（如 出队 + 占用充电桩），
+    崩溃恢复时要么全部重放、要么全部丢弃。可嵌套。
+    """
+    global _batch
+    with _lock:
+        if _batch is not None:
+            yield
+            return
+        _batch = []
+        try:
+            yield
+        finally:
+            records, _batch = _batch, None
+            if len(records) == 1:
+                _log(records[0])
+            elif records:
+                _log({"op": "batch", "records": records})
 
-# —— 事件队列 (供测试 / WS 转发) ——
-_events: Deque[dict] = deque(maxlen=100)   # append & pop
 
 # -------------------------------------------------
 #                 计数器  +  队列
@@ -32,37 +83,210 @@ _events: Deque[dict] = deque(maxlen=100)   # append & pop
 def inc_counter(date_str: str, ptype: str) -> int:
     with _lock:
         _counters[(date_str, ptype)] += 1
-        return _counters[(date_str, ptype)]
+        n = _counters[(date_str, ptype)]
+        _log({"op": "counter", "date": date_str, "ptype": ptype, "n": n})
+        return n
 
 
 def push_queue(req: ChargeRequest) -> None:
     with _lock:
-        _queues[req.pile_type].append(req)
+        _append_locked(req)
+        _log({"op": "enqueue", "req": req.to_dict()})
+
+
+def _append_locked(req: ChargeRequest) -> None:
+    ticket = next(_priority_tickets) if req.redispatched else None
+    _queues[req.pile_type].append(req, ticket=ticket)
 
 
 def pop_queue(ptype: str) -> ChargeRequest | None:
     with _lock:
         if _queues[ptype]:
-            return _queues[ptype].popleft()
+            req = _queues[ptype].popleft()
+            _log({"op": "remove", "req_id": req.req_id})
+            return req
+        return None
+
+
+def remove_from_queue(req_id: str) -> ChargeRequest | None:
+    with _lock:
+        for q in _queues.values():
+            req = q.remove(req_id)
+            if req is not None:
+                _log({"op": "remove", "req_id": req_id})
+                return req
         return None
 
 
-def peek_queue(ptype: str, n: int) -> List[ChargeRequest]:
+def update_queued(req_id: str, kwh: float | None = None,
+                  pile_type: str | None = None,
+                  queue_no: str | None = None) -> ChargeRequest | None:
+    """
+    原地修改排队中的请求；换类型时沿用原票号插入目标队列，保持先后次序。
+    """
+    with _lock:
+        req = _update_queued_locked(req_id, kwh, pile_type, queue_no)
+        if req is not None:
+            _log({"op": "update", "req_id": req_id, "kwh": kwh,
+                  "pile_type": pile_type, "queue_no": queue_no})
+        return req
+
+
+def _update_queued_locked(req_id, kwh, pile_type, queue_no) -> ChargeRequest | None:
+    for ptype, q in _queues.items():
+        req = q.get(req_id)
+        if req is None:
+            continue
+        if kwh is not None:
+            q.set_kwh(req_id, kwh)
+        if pile_type is not None and pile_type != ptype:
+            ticket = q.ticket_of(req_id)
+            q.remove(req_id)
+            req.pile_type = PileType(pile_type)
+            _queues[pile_type].append(req, ticket=ticket)
+        if queue_no is not None:
+            req.queue_no = queue_no
+        return req
+    return None
+
+
+def peek_queue(ptype: str, n: int, offset: int = 0) -> List[ChargeRequest]:
+    with _lock:
+        return _queues[ptype].peek(n, offset)
+
+
+def peek_redispatched(ptype: str) -> List[ChargeRequest]:
+    """队首连续的故障转移请求（优先票号保证它们都排在普通请求之前）"""
     with _lock:
-        return list(_queues[ptype])[:n]
+        n = 16
+        while True:
+            head = _queues[ptype].peek(n)
+            pending = list(takewhile(lambda req: req.redispatched, head))
+            if len(pending) < n:
+                return pending
+            n *= 2
+
+
+def queue_len(ptype: str) -> int:
+    with _lock:
+        return len(_queues[ptype])
+
+
+def queue_kwh(ptype: str) -> float:
+    """等候队列中请求电量之和，O(1)"""
+    with _lock:
+        return _queues[ptype].total_kwh
+
+
+def queue_position(req_id: str) -> Optional[Tuple[str, int]]:
+    """返回 (pile_type, 从 1 开始的位置)，不在任何队列中返回 None"""
+    with _lock:
+        for ptype, q in _queues.items():
+            pos = q.position(req_id)
+            if pos is not None:
+                return ptype, pos
+        return None
 
 
 # -------------------------------------------------
 #                 充电桩
 # -------------------------------------------------
 def add_pile(pile: Pile) -> None:
+    """注册或整体替换充电桩；类型变化时同时迁移类型索引"""
+    with _lock:
+        _put_pile_locked(pile)
+        _log({"op": "pile", "pile": pile.to_dict()})
+
+
+def add_piles(piles: List[Pile]) -> None:
+    """批量注册充电桩，作为一条日志记录写入"""
+    with _lock:
+        for pile in piles:
+            _put_pile_locked(pile)
+        _log({"op": "piles", "piles": [pile.to_dict() for pile in piles]})
+
+
+def remove_pile(pile_id: str) -> Optional[Pile]:
+    with _lock:
+        pile = _drop_pile_locked(pile_id)
+        if pile is not None:
+            _log({"op": "remove_pile", "pile_id": pile_id})
+        return pile
+
+
+def _put_pile_locked(pile: Pile) -> None:
+    ptype = PileType(pile.type).value
+    for other, piles in _piles_by_type.items():
+        if other != ptype:
+            piles.pop(pile.pile_id, None)     # 类型变化（含原地修改了 type 的同一对象）
+    _piles[pile.pile_id] = pile
+    _piles_by_type[ptype][pile.pile_id] = pile
+    _index_pile_locked(pile)
+
+
+def _drop_pile_locked(pile_id: str) -> Optional[Pile]:
+    pile = _piles.pop(pile_id, None)
+    if pile is not None:
+        del _piles_by_type[PileType(pile.type).value][pile_id]
+        _unindex_pile_locked(pile_id)
+    return pile
+
+
+def _index_pile_locked(pile: Pile) -> None:
+    """按桩上当前的请求刷新 _on_pile（本地队列有界，开销为 O(queue_len)）"""
+    _unindex_pile_locked(pile.pile_id)
+    ids = [req.req_id for req in pile.queue]
+    if pile.current_req_id:
+        ids.append(pile.current_req_id)
+    if ids:
+        _on_pile_ids[pile.pile_id] = ids
+        for req_id in ids:
+            _on_pile[req_id] = pile.pile_id
+
+
+def _unindex_pile_locked(pile_id: str) -> None:
+    for req_id in _on_pile_ids.pop(pile_id, ()):
+        if _on_pile.get(req_id) == pile_id:
+            del _on_pile[req_id]
+
+
+def save_pile(pile: Pile) -> None:
+    """core 直接修改 Pile 对象后调用，把桩的最新状态写入日志并刷新桩上请求索引"""
+    with _lock:
+        _index_pile_locked(pile)
+        _log({"op": "pile", "pile": pile.to_dict()})
+
+
+def get_pile(pile_id: str) -> Optional[Pile]:
+    with _lock:
+        return _piles.get(pile_id)
+
+
+def find_preassigned(req_id: str) -> Optional[Pile]:
+    """本地队列中有该请求的充电桩，O(1)"""
+    with _lock:
+        pile = _piles.get(_on_pile.get(req_id))
+        return pile if pile is not None and pile.current_req_id != req_id else None
+
+
+def find_charging(req_id: str) -> Optional[Pile]:
+    """正在为该请求充电的充电桩，O(1)"""
     with _lock:
-        _piles[pile.pile_id] = pile
+        pile = _piles.get(_on_pile.get(req_id))
+        return pile if pile is not None and pile.current_req_id == req_id else None
 
 
 def all_piles(ptype: str) -> List[Pile]:
     with _lock:
-        return [p for p in _piles.values() if p.type == ptype]
+        return list(_piles_by_type[PileType(ptype).value].values())
+
+
+def free_slots(ptype: str, slots_per_pile: int) -> int:
+    """可用桩位总数 − 占用中的桩 − 本地队列中的请求 − 排队中的请求"""
+    with _lock:
+        usable = [p for p in _piles_by_type[PileType(ptype).value].values() if p.status != PileStatus.FAULT]
+        occupied = sum(1 for p in usable if p.current_req_id) + sum(len(p.queue) for p in usable)
+        return max(0, len(usable) * slots_per_pile - occupied - len(_queues[ptype]))
 
 
 # -------------------------------------------------
@@ -78,3 +302,109 @@ def pop_events() -> List[dict]:
         evts = list(_events)
         _events.clear()
         return evts
+
+
+# -------------------------------------------------
+#                 快照（集群共享 / 主节点切换）
+# -------------------------------------------------
+def snapshot() -> dict:
+    """导出全部引擎状态（可 JSON 序列化，不含事件）"""
+    with _lock:
+        return {
+            "counters": [[d, t, n] for (d, t), n in _counters.items()],
+            "queues": {t: [r.to_dict() for r in q.peek()] for t, q in _queues.items()},
+            "piles": [p.to_dict() for p in _piles.values()],
+        }
+
+
+def restore(data: dict) -> None:
+    """用快照整体替换引擎状态，队列按快照中的先后次序重建"""
+    with _lock:
+        _clear()
+        for d, t, n in data.get("counters", []):
+            _counters[(d, t)] = n
+        for t, reqs in data.get("queues", {}).items():
+            for r in reqs:
+                _append_locked(ChargeRequest.from_dict(r))
+        for p in data.get("piles", []):
+            _put_pile_locked(Pile.from_dict(p))
+        if _wal is not None:
+            _wal.write_snapshot(snapshot())
+
+
+# -------------------------------------------------
+#                 预写日志 / 崩溃恢复
+# -------------------------------------------------
+def _apply(record: dict) -> None:
+    """重放一条日志记录（不再写日志）"""
+    op = record["op"]
+    if op == "batch":
+        for sub in record["records"]:
+            _apply(sub)
+    elif op == "counter":
+        _counters[(record["date"], record["ptype"])] = record["n"]
+    elif op == "enqueue":
+        _append_locked(ChargeRequest.from_dict(record["req"]))
+    elif op == "remove":
+        for q in _queues.values():
+            if q.remove(record["req_id"]) is not None:
+                break
+    elif op == "update":
+        _update_queued_locked(record["req_id"], record["kwh"],
+                              record["pile_type"], record["queue_no"])
+    elif op == "pile":
+        _put_pile_locked(Pile.from_dict(record["pile"]))
+    elif op == "piles":
+        for p in record["piles"]:
+            _put_pile_locked(Pile.from_dict(p))
+    elif op == "remove_pile":
+        _drop_pile_locked(record["pile_id"])
+
+
+def enable_wal(wal) -> int:
+    """从 wal 的快照 + 日志重建状态，之后的变更都写入 wal；返回重放的记录数"""
+    global _wal
+    with _lock:
+        state, records = wal.load()
+        _clear()
+        if state is not None:
+            restore(state)
+        for record in records:
+            _apply(record)
+        wal.open()
+        # 启动时压缩一次，日志从空开始
+        wal.write_snapshot(snapshot())
+        _wal = wal
+        return len(records)
+
+
+def disable_wal() -> None:
+    global _wal
+    with _lock:
+        if _wal is not None:
+            _wal.close()
+            _wal = None
+
+
+# -------------------------------------------------
+#                 测试 / 重建
+# -------------------------------------------------
+def reset() -> None:
+    """清空全部引擎状态（测试与状态重建用）"""
+    with _lock:
+        _clear()
+        if _wal is not None:
+            _wal.write_snapshot(snapshot())
+
+
+def _clear() -> None:
+    _counters.clear()
+    for q in _queues.values():
+        while q.popleft() is not None:
+            pass
+    _piles.clear()
+    for piles in _piles_by_type.values():
+        piles.clear()
+    _on_pile.clear()
+    _on_pile_ids.clear()
+    _events.clear()
@@ -0,0 +1,180 @@
+"""
+引擎状态的预写日志（WAL）+ 定期快照。
+
+  * 每次状态变更追加一行 JSON 记录（带单调递增的 seq），先写入操作系统缓冲区，
+    由后台线程按 fsync_interval 批量 fsync（组提交）；
+  * 记录数达到 snapshot_every 后压缩：持锁时只把当前日志换成旧日志、导出状态，
+    快照的序列化与 fsync 在后台线程完成（先写临时文件再 os.replace 原子替换），
+    然后删除旧日志。快照中记录了最后一条已包含的 seq，重放时跳过 seq 不大于它的记录，
+    因此在"快照已替换、旧日志未删除"之间崩溃也不会重复应用；
+  * 启动时 load() 读取快照 + 旧日志 + 当前日志，末尾写了一半的记录直接丢弃。
+
+非业务逻辑，调用方（store）负责在持锁状态下调用 append / 压缩，保证记录顺序与内存一致。
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+import threading
+from typing import List, Optional, Tuple
+
+WAL_FILE = "engine.wal"
+OLD_WAL_FILE = "engine.wal.old"     # 后台快照写完之前仍需保留的日志
+SNAPSHOT_FILE = "engine.snapshot.json"
+
+
+class WriteAheadLog:
+    def __init__(self, directory: str, fsync_interval: float = 0.05,
+                 snapshot_every: int = 1000) -> None:
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+        self.wal_path = os.path.join(directory, WAL_FILE)
+        self.old_wal_path = os.path.join(directory, OLD_WAL_FILE)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+
+        self.seq = 0                    # 最后一条记录的序号
+        self.records_since_snapshot = 0
+        self._file = None
+        self._dirty = False
+        self._io_lock = threading.Lock()
+        self._stop_flag = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._compactor: Optional[threading.Thread] = None
+
+    # ---------------- 读取 ----------------
+    def load(self) -> Tuple[Optional[dict], List[dict]]:
+        """返回 (快照状态, 快照之后的记录)；之后的 append 从最大 seq 继续编号"""
+        state, snap_seq = None, 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            state, snap_seq = snap["state"], snap["seq"]
+
+        records: List[dict] = []
+        for path in (self.old_wal_path, self.wal_path):
+            records.extend(self._read_records(path, snap_seq))
+
+        self.seq = records[-1]["seq"] if records else snap_seq
+        self.records_since_snapshot = len(records)
+        return state, records
+
+    @staticmethod
+    def _read_records(path: str, snap_seq: int) -> List[dict]:
+        records: List[dict] = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        break           # 崩溃时写了一半的末尾记录
+                    if rec["seq"] > snap_seq:
+                        records.append(rec)
+        return records
+
+    # ---------------- 写入 ----------------
+    def open(self) -> None:
+        self._file = open(self.wal_path, "a", encoding="utf-8")
+        self._stop_flag.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="EngineWALFlusher")
+        self._flusher.start()
+
+    def append(self, record: dict) -> None:
+        self.seq += 1
+        record["seq"] = self.seq
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._io_lock:
+            self._file.write(line)
+            self._dirty = True
+        self.records_since_snapshot += 1
+
+    def needs_snapshot(self) -> bool:
+        return self.records_since_snapshot >= self.snapshot_every and not self._compacting()
+
+    def _compacting(self) -> bool:
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def start_snapshot(self, state: dict) -> None:
+        """
+        持锁调用：当前日志换成旧日志，之后的记录写入新日志；
+        state 的序列化与落盘在后台线程完成，写好快照后删除旧日志。
+        """
+        seq = self.seq
+        with self._io_lock:
+            self._file.close()          # 只 flush 到系统缓冲区，fsync 留给组提交 / 快照
+            if os.path.exists(self.old_wal_path):
+                # 上一次后台快照失败，旧日志还不能丢：把当前日志接在后面
+                with open(self.wal_path, "r", encoding="utf-8") as src, \
+                        open(self.old_wal_path, "a", encoding="utf-8") as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.wal_path)
+            else:
+                os.replace(self.wal_path, self.old_wal_path)
+            self._file = open(self.wal_path, "w", encoding="utf-8")
+            self._dirty = False
+        self.records_since_snapshot = 0
+        self._compactor = threading.Thread(target=self._compact, args=(state, seq),
+                                           daemon=True, name="EngineWALSnapshot")
+        self._compactor.start()
+
+    def _compact(self, state: dict, seq: int) -> None:
+        try:
+            self._replace_snapshot(state, seq)
+            os.remove(self.old_wal_path)
+        except Exception as e:
+            print(f"❌ 引擎WAL快照写入失败（旧日志保留，下次压缩重试）: {e}")
+
+    def wait_snapshot(self) -> None:
+        """等待后台快照写完"""
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def _replace_snapshot(self, state: dict, seq: int) -> None:
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "state": state}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def write_snapshot(self, state: dict) -> None:
+        """同步写入包含到当前 seq 为止全部变更的快照，并截断日志（启动 / 整体替换状态时使用）"""
+        self.wait_snapshot()
+        self._replace_snapshot(state, self.seq)
+        with self._io_lock:
+            self._file.close()
+            self._file = open(self.wal_path, "w", encoding="utf-8")
+            self._dirty = False
+        if os.path.exists(self.old_wal_path):
+            os.remove(self.old_wal_path)
+        self.records_since_snapshot = 0
+
+    def sync(self) -> None:
+        """立即 flush + fsync"""
+        with self._io_lock:
+            if self._file and self._dirty:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def _flush_loop(self) -> None:
+        while not self._stop_flag.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"❌ 引擎WAL落盘失败: {e}")
+
+    def close(self) -> None:
+        self.wait_snapshot()
+        self._stop_flag.set()
+        if self._flusher:
+            self._flusher.join(1.0)
+        self.sync()
+        with self._io_lock:
+            if self._file:
+                self._file.close()
+                self._file = None
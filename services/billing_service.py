@@ -1,8 +1,11 @@
 from decimal import Decimal
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-from models.billing import ChargingRecord, SystemConfig, db
+from sqlalchemy import case, func
+from models.billing import ChargingRecord, ChargingPile, SystemConfig, db
 from models.user import User
+from utils.pagination import keyset_paginate, cursor_pagination_info, InvalidCursor
+from scheduler_core import clock
 
 class BillingService:
     """计费服务类"""
@@ -51,7 +54,7 @@ class BillingService:
             config = SystemConfig.query.filter_by(config_key='billing_rates').first()
             if config:
                 config.config_value = rates
-                config.updated_at = datetime.utcnow()
+                config.updated_at = clock.utcnow()
             else:
                 config = SystemConfig(
                     config_key='billing_rates',
@@ -181,6 +184,8 @@ class BillingService:
             )
             
             db.session.add(record)
+            # 充电桩累计统计与记录在同一事务中原子累加
+            BillingService.add_pile_totals(pile_id, 1, record.power_consumed, record.total_fee)
             db.session.commit()
             return record
         except Exception as e:
@@ -190,11 +195,82 @@ class BillingService:
             db.session.rollback()
             return None
     
+    @staticmethod
+    def add_pile_totals(pile_id: str, charges: int, power, revenue) -> None:
+        """
+        原子累加充电桩统计（UPDATE ... SET total = total + :x），不读取当前值，
+        并发结束的会话不会互相覆盖。不提交，由调用方随所在事务一起提交。
+        """
+        piles = ChargingPile.__table__
+        db.session.execute(
+            piles.update()
+            .where(piles.c.id == pile_id)
+            .values(
+                total_charges=func.coalesce(piles.c.total_charges, 0) + charges,
+                total_power=func.coalesce(piles.c.total_power, 0) + Decimal(str(power or 0)),
+                total_revenue=func.coalesce(piles.c.total_revenue, 0) + Decimal(str(revenue or 0)),
+            )
+        )
+    
+    @staticmethod
+    def reconcile_pile_counters() -> Dict:
+        """
+        按已完成的充电记录重新核对充电桩累计统计，修正漂移（如手工改数、记录被删除）。
+        一次分组聚合 + 仅对不一致的充电桩逐个更新。
+        """
+        try:
+            actual = {
+                row.pile_id: (int(row.charges), Decimal(str(row.power or 0)), Decimal(str(row.revenue or 0)))
+                for row in db.session.query(
+                    ChargingRecord.pile_id,
+                    func.count(ChargingRecord.id).label('charges'),
+                    func.sum(ChargingRecord.power_consumed).label('power'),
+                    func.sum(ChargingRecord.total_fee).label('revenue'),
+                ).filter(ChargingRecord.status == 'completed').group_by(ChargingRecord.pile_id)
+            }
+            
+            piles = ChargingPile.__table__
+            fixed = []
+            rows = db.session.execute(
+                piles.select().with_only_columns(piles.c.id, piles.c.total_charges,
+                                                 piles.c.total_power, piles.c.total_revenue)
+            ).all()
+            for row in rows:
+                charges, power, revenue = actual.get(row.id, (0, Decimal('0'), Decimal('0')))
+                stored = (row.total_charges or 0, Decimal(str(row.total_power or 0)),
+                          Decimal(str(row.total_revenue or 0)))
+                # 比较时按列精度取整，避免浮点误差被当作漂移
+                if (stored[0] != charges
+                        or round(stored[1], 3) != round(power, 3)
+                        or round(stored[2], 2) != round(revenue, 2)):
+                    db.session.execute(
+                        piles.update().where(piles.c.id == row.id)
+                        .values(total_charges=charges, total_power=power, total_revenue=revenue)
+                    )
+                    fixed.append({
+                        'pile_id': row.id,
+                        'before': {'total_charges': stored[0], 'total_power': float(stored[1]),
+                                   'total_revenue': float(stored[2])},
+                        'after': {'total_charges': charges, 'total_power': float(power),
+                                  'total_revenue': float(revenue)},
+                    })
+            db.session.commit()
+            
+            if fixed:
+                print(f"🔧 充电桩统计已校正: {[item['pile_id'] for item in fixed]}")
+            return {'checked': len(rows), 'fixed': fixed}
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 核对充电桩统计失败: {e}")
+            raise
+    
     @staticmethod
     def get_user_charging_records(user_id: int, page: int = 1, per_page: int = 10,
                                 start_date: Optional[str] = None, 
-                                end_date: Optional[str] = None) -> Dict:
-        """获取用户充电记录"""
+                                end_date: Optional[str] = None,
+                                cursor: Optional[str] = None,
+                                with_total: bool = False) -> Dict:
+        """获取用户充电记录（cursor 不为 None 时按 (created_at, id) 游标分页，空字符串表示首页）"""
         try:
             # 构建查询
             query = ChargingRecord.query.filter_by(user_id=user_id)
@@ -210,6 +286,19 @@ class BillingService:
                 end_dt = end_dt + timedelta(days=1)
                 query = query.filter(ChargingRecord.created_at < end_dt)
             
+            if cursor is not None:
+                page_data = keyset_paginate(query, [ChargingRecord.created_at, ChargingRecord.id], per_page,
+                                            cursor=cursor, with_total=with_total)
+                records = page_data['items']
+                return {
+                    'records': [record.to_dict() for record in records],
+                    'pagination': cursor_pagination_info(page_data, per_page),
+                    # 游标模式只取一页，代价与历史总量无关；不给出只覆盖本页、容易被误读为总计的电量 / 费用汇总
+                    'summary': {
+                        'total_records': page_data.get('total')
+                    }
+                }
+            
             # 按创建时间倒序排列
             query = query.order_by(ChargingRecord.created_at.desc())
             
@@ -242,6 +331,8 @@ class BillingService:
                     'total_cost': round(total_cost, 2)
                 }
             }
+        except InvalidCursor:
+            raise
         except Exception as e:
             print(f"❌ 获取用户充电记录失败: {e}")
             return {
@@ -261,6 +352,36 @@ class BillingService:
                 }
             }
     
+    @staticmethod
+    def get_user_charging_summary(user_id: int, windows: Dict[str, datetime]) -> Dict[str, Dict]:
+        """
+        多个时间窗口（名称 -> 起始时间）的充电次数 / 电量 / 费用汇总，一条聚合SQL完成。
+        只扫描最早起始时间之后的记录（走 user_id + created_at 索引），与用户的历史总量无关。
+        """
+        in_windows = {name: ChargingRecord.created_at >= since for name, since in windows.items()}
+        columns = []
+        for condition in in_windows.values():
+            columns += [
+                func.count(case((condition, 1))),
+                func.coalesce(func.sum(case((condition, ChargingRecord.power_consumed))), 0),
+                func.coalesce(func.sum(case((condition, ChargingRecord.total_fee))), 0),
+            ]
+        
+        row = db.session.query(*columns).filter(
+            ChargingRecord.user_id == user_id,
+            ChargingRecord.created_at >= min(windows.values())
+        ).one()
+        
+        summary = {}
+        for i, name in enumerate(in_windows):
+            count, power, cost = row[i * 3:i * 3 + 3]
+            summary[name] = {
+                'total_records': int(count or 0),
+                'total_power_consumed': round(float(power or 0), 3),
+                'total_cost': round(float(cost or 0), 2)
+            }
+        return summary
+    
     @staticmethod
     def get_charging_record_detail(record_id: int, user_id: Optional[int] = None) -> Optional[Dict]:
         """获取充电记录详情"""
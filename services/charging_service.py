@@ -1,18 +1,22 @@
-import json
-import threading
 import uuid
 import redis
 from datetime import datetime, timedelta, time
-from typing import List, Dict, Optional
-from threading import Lock
-from apscheduler.schedulers.background import BackgroundScheduler
+from typing import List, Dict, Optional, Tuple
+from contextlib import contextmanager
 from decimal import Decimal
 
 from models.user import db
 from models.charging import ChargingSession, ChargingMode, ChargingStatus
 from models.billing import ChargingPile
+from services.station_waiting_area import StationWaitingArea, CHARGING_MODES
+from services.session_state import SessionStateMachine, InvalidTransition
+from services.session_cache import ActiveSessionCache, CachedSession
+from services.pile_utilization import PileBusyIndex
+from utils.coalescing_worker import CoalescingWorker
+from utils.locks import InstrumentedLock, StripedLock
+from utils.startup import StartupPipeline, wait_until
 import scheduler_core
-from scheduler_core import PileType, PileStatus, Pile, ChargeRequest
+from scheduler_core import PileType, PileStatus, Pile, ChargeRequest, clock
 
 class ChargingService:
     """充电服务类 - 整合C模块的核心逻辑"""
@@ -21,10 +25,23 @@ class ChargingService:
         """初始化服务（不依赖应用上下文）"""
         self.app = None
         self.socketio = None
-        self.lock = Lock()
+        # 细粒度锁，加锁顺序固定为: 用户 -> 会话 -> 充电桩
+        # 等候区准入由Redis脚本原子完成，drain_lock 保证同时只有一个线程在出队
+        self.drain_lock = InstrumentedLock('drain')
+        self.user_locks = StripedLock('user')
+        self.session_locks = StripedLock('session')
+        self.pile_locks = StripedLock('pile')
         self.config = None
         self.redis_client = None
+        self.waiting_area = None
+        self.sessions = None
+        self.session_cache = ActiveSessionCache()
+        self.pile_busy = PileBusyIndex()
         self.scheduler = None
+        self.queue_worker = None
+        self.engine = scheduler_core
+        self.engine_recovery = None
+        self.startup_timings = {}
         self._initialized = False
         
         print("ChargeService 实例已创建（延迟初始化模式）")
@@ -41,6 +58,7 @@ class ChargingService:
         # 现在可以安全地导入配置
         from config import get_config
         self.config = get_config()
+        self._init_clock()
         
         # 初始化Redis客户端
         self.redis_client = redis.Redis(
@@ -50,24 +68,40 @@ class ChargingService:
             password=self.config.REDIS_PASSWORD,
             decode_responses=True
         )
+        self.waiting_area = StationWaitingArea(self.redis_client)
         
-        # 初始化调度器
+        # 会话状态机：校验状态转换，变更与事件由后台线程组提交，同时写穿活跃会话缓存和充电桩忙碌区间
+        self.session_cache.max_size = self.config.SESSION_CACHE_SIZE
+        if self.config.ENGINE_CLUSTER_MODE:
+            # 引擎事件由弹出它的节点处理，其它节点的缓存无法同步，集群模式下会话一律读数据库
+            self.session_cache.enabled = False
+            print("ℹ️ 集群模式：活跃会话缓存已关闭")
+        self.pile_busy = PileBusyIndex(self.config.PILE_UTILIZATION_RETENTION_DAYS)
+        self.sessions = SessionStateMachine(self.redis_client, cache=self.session_cache,
+                                            busy_index=self.pile_busy)
+        self.sessions.start(app)
+        
+        # 初始化调度器（APScheduler 只在服务初始化时才需要，不放在模块导入路径上）
+        from apscheduler.schedulers.background import BackgroundScheduler
         self.scheduler = BackgroundScheduler()
         
+        # 等候区处理后台线程：提交请求后合并触发，窗口内多次提交只处理/广播一次
+        self.queue_worker = CoalescingWorker(self._drain_waiting_area_and_broadcast,
+                                             delay=0.1, name='WaitingAreaDrainer')
+        
+        # 初始化流水线：Redis就绪检查代替固定等待，定时任务注册与引擎初始化并行
+        pipeline = StartupPipeline('充电服务初始化', context=app.app_context)
+        pipeline.add('redis_ready', lambda: wait_until(self.redis_client.ping, name='Redis'))
+        pipeline.add('engine', self._init_engine, depends=('redis_ready',))
+        pipeline.add('engine_piles', self.init_redis_data, depends=('engine',))
+        pipeline.add('scheduled_jobs', self._setup_scheduled_jobs)
+        pipeline.add('state_sync', self.startup_state_sync, depends=('engine_piles',))
+        pipeline.add('pile_utilization', self.load_pile_busy_intervals, deferred=True)
+        
         # 在应用上下文中进行初始化
         with app.app_context():
             try:
-                # 初始化Redis数据
-                self.init_redis_data()
-                
-                # 初始化充电桩
-                self.init_piles_in_engine()
-                
-                # 启动状态同步
-                self.startup_state_sync()
-                
-                # 设置定时任务
-                self._setup_scheduled_jobs()
+                self.startup_timings = pipeline.run()
                 
                 # 启动调度器
                 if not self.scheduler.running:
@@ -75,7 +109,10 @@ class ChargingService:
                     print("✅ APScheduler 调度器已启动")
                 
                 # 启动调度引擎
-                scheduler_core.start_dispatch_loop()
+                self.engine.start_dispatch_loop()
+                
+                # 启动等候区处理线程
+                self.queue_worker.start()
                 
                 self._initialized = True
                 
@@ -89,6 +126,49 @@ class ChargingService:
                 traceback.print_exc()
                 raise
     
+    def shutdown(self):
+        """应用退出时停止后台线程：等候区处理线程、定时任务、调度引擎循环，最后写完待提交的会话变更"""
+        if self.queue_worker:
+            self.queue_worker.stop()
+        if self.scheduler and self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        if self._initialized:
+            self.engine.stop_dispatch_loop()
+        if self.sessions:
+            self.sessions.stop()
+        self._initialized = False
+        print("🛑 充电服务后台线程已停止")
+    
+    def _init_clock(self):
+        """开启 SCALED_CLOCK_ENABLED 时按 CHARGING_SPEED_FACTOR 设置引擎、会话、计费与统计共用的时钟
+        （默认使用真实时间；测试已注入的时钟保持不变）"""
+        if not getattr(self.config, 'SCALED_CLOCK_ENABLED', False):
+            return
+        factor = getattr(self.config, 'CHARGING_SPEED_FACTOR', 1) or 1
+        if factor != 1 and isinstance(clock.get_clock(), clock.SystemClock):
+            clock.set_clock(clock.for_speed_factor(factor))
+            print(f"⏩ 时钟倍速 x{factor}：充电进度、调度预计时间与计费时段按加速时间计算")
+    
+    def _init_engine(self):
+        # 调度引擎：单进程直接使用 scheduler_core，集群模式使用租约选主的节点
+        self.engine = self._create_engine()
+        self.engine.set_policy(self.config.SCHEDULING_POLICY)
+        print(f"🧭 调度策略: {self.engine.get_policy().name}")
+    
+    def _create_engine(self):
+        """创建调度引擎访问对象（与 scheduler_core 模块接口一致）"""
+        if not self.config.ENGINE_CLUSTER_MODE:
+            if self.config.ENGINE_WAL_DIR:
+                self.engine_recovery = scheduler_core.enable_persistence(self.config.ENGINE_WAL_DIR)
+                print(f"💾 调度引擎状态已从WAL恢复: {self.engine_recovery}")
+            return scheduler_core
+        
+        from scheduler_core.cluster import ClusterNode, RedisSharedStore
+        node = ClusterNode(RedisSharedStore(self.redis_client), lease_ttl=self.config.ENGINE_LEASE_TTL)
+        node.tick()  # 立即参与选主，决定由谁初始化共享状态
+        print(f"🌐 调度引擎集群模式: 节点 {node.node_id} ({'主节点' if node.is_leader else '从节点'})")
+        return node
+    
     def _setup_scheduled_jobs(self):
         """设置定时任务"""
         if not self.app:
@@ -123,6 +203,13 @@ class ChargingService:
                 "seconds": 5,
                 "misfire_grace_time": 3
             },
+            {
+                "id": "pile_counter_reconciler",
+                "func": _with_app_context(self.reconcile_pile_counters),
+                "trigger": "interval",
+                "seconds": 3600,
+                "misfire_grace_time": 60
+            },
             {
                 "id": "timeout_completing_checker",
                 "func": _with_app_context(self.check_and_recover_timeout_completing_sessions),
@@ -151,16 +238,30 @@ class ChargingService:
             print("❌ Redis客户端未初始化")
             return
             
+        # 集群模式下共享状态只由主节点初始化
+        if not getattr(self.engine, 'is_leader', True):
+            print("ℹ️ 当前为引擎从节点，跳过Redis数据初始化与充电桩注册")
+            return
+            
         try:
-            # 清理旧数据
-            self.redis_client.delete('station_waiting_area:fast', 'station_waiting_area:trickle')
-            print("🧹 Redis数据已清理")
+            # 引擎从WAL恢复时，等候区与引擎队列保持一致，不能清理
+            if self._engine_recovered():
+                print("💾 引擎状态已恢复，保留Redis等候区数据")
+            else:
+                # 清理旧数据
+                self.waiting_area.clear()
+                print("🧹 Redis数据已清理")
             
-            # 从数据库获取充电桩数据并注册到引擎
+            # 从数据库获取充电桩数据并注册到引擎（已恢复的充电桩沿用引擎中的状态）
             piles = ChargingPile.query.all()
             print(f"📊 从数据库获取到 {len(piles)} 个充电桩")
+            registered = {p.pile_id for p in self.engine.get_all_piles()}
+            new_piles = []
             
             for pile_db in piles:
+                if pile_db.id in registered:
+                    continue
+                
                 if pile_db.status == 'offline':
                     print(f"⚠️ 充电桩 {pile_db.id} 处于离线状态，暂不添加到调度引擎")
                     continue
@@ -172,75 +273,68 @@ class ChargingService:
                 if pile_db.status == 'fault':
                     engine_status = PileStatus.FAULT
                 
-                pile_for_engine = Pile(
+                new_piles.append(Pile(
                     pile_id=pile_db.id,
                     type=engine_pile_type,
                     max_kw=float(pile_db.power_rating),
-                    status=engine_status
-                )
-                
-                try:
-                    scheduler_core.add_pile(pile_for_engine)
-                    print(f"✅ 充电桩已注册: {pile_db.id} ({pile_db.pile_type})")
-                except Exception as e:
-                    print(f"❌ 注册充电桩失败 {pile_db.id}: {e}")
+                    status=engine_status,
+                    queue_len=self.pile_queue_len
+                ))
             
-            print("✅ 充电桩注册到调度引擎完成")
+            # 整批注册：一次加锁、一条日志记录
+            if new_piles:
+                self.engine.add_piles(new_piles)
+            print(f"✅ 充电桩注册到调度引擎完成，新注册 {len(new_piles)} 个")
             
         except Exception as e:
             print(f"❌ 初始化Redis数据失败: {e}")
             raise
     
-    def init_piles_in_engine(self):
-        """初始化引擎中的充电桩（预留扩展）"""
-        pass
-    
     def startup_state_sync(self):
         """启动时的状态同步"""
         try:
             print("🔄 执行启动状态同步...")
             
-            # 处理所有completing状态的会话
-            completing_sessions = ChargingSession.query.filter_by(
-                status=ChargingStatus.COMPLETING
-            ).all()
-            
-            if completing_sessions:
-                print(f"🔧 发现 {len(completing_sessions)} 个completing会话，开始处理...")
+            if self._engine_recovered():
+                # 引擎状态已恢复：以引擎为准补处理崩溃前丢失的事件
+                self._reconcile_recovered_engine()
+            else:
+                # 处理所有completing状态的会话
+                completing_sessions = ChargingSession.query.filter_by(
+                    status=ChargingStatus.COMPLETING
+                ).all()
                 
-                for session in completing_sessions:
-                    print(f"⚡ 处理completing会话: {session.session_id}")
-                    
-                    fees = self.calculate_charging_fees(
-                        session.session_id,
-                        float(session.actual_amount or 0),
-                        session.start_time,
-                        datetime.now()
-                    )
-                    
-                    session.status = ChargingStatus.COMPLETED
-                    session.end_time = datetime.now()
-                    session.charging_fee = fees['charging_fee']
-                    session.service_fee = fees['service_fee']
-                    session.total_fee = fees['total_fee']
-                    
-                    # 清理Redis
-                    self.redis_client.delete(f"session_status:{session.session_id}")
-                    self.redis_client.delete(f"session_completing:{session.session_id}")
-                    
-                    if session.pile_id:
-                        try:
-                            scheduler_core.end_charging(session.pile_id)
-                        except:
-                            pass
-                        self.update_pile_redis_status(session.pile_id, PileStatus.IDLE.value, None)
+                if completing_sessions:
+                    print(f"🔧 发现 {len(completing_sessions)} 个completing会话，开始处理...")
                 
-                db.session.commit()
-                print(f"✅ 完成了 {len(completing_sessions)} 个completing会话的处理")
+                    for session in completing_sessions:
+                        print(f"⚡ 处理completing会话: {session.session_id}")
+                
+                        end_time = clock.now()
+                        fees = self.session_fees(session, end_time)
+                
+                        self.sessions.transition(
+                            session, ChargingStatus.COMPLETED, reason='startup_recovery',
+                            end_time=end_time,
+                            charging_fee=fees['charging_fee'],
+                            service_fee=fees['service_fee'],
+                            total_fee=fees['total_fee']
+                        )
+                
+                        # 清理Redis完成标志
+                        self.redis_client.delete(f"session_completing:{session.session_id}")
+                
+                        if session.pile_id:
+                            try:
+                                self.engine.end_charging(session.pile_id)
+                            except:
+                                pass
+                            self.update_pile_redis_status(session.pile_id, PileStatus.IDLE.value, None)
+                
+                    self.sessions.flush()
+                    print(f"✅ 完成了 {len(completing_sessions)} 个completing会话的处理")
             
-            # 强制同步所有充电桩状态
-            import time
-            time.sleep(1)
+            # 强制同步所有充电桩状态（引擎操作是同步的，无需等待）
             self.force_sync_engine_pile_states()
             
             print("✅ 启动状态同步完成")
@@ -251,20 +345,98 @@ class ChargingService:
             import traceback
             traceback.print_exc()
     
+    @property
+    def pile_queue_len(self) -> int:
+        """充电桩本地队列容量：CHARGING_QUEUE_LEN 个位置中除正在充电的一个之外可预分配的数量"""
+        queue_len = self.config.CHARGING_QUEUE_LEN if self.config else 1
+        return max(0, queue_len - 1)
+    
+    def _engine_recovered(self) -> bool:
+        return bool(self.engine_recovery and self.engine_recovery['recovered'])
+    
+    def _reconcile_recovered_engine(self):
+        """WAL 恢复后，按引擎中的队列 / 充电桩分配修正数据库中的会话（补处理崩溃前未处理的事件）"""
+        piles = {pile.pile_id: pile for pile in self.engine.get_all_piles()}
+        on_pile = {pile.current_req_id: pile for pile in piles.values() if pile.current_req_id}
+        
+        sessions = ChargingSession.query.filter(ChargingSession.status.in_([
+            ChargingStatus.ENGINE_QUEUED, ChargingStatus.CHARGING,
+            ChargingStatus.COMPLETING, ChargingStatus.CANCELLING_AFTER_DISPATCH
+        ])).all()
+        
+        for session in sessions:
+            session_id = session.session_id
+            pile = on_pile.get(session_id)
+            
+            if session.status == ChargingStatus.ENGINE_QUEUED:
+                if pile:
+                    # 调度事件丢失：按引擎的分配补记开始充电（故障转移的请求按引擎中的剩余电量推算）
+                    kwh = pile.current.kwh if pile.current else float(session.requested_amount)
+                    hours = kwh / pile.max_kw
+                    start_time = pile.estimated_end - timedelta(hours=hours) if pile.estimated_end else clock.now()
+                    print(f"🔧 补处理调度: 会话 {session_id} -> 充电桩 {pile.pile_id}")
+                    self.handle_engine_dispatch(session_id, pile.pile_id, start_time)
+                elif not self._engine_holds(session_id):
+                    # 入队记录未落盘：按原到达时间重新入队（故障转移中的会话只排剩余电量，仍优先调度）
+                    engine_pile_type = self._map_charging_mode_to_engine_piletype(session.charging_mode.value)
+                    charged = float(session.actual_amount or 0)
+                    self.engine.enqueue_request(ChargeRequest(
+                        req_id=session_id,
+                        queue_no=session.queue_number or self.engine.generate_queue_number(engine_pile_type.value),
+                        user_id=session.user_id,
+                        pile_type=engine_pile_type,
+                        kwh=float(session.requested_amount) - charged,
+                        generated_at=session.created_at,
+                        redispatched=charged > 0
+                    ))
+                    print(f"🔧 会话 {session_id} 重新加入引擎队列")
+            
+            elif pile is None and session.pile_id:
+                # 结束 / 故障事件丢失
+                engine_pile = piles.get(session.pile_id)
+                if engine_pile and engine_pile.status == PileStatus.FAULT:
+                    print(f"🔧 补处理充电桩故障: {session.pile_id}")
+                    self.handle_engine_pile_fault(session.pile_id)
+                else:
+                    print(f"🔧 补处理充电结束: 会话 {session_id}")
+                    self.handle_engine_charging_end(session_id, session.pile_id, graceful_end=True)
+            
+            elif pile and session.status == ChargingStatus.CHARGING and session.pile_id != pile.pile_id:
+                # 故障 / 调度事件丢失：会话仍记在故障桩上，引擎已把剩余电量转到其它充电桩
+                print(f"🔧 补处理故障转移: 会话 {session_id} {session.pile_id} -> {pile.pile_id}")
+                self.handle_engine_pile_fault(session.pile_id)
+                start_time = pile.estimated_end - timedelta(hours=pile.current.kwh / pile.max_kw) \
+                    if pile.estimated_end and pile.current else clock.now()
+                self.handle_engine_dispatch(session_id, pile.pile_id, start_time)
+            
+            elif pile and session.status in [ChargingStatus.COMPLETING, ChargingStatus.CANCELLING_AFTER_DISPATCH]:
+                # 结束指令可能未落盘，重新下发
+                self.engine.end_charging(pile.pile_id)
+    
+    @contextmanager
+    def _locked(self, session_ids=(), pile_ids=()):
+        """按 会话 -> 充电桩 的顺序获取分段锁"""
+        with self.session_locks.hold_many([sid for sid in session_ids if sid]):
+            with self.pile_locks.hold_many([pid for pid in pile_ids if pid]):
+                yield
+    
+    def get_lock_stats(self) -> Dict:
+        """各类锁的获取次数与等待 / 持有时间"""
+        return {
+            'drain': self.drain_lock.stats.to_dict(),
+            'user': self.user_locks.stats(),
+            'session': self.session_locks.stats(),
+            'pile': self.pile_locks.stats()
+        }
+    
     def submit_charging_request(self, user_id: int, charging_mode: str, requested_amount: float) -> Dict:
         """提交充电请求"""
         if not self._initialized:
             return {'success': False, 'message': '充电服务未初始化', 'code': 5003}
             
         try:
-            with self.lock:
-                # 检查等候区容量
-                fast_count = self.redis_client.llen('station_waiting_area:fast')
-                trickle_count = self.redis_client.llen('station_waiting_area:trickle')
-                
-                if (fast_count + trickle_count) >= self.config.WAITING_AREA_SIZE:
-                    return {'success': False, 'message': '等候区已满，请稍后再试', 'code': 2001}
-                
+            # 同一用户的提交串行化，不同用户互不阻塞
+            with self.user_locks.for_key(user_id):
                 # 检查用户是否有活跃会话
                 existing_session = self.get_user_active_session_details(user_id)
                 if existing_session and existing_session.status not in [ChargingStatus.COMPLETED, ChargingStatus.CANCELLED]:
@@ -281,56 +453,55 @@ class ChargingService:
                     status=ChargingStatus.STATION_WAITING
                 )
                 
-                db.session.add(new_session)
-                db.session.commit()
+                self.sessions.create(new_session)
+                self.sessions.flush()
                 
-                # 添加到Redis队列
                 request_data = {
                     'session_id': session_id,
                     'user_id': user_id,
                     'charging_mode': charging_mode,
                     'requested_amount': requested_amount,
-                    'created_at': datetime.now().isoformat()
+                    # 到达时间为 UTC，与会话 created_at 及引擎时钟同一时间基准（调度策略按它计算等待时长）
+                    'created_at': clock.utcnow().isoformat()
                 }
-                self.redis_client.rpush(f"station_waiting_area:{charging_mode}", json.dumps(request_data))
-                
-                # 更新Redis状态
-                self.redis_client.hset(f"session_status:{session_id}", mapping={
-                    'user_id': str(user_id),
-                    'charging_mode': charging_mode,
-                    'requested_amount': str(requested_amount),
-                    'status': 'station_waiting',
-                    'queue_number': ""
-                })
                 
-                # WebSocket通知
-                if self.socketio:
-                    self.socketio.emit('user_specific_event', 
-                                    {'message': f'请求 {session_id} 已提交至充电站等候区', 
-                                     'session_id': session_id, 
-                                     'type': 'request_submitted_station'}, 
-                                    room=f'user_{user_id}')
-                
-                # 异步处理队列
-                def delayed_process():
-                    import time
-                    time.sleep(0.1)
-                    if self.app:
-                        with self.app.app_context():
-                            self.process_station_waiting_area_to_engine()
-                            self.broadcast_status_update()
-                
-                threading.Thread(target=delayed_process, daemon=True).start()
-                
-                return {
-                    'success': True,
-                    'message': '充电请求已提交至充电站等候区',
-                    'data': {
-                        'session_id': session_id,
-                        'status': 'station_waiting'
+                # 原子准入：容量检查、入队、写会话状态一次往返完成，跨进程 / 节点一致
+                ticket = self.waiting_area.admit(
+                    charging_mode, request_data, self.config.WAITING_AREA_SIZE,
+                    status={
+                        'user_id': str(user_id),
+                        'charging_mode': charging_mode,
+                        'requested_amount': str(requested_amount),
+                        'status': 'station_waiting',
+                        'queue_number': ""
                     }
-                }
+                )
                 
+                if ticket is None:
+                    self.sessions.discard(session_id)
+                    self.sessions.flush()
+                    return {'success': False, 'message': '等候区已满，请稍后再试', 'code': 2001}
+            
+            # WebSocket通知
+            if self.socketio:
+                self.socketio.emit('user_specific_event', 
+                                {'message': f'请求 {session_id} 已提交至充电站等候区', 
+                                 'session_id': session_id, 
+                                 'type': 'request_submitted_station'}, 
+                                room=f'user_{user_id}')
+            
+            # 异步处理队列（合并触发）
+            self.queue_worker.trigger()
+            
+            return {
+                'success': True,
+                'message': '充电请求已提交至充电站等候区',
+                'data': {
+                    'session_id': session_id,
+                    'status': 'station_waiting'
+                }
+            }
+            
         except Exception as e:
             db.session.rollback()
             print(f"❌ 提交充电请求错误: {e}")
@@ -338,70 +509,146 @@ class ChargingService:
             traceback.print_exc()
             return {'success': False, 'message': '系统错误，请稍后重试', 'code': 5001}
     
-    def get_user_active_session_details(self, user_id: int) -> Optional[ChargingSession]:
-        """获取用户活跃会话详情"""
-        return ChargingSession.query.filter_by(user_id=user_id)\
+    def _drain_waiting_area_and_broadcast(self):
+        """后台线程任务：处理等候区并广播状态"""
+        if not self.app:
+            return
+        with self.app.app_context():
+            self.process_station_waiting_area_to_engine()
+            self.broadcast_status_update()
+    
+    def get_user_active_session_details(self, user_id: int) -> Optional[CachedSession]:
+        """获取用户活跃会话详情（优先读缓存，未命中再查数据库并补入缓存）"""
+        hit, cached = self.session_cache.lookup_user(user_id)
+        if hit:
+            return cached
+        
+        session = ChargingSession.query.filter_by(user_id=user_id)\
             .filter(~ChargingSession.status.in_([ChargingStatus.COMPLETED, ChargingStatus.CANCELLED, ChargingStatus.FAULT_COMPLETED]))\
             .order_by(ChargingSession.created_at.desc()).first()
+        self.session_cache.fill_user(user_id, session)
+        return CachedSession.from_model(session) if session else None
+    
+    def find_session(self, session_id: str) -> Optional[CachedSession]:
+        """按会话ID查找（活跃会话读缓存，未命中或已结束的会话查数据库）"""
+        cached = self.session_cache.get(session_id)
+        if cached:
+            return cached
+        
+        session = ChargingSession.query.filter_by(session_id=session_id).first()
+        if not session:
+            return None
+        self.session_cache.fill(session)
+        return CachedSession.from_model(session)
+    
+    def find_sessions(self, session_ids: List[str]) -> Dict[str, CachedSession]:
+        """批量查找会话，只为缓存未命中的部分查询一次数据库"""
+        found = self.session_cache.get_many(session_ids)
+        missing = [session_id for session_id in session_ids if session_id not in found]
+        if missing:
+            for session in ChargingSession.query.filter(ChargingSession.session_id.in_(missing)).all():
+                self.session_cache.fill(session)
+                found[session.session_id] = CachedSession.from_model(session)
+        return found
     
     def process_station_waiting_area_to_engine(self):
-        """将请求从充电站等候区移动到引擎队列"""
+        """将请求从充电站等候区批量移动到引擎队列（每种模式至多填满引擎剩余容量）"""
         if not self._initialized:
             return
             
-        with self.lock:
-            for mode in ['fast', 'trickle']:
-                station_queue_key = f"station_waiting_area:{mode}"
-                request_json = self.redis_client.lpop(station_queue_key)
+        # 同一时间只允许一个线程计算剩余容量并出队
+        with self.drain_lock:
+            # 按引擎剩余容量取队首会话ID（先不出队）
+            heads = {}
+            for mode in CHARGING_MODES:
+                engine_pile_type = self._map_charging_mode_to_engine_piletype(mode)
+                capacity = self.engine.get_queue_capacity(engine_pile_type.value, self.config.CHARGING_QUEUE_LEN)
+                heads[mode] = self.waiting_area.head(mode, capacity)
+            
+            session_ids = [session_id for ids in heads.values() for session_id in ids]
+            if not session_ids:
+                return
+            
+            # 先锁住本批会话再出队，与取消 / 修改互斥：期间已换模式或取消的会话不再出队
+            with self.session_locks.hold_many(session_ids):
+                moved_requests = []
+                for mode, ids in heads.items():
+                    moved_requests.extend(self.waiting_area.take(mode, ids))
+                if not moved_requests:
+                    return
                 
-                if request_json:
-                    request_data = json.loads(request_json)
+                # 验证所有会话的状态（缓存未命中的部分一次查询）
+                sessions = self.find_sessions([request_data['session_id'] for request_data in moved_requests])
+            
+                queued = []
+                stalled = False
+                for index, request_data in enumerate(moved_requests):
                     session_id = request_data['session_id']
-                    
-                    # 验证数据库状态
-                    session = ChargingSession.query.filter_by(session_id=session_id).first()
+                    session = sessions.get(session_id)
                     if not session or session.status != ChargingStatus.STATION_WAITING:
                         print(f"⚠️ 会话 {session_id} 状态不符合预期，跳过处理")
                         continue
-                    
-                    # 生成队列号并添加到引擎
-                    engine_pile_type = self._map_charging_mode_to_engine_piletype(request_data['charging_mode'])
-                    engine_queue_no = scheduler_core.generate_queue_number(engine_pile_type.value)
-                    
+                
+                    # 生成队列号并添加到引擎（模式与电量以锁内读到的会话为准）
+                    engine_pile_type = self._map_charging_mode_to_engine_piletype(session.charging_mode.value)
+                    try:
+                        engine_queue_no = self.engine.generate_queue_number(engine_pile_type.value)
+                    except TimeoutError as e:
+                        print(f"⚠️ {e}，本批剩余请求放回等候区")
+                        self._requeue_waiting(moved_requests[index:], sessions)
+                        break
+                
                     engine_req = ChargeRequest(
                         req_id=session_id,
                         queue_no=engine_queue_no,
                         user_id=request_data['user_id'],
                         pile_type=engine_pile_type,
-                        kwh=float(request_data['requested_amount']),
+                        kwh=float(session.requested_amount),
                         generated_at=datetime.fromisoformat(request_data['created_at'])
                     )
-                    
-                    scheduler_core.enqueue_request(engine_req)
-                    
-                    # 更新数据库
-                    session.status = ChargingStatus.ENGINE_QUEUED
-                    session.queue_number = engine_queue_no
-                    db.session.commit()
-                    
-                    # 更新Redis
-                    self.redis_client.hset(f"session_status:{session_id}", mapping={
-                        "status": "engine_queued",
-                        "queue_number": engine_queue_no
-                    })
-                    
-                    print(f"🔄 会话 {session_id} 移动到引擎的 {mode} 队列，队列号: {engine_queue_no}")
-                    
-                    # WebSocket通知
-                    if self.socketio:
-                        self.socketio.emit('user_specific_event', 
-                                         {'message': f'请求 {session_id} ({engine_queue_no}) 已进入调度队列', 
-                                          'session_id': session_id, 
-                                          'queue_number': engine_queue_no, 
-                                          'type': 'request_queued_engine'}, 
-                                         room=f"user_{request_data['user_id']}")
-                    
-                    self.broadcast_status_update()
+                
+                    try:
+                        self.engine.enqueue_request(engine_req)
+                    except TimeoutError as e:
+                        # 入队命令仍在共享队列中，主节点稍后会执行：按已入队处理，
+                        # 若最终没有执行，由对账按引擎中不存在的会话恢复
+                        print(f"⚠️ {e}，会话 {session_id} 按已入队处理，本批剩余请求放回等候区")
+                        self._requeue_waiting(moved_requests[index + 1:], sessions)
+                        stalled = True
+                
+                    self.sessions.transition(session, ChargingStatus.ENGINE_QUEUED, reason='dequeued',
+                                             queue_number=engine_queue_no)
+                    queued.append((request_data, engine_queue_no))
+                
+                    print(f"🔄 会话 {session_id} 移动到引擎的 {request_data['charging_mode']} 队列，队列号: {engine_queue_no}")
+                    if stalled:
+                        break
+            
+                if not queued:
+                    return
+            
+                # 本批会话的数据库与Redis状态随同一次组提交写入
+                self.sessions.flush()
+            
+            # WebSocket通知（在会话锁之外）
+            if self.socketio:
+                for request_data, engine_queue_no in queued:
+                    session_id = request_data['session_id']
+                    self.socketio.emit('user_specific_event', 
+                                     {'message': f'请求 {session_id} ({engine_queue_no}) 已进入调度队列', 
+                                      'session_id': session_id, 
+                                      'queue_number': engine_queue_no, 
+                                      'type': 'request_queued_engine'}, 
+                                     room=f"user_{request_data['user_id']}")
+            
+            self.broadcast_status_update()
+    
+    def _requeue_waiting(self, requests: List[Dict], sessions: Dict[str, CachedSession]):
+        """把本批未送入引擎、仍在等候状态的请求按原票号放回等候区"""
+        requests = [r for r in requests if getattr(sessions.get(r['session_id']), 'status', None)
+                    == ChargingStatus.STATION_WAITING]
+        for mode in CHARGING_MODES:
+            self.waiting_area.requeue(mode, [r for r in requests if r['charging_mode'] == mode])
     
     def _map_charging_mode_to_engine_piletype(self, charging_mode: str) -> PileType:
         """映射充电模式到引擎桩类型"""
@@ -413,7 +660,7 @@ class ChargingService:
             return
             
         try:
-            events = scheduler_core.pop_events()
+            events = self.engine.pop_events()
             
             for event in events:
                 event_type = event.get("type")
@@ -425,13 +672,18 @@ class ChargingService:
                     start_time_str = event_data.start_time
                     start_time_dt = datetime.fromisoformat(start_time_str) if isinstance(start_time_str, str) else start_time_str
                     
-                    session = ChargingSession.query.filter_by(session_id=session_id).first()
+                    session = self.find_session(session_id)
                     if session and session.status == ChargingStatus.CANCELLING_AFTER_DISPATCH:
                         print(f"⚠️ 会话 {session_id} 被标记为取消，调度后立即结束")
-                        scheduler_core.end_charging(pile_id)
+                        self.engine.end_charging(pile_id)
+                        self.handle_engine_charging_end(session_id, pile_id, graceful_end=False)
                     else:
                         self.handle_engine_dispatch(session_id, pile_id, start_time_dt)
                 
+                elif event_type == "pre_assign":
+                    # 预分配到忙碌充电桩的本地队列，会话仍为引擎排队状态，接续充电时会收到 dispatch 事件
+                    print(f"📌 会话 {event_data.req_id} 预分配到充电桩 {event_data.pile_id}（本地队列第 {event_data.position} 位）")
+                
                 elif event_type == "charging_end":
                     session_id = None
                     pile_id = None
@@ -457,6 +709,15 @@ class ChargingService:
                 elif event_type == "pile_recover":
                     pile_id = event_data
                     self.handle_engine_pile_recover(pile_id)
+                
+                elif event_type == "pile_removed":
+                    self.handle_engine_pile_fault(event_data, removed=True)
+                
+                elif event_type == "pile_updated":
+                    print(f"🔧 引擎中充电桩 {event_data} 的配置已更新")
+                
+                elif event_type == "fault_recovered":
+                    print(f"⏱️ 会话 {event_data['req_id']} 故障后 {event_data['seconds']:.1f} 秒在充电桩 {event_data['pile_id']} 恢复充电")
             
             if events:
                 self.broadcast_status_update()
@@ -470,29 +731,30 @@ class ChargingService:
     
     def handle_engine_dispatch(self, session_id: str, pile_id: str, engine_start_time: datetime):
         """处理引擎调度事件"""
-        with self.lock:
+        with self._locked([session_id], [pile_id]):
             print(f"⚡ 处理调度: 会话 {session_id} 到充电桩 {pile_id}")
             
-            session = ChargingSession.query.filter_by(session_id=session_id).first()
+            session = self.find_session(session_id)
             if session:
-                session.pile_id = pile_id
-                session.status = ChargingStatus.CHARGING
-                session.start_time = engine_start_time
-                session.actual_amount = 0
-                session.charging_duration = 0
-                db.session.commit()
+                # 故障转移后续充：开始时间为在新桩上的实际开始时间，之前已充的电量记在 resumed_amount 中
+                charged = float(session.actual_amount or 0) if session.status == ChargingStatus.ENGINE_QUEUED else 0.0
+                try:
+                    self.sessions.transition(
+                        session, ChargingStatus.CHARGING, reason='redispatched' if charged > 0 else 'dispatched',
+                        pile_id=pile_id,
+                        start_time=engine_start_time,
+                        actual_amount=charged,
+                        charging_duration=float(session.charging_duration or 0) if charged > 0 else 0.0
+                    )
+                except InvalidTransition as e:
+                    # 会话已结束（如重复的调度事件），释放引擎中的充电桩
+                    print(f"⚠️ {e}，释放充电桩 {pile_id}")
+                    self.engine.end_charging(pile_id)
+                    return
+                self.sessions.flush()
                 
                 self.update_pile_redis_status(pile_id, PileStatus.BUSY.value, session_id)
                 
-                # 更新Redis状态
-                self.redis_client.hset(f"session_status:{session_id}", mapping={
-                    "status": "charging",
-                    "pile_id": pile_id,
-                    "start_time": engine_start_time.isoformat(),
-                    "actual_amount": "0",
-                    "charging_duration": "0"
-                })
-                
                 # WebSocket通知
                 if self.socketio:
                     msg = f"您的请求 {session.queue_number} ({session_id}) 已开始在充电桩 {pile_id} 充电。"
@@ -510,39 +772,35 @@ class ChargingService:
             return
             
         try:
-            with self.lock:
+            # 锁外先查出正在充电的会话，只锁住这些会话和充电桩
+            charging = db.session.query(ChargingSession.session_id, ChargingSession.pile_id)\
+                .filter(ChargingSession.status == ChargingStatus.CHARGING)\
+                .all()
+            if not charging:
+                return
+            
+            with self._locked([row.session_id for row in charging], [row.pile_id for row in charging]):
                 active_sessions = db.session.query(ChargingSession)\
                     .join(ChargingPile, ChargingSession.pile_id == ChargingPile.id)\
+                    .filter(ChargingSession.session_id.in_([row.session_id for row in charging]))\
                     .filter(ChargingSession.status == ChargingStatus.CHARGING)\
+                    .populate_existing()\
                     .all()
                 
-                sessions_to_update = []
+                changed = False
                 
                 for session in active_sessions:
                     if not session.start_time:
                         continue
                     
-                    elapsed_seconds = (datetime.now() - session.start_time).total_seconds()
-                    elapsed_hours = max(0, elapsed_seconds / 3600.0)
-                    
-                    # 获取充电桩功率
-                    pile_power = float(session.pile.power_rating)
-                    
-                    # 计算实际充电量
-                    potential_total_charged = elapsed_hours * pile_power
-                    new_actual_kwh = min(potential_total_charged, float(session.requested_amount))
-                    new_actual_kwh = round(new_actual_kwh, 4)
+                    # 计算实际充电量（故障转移续充的会话从已充电量接着累计）
+                    new_actual_kwh, elapsed_hours = self._delivered(session, float(session.pile.power_rating))
                     
                     if new_actual_kwh > float(session.actual_amount or 0):
-                        session.actual_amount = new_actual_kwh
-                        session.charging_duration = round(elapsed_hours, 4)
-                        sessions_to_update.append(session)
-                        
-                        # 更新Redis
-                        self.redis_client.hset(f"session_status:{session.session_id}", 
-                                             "actual_amount", str(new_actual_kwh))
-                        self.redis_client.hset(f"session_status:{session.session_id}", 
-                                             "charging_duration", str(round(elapsed_hours, 4)))
+                        # 充电进度随下一次组提交写入数据库与Redis
+                        self.sessions.update(session, actual_amount=new_actual_kwh,
+                                             charging_duration=elapsed_hours)
+                        changed = True
                     
                     # 检查是否达到请求电量
                     if new_actual_kwh >= float(session.requested_amount):
@@ -553,17 +811,18 @@ class ChargingService:
                         if is_first_completion:
                             print(f"✅ 会话 {session.session_id} 达到请求电量，通过引擎结束充电")
                             
-                            session.status = ChargingStatus.COMPLETING
+                            self.sessions.transition(session, ChargingStatus.COMPLETING, reason='target_reached')
+                            changed = True
                             
                             try:
-                                scheduler_core.end_charging(session.pile_id)
+                                self.engine.end_charging(session.pile_id)
                                 print(f"📤 已向引擎发送end_charging指令: {session.pile_id}")
                             except Exception as engine_error:
                                 print(f"❌ 向引擎发送end_charging指令失败: {engine_error}")
                                 self.redis_client.set(f"force_complete:{session.session_id}", "true", ex=60)
                 
-                if sessions_to_update:
-                    db.session.commit()
+                if changed:
+                    self.sessions.flush()
                     self.broadcast_status_update()
                     
         except Exception as e:
@@ -574,14 +833,14 @@ class ChargingService:
     
     def handle_engine_charging_end(self, session_id: str, pile_id: str, graceful_end: bool = True):
         """处理引擎充电结束事件"""
-        with self.lock:
+        with self._locked([session_id], [pile_id]):
             print(f"🔚 处理充电结束: 会话 {session_id} 在充电桩 {pile_id}")
             
             # 清理Redis完成标志
             completion_key = f"session_completing:{session_id}"
             self.redis_client.delete(completion_key)
             
-            session = ChargingSession.query.filter_by(session_id=session_id).first()
+            session = self.find_session(session_id)
             if not session:
                 print(f"⚠️ 未找到会话 {session_id}")
                 self.update_pile_redis_status(pile_id, PileStatus.IDLE.value, None)
@@ -599,27 +858,41 @@ class ChargingService:
                 actual_amount = float(session.actual_amount or 0)
                 charging_duration_hours = float(session.charging_duration or 0)
                 
-                fees = self.calculate_charging_fees(
-                    session_id, 
-                    actual_amount, 
-                    session.start_time, 
-                    datetime.now()
-                )
+                end_time = clock.now()
+                fees = self.session_fees(session, end_time)
+                # 故障转移前的电量已在原充电桩上记账，这里只记本段
+                segment_amount = round(actual_amount - float(session.resumed_amount or 0), 4)
                 
-                # 更新会话
-                session.status = final_status
-                session.end_time = datetime.now()
-                session.charging_fee = fees['charging_fee']
-                session.service_fee = fees['service_fee']
-                session.total_fee = fees['total_fee']
-                session.actual_amount = actual_amount
-                session.charging_duration = charging_duration_hours
+                # 更新会话（Redis中的会话状态随组提交一起清理）
+                try:
+                    self.sessions.transition(
+                        session, final_status,
+                        reason='charging_end' if graceful_end else 'stopped',
+                        end_time=end_time,
+                        charging_fee=fees['charging_fee'],
+                        service_fee=fees['service_fee'],
+                        total_fee=fees['total_fee'],
+                        actual_amount=actual_amount,
+                        charging_duration=charging_duration_hours
+                    )
+                except InvalidTransition as e:
+                    print(f"⚠️ {e}，忽略重复的结束事件")
+                    self.update_pile_redis_status(pile_id, PileStatus.IDLE.value, None)
+                    return
                 
                 # 确保更新到数据库
-                db.session.commit()
-                
-                # 清理Redis中的会话状态
-                self.redis_client.delete(f"session_status:{session_id}")
+                self.sessions.flush()
+                
+                # 生成计费记录，并累加充电桩统计
+                if segment_amount > 0 and session.start_time:
+                    from services.billing_service import BillingService
+                    BillingService.create_charging_record(
+                        user_id=session.user_id,
+                        pile_id=pile_id,
+                        start_time=session.start_time,
+                        end_time=end_time,
+                        power_consumed=segment_amount
+                    )
                 
                 # 更新充电桩状态
                 self.update_pile_redis_status(pile_id, PileStatus.IDLE.value, None)
@@ -644,54 +917,97 @@ class ChargingService:
     
     def handle_pile_end_without_session_id(self, pile_id: str):
         """处理只有pile_id的充电结束事件"""
-        with self.lock:
-            session = ChargingSession.query.filter_by(pile_id=pile_id)\
-                .filter(ChargingSession.status.in_([ChargingStatus.COMPLETING, ChargingStatus.CHARGING]))\
-                .order_by(ChargingSession.start_time.desc()).first()
-            
-            if session:
-                print(f"🔍 找到充电桩 {pile_id} 上的会话 {session.session_id}")
-                self.handle_engine_charging_end(session.session_id, pile_id, graceful_end=True)
-            else:
-                print(f"⚠️ 充电桩 {pile_id} 上未找到活跃会话，仅更新充电桩状态")
-                self.update_pile_redis_status(pile_id, PileStatus.IDLE.value, None)
+        # 不在此处加锁，由 handle_engine_charging_end 按会话 / 充电桩加锁
+        session = ChargingSession.query.filter_by(pile_id=pile_id)\
+            .filter(ChargingSession.status.in_([ChargingStatus.COMPLETING, ChargingStatus.CHARGING,
+                                                ChargingStatus.CANCELLING_AFTER_DISPATCH]))\
+            .order_by(ChargingSession.start_time.desc()).first()
+        
+        if session:
+            print(f"🔍 找到充电桩 {pile_id} 上的会话 {session.session_id}")
+            self.handle_engine_charging_end(session.session_id, pile_id, graceful_end=True)
+        else:
+            print(f"⚠️ 充电桩 {pile_id} 上未找到活跃会话，仅更新充电桩状态")
+            self.update_pile_redis_status(pile_id, PileStatus.IDLE.value, None)
     
-    def handle_engine_pile_fault(self, pile_id: str):
-        """处理充电桩故障事件"""
-        with self.lock:
-            print(f"🚫 处理充电桩故障: 充电桩 {pile_id}")
+    def handle_engine_pile_fault(self, pile_id: str, removed: bool = False):
+        """处理充电桩故障 / 注销事件：引擎已把剩余电量转入优先重调度队列时会话退回调度队列，否则按已充电量结束"""
+        # 先查出桩上的会话，再按 会话 -> 充电桩 的顺序加锁
+        charging_session = ChargingSession.query.filter_by(pile_id=pile_id)\
+            .filter_by(status=ChargingStatus.CHARGING).first()
+        locked_session_id = charging_session.session_id if charging_session else None
+        
+        with self._locked([locked_session_id], [pile_id]):
+            print(f"🚫 处理充电桩{'注销' if removed else '故障'}: 充电桩 {pile_id}")
+            incident = '已停用' if removed else '发生故障'
+            reason = 'pile_removed' if removed else 'pile_fault'
             
-            # 更新充电桩状态
+            # 更新充电桩状态（注销的充电桩由管理端维护数据库状态）
             pile = ChargingPile.query.get(pile_id)
-            if pile:
+            if pile and not removed:
                 pile.status = 'fault'
             
-            # 处理该充电桩上的活跃会话
-            active_session = ChargingSession.query.filter_by(pile_id=pile_id)\
-                .filter_by(status=ChargingStatus.CHARGING).first()
+            # 处理该充电桩上的活跃会话（加锁后重新确认状态）
+            active_session = None
+            if locked_session_id:
+                db.session.refresh(charging_session)
+                if charging_session.status == ChargingStatus.CHARGING and charging_session.pile_id == pile_id:
+                    active_session = charging_session
             
-            if active_session:
-                actual_amount = float(active_session.actual_amount or 0)
-                fees = self.calculate_charging_fees(
-                    active_session.session_id,
-                    actual_amount,
-                    active_session.start_time,
-                    datetime.now()
+            if active_session and self._engine_holds(active_session.session_id):
+                # 已充的这一段按故障前的时段计费并记到原充电桩，剩余电量在新桩上另起一段
+                fault_time = clock.now()
+                actual_amount, duration = self._delivered(active_session, float(pile.power_rating)) if pile \
+                    else (float(active_session.actual_amount or 0), float(active_session.charging_duration or 0))
+                segment_amount = round(actual_amount - float(active_session.resumed_amount or 0), 4)
+                if segment_amount > 0:
+                    from services.billing_service import BillingService
+                    BillingService.create_charging_record(
+                        user_id=active_session.user_id,
+                        pile_id=pile_id,
+                        start_time=active_session.start_time,
+                        end_time=fault_time,
+                        power_consumed=segment_amount
+                    )
+                self.sessions.update(active_session, actual_amount=actual_amount, charging_duration=duration)
+                fees = self.session_fees(active_session, fault_time)
+                self.sessions.transition(
+                    active_session, ChargingStatus.ENGINE_QUEUED, reason=reason,
+                    pile_id=None,
+                    resumed_amount=actual_amount,
+                    charging_fee=fees['charging_fee'],
+                    service_fee=fees['service_fee'],
+                    total_fee=fees['total_fee']
                 )
+                print(f"🔁 会话 {active_session.session_id} 已充 {actual_amount:.2f} kWh，剩余电量优先重新调度")
                 
-                active_session.status = ChargingStatus.FAULT_COMPLETED
-                active_session.pile_id = None
-                active_session.end_time = datetime.now()
-                active_session.charging_fee = fees['charging_fee']
-                active_session.service_fee = fees['service_fee']
-                active_session.total_fee = fees['total_fee']
-                
-                # 清理Redis
-                self.redis_client.delete(f"session_status:{active_session.session_id}")
+                if self.socketio:
+                    msg = (f"充电桩 {pile_id} {incident}。已充电量 {actual_amount:.2f} kWh 保留，"
+                           f"剩余电量已优先安排到其它充电桩。")
+                    self.socketio.emit('user_specific_event', {
+                        'message': msg,
+                        'type': 'session_fault_redispatched',
+                        'session_id': active_session.session_id,
+                        'pile_id': pile_id,
+                        'partial_amount': actual_amount,
+                    }, room=f'user_{active_session.user_id}')
+            
+            elif active_session:
+                actual_amount = float(active_session.actual_amount or 0)
+                fees = self.session_fees(active_session, clock.now())
+                
+                self.sessions.transition(
+                    active_session, ChargingStatus.FAULT_COMPLETED, reason=reason,
+                    pile_id=None,
+                    end_time=clock.now(),
+                    charging_fee=fees['charging_fee'],
+                    service_fee=fees['service_fee'],
+                    total_fee=fees['total_fee']
+                )
                 
                 # WebSocket通知
                 if self.socketio:
-                    msg = f"充电桩 {pile_id} 发生故障。您的充电请求已中断。已充电量 {actual_amount:.2f} kWh，费用 {fees['total_fee']:.2f}元。"
+                    msg = f"充电桩 {pile_id} {incident}。您的充电请求已中断。已充电量 {actual_amount:.2f} kWh，费用 {fees['total_fee']:.2f}元。"
                     self.socketio.emit('user_specific_event', {
                         'message': msg, 
                         'type': 'session_fault_stopped',
@@ -701,12 +1017,20 @@ class ChargingService:
                         'partial_fees': fees
                     }, room=f'user_{active_session.user_id}')
             
+            # 先提交充电桩状态，再等待会话变更的组提交
             db.session.commit()
-            self.update_pile_redis_status(pile_id, PileStatus.FAULT.value, None)
+            self.sessions.flush()
+            self.update_pile_redis_status(pile_id, 'offline' if removed else PileStatus.FAULT.value, None)
+    
+    def _engine_holds(self, session_id: str) -> bool:
+        """引擎仍持有该请求（在等候队列 / 本地队列中，或已转到其它充电桩上充电）"""
+        return (self.engine.get_queue_position(session_id) is not None
+                or self.engine.get_preassigned_position(session_id) is not None
+                or self.engine.get_charging_pile(session_id) is not None)
     
     def handle_engine_pile_recover(self, pile_id: str):
         """处理充电桩恢复事件"""
-        with self.lock:
+        with self.pile_locks.for_key(pile_id):
             print(f"🔧 处理充电桩恢复: 充电桩 {pile_id}")
             
             pile = ChargingPile.query.get(pile_id)
@@ -715,7 +1039,8 @@ class ChargingService:
                 db.session.commit()
             
             self.update_pile_redis_status(pile_id, PileStatus.IDLE.value, None)
-            self.process_station_waiting_area_to_engine()
+        
+        self.process_station_waiting_area_to_engine()
     
     def check_and_recover_timeout_completing_sessions(self):
         """检查并恢复超时的completing会话"""
@@ -723,11 +1048,20 @@ class ChargingService:
             return
             
         try:
-            with self.lock:
-                # 查找所有completing状态的会话
-                completing_sessions = ChargingSession.query.filter_by(
-                    status=ChargingStatus.COMPLETING
-                ).all()
+            # 锁外先查出completing状态的会话，只锁住这些会话和充电桩
+            completing = db.session.query(ChargingSession.session_id, ChargingSession.pile_id)\
+                .filter(ChargingSession.status == ChargingStatus.COMPLETING)\
+                .all()
+            if not completing:
+                return
+            
+            with self._locked([row.session_id for row in completing], [row.pile_id for row in completing]):
+                # 查找所有completing状态的会话（加锁后重新确认状态）
+                completing_sessions = ChargingSession.query\
+                    .filter(ChargingSession.session_id.in_([row.session_id for row in completing]))\
+                    .filter_by(status=ChargingStatus.COMPLETING)\
+                    .populate_existing()\
+                    .all()
                 
                 if not completing_sessions:
                     return
@@ -740,35 +1074,33 @@ class ChargingService:
                         
                         # 计算费用
                         actual_amount = float(session.actual_amount or 0)
-                        fees = self.calculate_charging_fees(
-                            session.session_id,
-                            actual_amount,
-                            session.start_time,
-                            datetime.now()
-                        )
+                        segment_amount = round(actual_amount - float(session.resumed_amount or 0), 4)
+                        end_time = clock.now()
+                        fees = self.session_fees(session, end_time)
                         
                         # 更新会话状态
-                        session.status = ChargingStatus.COMPLETED
-                        session.end_time = datetime.now()
-                        session.charging_fee = fees['charging_fee']
-                        session.service_fee = fees['service_fee']
-                        session.total_fee = fees['total_fee']
+                        self.sessions.transition(
+                            session, ChargingStatus.COMPLETED, reason='completing_timeout',
+                            end_time=end_time,
+                            charging_fee=fees['charging_fee'],
+                            service_fee=fees['service_fee'],
+                            total_fee=fees['total_fee']
+                        )
                         
                         # 创建计费记录
-                        if actual_amount > 0:
+                        if segment_amount > 0:
                             from services.billing_service import BillingService
                             billing_record = BillingService.create_charging_record(
                                 user_id=session.user_id,
                                 pile_id=session.pile_id,
                                 start_time=session.start_time,
                                 end_time=session.end_time,
-                                power_consumed=actual_amount
+                                power_consumed=segment_amount
                             )
                             if billing_record:
                                 print(f"✅ 为恢复会话创建计费记录: ID={billing_record.id}")
                         
-                        # 清理Redis状态
-                        self.redis_client.delete(f"session_status:{session.session_id}")
+                        # 清理Redis完成标志
                         self.redis_client.delete(f"session_completing:{session.session_id}")
                         
                         # 更新充电桩状态
@@ -782,7 +1114,7 @@ class ChargingService:
                         continue
                 
                 # 提交所有更改
-                db.session.commit()
+                self.sessions.flush()
                 print(f"✅ 成功恢复了 {len(completing_sessions)} 个超时会话")
                 
         except Exception as e:
@@ -791,15 +1123,37 @@ class ChargingService:
             import traceback
             traceback.print_exc()
     
+    def reconcile_pile_counters(self):
+        """定时核对充电桩累计统计（计费记录为准）"""
+        from services.billing_service import BillingService
+        try:
+            return BillingService.reconcile_pile_counters()
+        except Exception as e:
+            print(f"❌ 充电桩统计核对任务失败: {e}")
+            return None
+    
+    def load_pile_busy_intervals(self):
+        """启动时从会话表补入保留期内的充电桩忙碌区间"""
+        since = clock.now() - timedelta(days=self.config.PILE_UTILIZATION_RETENTION_DAYS)
+        sessions = db.session.query(
+            ChargingSession.session_id, ChargingSession.pile_id, ChargingSession.status,
+            ChargingSession.start_time, ChargingSession.end_time
+        ).filter(
+            ChargingSession.pile_id.isnot(None),
+            ChargingSession.start_time >= since
+        ).order_by(ChargingSession.start_time).yield_per(1000)
+        loaded = self.pile_busy.load(sessions)
+        print(f"📈 充电桩忙碌区间已加载: {loaded} 个")
+    
     def force_sync_engine_pile_states(self):
         """强制同步引擎与应用的充电桩状态"""
         try:
             print("🔄 开始强制同步引擎充电桩状态...")
             
             try:
-                all_engine_piles = scheduler_core.get_all_piles()
+                all_engine_piles = self.engine.get_all_piles()
             except AttributeError:
-                print("⚠️ scheduler_core.get_all_piles()不可用，跳过强制同步")
+                print("⚠️ self.engine.get_all_piles()不可用，跳过强制同步")
                 return
             
             for pile in all_engine_piles:
@@ -815,7 +1169,7 @@ class ChargingService:
                     
                     if not active_session:
                         print(f"🔧 检测到状态不一致: 充电桩 {pile_id} 引擎状态为BUSY但无活跃会话，强制释放")
-                        scheduler_core.end_charging(pile_id)
+                        self.engine.end_charging(pile_id)
                         self.update_pile_redis_status(pile_id, PileStatus.IDLE.value, None)
                     else:
                         print(f"✅ 充电桩 {pile_id} 状态正常: 引擎BUSY且有活跃会话 {current_req_id}")
@@ -831,6 +1185,24 @@ class ChargingService:
             import traceback
             traceback.print_exc()
     
+    def _delivered(self, session, pile_power: float) -> Tuple[float, float]:
+        """按当前充电段的开始时间与充电桩功率推算 (累计充电量, 累计充电时长)"""
+        resumed = float(session.resumed_amount or 0)
+        elapsed_hours = max(0.0, (clock.now() - session.start_time).total_seconds() / 3600.0)
+        segment = min(elapsed_hours * pile_power, float(session.requested_amount) - resumed)
+        # 之前各段的时长按已充电量在本桩功率下折算
+        resumed_hours = resumed / pile_power if pile_power > 0 else 0.0
+        return round(resumed + segment, 4), round(resumed_hours + elapsed_hours, 4)
+    
+    def session_fees(self, session, end_time: Optional[datetime]) -> Dict[str, float]:
+        """会话费用：故障转移前各段已计的费用 + 当前充电段（累计电量 - resumed_amount）按本段时段计费"""
+        resumed = float(session.resumed_amount or 0)
+        fees = self.calculate_charging_fees(session.session_id, float(session.actual_amount or 0) - resumed,
+                                            session.start_time, end_time)
+        if resumed > 0:
+            fees = {key: round(value + float(getattr(session, key) or 0), 2) for key, value in fees.items()}
+        return fees
+    
     def calculate_charging_fees(self, session_id: str, actual_amount, 
                                start_time: Optional[datetime], end_time: Optional[datetime]) -> Dict[str, float]:
         """计算充电费用"""
@@ -861,20 +1233,23 @@ class ChargingService:
     
     def update_pile_redis_status(self, pile_id: str, engine_status_str: str, charging_session_id: Optional[str]):
         """更新充电桩Redis状态"""
-        app_status = 'offline'
-        if engine_status_str == PileStatus.IDLE.value:
-            app_status = 'available'
-        elif engine_status_str == PileStatus.BUSY.value:
-            app_status = 'occupied'
-        elif engine_status_str == PileStatus.FAULT.value:
-            app_status = 'fault'
-        elif engine_status_str == PileStatus.PAUSED.value:
-            app_status = 'maintenance'
+        self.update_piles_redis_status({pile_id: engine_status_str}, {pile_id: charging_session_id})
+    
+    def update_piles_redis_status(self, statuses: Dict[str, str], sessions: Optional[Dict[str, str]] = None):
+        """在一个管道中批量更新充电桩Redis状态：statuses 为 {pile_id: 引擎状态}"""
+        app_statuses = {
+            PileStatus.IDLE.value: 'available',
+            PileStatus.BUSY.value: 'occupied',
+            PileStatus.FAULT.value: 'fault',
+            PileStatus.PAUSED.value: 'maintenance',
+        }
+        sessions = sessions or {}
         
         with self.redis_client.pipeline() as pipe:
-            pipe.hset(f"pile_status:{pile_id}", "status", app_status)
-            pipe.hset(f"pile_status:{pile_id}", "current_charging_session_id", 
-                     charging_session_id if charging_session_id else "")
+            for pile_id, engine_status_str in statuses.items():
+                pipe.hset(f"pile_status:{pile_id}", "status", app_statuses.get(engine_status_str, 'offline'))
+                pipe.hset(f"pile_status:{pile_id}", "current_charging_session_id", 
+                         sessions.get(pile_id) or "")
             pipe.execute()
     
     def broadcast_status_update(self):
@@ -899,29 +1274,29 @@ class ChargingService:
         if not self._initialized or not self.redis_client:
             return {'error': '服务未初始化'}
             
-        station_waiting = {
-            'fast': self.redis_client.llen('station_waiting_area:fast'),
-            'trickle': self.redis_client.llen('station_waiting_area:trickle'),
-        }
+        station_waiting = self.waiting_area.sizes()
         station_waiting['total'] = station_waiting['fast'] + station_waiting['trickle']
         
         try:
-            engine_q_fast_reqs = scheduler_core.get_waiting_list(PileType.D.value)
-            engine_q_trickle_reqs = scheduler_core.get_waiting_list(PileType.A.value)
+            engine_q_fast_reqs = self.engine.get_waiting_list(PileType.D.value, n=5)
+            engine_q_trickle_reqs = self.engine.get_waiting_list(PileType.A.value, n=5)
+            engine_fast_count = self.engine.get_queue_length(PileType.D.value)
+            engine_trickle_count = self.engine.get_queue_length(PileType.A.value)
         except:
             engine_q_fast_reqs = []
             engine_q_trickle_reqs = []
+            engine_fast_count = engine_trickle_count = 0
         
         engine_queues_status = {
-            'fast_count': len(engine_q_fast_reqs),
-            'trickle_count': len(engine_q_trickle_reqs),
+            'fast_count': engine_fast_count,
+            'trickle_count': engine_trickle_count,
             'fast_queue_preview': [req.queue_no for req in engine_q_fast_reqs[:5]],
             'trickle_queue_preview': [req.queue_no for req in engine_q_trickle_reqs[:5]],
         }
         
         piles_ui_info = {}
         try:
-            all_engine_piles = scheduler_core.get_all_piles()
+            all_engine_piles = self.engine.get_all_piles()
         except AttributeError:
             all_engine_piles = []
         
@@ -942,7 +1317,7 @@ class ChargingService:
             'station_waiting_area': station_waiting,
             'engine_dispatch_queues': engine_queues_status,
             'charging_piles': piles_ui_info,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': clock.now().isoformat()
         }
     
     def get_queue_info_for_user(self, user_id: int, charging_mode_filter: Optional[str] = None) -> Dict:
@@ -979,21 +1354,15 @@ class ChargingService:
             'total_in_station_queue': None,
             'position_in_engine_queue': None,
             'total_in_engine_queue': None,
+            'assigned_pile_id': None,
+            'position_in_pile_queue': None,
             'pile_id': active_session.pile_id,
             'estimated_wait_time_msg': "等待时间信息暂不可用"
         }
         
         if status == 'station_waiting':
-            station_q_key = f"station_waiting_area:{current_mode}"
-            station_q_list_json = self.redis_client.lrange(station_q_key, 0, -1)
-            response_data['total_in_station_queue'] = len(station_q_list_json)
-            
-            pos_station = 0
-            for idx, item_json in enumerate(station_q_list_json):
-                item = json.loads(item_json)
-                if item['session_id'] == session_id:
-                    pos_station = idx + 1
-                    break
+            response_data['total_in_station_queue'] = self.waiting_area.size(current_mode)
+            pos_station = self.waiting_area.position(current_mode, session_id) or 0
             
             response_data['position_in_station_queue'] = pos_station if pos_station > 0 else "N/A"
             response_data['estimated_wait_time_msg'] = f"正在充电站等候区排队，前方还有 {pos_station-1 if pos_station > 0 else 'N/A'} 位。"
@@ -1001,17 +1370,21 @@ class ChargingService:
         elif status == 'engine_queued':
             engine_pile_type_filter = self._map_charging_mode_to_engine_piletype(current_mode)
             try:
-                engine_q_list = scheduler_core.get_waiting_list(engine_pile_type_filter.value, n=-1)
-                response_data['total_in_engine_queue'] = len(engine_q_list)
-                
-                pos_engine = 0
-                for idx, req in enumerate(engine_q_list):
-                    if req.req_id == session_id:
-                        pos_engine = idx + 1
-                        break
-                
-                response_data['position_in_engine_queue'] = pos_engine if pos_engine > 0 else "N/A"
-                response_data['estimated_wait_time_msg'] = f"正在调度队列排队 (号码: {queue_number})，前方还有 {pos_engine-1 if pos_engine > 0 else 'N/A'} 位。"
+                response_data['total_in_engine_queue'] = self.engine.get_queue_length(engine_pile_type_filter.value)
+                engine_position = self.engine.get_queue_position(session_id)
+                preassigned = self.engine.get_preassigned_position(session_id) if not engine_position else None
+                
+                if preassigned:
+                    # 已预分配到充电桩的本地队列：位置按该桩的本地队列计，不与等候队列混在一起
+                    pile_id, pos_pile = preassigned
+                    response_data['assigned_pile_id'] = pile_id
+                    response_data['position_in_pile_queue'] = pos_pile
+                    response_data['estimated_wait_time_msg'] = (f"已安排到充电桩 {pile_id} (号码: {queue_number})，"
+                                                                f"前方还有 {pos_pile} 位（含正在充电的车辆）。")
+                else:
+                    pos_engine = engine_position[1] if engine_position else 0
+                    response_data['position_in_engine_queue'] = pos_engine if pos_engine > 0 else "N/A"
+                    response_data['estimated_wait_time_msg'] = f"正在调度队列排队 (号码: {queue_number})，前方还有 {pos_engine-1 if pos_engine > 0 else 'N/A'} 位。"
             except:
                 response_data['estimated_wait_time_msg'] = f"正在调度队列排队 (号码: {queue_number})。"
         
@@ -1026,14 +1399,11 @@ class ChargingService:
             return {'success': False, 'message': '充电服务未初始化', 'code': 5003}
             
         try:
-            with self.lock:
+            with self.session_locks.for_key(session_id):
                 # 验证会话归属
-                session = ChargingSession.query.filter_by(
-                    session_id=session_id,
-                    user_id=user_id
-                ).first()
+                session = self.find_session(session_id)
                 
-                if not session:
+                if not session or session.user_id != user_id:
                     return {'success': False, 'message': '充电会话不存在或无权访问', 'code': 4004}
                 
                 current_status = session.status
@@ -1043,40 +1413,43 @@ class ChargingService:
                 
                 if current_status == ChargingStatus.STATION_WAITING:
                     # 从充电站等候区移除
-                    station_queue_key = f"station_waiting_area:{session.charging_mode.value}"
-                    queue_items = self.redis_client.lrange(station_queue_key, 0, -1)
-                    
-                    for idx, item_json in enumerate(queue_items):
-                        item = json.loads(item_json)
-                        if item['session_id'] == session_id:
-                            self.redis_client.lrem(station_queue_key, 1, item_json)
-                            break
+                    self.waiting_area.remove(session.charging_mode.value, session_id)
                     
-                    session.status = ChargingStatus.CANCELLED
-                    session.end_time = datetime.now()
+                    self.sessions.transition(session, ChargingStatus.CANCELLED, reason='user_cancel',
+                                             end_time=clock.now())
                     
                 elif current_status == ChargingStatus.ENGINE_QUEUED:
-                    # 标记取消，让引擎处理
-                    session.status = ChargingStatus.CANCELLED
-                    session.end_time = datetime.now()
+                    # 直接从引擎队列摘除，不再占用充电桩
+                    if self.engine.cancel_request(session_id):
+                        end_time = clock.now()
+                        fee_fields = {}
+                        if float(session.actual_amount or 0) > 0:
+                            # 故障转移等待中取消：已充电量在故障时已计费
+                            fees = self.session_fees(session, end_time)
+                            fee_fields = {key: fees[key] for key in ('charging_fee', 'service_fee', 'total_fee')}
+                        self.sessions.transition(session, ChargingStatus.CANCELLED, reason='user_cancel',
+                                                 end_time=end_time, **fee_fields)
+                    else:
+                        # 已被调度线程取走，等调度事件到达后立即结束
+                        self.sessions.transition(session, ChargingStatus.CANCELLING_AFTER_DISPATCH,
+                                                 reason='user_cancel')
                     
                 elif current_status in [ChargingStatus.CHARGING, ChargingStatus.COMPLETING]:
                     if session.pile_id:
                         # 立即结束充电
                         try:
-                            scheduler_core.end_charging(session.pile_id)
-                            session.status = ChargingStatus.CANCELLING_AFTER_DISPATCH
+                            self.engine.end_charging(session.pile_id)
                         except Exception as e:
                             print(f"❌ 结束充电时出错: {e}")
                             return {'success': False, 'message': '取消充电失败', 'code': 5002}
+                        self.sessions.transition(session, ChargingStatus.CANCELLING_AFTER_DISPATCH,
+                                                 reason='user_cancel')
                     else:
-                        session.status = ChargingStatus.CANCELLED
-                        session.end_time = datetime.now()
-                
-                # 清理Redis状态
-                self.redis_client.delete(f"session_status:{session_id}")
+                        self.sessions.transition(session, ChargingStatus.CANCELLED, reason='user_cancel',
+                                                 end_time=clock.now())
                 
-                db.session.commit()
+                # 会话变更与Redis状态清理随组提交一起写入
+                self.sessions.flush()
                 
                 # WebSocket通知
                 if self.socketio:
@@ -1114,14 +1487,11 @@ class ChargingService:
             return {'success': False, 'message': '充电服务未初始化', 'code': 5003}
             
         try:
-            with self.lock:
+            with self.session_locks.for_key(session_id):
                 # 验证会话归属
-                session = ChargingSession.query.filter_by(
-                    session_id=session_id,
-                    user_id=user_id
-                ).first()
+                session = self.find_session(session_id)
                 
-                if not session:
+                if not session or session.user_id != user_id:
                     return {'success': False, 'message': '充电会话不存在或无权访问', 'code': 4004}
                 
                 current_status = session.status
@@ -1130,56 +1500,54 @@ class ChargingService:
                 if current_status not in [ChargingStatus.STATION_WAITING, ChargingStatus.ENGINE_QUEUED]:
                     return {'success': False, 'message': '当前状态不允许修改请求', 'code': 4006}
                 
-                modified_fields = []
+                changes = {}
+                mode_changed = bool(new_charging_mode) and new_charging_mode != session.charging_mode.value
+                amount_changed = bool(new_requested_amount) and new_requested_amount != float(session.requested_amount)
+                
+                # 调度队列中的请求：在引擎中原地修改，保持排队次序（故障转移的请求在引擎中只记剩余电量）
+                if current_status == ChargingStatus.ENGINE_QUEUED and (mode_changed or amount_changed):
+                    charged = float(session.actual_amount or 0)
+                    if amount_changed and new_requested_amount <= charged:
+                        return {'success': False, 'message': f'请求电量不能小于已充电量 {charged:.2f} kWh', 'code': 4006}
+                    engine_req = self.engine.update_request(
+                        session_id,
+                        kwh=new_requested_amount - charged if amount_changed else None,
+                        pile_type=self._map_charging_mode_to_engine_piletype(new_charging_mode).value if mode_changed else None
+                    )
+                    if engine_req is None:
+                        return {'success': False, 'message': '请求已被调度，无法修改', 'code': 4006}
+                    if mode_changed:
+                        changes['queue_number'] = engine_req.queue_no
+                
+                # 等候区中的请求：换队列（保持原有先后次序）或原地修改
+                if current_status == ChargingStatus.STATION_WAITING and (mode_changed or amount_changed):
+                    fields = {'requested_amount': new_requested_amount} if amount_changed else {}
+                    if mode_changed:
+                        updated = self.waiting_area.move(session_id, session.charging_mode.value,
+                                                         new_charging_mode, **fields)
+                    else:
+                        updated = self.waiting_area.update(session.charging_mode.value, session_id, **fields)
+                    if not updated:
+                        # 已被出队线程取走，正在进入调度队列
+                        return {'success': False, 'message': '请求正在进入调度队列，请稍后重试', 'code': 4006}
                 
                 # 修改充电模式
-                if new_charging_mode and new_charging_mode != session.charging_mode.value:
-                    if current_status == ChargingStatus.ENGINE_QUEUED:
-                        return {'success': False, 'message': '调度队列中的请求不允许修改充电模式', 'code': 4007}
-                    
-                    # 从当前队列移除
-                    old_queue_key = f"station_waiting_area:{session.charging_mode.value}"
-                    queue_items = self.redis_client.lrange(old_queue_key, 0, -1)
-                    
-                    for idx, item_json in enumerate(queue_items):
-                        item = json.loads(item_json)
-                        if item['session_id'] == session_id:
-                            self.redis_client.lrem(old_queue_key, 1, item_json)
-                            
-                            # 更新数据并添加到新队列
-                            item['charging_mode'] = new_charging_mode
-                            self.redis_client.rpush(f"station_waiting_area:{new_charging_mode}", json.dumps(item))
-                            break
-                    
-                    session.charging_mode = ChargingMode(new_charging_mode)
+                modified_fields = []
+                if mode_changed:
+                    changes['charging_mode'] = ChargingMode(new_charging_mode)
                     modified_fields.append('charging_mode')
                 
                 # 修改请求充电量
-                if new_requested_amount and new_requested_amount != float(session.requested_amount):
-                    session.requested_amount = new_requested_amount
+                if amount_changed:
+                    changes['requested_amount'] = new_requested_amount
                     modified_fields.append('requested_amount')
-                    
-                    # 更新Redis中的数据
-                    if current_status == ChargingStatus.STATION_WAITING:
-                        queue_key = f"station_waiting_area:{session.charging_mode.value}"
-                        queue_items = self.redis_client.lrange(queue_key, 0, -1)
-                        
-                        for idx, item_json in enumerate(queue_items):
-                            item = json.loads(item_json)
-                            if item['session_id'] == session_id:
-                                item['requested_amount'] = new_requested_amount
-                                self.redis_client.lset(queue_key, idx, json.dumps(item))
-                                break
                 
                 if not modified_fields:
                     return {'success': False, 'message': '没有需要修改的字段', 'code': 4008}
                 
-                # 更新Redis状态
-                if new_requested_amount:
-                    self.redis_client.hset(f"session_status:{session_id}", 
-                                         "requested_amount", str(new_requested_amount))
-                
-                db.session.commit()
+                # 数据库与Redis状态随组提交一起写入
+                self.sessions.update(session, reason='user_modify', **changes)
+                self.sessions.flush()
                 
                 # WebSocket通知
                 if self.socketio:
@@ -0,0 +1,204 @@
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from models.charging import ChargingStatus
+from scheduler_core import clock
+
+# 会话在这些状态下占用充电桩（已调度，尚未结束）
+_DISPATCHED_STATUSES = frozenset({
+    ChargingStatus.CHARGING, ChargingStatus.COMPLETING, ChargingStatus.CANCELLING_AFTER_DISPATCH,
+})
+
+
+def _ts(value) -> float:
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+class _PileIntervals:
+    """单个充电桩互不重叠的忙碌区间，按开始时间排序，附带时长前缀和
+
+    prefix[k] 为前 k 个区间的总时长，任意窗口的忙碌时长只需两次二分查找。
+    过期区间通过移动 head 淘汰，累计到一定数量后再整体压缩。
+    """
+
+    __slots__ = ('starts', 'ends', 'prefix', 'head', 'open_session', 'open_start')
+
+    def __init__(self):
+        self.starts: List[float] = []
+        self.ends: List[float] = []
+        self.prefix: List[float] = [0.0]
+        self.head = 0
+        self.open_session: Optional[str] = None
+        self.open_start: Optional[float] = None
+
+    def add(self, start: float, end: float) -> None:
+        # 与已有区间重叠的部分裁掉（重复上报同一会话时不会重复计算）
+        pos = bisect_right(self.starts, start, lo=self.head)
+        if pos > self.head:
+            start = max(start, self.ends[pos - 1])
+        if pos < len(self.starts):
+            end = min(end, self.starts[pos])
+        if end <= start:
+            return
+
+        if pos == len(self.starts):
+            self.starts.append(start)
+            self.ends.append(end)
+            self.prefix.append(self.prefix[-1] + end - start)
+            return
+
+        # 乱序到达（少见）：插入后重建其后的前缀和
+        self.starts.insert(pos, start)
+        self.ends.insert(pos, end)
+        self.prefix.insert(pos + 1, 0.0)
+        for k in range(pos, len(self.starts)):
+            self.prefix[k + 1] = self.prefix[k] + self.ends[k] - self.starts[k]
+
+    def busy_seconds(self, t0: float, t1: float, now: float) -> float:
+        busy = 0.0
+        i = bisect_right(self.ends, t0, lo=self.head)      # 第一个结束晚于 t0 的区间
+        j = bisect_left(self.starts, t1, lo=self.head)     # 第一个开始不早于 t1 的区间
+        if i < j:
+            busy = self.prefix[j] - self.prefix[i]
+            busy -= max(0.0, t0 - self.starts[i])
+            busy -= max(0.0, self.ends[j - 1] - t1)
+        if self.open_start is not None:
+            busy += max(0.0, min(t1, now) - max(t0, self.open_start))
+        return busy
+
+    def prune(self, before: float) -> None:
+        self.head = max(self.head, bisect_right(self.ends, before, lo=self.head))
+        if self.head > 1024 and self.head * 2 > len(self.starts):
+            offset = self.prefix[self.head]
+            self.starts = self.starts[self.head:]
+            self.ends = self.ends[self.head:]
+            self.prefix = [value - offset for value in self.prefix[self.head:]]
+            self.head = 0
+
+    def __len__(self):
+        return len(self.starts) - self.head
+
+
+class PileBusyIndex:
+    """充电桩忙碌区间索引，用于计算任意时间窗口内的利用率
+
+    由会话状态机在调度（进入充电）和结束（进入终态）时喂入，不扫描会话表；
+    启动时用 load() 从数据库补入保留期内的历史区间。load() 在后台执行，期间状态机已在喂入，
+    load() 完成前结束的会话记下结束时间，读到的旧"充电中"记录按该时间补成已结束的区间。
+    每个充电桩一个有序区间数组 + 前缀和，"[t0, t1) 内忙碌秒数" 为 O(log n)。
+    """
+
+    def __init__(self, retention_days: int = 31):
+        self.retention = timedelta(days=retention_days).total_seconds()
+        self._lock = threading.Lock()
+        self._piles: Dict[str, _PileIntervals] = {}
+        # load() 完成前已结束的会话 session_id -> 结束时间，加载完成后不再记录
+        self._closed: Optional[Dict[str, float]] = {}
+
+    # ==================== 写入 ====================
+
+    def open(self, pile_id: str, session_id: str, start: datetime) -> None:
+        """会话开始在充电桩上充电"""
+        with self._lock:
+            pile = self._pile_locked(pile_id)
+            if pile.open_session is not None and pile.open_session != session_id:
+                # 上一个会话没有收到结束事件，按新会话开始时间截断
+                pile.add(pile.open_start, _ts(start))
+            pile.open_session = session_id
+            pile.open_start = _ts(start)
+
+    def close(self, pile_id: str, session_id: str, end: datetime) -> None:
+        """会话在充电桩上结束"""
+        with self._lock:
+            if self._closed is not None:
+                self._closed[session_id] = _ts(end)
+            pile = self._piles.get(pile_id)
+            if pile is None or pile.open_session != session_id:
+                return
+            pile.add(pile.open_start, _ts(end))
+            pile.open_session = None
+            pile.open_start = None
+            pile.prune(_ts(end) - self.retention)
+
+    def add(self, pile_id: str, start: datetime, end: datetime) -> None:
+        """补入一个已结束的忙碌区间"""
+        with self._lock:
+            self._pile_locked(pile_id).add(_ts(start), _ts(end))
+
+    def observe(self, session_id: str, pile_id: Optional[str], from_status: ChargingStatus,
+                to_status: ChargingStatus, values: Dict) -> None:
+        """会话状态机的转换回调：进入充电时开始区间，已调度的会话进入终态或因故障退回调度队列时结束区间"""
+        if to_status == ChargingStatus.CHARGING and from_status not in _DISPATCHED_STATUSES:
+            pile_id = values.get('pile_id', pile_id)
+            start = values.get('start_time')
+            if pile_id and start:
+                self.open(pile_id, session_id, start)
+        elif from_status in _DISPATCHED_STATUSES and to_status not in _DISPATCHED_STATUSES and pile_id:
+            self.close(pile_id, session_id, values.get('end_time') or clock.now())
+
+    def load(self, sessions: Iterable) -> int:
+        """从会话记录补入区间（需有 session_id / pile_id / status / start_time / end_time），返回补入个数"""
+        count = 0
+        try:
+            for session in sessions:
+                if not session.pile_id or not session.start_time:
+                    continue
+                if session.status in _DISPATCHED_STATUSES:
+                    count += self._load_dispatched(session)
+                elif session.end_time:
+                    self.add(session.pile_id, session.start_time, session.end_time)
+                    count += 1
+        finally:
+            with self._lock:
+                self._closed = None
+        return count
+
+    def _load_dispatched(self, session) -> int:
+        with self._lock:
+            pile = self._pile_locked(session.pile_id)
+            closed_at = self._closed.get(session.session_id) if self._closed is not None else None
+            if closed_at is not None:
+                # 读到记录之后会话已实时结束，补成已结束的区间
+                pile.add(_ts(session.start_time), closed_at)
+                return 1
+            if pile.open_session is None:
+                pile.open_session = session.session_id
+                pile.open_start = _ts(session.start_time)
+                return 1
+            return 0
+
+    # ==================== 查询 ====================
+
+    def busy_seconds(self, pile_id: str, start: datetime, end: datetime,
+                     now: Optional[datetime] = None) -> float:
+        """充电桩在 [start, end) 内的忙碌秒数（进行中的会话计到 now）"""
+        now_ts = _ts(now or clock.now())
+        with self._lock:
+            pile = self._piles.get(pile_id)
+            return pile.busy_seconds(_ts(start), _ts(end), now_ts) if pile is not None else 0.0
+
+    def utilization(self, pile_id: str, start: datetime, end: datetime,
+                    now: Optional[datetime] = None) -> float:
+        """[start, end) 内的利用率（百分比），窗口尚未结束的部分不计入分母"""
+        now = now or clock.now()
+        end = min(end, now)
+        window = (end - start).total_seconds()
+        if window <= 0:
+            return 0.0
+        return round(self.busy_seconds(pile_id, start, end, now) / window * 100, 2)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'piles': len(self._piles),
+                'intervals': sum(len(pile) for pile in self._piles.values()),
+                'open': sum(1 for pile in self._piles.values() if pile.open_session is not None),
+            }
+
+    def _pile_locked(self, pile_id: str) -> _PileIntervals:
+        pile = self._piles.get(pile_id)
+        if pile is None:
+            pile = self._piles[pile_id] = _PileIntervals()
+        return pile
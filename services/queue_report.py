@@ -0,0 +1,194 @@
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from models.user import db
+from models.billing import ChargingPile
+from models.charging import ChargingSession, ChargingStatus
+from services.station_waiting_area import CHARGING_MODES
+from scheduler_core import PileType, PileStatus, clock
+
+# 分区名 -> (类别, 充电模式)
+SECTIONS = {
+    'station_fast': ('station', 'fast'),
+    'station_trickle': ('station', 'trickle'),
+    'engine_fast': ('engine', 'fast'),
+    'engine_trickle': ('engine', 'trickle'),
+    'charging': ('charging', None),
+}
+
+_ENGINE_TYPES = {'fast': PileType.D, 'trickle': PileType.A}
+
+_CHARGING_STATUSES = (ChargingStatus.CHARGING, ChargingStatus.COMPLETING)
+
+
+class QueueReport:
+    """管理端队列信息：按分区分批读取，内存占用与队列总长度无关
+
+    等候区按 [start, stop] 区间读取 Redis，引擎队列按 offset 读取（引擎内 O(log n) 定位），
+    充电中的会话按批次查询，每批 batch_size 条；遍历时逐条产出，调用方可直接分页返回或以 NDJSON 流式输出。
+
+    每条排队请求附带已等待时长和预计等待时长（分钟）。预计等待按排在前面的请求电量累加：
+    (该类型充电桩剩余充电时长之和 + 前方请求电量 / 平均功率) / 可用充电桩数。
+    等候区的请求排在同类型引擎队列之后，引擎队列的总电量由引擎直接给出，不需要读整个队列。
+    """
+
+    def __init__(self, charging_service, batch_size: int = 200):
+        self.service = charging_service
+        self.batch_size = batch_size
+        # 等候区到达时间、引擎请求生成时间与充电桩预计结束时间都是 UTC，已等待时长统一按 UTC 计算
+        self.now = clock.utcnow()
+        self._capacity = None                   # mode -> (可用桩数, 平均功率, 剩余充电小时)
+        self._engine_kwh = {}                   # mode -> 引擎队列总电量
+
+    # ==================== 汇总 ====================
+
+    def totals(self) -> Dict[str, int]:
+        station_sizes = self.service.waiting_area.sizes()
+        totals = {f'station_{mode}': station_sizes[mode] for mode in CHARGING_MODES}
+        for mode in CHARGING_MODES:
+            totals[f'engine_{mode}'] = self.service.engine.get_queue_length(_ENGINE_TYPES[mode].value)
+        totals['charging'] = self._charging_query().order_by(None).count()
+        return totals
+
+    @staticmethod
+    def summary(totals: Dict[str, int]) -> Dict[str, int]:
+        return {
+            'total_waiting_station': totals['station_fast'] + totals['station_trickle'],
+            'total_waiting_engine': totals['engine_fast'] + totals['engine_trickle'],
+            'total_charging': totals['charging'],
+            'fast_waiting_station': totals['station_fast'],
+            'fast_waiting_engine': totals['engine_fast'],
+            'trickle_waiting_station': totals['station_trickle'],
+            'trickle_waiting_engine': totals['engine_trickle'],
+        }
+
+    # ==================== 分区遍历 ====================
+
+    def iter_section(self, section: str, offset: int = 0, limit: Optional[int] = None) -> Iterator[Dict]:
+        """按顺序产出分区内第 offset 条起的至多 limit 条（limit 为 None 时到末尾）"""
+        kind, mode = SECTIONS[section]
+        if kind == 'station':
+            return self._iter_station(mode, offset, limit)
+        if kind == 'engine':
+            return self._iter_engine(mode, offset, limit)
+        return self._iter_charging(offset, limit)
+
+    def page(self, section: str, offset: int, limit: int, total: int) -> Dict:
+        items = list(self.iter_section(section, offset, limit))
+        return {
+            'items': items,
+            'offset': offset,
+            'limit': limit,
+            'total': total,
+            'has_more': offset + len(items) < total,
+        }
+
+    def _batches(self, fetch, offset: int, limit: Optional[int]) -> Iterator:
+        """fetch(start, count) 返回至多 count 条；按批读取直到取满 limit 或读完"""
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = self.batch_size if remaining is None else min(self.batch_size, remaining)
+            batch = fetch(offset, size)
+            for item in batch:
+                yield item
+            if len(batch) < size:
+                return
+            offset += len(batch)
+            if remaining is not None:
+                remaining -= len(batch)
+
+    def _iter_station(self, mode: str, offset: int, limit: Optional[int]) -> Iterator[Dict]:
+        waiting_area = self.service.waiting_area
+        fetch = lambda start, size: waiting_area.items(mode, start, start + size - 1)
+        kwh_ahead = self._engine_queue_kwh(mode)
+        if offset:
+            kwh_ahead += sum(float(item['requested_amount']) for item in self._batches(fetch, 0, offset))
+
+        for position, item in enumerate(self._batches(fetch, offset, limit), start=offset + 1):
+            requested = float(item['requested_amount'])
+            created_at = datetime.fromisoformat(item['created_at'])
+            yield {
+                'position': position,
+                'session_id': item['session_id'],
+                'user_id': item['user_id'],
+                'requested_amount': requested,
+                'created_at': item['created_at'],
+                'waiting_time_minutes': (self.now - created_at).total_seconds() / 60,
+                'estimated_wait_minutes': self._estimated_wait(mode, kwh_ahead),
+            }
+            kwh_ahead += requested
+
+    def _iter_engine(self, mode: str, offset: int, limit: Optional[int]) -> Iterator[Dict]:
+        engine, ptype = self.service.engine, _ENGINE_TYPES[mode].value
+        fetch = lambda start, size: engine.get_waiting_list(ptype, n=size, offset=start)
+        kwh_ahead = sum(float(req.kwh) for req in self._batches(fetch, 0, offset)) if offset else 0.0
+
+        for position, req in enumerate(self._batches(fetch, offset, limit), start=offset + 1):
+            yield {
+                'position': position,
+                'queue_number': req.queue_no,
+                'session_id': req.req_id,
+                'user_id': req.user_id,
+                'requested_amount': float(req.kwh),
+                'generated_at': req.generated_at.isoformat() if req.generated_at else None,
+                'waiting_time_minutes': (self.now - req.generated_at).total_seconds() / 60
+                                        if req.generated_at else 0,
+                'estimated_wait_minutes': self._estimated_wait(mode, kwh_ahead),
+            }
+            kwh_ahead += float(req.kwh)
+
+    def _charging_query(self):
+        return db.session.query(ChargingSession, ChargingPile)\
+            .join(ChargingPile, ChargingSession.pile_id == ChargingPile.id)\
+            .filter(ChargingSession.status.in_(_CHARGING_STATUSES))\
+            .order_by(ChargingSession.start_time.desc(), ChargingSession.id.desc())
+
+    def _iter_charging(self, offset: int, limit: Optional[int]) -> Iterator[Dict]:
+        fetch = lambda start, size: self._charging_query().offset(start).limit(size).all()
+        for session, pile in self._batches(fetch, offset, limit):
+            requested = float(session.requested_amount)
+            actual = float(session.actual_amount or 0)
+            pile_power = float(pile.power_rating)
+            session_info = {
+                'session_id': session.session_id,
+                'user_id': session.user_id,
+                'pile_id': session.pile_id,
+                'pile_type': pile.pile_type,
+                'pile_power': pile_power,
+                'requested_amount': requested,
+                'actual_amount': actual,
+                'progress_percentage': actual / requested * 100 if requested else 0,
+                'start_time': session.start_time.isoformat() if session.start_time else None,
+                'charging_duration_hours': float(session.charging_duration or 0),
+                'status': session.status.value
+            }
+            # 计算预估剩余时间
+            if session.start_time and session.status == ChargingStatus.CHARGING:
+                remaining_kwh = requested - actual
+                if pile_power > 0 and remaining_kwh > 0:
+                    session_info['estimated_remaining_hours'] = round(remaining_kwh / pile_power, 2)
+                else:
+                    session_info['estimated_remaining_hours'] = 0
+            yield session_info
+
+    # ==================== 预计等待 ====================
+
+    def _engine_queue_kwh(self, mode: str) -> float:
+        if mode not in self._engine_kwh:
+            self._engine_kwh[mode] = float(self.service.engine.get_queue_kwh(_ENGINE_TYPES[mode].value))
+        return self._engine_kwh[mode]
+
+    def _estimated_wait(self, mode: str, kwh_ahead: float) -> Optional[float]:
+        if self._capacity is None:
+            self._capacity = {}
+            piles = self.service.engine.get_all_piles()
+            for name, ptype in _ENGINE_TYPES.items():
+                usable = [p for p in piles if p.type == ptype and p.status != PileStatus.FAULT]
+                busy_hours = sum(p.backlog_seconds(self.now) for p in usable) / 3600
+                power = sum(float(p.max_kw) for p in usable) / len(usable) if usable else 0.0
+                self._capacity[name] = (len(usable), power, busy_hours)
+
+        pile_count, power, busy_hours = self._capacity[mode]
+        if not pile_count or power <= 0:
+            return None
+        return round((busy_hours + kwh_ahead / power) / pile_count * 60, 1)
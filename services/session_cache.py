@@ -0,0 +1,194 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from models.charging import ChargingSession
+from services.session_state import TERMINAL_STATUSES
+
+_COLUMNS = tuple(column.key for column in ChargingSession.__table__.columns)
+
+# 查询结果为"无活跃会话"的占位
+_NO_ACTIVE = object()
+
+
+class CachedSession:
+    """活跃会话的内存快照，字段与 ChargingSession 的列一致（不含关联对象）"""
+
+    __slots__ = _COLUMNS
+
+    def __init__(self, **values):
+        for key in _COLUMNS:
+            setattr(self, key, values.get(key))
+
+    @classmethod
+    def from_model(cls, session) -> 'CachedSession':
+        return cls(**{key: getattr(session, key) for key in _COLUMNS})
+
+    def copy(self) -> 'CachedSession':
+        return CachedSession.from_model(self)
+
+    to_dict = ChargingSession.to_dict
+
+    def __repr__(self):
+        return f'<CachedSession {self.session_id} {self.status.value if self.status else None}>'
+
+
+class ActiveSessionCache:
+    """有界的活跃会话缓存（按 session_id 与 user_id 索引，LRU 淘汰）
+
+    由会话状态机在每次变更时写穿（write()）；会话进入终态时移出缓存并留下墓碑，
+    防止并发的数据库读取把旧状态重新放回缓存。数据库读取的结果只能通过
+    fill() / fill_user() 在缓存中没有对应条目时补入。
+    读写返回的都是副本，调用方修改不会影响缓存。
+
+    缓存只在本进程内写穿：多个进程各自处理引擎事件（集群模式）时其它进程的条目会过期，
+    此时应设置 enabled=False，所有读取都按未命中处理、写入不生效。
+    """
+
+    def __init__(self, max_size: int = 10000, enabled: bool = True):
+        self.max_size = max_size
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._sessions: 'OrderedDict[str, CachedSession]' = OrderedDict()
+        self._by_user: 'OrderedDict[int, object]' = OrderedDict()   # user_id -> session_id / _NO_ACTIVE
+        self._tombstones: 'OrderedDict[str, None]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # ==================== 读取 ====================
+
+    def get(self, session_id: str) -> Optional[CachedSession]:
+        with self._lock:
+            cached = self._sessions.get(session_id) if self.enabled else None
+            if cached is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return cached.copy()
+
+    def get_many(self, session_ids: Iterable[str]) -> Dict[str, CachedSession]:
+        """返回命中的会话，未命中的不在结果中"""
+        result = {}
+        with self._lock:
+            for session_id in session_ids:
+                cached = self._sessions.get(session_id) if self.enabled else None
+                if cached is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    result[session_id] = cached.copy()
+        return result
+
+    def lookup_user(self, user_id: int):
+        """(是否命中, 活跃会话或None)"""
+        with self._lock:
+            entry = self._by_user.get(user_id) if self.enabled else None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._by_user.move_to_end(user_id)
+            if entry is _NO_ACTIVE:
+                self.hits += 1
+                return True, None
+            cached = self._sessions.get(entry)
+            if cached is None:
+                # 会话条目已被LRU淘汰，按未命中处理
+                del self._by_user[user_id]
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, cached.copy()
+
+    # ==================== 写穿 ====================
+
+    def write(self, session) -> None:
+        """会话变更后调用：活跃会话覆盖缓存条目，终态会话移出"""
+        if not self.enabled:
+            return
+        snapshot = CachedSession.from_model(session)
+        with self._lock:
+            if snapshot.status in TERMINAL_STATUSES:
+                self._evict_locked(snapshot.session_id, snapshot.user_id)
+                return
+            self._tombstones.pop(snapshot.session_id, None)
+            self._put_locked(snapshot)
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            cached = self._sessions.get(session_id)
+            self._evict_locked(session_id, cached.user_id if cached else None)
+
+    def invalidate(self, session_id: str, user_id: Optional[int] = None) -> None:
+        """丢弃会话及其用户的条目（如变更未能落库），之后的读取回到数据库并可重新补入"""
+        with self._lock:
+            cached = self._sessions.pop(session_id, None)
+            self._tombstones.pop(session_id, None)
+            if user_id is None and cached is not None:
+                user_id = cached.user_id
+            if user_id is not None:
+                self._by_user.pop(user_id, None)
+
+    def fill(self, session) -> None:
+        """用数据库读取结果补入缓存（已有条目或已结束的会话不覆盖）"""
+        if not self.enabled or session.status in TERMINAL_STATUSES:
+            return
+        with self._lock:
+            if session.session_id in self._sessions or session.session_id in self._tombstones:
+                return
+            self._put_locked(CachedSession.from_model(session))
+
+    def fill_user(self, user_id: int, session) -> None:
+        """用户活跃会话查询结果补入缓存；session 为 None 时记录"无活跃会话" """
+        if session is not None:
+            self.fill(session)
+            return
+        if not self.enabled:
+            return
+        with self._lock:
+            if user_id not in self._by_user:
+                self._by_user[user_id] = _NO_ACTIVE
+                self._trim_locked()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self._by_user.clear()
+            self._tombstones.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'sessions': len(self._sessions),
+                'users': len(self._by_user),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    # ==================== 内部实现 ====================
+
+    def _put_locked(self, snapshot: CachedSession) -> None:
+        self._sessions[snapshot.session_id] = snapshot
+        self._sessions.move_to_end(snapshot.session_id)
+        self._by_user[snapshot.user_id] = snapshot.session_id
+        self._by_user.move_to_end(snapshot.user_id)
+        self._trim_locked()
+
+    def _evict_locked(self, session_id: str, user_id: Optional[int]) -> None:
+        self._sessions.pop(session_id, None)
+        self._tombstones[session_id] = None
+        if user_id is not None:
+            if self._by_user.get(user_id) == session_id:
+                self._by_user[user_id] = _NO_ACTIVE
+        self._trim_locked()
+
+    def _trim_locked(self) -> None:
+        while len(self._sessions) > self.max_size:
+            self._sessions.popitem(last=False)
+        while len(self._by_user) > self.max_size:
+            self._by_user.popitem(last=False)
+        while len(self._tombstones) > self.max_size:
+            self._tombstones.popitem(last=False)
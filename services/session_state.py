@@ -0,0 +1,378 @@
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models.user import db
+from models.charging import ChargingSession, ChargingSessionEvent, ChargingStatus
+from scheduler_core import clock
+
+# 合法的状态转换：等候区 -> 调度队列 -> 充电 -> 完成中 -> 完成，以及取消 / 故障分支
+# 充电桩故障时剩余电量由引擎转给其它充电桩，会话从充电退回调度队列
+TRANSITIONS = {
+    ChargingStatus.STATION_WAITING: {
+        ChargingStatus.ENGINE_QUEUED, ChargingStatus.CANCELLED,
+    },
+    ChargingStatus.ENGINE_QUEUED: {
+        ChargingStatus.CHARGING, ChargingStatus.CANCELLED, ChargingStatus.CANCELLING_AFTER_DISPATCH,
+    },
+    ChargingStatus.CHARGING: {
+        ChargingStatus.COMPLETING, ChargingStatus.COMPLETED, ChargingStatus.CANCELLED,
+        ChargingStatus.CANCELLING_AFTER_DISPATCH, ChargingStatus.FAULT_COMPLETED,
+        ChargingStatus.ENGINE_QUEUED,
+    },
+    ChargingStatus.COMPLETING: {
+        ChargingStatus.COMPLETED, ChargingStatus.CANCELLED,
+        ChargingStatus.CANCELLING_AFTER_DISPATCH, ChargingStatus.FAULT_COMPLETED,
+    },
+    ChargingStatus.CANCELLING_AFTER_DISPATCH: {
+        ChargingStatus.CANCELLED, ChargingStatus.FAULT_COMPLETED,
+    },
+    ChargingStatus.COMPLETED: set(),
+    ChargingStatus.CANCELLED: set(),
+    ChargingStatus.FAULT_COMPLETED: set(),
+}
+
+TERMINAL_STATUSES = frozenset(status for status, targets in TRANSITIONS.items() if not targets)
+
+# 这些状态下 Redis 中不再保留 session_status
+_REDIS_CLEARED_STATUSES = TERMINAL_STATUSES | {ChargingStatus.CANCELLING_AFTER_DISPATCH}
+
+# 变更时同步到 Redis session_status 的字段
+_REDIS_FIELDS = ('queue_number', 'pile_id', 'start_time', 'actual_amount',
+                 'charging_duration', 'requested_amount', 'charging_mode')
+
+
+class InvalidTransition(Exception):
+    """非法的会话状态转换"""
+
+    def __init__(self, session_id: str, from_status: ChargingStatus, to_status: ChargingStatus):
+        self.session_id = session_id
+        self.from_status = from_status
+        self.to_status = to_status
+        super().__init__(f"会话 {session_id} 不能从 {from_status.value} 转换为 {to_status.value}")
+
+
+class SessionPersistError(Exception):
+    """会话变更批量落库失败"""
+
+
+def can_transition(from_status: ChargingStatus, to_status: ChargingStatus) -> bool:
+    return to_status in TRANSITIONS.get(from_status, set())
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'value'):
+        return value.value
+    return value
+
+
+class _Op:
+    __slots__ = ('seq', 'kind', 'session_id', 'values', 'event', 'redis', 'user_id')
+
+    def __init__(self, seq, kind, session_id, values, event=None, redis=None, user_id=None):
+        self.seq = seq
+        self.kind = kind              # insert / update / delete
+        self.session_id = session_id
+        self.values = values          # 写入 charging_sessions 的列
+        self.event = event            # 追加到 charging_session_events 的记录
+        self.redis = redis            # ('hset', mapping) / ('delete', None)
+        self.user_id = user_id        # 写入失败时回退缓存用
+
+
+class SessionStateMachine:
+    """充电会话状态机
+
+    transition() 在内存中校验并应用状态转换，变更与一条只追加的事件记录放入待写队列，
+    由后台线程每 flush_interval 秒把积攒的变更合并为一次事务提交（组提交），
+    Redis 中的 session_status 也在同一批次用一个管道同步。
+
+    需要持久化后再继续的调用方（如返回给用户之前）调用 flush()，等待包含自己变更的批次提交；
+    并发的多个请求共享同一次提交。未 start() 时 flush() 在调用线程中直接写入。
+    批次提交失败时逐条重试，只有写不进去的变更失败，其会话移出缓存（下次从数据库读取）。
+
+    应用到 ORM 对象上的值通过 set_committed_value 写入，不会把对象标记为脏，
+    因此调用方自己的 db.session 不会再重复 UPDATE；也可以直接传入缓存中的会话快照。
+    给出 cache（ActiveSessionCache）时，每次变更同步写穿缓存；
+    给出 busy_index（PileBusyIndex）时，状态转换同步记录充电桩忙碌区间。
+    """
+
+    def __init__(self, redis_client=None, flush_interval: float = 0.005, max_batch: int = 500,
+                 cache=None, busy_index=None):
+        self.redis_client = redis_client
+        self.cache = cache
+        self.busy_index = busy_index
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._db_engine = None
+        self._pending: List[_Op] = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._seq = 0                    # 最后一条入队变更的序号
+        self._done_seq = 0               # 已处理（成功或失败）到的序号
+        self._failures: List[tuple] = []  # [(起始序号, 结束序号, 异常)]
+        self.failed_count = 0
+        self._local = threading.local()      # 本线程尚未 flush 的第一条变更序号
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.event_count = 0
+        self.commit_count = 0
+
+    # ==================== 生命周期 ====================
+
+    def start(self, app):
+        """启动组提交线程（重复调用无副作用）"""
+        if self._thread and self._thread.is_alive():
+            return
+        with app.app_context():
+            self._db_engine = db.engine
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='SessionStateWriter')
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """写完待提交的变更后停止"""
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self._write_pending()
+
+    # ==================== 变更 ====================
+
+    def create(self, session: ChargingSession, reason: str = 'submitted') -> int:
+        """新建会话（初始状态为 session.status），返回变更序号"""
+        # 补齐列默认值，使缓存中的快照与落库后的行一致（可调用的默认值只有时间戳列，与模型默认值一样为 UTC）
+        now = clock.utcnow()
+        for column in ChargingSession.__table__.columns:
+            if column.key == 'id' or column.default is None or getattr(session, column.key) is not None:
+                continue
+            setattr(session, column.key, column.default.arg if column.default.is_scalar else now)
+
+        values = {column.name: getattr(session, column.key)
+                  for column in ChargingSession.__table__.columns
+                  if column.key != 'id' and getattr(session, column.key) is not None}
+        values.setdefault('status', ChargingStatus.STATION_WAITING)
+        event = self._event(session.session_id, None, values['status'], reason,
+                            {'user_id': session.user_id})
+        if self.cache is not None:
+            self.cache.write(session)
+        return self._enqueue('insert', session.session_id, values, event, user_id=session.user_id)
+
+    def transition(self, session: ChargingSession, to_status: ChargingStatus,
+                   reason: Optional[str] = None, **fields) -> int:
+        """校验并执行状态转换，fields 为同时修改的列；非法转换抛出 InvalidTransition"""
+        from_status = session.status
+        if not can_transition(from_status, to_status):
+            raise InvalidTransition(session.session_id, from_status, to_status)
+
+        values = dict(fields, status=to_status)
+        pile_id = session.pile_id
+        self._apply(session, values)
+        if self.busy_index is not None:
+            self.busy_index.observe(session.session_id, pile_id, from_status, to_status, values)
+        event = self._event(session.session_id, from_status, to_status, reason, fields)
+        return self._enqueue('update', session.session_id, values, event, self._redis_op(to_status, values),
+                             user_id=session.user_id)
+
+    def update(self, session: ChargingSession, reason: Optional[str] = None, **fields) -> int:
+        """不改变状态的字段更新；给出 reason 时记录事件（如用户修改请求），充电进度等高频更新不记录"""
+        self._apply(session, fields)
+        event = self._event(session.session_id, session.status, session.status, reason, fields) if reason else None
+        return self._enqueue('update', session.session_id, fields, event,
+                             self._redis_op(session.status, fields), user_id=session.user_id)
+
+    def discard(self, session_id: str) -> int:
+        """撤销尚未对外可见的新建会话（如等候区准入失败），连同其事件一起删除"""
+        if self.cache is not None:
+            self.cache.discard(session_id)
+        return self._enqueue('delete', session_id, None, None, ('delete', None))
+
+    def flush(self, timeout: float = 5.0):
+        """等待本线程此前入队的全部变更提交；其中有变更写入失败时抛出 SessionPersistError"""
+        first = getattr(self._local, 'first_seq', None)
+        self._local.first_seq = None
+        with self._cond:
+            target = self._seq
+        if not (self._thread and self._thread.is_alive()):
+            self._write_pending()
+        else:
+            deadline = time.monotonic() + timeout
+            with self._cond:
+                while self._done_seq < target:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise SessionPersistError(f"等待会话变更提交超时（{timeout} 秒）")
+                    self._cond.wait(remaining)
+
+        if first is not None:
+            for batch_first, batch_last, error in self._failures:
+                if batch_first <= target and batch_last >= first:
+                    raise SessionPersistError(f"会话变更提交失败: {error}") from error
+
+    def stats(self) -> Dict:
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'events': self.event_count,
+            'commits': self.commit_count,
+            'pending': pending,
+            'failed': self.failed_count,
+            'events_per_commit': round(self.event_count / self.commit_count, 2) if self.commit_count else 0.0,
+        }
+
+    # ==================== 内部实现 ====================
+
+    def _apply(self, session, values: Dict):
+        if isinstance(session, ChargingSession):
+            for key, value in values.items():
+                set_committed_value(session, key, value)
+        else:
+            for key, value in values.items():
+                setattr(session, key, value)
+        if self.cache is not None:
+            self.cache.write(session)
+
+    @staticmethod
+    def _event(session_id, from_status, to_status, reason, fields) -> Dict:
+        return {
+            'session_id': session_id,
+            'from_status': from_status.value if from_status else None,
+            'to_status': to_status.value,
+            'reason': reason,
+            'payload': {key: _to_json(value) for key, value in fields.items()} or None,
+            'created_at': clock.now(),
+        }
+
+    @staticmethod
+    def _redis_op(status: ChargingStatus, values: Dict):
+        if status in _REDIS_CLEARED_STATUSES:
+            return ('delete', None) if 'status' in values else None
+        mapping = {key: str(_to_json(values[key])) for key in _REDIS_FIELDS if key in values}
+        if 'status' in values:
+            mapping['status'] = status.value
+        return ('hset', mapping) if mapping else None
+
+    def _enqueue(self, kind, session_id, values, event, redis_op=None, user_id=None) -> int:
+        with self._cond:
+            self._seq += 1
+            self._pending.append(_Op(self._seq, kind, session_id, values, event, redis_op, user_id))
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+            seq = self._seq
+        if getattr(self._local, 'first_seq', None) is None:
+            self._local.first_seq = seq
+        return seq
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                while not self._pending and not self._stopped.is_set():
+                    self._cond.wait()
+            # 窗口内到达的变更合并进同一次提交（积满 max_batch 时不再等待）
+            if len(self._pending) < self.max_batch:
+                time.sleep(self.flush_interval)
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            written = batch
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"❌ 会话变更批量提交失败，逐条重试: {e}")
+                written = self._write_one_by_one(batch)
+            self._sync_redis(written)
+            with self._cond:
+                self._done_seq = batch[-1].seq
+                self._cond.notify_all()
+
+    def _write_one_by_one(self, batch: List[_Op]) -> List[_Op]:
+        """批次失败后逐条提交，返回写入成功的变更；失败的记入 _failures 并把会话移出缓存"""
+        written, failed = [], set()
+        for op in batch:
+            if op.session_id in failed:
+                # 同一会话前面的变更已失败，后面的不再写入，避免跳过中间状态
+                self._record_failure(op, None)
+                continue
+            try:
+                self._write_batch([op])
+                written.append(op)
+            except Exception as e:
+                failed.add(op.session_id)
+                self._record_failure(op, e)
+        return written
+
+    def _record_failure(self, op: _Op, error: Optional[Exception]):
+        print(f"❌ 会话 {op.session_id} 的变更（{op.kind}）未能写入: {error or '前序变更失败'}")
+        self.failed_count += 1
+        self._failures = (self._failures + [(op.seq, op.seq, error or SessionPersistError('前序变更失败'))])[-100:]
+        if self.cache is not None:
+            # 内存中已应用的变更没有落库，缓存回退为以数据库为准
+            self.cache.invalidate(op.session_id, op.user_id)
+
+    def _write_batch(self, batch: List[_Op]):
+        table = ChargingSession.__table__
+        inserts = [op.values for op in batch if op.kind == 'insert']
+
+        # 同一批次内对同一会话的多次更新合并为一条，再按列集合分组 executemany
+        merged: Dict[str, Dict] = {}
+        for op in batch:
+            if op.kind == 'update':
+                merged.setdefault(op.session_id, {}).update(op.values)
+        groups: Dict[tuple, List[Dict]] = {}
+        for session_id, values in merged.items():
+            groups.setdefault(tuple(sorted(values)), []).append(dict(values, _session_id=session_id))
+
+        events = [op.event for op in batch if op.event]
+        deleted = [op.session_id for op in batch if op.kind == 'delete']
+
+        engine = self._db_engine or db.engine
+        with engine.begin() as conn:
+            if inserts:
+                for columns in {tuple(sorted(values)) for values in inserts}:
+                    conn.execute(table.insert(),
+                                 [values for values in inserts if tuple(sorted(values)) == columns])
+            for rows in groups.values():
+                conn.execute(table.update().where(table.c.session_id == bindparam('_session_id')), rows)
+            if events:
+                conn.execute(ChargingSessionEvent.__table__.insert(), events)
+            if deleted:
+                event_table = ChargingSessionEvent.__table__
+                conn.execute(event_table.delete().where(event_table.c.session_id.in_(deleted)))
+                conn.execute(table.delete().where(table.c.session_id.in_(deleted)))
+
+        self.event_count += len(events)
+        self.commit_count += 1
+
+    def _sync_redis(self, ops: List[_Op]):
+        """已落库的变更同步到 Redis 的 session_status（失败只记录，数据库为准）"""
+        redis_ops = [op for op in ops if op.redis]
+        if self.redis_client is None or not redis_ops:
+            return
+        try:
+            with self.redis_client.pipeline() as pipe:
+                for op in redis_ops:
+                    key = f"session_status:{op.session_id}"
+                    action, mapping = op.redis
+                    if action == 'delete':
+                        pipe.delete(key)
+                    else:
+                        pipe.hset(key, mapping=mapping)
+                pipe.execute()
+        except Exception as e:
+            print(f"❌ 会话状态同步到Redis失败: {e}")
@@ -0,0 +1,237 @@
+import json
+from typing import Dict, List, Optional
+
+CHARGING_MODES = ('fast', 'trickle')
+
+# 全局票号计数器（跨模式共享，修改充电模式时保持原有先后次序）
+SEQ_KEY = 'station_waiting_seq'
+
+# 原子准入脚本：检查等候区总量 -> 取票号 -> 入队 -> 写会话状态，一次往返完成
+# KEYS: 票号计数器, 目标ZSET, 目标HASH, session_status键, 各模式ZSET...
+# ARGV: 容量上限, session_id, 请求JSON, session_status字段/值...
+# 返回票号；等候区已满返回0
+ADMIT_SCRIPT = """
+local total = 0
+for i = 5, #KEYS do
+    total = total + redis.call('ZCARD', KEYS[i])
+end
+if total >= tonumber(ARGV[1]) then
+    return 0
+end
+local ticket = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], ticket, ARGV[2])
+redis.call('HSET', KEYS[3], ARGV[2], ARGV[3])
+if #ARGV > 3 then
+    redis.call('HSET', KEYS[4], unpack(ARGV, 4))
+end
+return ticket
+"""
+
+# 按会话ID出队：只取仍在队列中的会话，返回 [session_id, 票号, 请求JSON, ...]
+# KEYS: ZSET, HASH   ARGV: session_id...
+TAKE_SCRIPT = """
+local out = {}
+for i = 1, #ARGV do
+    local ticket = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if ticket then
+        local item = redis.call('HGET', KEYS[2], ARGV[i])
+        redis.call('ZREM', KEYS[1], ARGV[i])
+        redis.call('HDEL', KEYS[2], ARGV[i])
+        if item then
+            table.insert(out, ARGV[i])
+            table.insert(out, ticket)
+            table.insert(out, item)
+        end
+    end
+end
+return out
+"""
+
+# 条件修改：会话仍在队列中才写入请求数据，已被出队时返回0，不留下孤立条目
+# KEYS: ZSET, HASH   ARGV: session_id, 请求JSON
+UPDATE_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+return 1
+"""
+
+# 条件换队列：会话仍在原队列中才沿用原票号移入新队列
+# KEYS: 原ZSET, 原HASH, 新ZSET, 新HASH   ARGV: session_id, 请求JSON
+MOVE_SCRIPT = """
+local ticket = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not ticket then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[3], ticket, ARGV[1])
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[2])
+return 1
+"""
+
+
+class StationWaitingArea:
+    """充电站等候区 - 基于Redis有序集合，按会话ID O(log n) 定位 / 删除 / 修改
+
+    键结构:
+        station_waiting_area:<mode>   ZSET  member=session_id, score=票号
+        station_waiting_items:<mode>  HASH  session_id -> 请求JSON
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._scripts = {}
+
+    @staticmethod
+    def queue_key(mode: str) -> str:
+        return f"station_waiting_area:{mode}"
+
+    @staticmethod
+    def items_key(mode: str) -> str:
+        return f"station_waiting_items:{mode}"
+
+    def _run(self, source: str, keys: List[str], args: List):
+        """执行Lua脚本（首次使用时注册，之后按SHA调用）"""
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.redis_client.register_script(source)
+        return script(keys=keys, args=args)
+
+    def clear(self):
+        """清空等候区"""
+        keys = [SEQ_KEY]
+        for mode in CHARGING_MODES:
+            keys += [self.queue_key(mode), self.items_key(mode)]
+        self.redis_client.delete(*keys)
+
+    # ==================== 入队 / 出队 ====================
+
+    def push(self, mode: str, request_data: Dict) -> int:
+        """加入队尾，返回票号"""
+        ticket = self.redis_client.incr(SEQ_KEY)
+        session_id = request_data['session_id']
+        with self.redis_client.pipeline() as pipe:
+            pipe.zadd(self.queue_key(mode), {session_id: ticket})
+            pipe.hset(self.items_key(mode), session_id, json.dumps(request_data))
+            pipe.execute()
+        return ticket
+
+    def admit(self, mode: str, request_data: Dict, limit: int,
+              status: Optional[Dict] = None) -> Optional[int]:
+        """原子准入：等候区总量未达上限时入队并写入 session_status，返回票号；已满返回None
+
+        检查与写入在Redis服务端一次执行，多进程 / 多节点并发提交也不会超出容量。
+        """
+        session_id = request_data['session_id']
+        keys = [SEQ_KEY, self.queue_key(mode), self.items_key(mode), f"session_status:{session_id}"]
+        keys += [self.queue_key(m) for m in CHARGING_MODES]
+        args = [limit, session_id, json.dumps(request_data)]
+        for field, value in (status or {}).items():
+            args += [field, value]
+        ticket = self._run(ADMIT_SCRIPT, keys, args)
+        return int(ticket) if ticket else None
+    
+    def pop(self, mode: str) -> Optional[Dict]:
+        """弹出队首请求"""
+        items = self.pop_many(mode, 1)
+        return items[0] if items else None
+
+    def pop_many(self, mode: str, count: int) -> List[Dict]:
+        """按排队顺序一次弹出至多count个请求（一次ZPOPMIN + 一次管道），请求中附带原票号"""
+        if count <= 0:
+            return []
+        popped = self.redis_client.zpopmin(self.queue_key(mode), count)
+        if not popped:
+            return []
+        session_ids = [session_id for session_id, _ in popped]
+        with self.redis_client.pipeline() as pipe:
+            pipe.hmget(self.items_key(mode), session_ids)
+            pipe.hdel(self.items_key(mode), *session_ids)
+            items_json, _ = pipe.execute()
+        return [dict(json.loads(item_json), ticket=int(ticket))
+                for (_, ticket), item_json in zip(popped, items_json) if item_json]
+
+    def head(self, mode: str, count: int) -> List[str]:
+        """队首至多count个会话ID（不出队），供调用方先锁住这些会话再 take"""
+        if count <= 0:
+            return []
+        return self.redis_client.zrange(self.queue_key(mode), 0, count - 1)
+
+    def take(self, mode: str, session_ids: List[str]) -> List[Dict]:
+        """按给定会话ID原子出队，跳过已不在队列中的会话（已取消 / 已换模式），请求中附带原票号"""
+        if not session_ids:
+            return []
+        flat = self._run(TAKE_SCRIPT, [self.queue_key(mode), self.items_key(mode)], list(session_ids))
+        taken = [dict(json.loads(flat[i + 2]), ticket=int(flat[i + 1])) for i in range(0, len(flat), 3)]
+        return sorted(taken, key=lambda item: item['ticket'])
+
+    def requeue(self, mode: str, items: List[Dict]):
+        """把 pop_many / take 弹出但未能处理的请求按原票号放回，排队位置不变"""
+        if not items:
+            return
+        with self.redis_client.pipeline() as pipe:
+            pipe.zadd(self.queue_key(mode), {item['session_id']: item['ticket'] for item in items})
+            pipe.hset(self.items_key(mode), mapping={item['session_id']: json.dumps(item) for item in items})
+            pipe.execute()
+
+    # ==================== 按会话ID操作 ====================
+
+    def position(self, mode: str, session_id: str) -> Optional[int]:
+        """从1开始的排队位置，不在队列中返回None"""
+        rank = self.redis_client.zrank(self.queue_key(mode), session_id)
+        return rank + 1 if rank is not None else None
+
+    def get(self, mode: str, session_id: str) -> Optional[Dict]:
+        item_json = self.redis_client.hget(self.items_key(mode), session_id)
+        return json.loads(item_json) if item_json else None
+
+    def remove(self, mode: str, session_id: str) -> bool:
+        """从等候区移除"""
+        with self.redis_client.pipeline() as pipe:
+            pipe.zrem(self.queue_key(mode), session_id)
+            pipe.hdel(self.items_key(mode), session_id)
+            removed, _ = pipe.execute()
+        return bool(removed)
+
+    def update(self, mode: str, session_id: str, **fields) -> bool:
+        """原地修改请求数据，排队位置不变；已被出队返回False"""
+        item = self.get(mode, session_id)
+        if item is None:
+            return False
+        item.update(fields)
+        keys = [self.queue_key(mode), self.items_key(mode)]
+        return bool(self._run(UPDATE_SCRIPT, keys, [session_id, json.dumps(item)]))
+
+    def move(self, session_id: str, old_mode: str, new_mode: str, **fields) -> bool:
+        """换到另一模式的队列，沿用原票号以保持先后次序；已被出队返回False"""
+        item = self.get(old_mode, session_id)
+        if item is None:
+            return False
+        item.update(fields)
+        item['charging_mode'] = new_mode
+        keys = [self.queue_key(old_mode), self.items_key(old_mode),
+                self.queue_key(new_mode), self.items_key(new_mode)]
+        return bool(self._run(MOVE_SCRIPT, keys, [session_id, json.dumps(item)]))
+
+    # ==================== 统计 / 浏览 ====================
+
+    def size(self, mode: str) -> int:
+        return self.redis_client.zcard(self.queue_key(mode))
+
+    def sizes(self) -> Dict[str, int]:
+        """各模式队列长度，一次往返"""
+        with self.redis_client.pipeline() as pipe:
+            for mode in CHARGING_MODES:
+                pipe.zcard(self.queue_key(mode))
+            counts = pipe.execute()
+        return dict(zip(CHARGING_MODES, counts))
+
+    def items(self, mode: str, start: int = 0, stop: int = -1) -> List[Dict]:
+        """按排队顺序返回 [start, stop] 区间内的请求"""
+        session_ids = self.redis_client.zrange(self.queue_key(mode), start, stop)
+        if not session_ids:
+            return []
+        items_json = self.redis_client.hmget(self.items_key(mode), session_ids)
+        return [json.loads(item_json) for item_json in items_json if item_json]
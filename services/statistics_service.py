@@ -1,17 +1,26 @@
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+from flask import current_app, has_app_context
 from sqlalchemy import func, and_
 from models.billing import ChargingRecord, ChargingPile, db
 from models.user import User
+from scheduler_core import clock
 
 class StatisticsService:
     """统计服务类"""
     
+    @staticmethod
+    def _pile_busy_index():
+        """充电服务维护的充电桩忙碌区间索引（服务未初始化时为 None）"""
+        if not has_app_context():
+            return None
+        return getattr(current_app.extensions.get('charging_service'), 'pile_busy', None)
+    
     @staticmethod
     def get_overview_statistics() -> Dict:
         """获取系统概览统计"""
         try:
-            today = datetime.now().date()
+            today = clock.now().date()
             yesterday = today - timedelta(days=1)
             
             # 今日充电次数
@@ -45,7 +54,7 @@ class StatisticsService:
             ).scalar() or 0
             
             # 活跃用户数（过去7天）
-            week_ago = datetime.now() - timedelta(days=7)
+            week_ago = clock.now() - timedelta(days=7)
             active_users = db.session.query(func.count(func.distinct(ChargingRecord.user_id))).filter(
                 ChargingRecord.created_at >= week_ago
             ).scalar() or 0
@@ -103,7 +112,7 @@ class StatisticsService:
     def get_daily_statistics(days: int = 7) -> List[Dict]:
         """获取日统计数据"""
         try:
-            end_date = datetime.now().date()
+            end_date = clock.now().date()
             start_date = end_date - timedelta(days=days-1)
             
             # 查询每日统计
@@ -131,18 +140,27 @@ class StatisticsService:
                 }
             
             # 填充缺失日期
+            busy_index = StatisticsService._pile_busy_index()
+            pile_ids = [row.id for row in db.session.query(ChargingPile.id)] if busy_index else []
             daily_stats = []
             current_date = start_date
             while current_date <= end_date:
                 if current_date in result_dict:
-                    daily_stats.append(result_dict[current_date])
+                    day_stats = result_dict[current_date]
                 else:
-                    daily_stats.append({
+                    day_stats = {
                         'date': current_date.isoformat(),
                         'charging_count': 0,
                         'revenue': 0.0,
                         'power_consumed': 0.0
-                    })
+                    }
+                # 当日全部充电桩的平均利用率
+                day_start = datetime.combine(current_date, datetime.min.time())
+                day_stats['utilization_rate'] = round(sum(
+                    busy_index.utilization(pile_id, day_start, day_start + timedelta(days=1))
+                    for pile_id in pile_ids
+                ) / len(pile_ids), 2) if pile_ids else 0
+                daily_stats.append(day_stats)
                 current_date += timedelta(days=1)
             
             return daily_stats
@@ -157,7 +175,7 @@ class StatisticsService:
             if date:
                 target_date = datetime.fromisoformat(date).date()
             else:
-                target_date = datetime.now().date()
+                target_date = clock.now().date()
             
             # 查询小时统计
             hourly_query = db.session.query(
@@ -201,37 +219,39 @@ class StatisticsService:
             return []
     
     @staticmethod
-    def get_pile_usage_statistics() -> List[Dict]:
-        """获取充电桩使用统计"""
+    def get_pile_usage_statistics(days: int = 7) -> List[Dict]:
+        """获取充电桩使用统计（累计值直接读取充电桩上维护的统计字段，利用率为最近 days 天）"""
         try:
-            # 查询每个充电桩的使用情况
-            pile_query = db.session.query(
+            piles = ChargingPile.query.all()
+            busy_index = StatisticsService._pile_busy_index()
+            now = clock.now()
+            window_start = now - timedelta(days=days)
+            
+            # 最近充电时间：按 (pile_id, status, created_at) 索引分组取最大值
+            last_charge = dict(db.session.query(
                 ChargingRecord.pile_id,
-                func.count(ChargingRecord.id).label('total_charges'),
-                func.sum(ChargingRecord.total_fee).label('total_revenue'),
-                func.sum(ChargingRecord.power_consumed).label('total_power'),
-                func.avg(ChargingRecord.power_consumed).label('avg_power'),
-                func.max(ChargingRecord.created_at).label('last_charge_time')
+                func.max(ChargingRecord.created_at)
             ).filter(
                 ChargingRecord.status == 'completed'
-            ).group_by(ChargingRecord.pile_id).all()
+            ).group_by(ChargingRecord.pile_id).all())
             
             pile_stats = []
-            for row in pile_query:
-                # 获取充电桩基本信息
-                pile = ChargingPile.query.get(row.pile_id)
+            for pile in piles:
+                total_charges = pile.total_charges or 0
+                total_power = float(pile.total_power or 0)
+                last_charge_time = last_charge.get(pile.id)
                 
                 pile_stats.append({
-                    'pile_id': row.pile_id,
-                    'pile_name': pile.name if pile else row.pile_id,
-                    'pile_type': pile.pile_type if pile else 'unknown',
-                    'pile_status': pile.status if pile else 'unknown',
-                    'total_charges': row.total_charges,
-                    'total_revenue': float(row.total_revenue or 0),
-                    'total_power': float(row.total_power or 0),
-                    'avg_power_per_charge': float(row.avg_power or 0),
-                    'last_charge_time': row.last_charge_time.isoformat() if row.last_charge_time else None,
-                    'utilization_rate': 0  # TODO: 计算利用率
+                    'pile_id': pile.id,
+                    'pile_name': pile.name,
+                    'pile_type': pile.pile_type,
+                    'pile_status': pile.status,
+                    'total_charges': total_charges,
+                    'total_revenue': float(pile.total_revenue or 0),
+                    'total_power': total_power,
+                    'avg_power_per_charge': total_power / total_charges if total_charges else 0.0,
+                    'last_charge_time': last_charge_time.isoformat() if last_charge_time else None,
+                    'utilization_rate': busy_index.utilization(pile.id, window_start, now) if busy_index else 0
                 })
             
             # 按总收入排序
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+测试充电汇总：多个时间窗口一条聚合查询完成，大量记录时总数仍然正确
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+from flask import Flask
+from sqlalchemy import event
+
+from models.user import db
+from models.billing import ChargingRecord
+from services.billing_service import BillingService
+
+
+def _make_app():
+    path = os.path.join(tempfile.mkdtemp(), 'summary.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def test_summary_windows_in_one_query():
+    """超过 1000 条记录时总数正确，窗口外与其他用户的记录不计入"""
+    app = _make_app()
+    now = datetime(2025, 6, 20, 12, 0)
+    month_start = datetime(2025, 6, 1)
+    with app.app_context():
+        rows = []
+        for i in range(1500):
+            created = now - timedelta(hours=i)          # 最早约 62 天前
+            rows.append(dict(user_id=1, pile_id='A', start_time=created, time_period='normal',
+                             power_consumed=1.5, total_fee=2.25, created_at=created))
+        rows.append(dict(user_id=2, pile_id='A', start_time=now, time_period='peak',
+                         power_consumed=100, total_fee=100, created_at=now))
+        db.session.execute(ChargingRecord.__table__.insert(), rows)
+        db.session.commit()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        summary = BillingService.get_user_charging_summary(1, {
+            'current_month': month_start,
+            'last_30_days': now - timedelta(days=30),
+        })
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+        month_count = sum(1 for i in range(1500) if now - timedelta(hours=i) >= month_start)
+        thirty_count = sum(1 for i in range(1500) if now - timedelta(hours=i) >= now - timedelta(days=30))
+        assert len(statements) == 1
+        assert summary['current_month'] == {'total_records': month_count,
+                                            'total_power_consumed': round(month_count * 1.5, 3),
+                                            'total_cost': round(month_count * 2.25, 2)}
+        assert summary['last_30_days']['total_records'] == thirty_count == 721
+        assert summary['last_30_days']['total_cost'] == round(thirty_count * 2.25, 2)
+
+        empty = BillingService.get_user_charging_summary(3, {'all': month_start})
+        assert empty['all'] == {'total_records': 0, 'total_power_consumed': 0.0, 'total_cost': 0.0}
+    print(f"✅ 汇总一条查询完成: 本月 {month_count} 条, 近30天 {thirty_count} 条")
+
+
+if __name__ == "__main__":
+    test_summary_windows_in_one_query()
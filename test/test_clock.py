@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+测试共用时钟：倍速时钟、按 CHARGING_SPEED_FACTOR 安装、充电进度与计费时段随注入的时钟计算
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+from flask import Flask
+
+import scheduler_core
+from scheduler_core import PileType, Pile, ManualClock, ScaledClock, SystemClock, get_clock, set_clock, store
+from scheduler_core import clock
+from models.user import db
+from models.billing import ChargingPile
+from models.charging import ChargingSession, ChargingStatus, ChargingMode
+from services.billing_service import BillingService
+from services.charging_service import ChargingService
+from services.session_state import SessionStateMachine
+
+
+class _FakeRedis:
+    """只实现充电进度监控用到的命令"""
+
+    def __init__(self):
+        self.values = {}
+
+    def exists(self, key):
+        return key in self.values
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+
+class _Config:
+    CHARGING_SPEED_FACTOR = 100
+    SCALED_CLOCK_ENABLED = True
+
+
+class _DefaultConfig:
+    CHARGING_SPEED_FACTOR = 100
+
+
+def test_scaled_clock():
+    """倍速时钟按 factor 倍流逝，倍速为 1 时使用真实时间"""
+    scaled = ScaledClock(1000, start=datetime(2025, 6, 1))
+    time.sleep(0.05)
+    elapsed = (scaled.utcnow() - datetime(2025, 6, 1)).total_seconds()
+    assert 50 <= elapsed < 1000, elapsed
+    assert isinstance(clock.for_speed_factor(1), SystemClock)
+    try:
+        ScaledClock(0)
+        assert False, "倍速必须大于 0"
+    except ValueError:
+        pass
+
+    service = ChargingService()
+    service.config = _DefaultConfig()
+    try:
+        service._init_clock()               # 未开启倍速时钟时保持真实时间
+        assert isinstance(get_clock(), SystemClock)
+        service.config = _Config()
+        service._init_clock()
+        assert isinstance(get_clock(), ScaledClock) and get_clock().factor == 100
+        manual = ManualClock()
+        set_clock(manual)
+        service._init_clock()               # 已注入的时钟不被覆盖
+        assert get_clock() is manual
+    finally:
+        set_clock(None)
+    print(f"✅ 倍速时钟: 真实 0.05 秒 = 虚拟 {elapsed:.0f} 秒")
+
+
+def test_monitor_and_billing_use_injected_clock():
+    """充电量按虚拟时间累计，达到请求电量后结束；计费时段取虚拟开始时间"""
+    path = os.path.join(tempfile.mkdtemp(), 'clock.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+
+    manual = ManualClock(datetime(2025, 6, 1, 23, 30), utc_offset=timedelta(0))
+    previous = set_clock(manual)
+    service = ChargingService()
+    service.redis_client = _FakeRedis()
+    service.sessions = SessionStateMachine()
+    service._initialized = True
+    store.reset()
+    scheduler_core.add_pile(Pile(pile_id='A', type=PileType.D, max_kw=30.0))
+    try:
+        with app.app_context():
+            db.create_all()
+            db.session.add(ChargingPile(id='A', name='快充A', pile_type='fast', power_rating=30))
+            db.session.commit()
+            service.sessions.create(ChargingSession(
+                session_id='s1', user_id=1, pile_id='A', charging_mode=ChargingMode.FAST,
+                requested_amount=20, status=ChargingStatus.CHARGING, start_time=clock.now()))
+            service.sessions.flush()
+
+            manual.advance(timedelta(minutes=20))
+            service.monitor_charging_progress()
+            session = ChargingSession.query.filter_by(session_id='s1').first()
+            assert float(session.actual_amount) == 10.0 and session.status == ChargingStatus.CHARGING
+
+            manual.advance(timedelta(minutes=30))
+            service.monitor_charging_progress()
+            db.session.refresh(session)
+            assert float(session.actual_amount) == 20.0 and session.status == ChargingStatus.COMPLETING
+
+            record = BillingService.create_charging_record(1, 'A', session.start_time, clock.now(), 20)
+            assert record.time_period == 'valley'
+            assert record.end_time == datetime(2025, 6, 2, 0, 20)
+    finally:
+        store.reset()
+        set_clock(previous)
+    print("✅ 充电进度与计费时段按注入的时钟计算")
+
+
+if __name__ == "__main__":
+    test_scaled_clock()
+    test_monitor_and_billing_use_injected_clock()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+测试租约选主的调度引擎集群（进程内共享存储 / fakeredis 上的 Redis 共享存储）
+"""
+import sys
+import time
+sys.path.append('scheduler_core')
+
+import fakeredis
+
+from scheduler_core import PileType, PileStatus, Pile, ChargeRequest, store
+from scheduler_core.cluster import ClusterNode, LocalSharedStore, RedisSharedStore
+
+
+def _req(req_id, kwh=10.0):
+    return ChargeRequest(req_id=req_id, queue_no=f"Q-{req_id}", user_id="u",
+                         pile_type=PileType.D, kwh=kwh)
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_single_leader():
+    """同一时刻只有一个节点持有租约"""
+    store.reset()
+    shared = LocalSharedStore()
+    a = ClusterNode(shared, "a", lease_ttl=0.3)
+    b = ClusterNode(shared, "b", lease_ttl=0.3)
+
+    a.tick()
+    b.tick()
+    assert a.is_leader and not b.is_leader
+    assert shared.lease_holder() == "a"
+
+    # 主节点不续约，租约过期后由其他节点接管
+    time.sleep(0.35)
+    b.tick()
+    assert b.is_leader
+    a.tick()
+    assert not a.is_leader
+    print("✅ 租约选主正确")
+
+
+def test_follower_forwards_commands():
+    """从节点的写操作转发给主节点执行，读操作读取共享快照"""
+    store.reset()
+    shared = LocalSharedStore()
+    leader = ClusterNode(shared, "leader", interval=0.02)
+    follower = ClusterNode(shared, "follower", interval=0.02)
+    leader.tick()
+    follower.tick()
+    leader.start_dispatch_loop()
+    try:
+        follower.add_pile(Pile("F1", PileType.D, 30.0))
+        queue_no = follower.generate_queue_number(PileType.D.value)
+        assert queue_no.startswith("D")
+
+        follower.enqueue_request(_req("c1"))
+        follower.enqueue_request(_req("c2"))
+        assert follower.cancel_request("c2") is True
+        assert follower.cancel_request("c2") is False
+
+        assert _wait_for(lambda: any(p.status == PileStatus.BUSY for p in follower.get_all_piles()))
+        dispatches = [e for e in follower.pop_events() if e["type"] == "dispatch"]
+        assert [e["data"].req_id for e in dispatches] == ["c1"]
+        assert dispatches[0]["data"].pile_id == "F1"
+
+        follower.enqueue_request(_req("c3"))
+        assert _wait_for(lambda: follower.get_queue_position("c3") == (PileType.D.value, 1))
+        assert follower.update_request("c3", kwh=5.0).kwh == 5.0
+    finally:
+        leader.stop_dispatch_loop()
+    print("✅ 从节点命令转发正确")
+
+
+def test_failover_restores_state():
+    """主节点退出后，新主节点从共享快照恢复队列与充电桩状态"""
+    store.reset()
+    shared = LocalSharedStore()
+    a = ClusterNode(shared, "a")
+    b = ClusterNode(shared, "b")
+    a.tick()
+    b.tick()
+
+    a.add_pile(Pile("F1", PileType.D, 30.0, status=PileStatus.FAULT))
+    a.enqueue_request(_req("f1"))
+    a.enqueue_request(_req("f2"))
+    a.tick()
+    a.stop_dispatch_loop()           # 让出租约并保存快照
+
+    store.reset()                    # 模拟新主节点进程的空白内存
+    b.tick()
+    assert b.is_leader
+    assert [r.req_id for r in b.get_waiting_list(PileType.D.value)] == ["f1", "f2"]
+    assert b.get_all_piles()[0].status == PileStatus.FAULT
+    print("✅ 主节点切换后状态恢复正确")
+
+
+def _redis_shared(server):
+    return RedisSharedStore(fakeredis.FakeRedis(server=server, decode_responses=True))
+
+
+def test_redis_shared_store_lease_and_forwarding():
+    """Redis 共享存储：Lua 续约 / 释放租约，从节点命令经 Redis 列表转发"""
+    store.reset()
+    server = fakeredis.FakeServer()
+    leader = ClusterNode(_redis_shared(server), "a", interval=0.02)
+    follower = ClusterNode(_redis_shared(server), "b")
+    leader.tick()
+    follower.tick()
+    assert leader.is_leader and not follower.is_leader
+    assert follower.shared.lease_holder() == "a"
+
+    # 非持有者释放 / 续约都不生效
+    follower.shared.release_lease("b")
+    assert follower.shared.lease_holder() == "a"
+    leader.tick()
+    assert leader.is_leader
+
+    leader.add_pile(Pile("F1", PileType.D, 30.0))
+    leader.start_dispatch_loop()
+    try:
+        follower.enqueue_request(_req("r1"))
+        follower.enqueue_request(_req("r2"))
+        assert _wait_for(lambda: follower.get_charging_pile("r1") == "F1")
+        assert _wait_for(lambda: follower.get_queue_position("r2") == (PileType.D.value, 1))
+        assert follower.cancel_request("r2") is True
+        try:
+            follower.update_pile("X9", max_kw=1.0)
+            assert False, "主节点上的异常应转发给调用方"
+        except RuntimeError as e:
+            assert "KeyError" in str(e)
+    finally:
+        leader.stop_dispatch_loop()
+    assert follower.shared.lease_holder() is None
+    print("✅ Redis 共享存储租约与命令转发正确")
+
+
+def test_follower_view_cached_per_snapshot_version():
+    """从节点按快照版本号缓存解码结果；主节点直接读本地内存"""
+    store.reset()
+    server = fakeredis.FakeServer()
+    leader = ClusterNode(_redis_shared(server), "a")
+    follower = ClusterNode(_redis_shared(server), "b")
+    leader.tick()
+    leader.add_pile(Pile("F1", PileType.D, 30.0))
+    leader.tick()
+
+    version = follower.shared.snapshot_version()
+    view = follower._view()
+    leader.tick()                    # 状态未变，不重写快照
+    assert follower.shared.snapshot_version() == version
+    assert follower._view() is view
+
+    leader.enqueue_request(_req("v1"))
+    leader.enqueue_request(_req("v2"))
+    assert leader.get_queue_position("v2") == (PileType.D.value, 2)   # 主节点直接读内存
+    leader.tick()
+    assert follower.shared.snapshot_version() > version
+    assert follower._view() is not view
+    assert follower.get_charging_pile("v1") == "F1"
+    assert follower.get_preassigned_position("v2") is None
+    assert follower.get_queue_position("v2") == (PileType.D.value, 1)
+    assert follower.get_queue_kwh(PileType.D.value) == leader.get_queue_kwh(PileType.D.value) == 10.0
+    assert follower.get_queue_capacity(PileType.D.value, 2) == 0
+    print("✅ 从节点快照按版本缓存")
+
+
+def test_call_timeout_raises():
+    """没有主节点处理命令时，转发调用超时抛 TimeoutError 而不是返回 None"""
+    store.reset()
+    follower = ClusterNode(_redis_shared(fakeredis.FakeServer()), "b", call_timeout=0.1)
+    try:
+        follower.generate_queue_number(PileType.D.value)
+        assert False, "应抛出 TimeoutError"
+    except TimeoutError:
+        pass
+    print("✅ 命令转发超时抛出异常")
+
+
+def test_expired_lease_fences_local_writes():
+    """选主后租约过期：旧主节点不再本地执行写操作，命令由新主节点执行；任期号只在重新获得租约时增加"""
+    store.reset()
+    shared = LocalSharedStore()
+    old = ClusterNode(shared, "old", lease_ttl=0.1, call_timeout=0.1)
+    new = ClusterNode(shared, "new")
+    old.tick()
+    assert old.is_leader
+
+    time.sleep(0.15)
+    new.tick()
+    assert new.is_leader and old.is_leader
+    try:
+        old.enqueue_request(_req("f1"))
+        assert False, "租约已过期，写操作不应在本地执行"
+    except TimeoutError:
+        pass
+    assert not old.is_leader and store.peek_queue(PileType.D.value, -1) == []
+    new.tick()
+    assert new.get_queue_position("f1") == (PileType.D.value, 1)
+
+    # Redis 共享存储：续约任期号不变，租约过期后重新获得任期号加一
+    redis_shared = _redis_shared(fakeredis.FakeServer())
+    assert redis_shared.acquire_lease("a", 5.0) == 1 and redis_shared.acquire_lease("a", 5.0) == 1
+    assert redis_shared.acquire_lease("b", 5.0) is None
+    redis_shared.redis_client.delete("engine:leader")
+    assert redis_shared.acquire_lease("b", 5.0) == 2 and redis_shared.acquire_lease("a", 5.0) is None
+    print("✅ 租约过期后写操作不在旧主节点执行")
+
+
+if __name__ == "__main__":
+    test_single_leader()
+    test_follower_forwards_commands()
+    test_failover_restores_state()
+    test_redis_shared_store_lease_and_forwarding()
+    test_follower_view_cached_per_snapshot_version()
+    test_call_timeout_raises()
+    test_expired_lease_fences_local_writes()
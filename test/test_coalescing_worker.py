@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试合并触发的后台工作线程
+"""
+import threading
+
+from utils.coalescing_worker import CoalescingWorker
+
+
+class _Window:
+    """可控的合并窗口：工作线程进入窗口后阻塞，直到测试放行"""
+
+    def __init__(self):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, delay):
+        self.entered.set()
+        assert self.release.wait(2.0), "合并窗口未被放行"
+        self.release.clear()
+
+
+def test_triggers_are_coalesced():
+    """合并窗口内的大量并发触发只执行一次，且线程数不增长"""
+    window = _Window()
+    ran = threading.Semaphore(0)
+    calls = []
+
+    def task():
+        calls.append(1)
+        ran.release()
+
+    worker = CoalescingWorker(task, delay=0.05, name='TestWorker', sleep=window)
+    worker.start()
+    threads_before = threading.active_count()
+
+    worker.trigger()
+    assert window.entered.wait(2.0)
+    triggers = [threading.Thread(target=lambda: [worker.trigger() for _ in range(111)]) for _ in range(9)]
+    for t in triggers:
+        t.start()
+    for t in triggers:
+        t.join()
+    window.release.set()
+    assert ran.acquire(timeout=2.0)
+
+    assert threading.active_count() == threads_before
+    assert len(calls) == 1
+    assert worker.stats()['triggers'] == 1000
+
+    # 空闲后再次触发仍会执行
+    window.entered.clear()
+    worker.trigger()
+    assert window.entered.wait(2.0)
+    window.release.set()
+    assert ran.acquire(timeout=2.0)
+    assert len(calls) == 2 and worker.stats()['runs'] == 2
+
+    worker.stop()
+    assert not worker.stats()['alive']
+    print("✅ 1000 次触发合并为 1 次执行")
+
+
+def test_failure_does_not_kill_worker():
+    """任务抛异常后线程继续工作"""
+    ran = threading.Semaphore(0)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        ran.release()
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+
+    worker = CoalescingWorker(flaky, delay=0, name='FlakyWorker')
+    worker.start()
+    worker.trigger()
+    assert ran.acquire(timeout=2.0)
+    worker.trigger()
+    assert ran.acquire(timeout=2.0)
+    worker.stop()
+    assert len(calls) == 2
+    print("✅ 任务失败后工作线程继续运行")
+
+
+def test_service_shutdown_stops_worker():
+    """充电服务退出时停止等候区处理线程"""
+    from services.charging_service import ChargingService
+
+    service = ChargingService()
+    service.queue_worker = CoalescingWorker(lambda: None, delay=0, name='DrainerUnderTest')
+    service.queue_worker.start()
+    service.shutdown()
+    assert not service.queue_worker.stats()['alive']
+    print("✅ 服务退出时停止后台线程")
+
+
+if __name__ == "__main__":
+    test_triggers_are_coalesced()
+    test_failure_does_not_kill_worker()
+    test_service_shutdown_stops_worker()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+测试调度循环：容量计算、无空闲桩时不丢请求、一次处理大批请求时调度事件不丢失、经服务提交的请求按 UTC 计算等待时长
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+sys.path.append('scheduler_core')
+
+import fakeredis
+from flask import Flask
+
+import scheduler_core
+from scheduler_core import PileType, PileStatus, Pile, ChargeRequest, ManualClock, clock, set_clock
+from scheduler_core import store
+from models.user import db
+from models.billing import ChargingPile
+from models.charging import ChargingSession, ChargingStatus, ChargingMode
+from services.charging_service import ChargingService
+from services.session_state import SessionStateMachine
+from services.station_waiting_area import StationWaitingArea
+from utils.coalescing_worker import CoalescingWorker
+
+START = datetime(2030, 1, 1, 8, 0)
+
+
+def _req(req_id, ptype=PileType.D, kwh=10.0):
+    return ChargeRequest(req_id=req_id, queue_no=f"Q-{req_id}", user_id="u",
+                         pile_type=ptype, kwh=kwh)
+
+
+def _setup_piles():
+    store.reset()
+    scheduler_core.add_pile(Pile(pile_id="F1", type=PileType.D, max_kw=30.0))
+    scheduler_core.add_pile(Pile(pile_id="F2", type=PileType.D, max_kw=30.0))
+    scheduler_core.add_pile(Pile(pile_id="F3", type=PileType.D, max_kw=30.0,
+                                 status=PileStatus.FAULT))
+
+
+def test_queue_capacity():
+    """容量 = 可用桩 × 每桩位数 − 占用 − 排队"""
+    _setup_piles()
+    assert scheduler_core.get_queue_capacity(PileType.D.value, 2) == 4
+
+    scheduler_core.enqueue_request(_req("cap_1"))
+    assert scheduler_core.dispatch_next(PileType.D.value).req_id == "cap_1"
+    scheduler_core.enqueue_request(_req("cap_2"))
+    assert scheduler_core.get_queue_capacity(PileType.D.value, 2) == 2
+    assert scheduler_core.get_queue_capacity(PileType.A.value, 2) == 0
+    print("✅ 引擎容量计算正确")
+
+
+def test_dispatch_keeps_request_without_idle_pile():
+    """没有空闲桩时请求留在队列中"""
+    _setup_piles()
+    for i in range(3):
+        scheduler_core.enqueue_request(_req(f"keep_{i}"))
+
+    dispatched = []
+    while True:
+        result = scheduler_core.dispatch_next(PileType.D.value)
+        if result is None:
+            break
+        dispatched.append(result)
+
+    assert [r.req_id for r in dispatched] == ["keep_0", "keep_1"]
+    assert {r.pile_id for r in dispatched} == {"F1", "F2"}
+    assert scheduler_core.get_queue_position("keep_2") == (PileType.D.value, 1)
+
+    scheduler_core.end_charging(dispatched[0].pile_id)
+    assert scheduler_core.dispatch_next(PileType.D.value).req_id == "keep_2"
+    print("✅ 无空闲桩时请求不丢失")
+
+
+def _make_service(app, piles):
+    """等候区跑在 fakeredis 上、数据库为 SQLite 的充电服务"""
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    service = ChargingService()
+    service.config = SimpleNamespace(CHARGING_QUEUE_LEN=2, WAITING_AREA_SIZE=10)
+    service.redis_client = redis_client
+    service.waiting_area = StationWaitingArea(redis_client)
+    service.sessions = SessionStateMachine(cache=service.session_cache, busy_index=service.pile_busy)
+    service._initialized = True
+    store.reset()
+    scheduler_core.add_piles(piles)
+    with app.app_context():
+        db.create_all()
+        for pile in piles:
+            db.session.add(ChargingPile(id=pile.pile_id, name=pile.pile_id, pile_type='fast', power_rating=pile.max_kw))
+        db.session.commit()
+    return service
+
+
+def _make_app(name):
+    path = os.path.join(tempfile.mkdtemp(), f'{name}.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    return app
+
+
+def _submit(service, session_id, mode='fast', amount=10.0):
+    service.sessions.create(ChargingSession(
+        session_id=session_id, user_id=1, charging_mode=ChargingMode(mode), requested_amount=amount,
+        status=ChargingStatus.STATION_WAITING))
+    service.waiting_area.push(mode, {'session_id': session_id, 'user_id': 1, 'charging_mode': mode,
+                                     'requested_amount': amount, 'created_at': clock.now().isoformat()})
+
+
+def test_large_drain_keeps_every_dispatch_event():
+    """一次出队 240 个请求、调度 120 次（事件远超 100 条），每个会话都进入充电或预分配到充电桩"""
+    app = _make_app('drain')
+    service = _make_service(app, [Pile(pile_id=f"F{i}", type=PileType.D, max_kw=30.0, queue_len=1)
+                                  for i in range(120)])
+    try:
+        with app.app_context():
+            session_ids = [f"s{i}" for i in range(240)]
+            for session_id in session_ids:
+                _submit(service, session_id)
+            service.sessions.flush()
+
+            service.process_station_waiting_area_to_engine()
+            while scheduler_core.dispatch_next('D'):
+                pass
+            service.poll_and_process_engine_events()
+
+            statuses = {s.session_id: s.status for s in ChargingSession.query.all()}
+            charging = [sid for sid in session_ids if statuses[sid] == ChargingStatus.CHARGING]
+            pre_assigned = [sid for sid in session_ids if statuses[sid] == ChargingStatus.ENGINE_QUEUED
+                            and scheduler_core.get_preassigned_position(sid)]
+            assert len(charging) == 120 and len(pre_assigned) == 120
+            assert all(store.get_pile(f"F{i}").current_req_id in charging for i in range(120))
+    finally:
+        store.reset()
+    print("✅ 大批出队调度事件全部处理")
+
+
+def test_drain_uses_values_modified_before_lock():
+    """出队线程取到队首、加锁之前用户修改了请求：按修改后的电量入队，换了模式的会话不被重复出队"""
+    app = _make_app('modify')
+    service = _make_service(app, [Pile(pile_id="F1", type=PileType.D, max_kw=30.0),
+                                  Pile(pile_id="T1", type=PileType.A, max_kw=7.0)])
+    head = service.waiting_area.head
+
+    def head_then_modify(mode, count):
+        ids = head(mode, count)
+        if mode == 'fast':
+            assert service.modify_charging_request('m1', 1, new_requested_amount=25.0)['success']
+            assert service.modify_charging_request('m2', 1, new_charging_mode='trickle')['success']
+        return ids
+
+    service.waiting_area.head = head_then_modify
+    try:
+        with app.app_context():
+            _submit(service, 'm1')
+            _submit(service, 'm2')
+            service.sessions.flush()
+
+            service.process_station_waiting_area_to_engine()
+            assert store.peek_queue('D', -1)[0].kwh == 25.0
+            assert [r.req_id for r in store.peek_queue('D', -1)] == ['m1']
+            # m2 已换到慢充等候区，只从慢充队列进入引擎一次
+            assert [r.req_id for r in store.peek_queue('A', -1)] == ['m2']
+            assert service.waiting_area.sizes() == {'fast': 0, 'trickle': 0}
+            m2 = ChargingSession.query.filter_by(session_id='m2').first()
+            assert m2.status == ChargingStatus.ENGINE_QUEUED and m2.charging_mode == ChargingMode.TRICKLE
+    finally:
+        store.reset()
+    print("✅ 加锁前的修改在出队时生效")
+
+
+def test_sjf_max_wait_with_submitted_requests():
+    """UTC+8 下经服务提交的请求：队首等待超过 max_wait 后短作业优先先服务队首"""
+    manual = ManualClock(START, utc_offset=timedelta(hours=8))
+    previous = set_clock(manual)
+    app = _make_app('sjf')
+    service = _make_service(app, [Pile(pile_id="F1", type=PileType.D, max_kw=30.0)])
+    service.queue_worker = CoalescingWorker(lambda: None, name='test')
+    scheduler_core.set_policy("sjf")
+    try:
+        with app.app_context():
+            first = service.submit_charging_request(1, 'fast', 60.0)['data']['session_id']
+            service.process_station_waiting_area_to_engine()
+            manual.advance(timedelta(minutes=31))
+            assert service.submit_charging_request(2, 'fast', 5.0)['success']
+            service.process_station_waiting_area_to_engine()
+
+            assert store.peek_queue('D', 1)[0].generated_at == START
+            assert scheduler_core.dispatch_next('D').req_id == first
+    finally:
+        scheduler_core.set_policy("fifo")
+        store.reset()
+        set_clock(previous)
+    print("✅ 经服务提交的请求按 UTC 计算等待时长")
+
+
+if __name__ == "__main__":
+    test_queue_capacity()
+    test_dispatch_keeps_request_without_idle_pile()
+    test_large_drain_keeps_every_dispatch_event()
+    test_drain_uses_values_modified_before_lock()
+    test_sjf_max_wait_with_submitted_requests()
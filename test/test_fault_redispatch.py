@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+测试故障转移：剩余电量与原排队信息保留、优先于普通请求调度、批量分配到其余充电桩、会话续充与恢复时长
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+from flask import Flask
+
+import scheduler_core
+from scheduler_core import PileType, PileStatus, Pile, ChargeRequest, ManualClock, set_clock, store
+from scheduler_core import core
+from scheduler_core.simulation import simulate
+from models.user import db
+from models.billing import ChargingPile, ChargingRecord
+from models.charging import ChargingSession, ChargingStatus, ChargingMode
+from services.charging_service import ChargingService
+from services.session_state import SessionStateMachine
+
+START = datetime(2030, 1, 1, 8, 0)
+
+
+class _FakeRedis:
+    """只实现事件处理与进度监控用到的命令"""
+
+    def __init__(self):
+        self.values = {}
+
+    def exists(self, key):
+        return key in self.values
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def hset(self, key, field, value):
+        self.values.setdefault(key, {})[field] = value
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def hset(self, key, field, value):
+        self.redis.hset(key, field, value)
+
+    def execute(self):
+        pass
+
+
+def _req(req_id, kwh, generated_at=START):
+    return ChargeRequest(req_id=req_id, queue_no=f"Q{req_id}", user_id=f"u{req_id}",
+                         pile_type=PileType.D, kwh=kwh, generated_at=generated_at)
+
+
+def test_remaining_kwh_and_priority():
+    """中断的请求只排剩余电量，保留排队号 / 用户 / 到达时间，排在普通请求之前且策略不能越过"""
+    clock = ManualClock(START)
+    previous = set_clock(clock)
+    store.reset()
+    try:
+        scheduler_core.add_pile(Pile(pile_id="F1", type=PileType.D, max_kw=30.0))
+        scheduler_core.add_pile(Pile(pile_id="F2", type=PileType.D, max_kw=30.0))
+        for req in (_req("r1", 30), _req("r2", 30), _req("r3", 5), _req("r4", 10)):
+            scheduler_core.enqueue_request(req)
+        scheduler_core.dispatch_next("D")
+        scheduler_core.dispatch_next("D")
+
+        clock.advance(timedelta(minutes=20))
+        scheduler_core.mark_fault("F1")
+        queued = store.peek_queue("D", -1)
+        assert [req.req_id for req in queued] == ["r1", "r3", "r4"]
+        r1 = queued[0]
+        assert r1.kwh == 20.0 and r1.queue_no == "Qr1" and r1.user_id == "ur1"
+        assert r1.generated_at == START and r1.redispatched and r1.faulted_at == START + timedelta(minutes=20)
+        assert scheduler_core.get_fault_recovery_stats()["pending"] == 1
+
+        # 快照 / 恢复后仍排在队首，之后新到的普通请求排在后面
+        store.restore(store.snapshot())
+        scheduler_core.enqueue_request(_req("r5", 1))
+        assert [req.req_id for req in store.peek_queue("D", -1)] == ["r1", "r3", "r4", "r5"]
+
+        # 短作业优先也不能越过故障转移的请求
+        scheduler_core.set_policy("sjf")
+        clock.advance(timedelta(minutes=40))
+        store.pop_events()
+        scheduler_core.end_charging("F2")
+        result = scheduler_core.dispatch_next("D")
+        assert (result.req_id, result.pile_id) == ("r1", "F2")
+        assert result.estimated_end == START + timedelta(minutes=100)
+        recovered = [e["data"] for e in store.pop_events() if e["type"] == "fault_recovered"]
+        assert recovered == [{"req_id": "r1", "pile_id": "F2", "seconds": 2400.0}]
+        assert store.get_pile("F2").current.faulted_at is None
+    finally:
+        scheduler_core.set_policy("fifo")
+        store.reset()
+        set_clock(previous)
+    print("✅ 剩余电量与优先次序保留")
+
+
+def test_batch_redispatch_across_survivors():
+    """故障时中断的请求立即整体分配到其余有空位的充电桩，放不下的留在队首"""
+    clock = ManualClock(START)
+    previous = set_clock(clock)
+    store.reset()
+    try:
+        for pile_id in ("F1", "F2", "F3"):
+            scheduler_core.add_pile(Pile(pile_id=pile_id, type=PileType.D, max_kw=30.0, queue_len=2))
+        scheduler_core.mark_fault("F2")
+        scheduler_core.mark_fault("F3")
+        for req in (_req("r1", 30), _req("r3", 10), _req("r5", 20), _req("r6", 5)):
+            scheduler_core.enqueue_request(req)
+        while scheduler_core.dispatch_next("D"):
+            pass
+        assert [req.req_id for req in store.get_pile("F1").queue] == ["r3", "r5"]
+
+        scheduler_core.recover_pile("F2")
+        scheduler_core.recover_pile("F3")
+        clock.advance(timedelta(minutes=20))
+        scheduler_core.mark_fault("F1")
+        # r1 剩 20 度、r3 10 度、r5 20 度按完成时间之和最小排到 F2 / F3，先于排队的 r6
+        f2, f3 = store.get_pile("F2"), store.get_pile("F3")
+        assert (f2.current_req_id, [r.req_id for r in f2.queue]) == ("r3", ["r5"])
+        assert (f3.current_req_id, [r.req_id for r in f3.queue]) == ("r1", [])
+        assert [req.req_id for req in store.peek_queue("D", -1)] == ["r6"]
+        assert scheduler_core.get_fault_recovery_stats()["pending"] == 1
+    finally:
+        store.reset()
+        set_clock(previous)
+    print("✅ 故障请求批量分配到其余充电桩")
+
+
+def test_service_resumes_session_after_fault():
+    """充电桩故障后会话保留已充电量退回调度队列，在其它充电桩续充到请求电量"""
+    path = os.path.join(tempfile.mkdtemp(), 'fault.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+
+    manual = ManualClock(START, utc_offset=timedelta(0))
+    previous = set_clock(manual)
+    service = ChargingService()
+    service.redis_client = _FakeRedis()
+    service.sessions = SessionStateMachine(cache=service.session_cache, busy_index=service.pile_busy)
+    service._initialized = True
+    store.reset()
+    scheduler_core.add_pile(Pile(pile_id='A', type=PileType.D, max_kw=30.0))
+    scheduler_core.add_pile(Pile(pile_id='B', type=PileType.D, max_kw=30.0))
+    try:
+        with app.app_context():
+            db.create_all()
+            db.session.add(ChargingPile(id='A', name='快充A', pile_type='fast', power_rating=30))
+            db.session.add(ChargingPile(id='B', name='快充B', pile_type='fast', power_rating=30))
+            db.session.commit()
+            for session_id in ('s1', 's2'):
+                service.sessions.create(ChargingSession(
+                    session_id=session_id, user_id=1, charging_mode=ChargingMode.FAST, requested_amount=30,
+                    status=ChargingStatus.ENGINE_QUEUED, queue_number=f'Q{session_id}'))
+                scheduler_core.enqueue_request(ChargeRequest(req_id=session_id, queue_no=f'Q{session_id}',
+                                                             user_id='1', pile_type=PileType.D, kwh=30))
+            service.sessions.flush()
+            scheduler_core.dispatch_next('D')
+            scheduler_core.dispatch_next('D')
+            service.poll_and_process_engine_events()
+
+            manual.advance(timedelta(minutes=20))
+            service.monitor_charging_progress()
+            scheduler_core.mark_fault('A')
+            service.poll_and_process_engine_events()
+            s1 = ChargingSession.query.filter_by(session_id='s1').first()
+            assert s1.status == ChargingStatus.ENGINE_QUEUED and s1.pile_id is None
+            assert float(s1.actual_amount) == 10.0 and float(s1.resumed_amount) == 10.0
+            assert scheduler_core.get_queue_position('s1') == ('D', 1)
+            # 故障前的一段记到 A 上，A 的忙碌区间在故障时结束
+            fault_record = ChargingRecord.query.filter_by(pile_id='A').one()
+            assert float(fault_record.power_consumed) == 10.0
+            assert float(s1.total_fee) == float(fault_record.total_fee) > 0
+            later = START + timedelta(hours=3)
+            assert service.pile_busy.busy_seconds('A', START, later, later) == 20 * 60
+
+            manual.advance(timedelta(minutes=40))
+            scheduler_core.end_charging('B')
+            scheduler_core.dispatch_next('D')
+            service.poll_and_process_engine_events()
+            db.session.refresh(s1)
+            assert s1.status == ChargingStatus.CHARGING and s1.pile_id == 'B'
+            assert float(s1.actual_amount) == 10.0
+            # 开始时间为在 B 上的实际开始时间，B 上 s2 的区间不被截断
+            assert s1.start_time == START + timedelta(minutes=60)
+            assert core._recoveries[-1] == 2400.0
+            now = START + timedelta(minutes=60)
+            assert service.pile_busy.busy_seconds('B', START, now, now) == 60 * 60
+
+            manual.advance(timedelta(minutes=40))
+            service.monitor_charging_progress()
+            db.session.refresh(s1)
+            assert float(s1.actual_amount) == 30.0 and s1.status == ChargingStatus.COMPLETING
+
+            # 结束时只把本段 20 度记到 B 上，会话费用为两段之和
+            scheduler_core.end_charging('B')
+            service.poll_and_process_engine_events()
+            db.session.refresh(s1)
+            records = ChargingRecord.query.filter_by(user_id=1).order_by(ChargingRecord.id).all()
+            assert [(r.pile_id, float(r.power_consumed)) for r in records] == [('A', 10.0), ('B', 10.0), ('B', 20.0)]
+            assert float(s1.total_fee) == round(float(records[0].total_fee) + float(records[2].total_fee), 2)
+            assert float(db.session.get(ChargingPile, 'A').total_power) == 10.0
+            assert float(db.session.get(ChargingPile, 'B').total_power) == 30.0
+    finally:
+        store.reset()
+        set_clock(previous)
+    print("✅ 会话故障后续充到请求电量")
+
+
+def test_simulated_recovery_time():
+    """仿真中故障转移的请求恢复时长远小于普通请求的排队等待"""
+    report = simulate(rate=6, fast_piles=4, slow_piles=4, faults=[(36000, "F1", 7200), (36000, "F2", 7200)])
+    assert report.redispatched >= 2 and report.recovered == report.redispatched
+    assert report.mean_recovery_seconds < report.mean_wait_minutes * 60
+    assert report.arrivals == report.dispatched + report.unserved
+    print(f"✅ 故障恢复平均 {report.mean_recovery_seconds:.0f} 秒，普通请求平均等待 {report.mean_wait_minutes:.0f} 分钟")
+
+
+if __name__ == "__main__":
+    test_remaining_kwh_and_priority()
+    test_batch_redispatch_across_survivors()
+    test_service_resumes_session_after_fault()
+    test_simulated_recovery_time()
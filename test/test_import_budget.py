@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+测试导入耗时预算：应用与各蓝图的导入不能超出预算，重量级可选依赖不在导入路径上
+"""
+import sys
+sys.path.append('scheduler_core')
+
+from utils.import_profiler import parse_importtime, profile_import
+
+# 应用、全部蓝图与充电服务的累计导入耗时预算（毫秒）。
+# 当前约 600 ms，预算留出足够余量以免慢机器上误报，明显的回退（如重新引入重量级依赖）仍会失败
+IMPORT_BUDGET_MS = 2500
+
+APP_IMPORTS = 'import app, api.admin, api.charging, services.charging_service'
+
+
+def test_parse_importtime_tree():
+    """按缩进把子模块挂到父模块下"""
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |     b.c",
+        "import time:       200 |        300 |   b",
+        "import time:        50 |         50 |   d",
+        "import time:        10 |        360 | a",
+        "import time:        30 |         30 | e",
+    ])
+    root = parse_importtime(output)
+
+    assert [n.name for n in root.children] == ['a', 'e']
+    a = root.children[0]
+    assert [n.name for n in a.children] == ['b', 'd']
+    assert a.children[0].children[0].name == 'b.c'
+    assert root.cumulative_us == 390
+    print("✅ 导入耗时树解析正确")
+
+
+def test_app_import_within_budget():
+    """应用导入耗时不超过预算，且 APScheduler 延迟到服务初始化时才导入"""
+    profile = profile_import(APP_IMPORTS)
+
+    assert profile.is_imported('flask')
+    assert not profile.is_imported('apscheduler'), "APScheduler 不应在导入路径上"
+    assert profile.total_ms < IMPORT_BUDGET_MS, (
+        f"导入耗时 {profile.total_ms} ms 超出预算 {IMPORT_BUDGET_MS} ms:\n{profile.format_tree()}")
+    print(f"✅ 应用导入耗时 {profile.total_ms} ms（预算 {IMPORT_BUDGET_MS} ms）")
+
+
+if __name__ == "__main__":
+    test_parse_importtime_tree()
+    test_app_import_within_budget()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+测试细粒度锁：分段锁互不阻塞、批量加锁不死锁、持有时间统计
+"""
+import sys
+import threading
+import time
+sys.path.append('scheduler_core')
+
+from utils.locks import InstrumentedLock, StripedLock
+
+
+def test_instrumented_lock_stats():
+    """记录获取次数与持有时间"""
+    lock = InstrumentedLock('t')
+    with lock:
+        time.sleep(0.02)
+    with lock:
+        pass
+
+    stats = lock.stats.to_dict()
+    assert stats['acquisitions'] == 2
+    assert stats['max_hold_ms'] >= 15
+    print("✅ 锁持有时间统计正确")
+
+
+def test_striped_lock_independent_keys():
+    """持有某个键的锁时，其他分段的键不被阻塞"""
+    locks = StripedLock('s', stripes=8)
+    key_a = 'session-a'
+    key_b = next(f"session-{i}" for i in range(100)
+                 if locks.for_key(f"session-{i}") is not locks.for_key(key_a))
+
+    acquired = threading.Event()
+    with locks.for_key(key_a):
+        t = threading.Thread(target=lambda: (locks.for_key(key_b).acquire(),
+                                             acquired.set(),
+                                             locks.for_key(key_b).release()))
+        t.start()
+        assert acquired.wait(1.0)
+        t.join()
+    print("✅ 不同分段互不阻塞")
+
+
+def test_striped_lock_hold_many_no_deadlock():
+    """多个线程以不同顺序批量加锁不会死锁"""
+    locks = StripedLock('s', stripes=16)
+    keys = [f"k{i}" for i in range(40)]
+    counter = {'n': 0}
+
+    def worker(order):
+        for _ in range(50):
+            with locks.hold_many(order):
+                counter['n'] += 1
+
+    threads = [threading.Thread(target=worker, args=(keys,)),
+               threading.Thread(target=worker, args=(list(reversed(keys)),)),
+               threading.Thread(target=worker, args=(keys[::3] + keys[1::3],))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5.0)
+        assert not t.is_alive()
+
+    assert counter['n'] == 150
+    assert locks.stats()['acquisitions'] > 0
+    print("✅ 批量加锁无死锁")
+
+
+if __name__ == "__main__":
+    test_instrumented_lock_stats()
+    test_striped_lock_independent_keys()
+    test_striped_lock_hold_many_no_deadlock()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+测试游标分页：逐页遍历结果与整体排序一致、可为空的排序列、近似总数、无效游标
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+from flask import Flask
+
+from models.user import db
+from models.billing import ChargingRecord
+from models.charging import ChargingSession, ChargingStatus, ChargingMode
+from services.billing_service import BillingService
+from utils.pagination import keyset_paginate, encode_cursor, decode_cursor, InvalidCursor
+
+
+def _make_app():
+    path = os.path.join(tempfile.mkdtemp(), 'pages.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _walk(query, columns, per_page):
+    ids, cursor, pages = [], '', 0
+    while True:
+        page = keyset_paginate(query, columns, per_page, cursor=cursor)
+        ids.extend(item.id for item in page['items'])
+        pages += 1
+        if not page['has_next']:
+            return ids, pages
+        cursor = page['next_cursor']
+
+
+def test_walk_all_pages_with_ties():
+    """created_at 有大量重复时逐页遍历不重不漏，顺序与 ORDER BY created_at DESC, id DESC 一致"""
+    app = _make_app()
+    base = datetime(2025, 6, 1, 8, 0)
+    with app.app_context():
+        for i in range(53):
+            db.session.add(ChargingRecord(user_id=1 if i % 5 else 2, pile_id='A', start_time=base,
+                                          time_period='normal', created_at=base + timedelta(minutes=i // 4)))
+        db.session.commit()
+
+        query = ChargingRecord.query.filter_by(user_id=1)
+        columns = [ChargingRecord.created_at, ChargingRecord.id]
+        ids, pages = _walk(query, columns, per_page=7)
+        expected = [r.id for r in query.order_by(ChargingRecord.created_at.desc(), ChargingRecord.id.desc()).all()]
+
+        assert ids == expected
+        assert pages == -(-len(expected) // 7)
+    print(f"✅ {len(expected)} 条记录分 {pages} 页遍历一致")
+
+
+def test_nullable_sort_column():
+    """end_time 为空的会话排在最后且不会丢失"""
+    app = _make_app()
+    base = datetime(2025, 6, 1, 8, 0)
+    with app.app_context():
+        for i in range(12):
+            db.session.add(ChargingSession(
+                session_id=f's{i}', user_id=1, charging_mode=ChargingMode.FAST, requested_amount=10,
+                status=ChargingStatus.COMPLETED, end_time=None if i % 3 == 0 else base + timedelta(hours=i % 4)))
+        db.session.commit()
+
+        query = ChargingSession.query.filter_by(user_id=1)
+        ids, _ = _walk(query, [ChargingSession.end_time, ChargingSession.id], per_page=5)
+        sessions = {s.id: s for s in query.all()}
+
+        assert sorted(ids) == sorted(sessions)
+        assert len(ids) == len(set(ids))
+        keys = [(sessions[i].end_time is not None, sessions[i].end_time or base, i) for i in ids]
+        assert keys == sorted(keys, reverse=True)
+    print("✅ 可为空的排序列分页正确")
+
+
+def test_capped_total_and_invalid_cursor():
+    """总数最多数到上限；损坏的游标报 InvalidCursor"""
+    app = _make_app()
+    with app.app_context():
+        for _ in range(30):
+            db.session.add(ChargingRecord(user_id=1, pile_id='A', start_time=datetime.now(), time_period='peak'))
+        db.session.commit()
+
+        columns = [ChargingRecord.created_at, ChargingRecord.id]
+        page = keyset_paginate(ChargingRecord.query, columns, 10, with_total=True, total_cap=20)
+        assert page['total'] == 20 and page['total_capped']
+        page = keyset_paginate(ChargingRecord.query, columns, 10, with_total=True)
+        assert page['total'] == 30 and not page['total_capped']
+
+        for bad in ('not-base64!!', encode_cursor([1])):
+            try:
+                keyset_paginate(ChargingRecord.query, columns, 10, cursor=bad)
+                assert False, "无效游标应报错"
+            except InvalidCursor:
+                pass
+
+    now = datetime(2025, 6, 1, 12, 30, 5)
+    assert decode_cursor(encode_cursor([now, 42]), 2) == [now, 42]
+    print("✅ 近似总数与游标校验正确")
+
+
+def test_cursor_records_summary_has_no_page_sums():
+    """游标模式的充电记录汇总只给近似总数，不给只覆盖本页的电量 / 费用"""
+    app = _make_app()
+    with app.app_context():
+        for _ in range(12):
+            db.session.add(ChargingRecord(user_id=1, pile_id='A', start_time=datetime.now(), time_period='peak',
+                                          power_consumed=10, total_fee=18))
+        db.session.commit()
+
+        result = BillingService.get_user_charging_records(1, per_page=5, cursor='', with_total=True)
+        assert len(result['records']) == 5
+        assert result['summary'] == {'total_records': 12}
+    print("✅ 游标模式汇总不含本页电量 / 费用")
+
+
+if __name__ == "__main__":
+    test_walk_all_pages_with_ties()
+    test_nullable_sort_column()
+    test_capped_total_and_invalid_cursor()
+    test_cursor_records_summary_has_no_page_sums()
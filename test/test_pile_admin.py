@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+测试充电桩批量注册、注销与热更新：一次加锁一条日志、类型索引、运行状态保留、管理端批量导入
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+from flask import Flask
+
+import scheduler_core
+from scheduler_core import PileType, PileStatus, Pile, ChargeRequest, ManualClock, set_clock, store
+from models.user import db
+from models.billing import ChargingPile
+from services.charging_service import ChargingService
+from api.admin import admin_bp
+
+START = datetime(2030, 1, 1, 8, 0)
+
+
+class _RecordingWal:
+    """只记录追加的日志条数"""
+
+    def __init__(self):
+        self.records = []
+
+    def append(self, record):
+        self.records.append(record)
+
+    def needs_snapshot(self):
+        return False
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def exists(self, key):
+        return key in self.values
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def hset(self, key, field, value):
+        self.redis.values.setdefault(key, {})[field] = value
+
+    def execute(self):
+        pass
+
+
+def _req(req_id, kwh):
+    return ChargeRequest(req_id=req_id, queue_no=f"Q{req_id}", user_id="u",
+                         pile_type=PileType.D, kwh=kwh, generated_at=START)
+
+
+def test_bulk_add_single_record_and_type_index():
+    """1000 台充电桩一次注册只写一条日志，按类型取桩只看该类型"""
+    store.reset()
+    wal = _RecordingWal()
+    store._wal = wal
+    try:
+        piles = [Pile(pile_id=f"P{i}", type=PileType.D if i % 4 else PileType.A, max_kw=30.0 if i % 4 else 7.0)
+                 for i in range(1000)]
+        result = scheduler_core.add_piles(piles)
+        assert len(result["added"]) == 1000 and result["updated"] == []
+        assert len(wal.records) == 1 and wal.records[0]["op"] == "piles"
+        assert len(store.all_piles("A")) == 250 and len(store.all_piles("D")) == 750
+        assert all(p.type == PileType.A for p in store.all_piles("A"))
+
+        # 重复导入相同配置不写日志
+        result = scheduler_core.add_piles(piles[:10])
+        assert result["updated"] == [f"P{i}" for i in range(10)] and len(wal.records) == 1
+    finally:
+        store._wal = None
+        store.reset()
+    print("✅ 批量注册一条日志记录，类型索引正确")
+
+
+def test_upsert_keeps_runtime_state_and_hot_update():
+    """重复注册保留运行状态；改功率重算预计结束时间；有请求时不能改类型"""
+    clock = ManualClock(START)
+    previous = set_clock(clock)
+    store.reset()
+    try:
+        scheduler_core.add_piles([Pile(pile_id="F1", type=PileType.D, max_kw=30.0, queue_len=1),
+                                  Pile(pile_id="F2", type=PileType.D, max_kw=30.0, queue_len=1)])
+        for req in (_req("r1", 30), _req("r2", 30), _req("r3", 15)):
+            scheduler_core.enqueue_request(req)
+        while scheduler_core.dispatch_next("D"):
+            pass
+        f1 = store.get_pile("F1")
+        assert (f1.current_req_id, [r.req_id for r in f1.queue]) == ("r1", ["r3"])
+
+        scheduler_core.add_piles([Pile(pile_id="F1", type=PileType.D, max_kw=30.0, queue_len=1)])
+        assert f1.status == PileStatus.BUSY and f1.current_req_id == "r1" and len(f1.queue) == 1
+
+        # 充了 20 分钟（10 度），剩余 20 度按 60 kW 还要 20 分钟
+        clock.advance(timedelta(minutes=20))
+        scheduler_core.update_pile("F1", max_kw=60.0)
+        assert f1.max_kw == 60.0 and f1.estimated_end == START + timedelta(minutes=40)
+
+        try:
+            scheduler_core.update_pile("F1", pile_type="A")
+            assert False, "有请求时不应允许改类型"
+        except ValueError:
+            pass
+        try:
+            scheduler_core.add_piles([Pile(pile_id="N1", type=PileType.A, max_kw=7.0),
+                                      Pile(pile_id="F2", type=PileType.A, max_kw=7.0)])
+            assert False, "整批应被拒绝"
+        except ValueError:
+            assert store.get_pile("N1") is None
+
+        scheduler_core.add_pile(Pile(pile_id="F3", type=PileType.D, max_kw=30.0))
+        scheduler_core.update_pile("F3", pile_type="A", max_kw=7.0)
+        assert [p.pile_id for p in store.all_piles("A")] == ["F3"]
+        assert "F3" not in [p.pile_id for p in store.all_piles("D")]
+        try:
+            scheduler_core.update_pile("X9", max_kw=1.0)
+            assert False, "未注册的充电桩应抛 KeyError"
+        except KeyError:
+            pass
+    finally:
+        store.reset()
+        set_clock(previous)
+    print("✅ 重复注册保留运行状态，热更新功率 / 类型")
+
+
+def test_remove_pile_redispatches_local_queue():
+    """注销充电桩时本地队列中的请求转给其余充电桩"""
+    clock = ManualClock(START)
+    previous = set_clock(clock)
+    store.reset()
+    try:
+        scheduler_core.add_piles([Pile(pile_id="F1", type=PileType.D, max_kw=30.0, queue_len=1),
+                                  Pile(pile_id="F2", type=PileType.D, max_kw=30.0, queue_len=1)])
+        for req in (_req("r1", 30), _req("r2", 30), _req("r3", 15), _req("r4", 30)):
+            scheduler_core.enqueue_request(req)
+        while scheduler_core.dispatch_next("D"):
+            pass
+        assert [r.req_id for r in store.get_pile("F1").queue] == ["r3"]
+
+        store.pop_events()
+        assert scheduler_core.remove_pile("F1", requeue_current=False) is True
+        assert store.get_pile("F1") is None and scheduler_core.remove_pile("F1") is False
+        assert [p.pile_id for p in store.all_piles("D")] == ["F2"]
+        # F2 本地队列已满，r3 回到等候队列队首
+        assert [r.req_id for r in store.get_pile("F2").queue] == ["r4"]
+        assert [r.req_id for r in store.peek_queue("D", -1)] == ["r3"]
+        assert "pile_removed" in [e["type"] for e in store.pop_events()]
+
+        scheduler_core.enqueue_request(_req("r5", 5))
+        scheduler_core.end_charging("F2")
+        assert scheduler_core.dispatch_next("D").req_id == "r3"
+    finally:
+        store.reset()
+        set_clock(previous)
+    print("✅ 注销充电桩转移本地队列")
+
+
+def _make_app():
+    path = os.path.join(tempfile.mkdtemp(), 'piles.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    with app.app_context():
+        db.create_all()
+
+    service = ChargingService()
+    service.redis_client = _FakeRedis()
+    app.extensions['charging_service'] = service
+    store.reset()
+    return app, service
+
+
+def test_import_endpoint_json_and_csv():
+    """批量导入接口：JSON 与 CSV，错误行整批不导入，已有充电桩更新配置"""
+    app, service = _make_app()
+    client = app.test_client()
+    try:
+        piles = [{'id': f'F{i}', 'name': f'快充{i}', 'pile_type': 'fast', 'power_rating': 30} for i in range(300)]
+        resp = client.post('/api/admin/piles/import', json={'piles': piles})
+        assert resp.status_code == 200, resp.get_json()
+        data = resp.get_json()['data']
+        assert (data['created'], data['updated'], data['engine']['added']) == (300, 0, 300)
+        assert len(store.all_piles("D")) == 300
+        assert service.redis_client.values['pile_status:F0']['status'] == 'available'
+
+        resp = client.post('/api/admin/piles/import', json=[
+            {'id': 'T1', 'pile_type': 'slow', 'power_rating': 7},
+            {'id': 'T1', 'pile_type': 'slow', 'power_rating': 7},
+            {'id': 'T2', 'pile_type': 'medium', 'power_rating': 7},
+            {'id': 'T3', 'pile_type': 'slow', 'power_rating': 0},
+        ])
+        assert resp.status_code == 400
+        assert set(resp.get_json()['errors']) == {'2', '3', '4'}
+        with app.app_context():
+            assert db.session.get(ChargingPile, 'T1') is None
+
+        csv_body = "id,name,pile_type,power_rating,location\nF0,快充零,fast,60,A区\nT1,慢充1,slow,7,B区\n"
+        resp = client.post('/api/admin/piles/import', data=csv_body, content_type='text/csv')
+        assert resp.status_code == 200, resp.get_json()
+        data = resp.get_json()['data']
+        assert (data['created'], data['updated']) == (1, 1)
+        assert store.get_pile('F0').max_kw == 60.0 and store.get_pile('T1').type == PileType.A
+        with app.app_context():
+            f0 = db.session.get(ChargingPile, 'F0')
+            assert f0.name == '快充零' and float(f0.power_rating) == 60.0 and f0.location == 'A区'
+            assert ChargingPile.query.count() == 301
+
+        # 引擎拒绝（有请求的桩改类型）时数据库回滚
+        scheduler_core.enqueue_request(_req('r1', 10))
+        scheduler_core.dispatch_next('D')
+        busy = next(p.pile_id for p in store.all_piles('D') if p.current_req_id == 'r1')
+        resp = client.post('/api/admin/piles/import', json=[{'id': busy, 'pile_type': 'slow', 'power_rating': 7}])
+        assert resp.status_code == 409
+        with app.app_context():
+            assert db.session.get(ChargingPile, busy).pile_type == 'fast'
+    finally:
+        store.reset()
+    print("✅ 批量导入接口 JSON / CSV")
+
+
+if __name__ == "__main__":
+    test_bulk_add_single_record_and_type_index()
+    test_upsert_keeps_runtime_state_and_hot_update()
+    test_remove_pile_redispatches_local_queue()
+    test_import_endpoint_json_and_csv()
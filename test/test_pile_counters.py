@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试充电桩累计统计：生成计费记录时原子累加，核对任务按计费记录修正漂移
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+from flask import Flask
+
+from models.user import db
+from models.billing import ChargingPile, ChargingRecord
+from services.billing_service import BillingService
+from services.statistics_service import StatisticsService
+
+
+def _make_app():
+    path = os.path.join(tempfile.mkdtemp(), 'counters.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(ChargingPile(id='A', name='快充A', pile_type='fast', power_rating=30))
+        db.session.add(ChargingPile(id='B', name='慢充B', pile_type='slow', power_rating=7))
+        db.session.commit()
+    return app
+
+
+def test_counters_follow_records():
+    """每生成一条计费记录，充电桩次数 / 电量 / 收入同步累加"""
+    app = _make_app()
+    start = datetime(2025, 6, 1, 8, 0)
+    with app.app_context():
+        fees = []
+        for i in range(5):
+            record = BillingService.create_charging_record(
+                user_id=1, pile_id='A', start_time=start + timedelta(hours=i),
+                end_time=start + timedelta(hours=i, minutes=30), power_consumed=10.5)
+            fees.append(float(record.total_fee))
+
+        pile = db.session.get(ChargingPile, 'A')
+        db.session.refresh(pile)
+        assert pile.total_charges == 5
+        assert float(pile.total_power) == 52.5
+        assert round(float(pile.total_revenue), 2) == round(sum(fees), 2)
+        assert db.session.get(ChargingPile, 'B').total_charges == 0
+
+        stats = {item['pile_id']: item for item in StatisticsService.get_pile_usage_statistics()}
+        assert stats['A']['total_charges'] == 5 and stats['A']['avg_power_per_charge'] == 10.5
+        assert stats['B']['total_charges'] == 0 and stats['B']['last_charge_time'] is None
+    print(f"✅ 充电桩统计随计费记录累加: 收入 {round(sum(fees), 2)}")
+
+
+def test_reconcile_fixes_drift():
+    """统计被改乱后核对任务按计费记录修正，一致时不做修改"""
+    app = _make_app()
+    start = datetime(2025, 6, 1, 8, 0)
+    with app.app_context():
+        db.session.execute(ChargingRecord.__table__.insert(), [
+            dict(user_id=1, pile_id='B', start_time=start, time_period='normal', status='completed',
+                 power_consumed=7, total_fee=10.5),
+            dict(user_id=1, pile_id='B', start_time=start, time_period='normal', status='completed',
+                 power_consumed=3.5, total_fee=5.25),
+            dict(user_id=1, pile_id='B', start_time=start, time_period='normal', status='cancelled',
+                 power_consumed=100, total_fee=100),
+        ])
+        db.session.execute(ChargingPile.__table__.update().where(ChargingPile.id == 'A')
+                           .values(total_charges=9, total_power=None))
+        db.session.commit()
+
+        result = BillingService.reconcile_pile_counters()
+        assert result['checked'] == 2
+        assert sorted(item['pile_id'] for item in result['fixed']) == ['A', 'B']
+
+        piles = {pile.id: pile for pile in ChargingPile.query.populate_existing().all()}
+        assert piles['A'].total_charges == 0 and float(piles['A'].total_power) == 0
+        assert piles['B'].total_charges == 2
+        assert float(piles['B'].total_power) == 10.5 and float(piles['B'].total_revenue) == 15.75
+
+        assert BillingService.reconcile_pile_counters()['fixed'] == []
+    print("✅ 核对任务修正统计漂移")
+
+
+if __name__ == "__main__":
+    test_counters_follow_records()
+    test_reconcile_fixes_drift()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+测试充电桩本地队列：按累计完成时间预分配、结束时立即接续、取消 / 修改 / 故障转移
+"""
+import sys
+from datetime import datetime
+sys.path.append('scheduler_core')
+
+import scheduler_core
+from scheduler_core import PileType, PileStatus, Pile, ChargeRequest, ManualClock, set_clock, store
+from scheduler_core.simulation import simulate
+
+
+def _setup(kwhs, queue_len=1):
+    store.reset()
+    scheduler_core.add_pile(Pile(pile_id="F1", type=PileType.D, max_kw=30.0, queue_len=queue_len))
+    scheduler_core.add_pile(Pile(pile_id="F2", type=PileType.D, max_kw=30.0, queue_len=queue_len))
+    for i, kwh in enumerate(kwhs, start=1):
+        scheduler_core.enqueue_request(ChargeRequest(req_id=f"r{i}", queue_no=f"D{i}", user_id=str(i),
+                                                     pile_type=PileType.D, kwh=kwh))
+    results = []
+    while True:
+        result = scheduler_core.dispatch_next(PileType.D.value)
+        if result is None:
+            return results
+        results.append(result)
+
+
+def test_preassign_and_handoff():
+    """忙碌桩按累计完成时间预分配，满额后留在等候队列；结束时本地队列立即接续"""
+    clock = ManualClock(datetime(2030, 1, 1, 8, 0))
+    previous = set_clock(clock)
+    try:
+        results = _setup([30, 15, 10, 10, 5])
+        assert [(r.req_id, r.pile_id, r.position) for r in results] == [
+            ("r1", "F1", 0), ("r2", "F2", 0), ("r3", "F2", 1), ("r4", "F1", 1)]
+        # r3 排在 F2 剩余 30 分钟之后
+        assert results[2].start_time == datetime(2030, 1, 1, 8, 30)
+        assert [req.req_id for req in store.peek_queue("D", -1)] == ["r5"]
+        assert scheduler_core.get_queue_capacity("D", 2) == 0
+        # 等候队列位置与本地队列位置分开报告
+        assert scheduler_core.get_queue_position("r3") is None
+        assert scheduler_core.get_preassigned_position("r3") == ("F2", 1)
+        assert scheduler_core.get_queue_position("r5") == ("D", 1)
+        assert scheduler_core.get_charging_pile("r2") == "F2" and scheduler_core.get_charging_pile("r3") is None
+
+        store.pop_events()
+        clock.advance(1800)
+        scheduler_core.end_charging("F2")
+        f2 = store.get_pile("F2")
+        assert f2.status == PileStatus.BUSY and f2.current_req_id == "r3" and f2.queue == []
+        assert scheduler_core.get_preassigned_position("r3") is None and scheduler_core.get_charging_pile("r3") == "F2"
+        assert scheduler_core.get_charging_pile("r2") is None
+        events = store.pop_events()
+        assert [e["type"] for e in events] == ["charging_end", "dispatch"]
+        assert events[1]["data"].start_time == datetime(2030, 1, 1, 8, 30)
+
+        # 接续后本地队列有空位，下一轮调度继续预分配
+        assert [(r.req_id, r.pile_id, r.position) for r in
+                [scheduler_core.dispatch_next("D")]] == [("r5", "F2", 1)]
+    finally:
+        store.reset()
+        set_clock(previous)
+    print("✅ 预分配与结束接续正确")
+
+
+def test_cancel_update_fault_and_snapshot():
+    """本地队列中的请求可取消 / 修改；故障时转给其余充电桩；快照保留本地队列"""
+    previous = set_clock(ManualClock(datetime(2030, 1, 1, 8, 0)))
+    try:
+        _setup([30, 30, 10, 20])
+        assert scheduler_core.update_request("r3", kwh=12.5).kwh == 12.5
+        assert Pile.from_dict(store.get_pile("F1").to_dict()) == store.get_pile("F1")
+
+        assert scheduler_core.cancel_request("r4") is True
+        assert scheduler_core.get_queue_position("r4") is None
+        assert scheduler_core.cancel_request("r4") is False
+
+        # F1 上的 r1 与本地队列中的 r3 转给 F2：r3 占满 F2 的本地队列，r1 留在队首
+        scheduler_core.mark_fault("F1")
+        assert [req.req_id for req in store.get_pile("F2").queue] == ["r3"]
+        queued = store.peek_queue("D", -1)
+        assert [req.req_id for req in queued] == ["r1"]
+        assert queued[0].kwh == 30 and queued[0].queue_no == "D1" and queued[0].redispatched
+        assert store.get_pile("F1").queue == []
+    finally:
+        store.reset()
+        set_clock(previous)
+    print("✅ 本地队列取消 / 修改 / 故障退回正确")
+
+
+def test_on_pile_index_follows_snapshot_and_removal():
+    """桩上请求索引随快照恢复、注销充电桩同步更新"""
+    try:
+        _setup([30, 30, 10, 20])
+        store.restore(store.snapshot())
+        assert scheduler_core.get_preassigned_position("r4") == ("F2", 1)
+        assert scheduler_core.get_preassigned_position("r3") == ("F1", 1)
+        assert scheduler_core.get_charging_pile("r1") == "F1"
+        assert scheduler_core.cancel_request("r4") is True
+        assert scheduler_core.get_preassigned_position("r4") is None
+
+        scheduler_core.remove_pile("F1", requeue_current=False)
+        assert scheduler_core.get_charging_pile("r1") is None
+        assert scheduler_core.get_preassigned_position("r3") == ("F2", 1)
+        assert store._on_pile == {"r2": "F2", "r3": "F2"}
+    finally:
+        store.reset()
+    print("✅ 桩上请求索引与快照 / 注销一致")
+
+
+def test_local_queue_removes_handoff_gap():
+    """调度线程轮询时，本地队列消除充电桩结束到接续之间的空档"""
+    without = simulate(rate=3, dispatch_interval=120, pile_queue_len=0)
+    with_queue = simulate(rate=3, dispatch_interval=120, pile_queue_len=1)
+    assert without.mean_handoff_seconds > 30
+    assert with_queue.mean_handoff_seconds < 1
+    assert with_queue.arrivals == with_queue.dispatched + with_queue.unserved
+    print(f"✅ 接续空档: {without.mean_handoff_seconds:.1f} 秒 -> {with_queue.mean_handoff_seconds:.1f} 秒")
+
+
+if __name__ == "__main__":
+    test_preassign_and_handoff()
+    test_cancel_update_fault_and_snapshot()
+    test_on_pile_index_follows_snapshot_and_removal()
+    test_local_queue_removes_handoff_gap()
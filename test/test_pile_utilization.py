@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+测试充电桩忙碌区间索引：窗口忙碌时长与逐区间计算一致、状态机喂入、进行中的会话、过期淘汰、启动加载与实时结束并发
+"""
+import random
+import sys
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+from models.charging import ChargingStatus, ChargingMode
+from services.pile_utilization import PileBusyIndex
+from services.session_cache import CachedSession
+from services.session_state import SessionStateMachine
+
+BASE = datetime(2025, 6, 1)
+
+
+def _brute_force(intervals, t0, t1):
+    return sum(max(0.0, (min(end, t1) - max(start, t0)).total_seconds()) for start, end in intervals)
+
+
+def test_busy_seconds_matches_brute_force():
+    """随机区间与随机窗口：二分 + 前缀和结果与逐区间累加一致"""
+    rng = random.Random(7)
+    index = PileBusyIndex(retention_days=365)
+    intervals, cursor = [], BASE
+    for _ in range(2000):
+        start = cursor + timedelta(minutes=rng.randint(0, 90))
+        end = start + timedelta(minutes=rng.randint(1, 120))
+        intervals.append((start, end))
+        cursor = end
+    # 打乱顺序写入，并重复写入一部分（重复上报不应重复计算）
+    shuffled = intervals[:] + intervals[:100]
+    rng.shuffle(shuffled)
+    for start, end in shuffled:
+        index.add('A', start, end)
+
+    now = cursor + timedelta(days=1)
+    for _ in range(300):
+        t0 = BASE + timedelta(minutes=rng.randint(-60, 200000))
+        t1 = t0 + timedelta(minutes=rng.randint(1, 20000))
+        assert abs(index.busy_seconds('A', t0, t1, now) - _brute_force(intervals, t0, t1)) < 1e-6
+
+    day = index.utilization('A', BASE, BASE + timedelta(days=1), now)
+    assert day == round(_brute_force(intervals, BASE, BASE + timedelta(days=1)) / 864, 2)
+    assert index.busy_seconds('B', BASE, now, now) == 0.0
+    print(f"✅ {len(intervals)} 个区间的窗口查询与逐个累加一致，首日利用率 {day}%")
+
+
+def test_fed_by_state_machine():
+    """调度时开始区间、结束 / 故障时结束区间；进行中的会话按 now 计入"""
+    index = PileBusyIndex()
+
+    class _Sessions(SessionStateMachine):
+        def _enqueue(self, *args, **kwargs):
+            return 0
+
+    sessions = _Sessions(busy_index=index)
+    first = CachedSession(session_id='s1', user_id=1, status=ChargingStatus.ENGINE_QUEUED,
+                          charging_mode=ChargingMode.FAST, requested_amount=10)
+    sessions.transition(first, ChargingStatus.CHARGING, pile_id='A', start_time=BASE + timedelta(hours=1))
+    sessions.transition(first, ChargingStatus.COMPLETED, end_time=BASE + timedelta(hours=3))
+
+    second = CachedSession(session_id='s2', user_id=2, status=ChargingStatus.ENGINE_QUEUED,
+                           charging_mode=ChargingMode.FAST, requested_amount=10)
+    sessions.transition(second, ChargingStatus.CHARGING, pile_id='A', start_time=BASE + timedelta(hours=4))
+    # 进行中：计到 now
+    now = BASE + timedelta(hours=5)
+    assert index.busy_seconds('A', BASE, BASE + timedelta(days=1), now) == 3 * 3600
+    assert index.utilization('A', BASE, BASE + timedelta(days=1), now) == 60.0
+
+    # 故障结束时会话的 pile_id 被清空，区间仍记在原充电桩上
+    sessions.transition(second, ChargingStatus.FAULT_COMPLETED, pile_id=None, end_time=BASE + timedelta(hours=6))
+    later = BASE + timedelta(hours=12)
+    assert index.busy_seconds('A', BASE, later, later) == 4 * 3600
+    assert index.stats() == {'piles': 1, 'intervals': 2, 'open': 0}
+    print("✅ 状态机转换喂入忙碌区间")
+
+
+def test_open_interval_without_closed_ones():
+    """启动后第一个会话仍在充电（还没有结束的区间）时也计入忙碌时长"""
+    index = PileBusyIndex()
+    index.open('A', 's1', BASE)
+    assert index.stats() == {'piles': 1, 'intervals': 0, 'open': 1}
+    assert index.busy_seconds('A', BASE, BASE + timedelta(hours=2), BASE + timedelta(hours=2)) == 2 * 3600
+    assert index.utilization('A', BASE, BASE + timedelta(hours=4), BASE + timedelta(hours=1)) == 100.0
+    print("✅ 只有进行中区间的充电桩也计入利用率")
+
+
+def test_retention_prunes_old_intervals():
+    """超过保留期的区间在后续结束事件时淘汰"""
+    index = PileBusyIndex(retention_days=1)
+    for day in range(3000):
+        start = BASE + timedelta(hours=day)
+        index.open('A', f's{day}', start)
+        index.close('A', f's{day}', start + timedelta(minutes=30))
+    last = BASE + timedelta(hours=2999, minutes=30)
+    assert index.stats()['intervals'] <= 25
+    assert index.busy_seconds('A', last - timedelta(hours=10), last, last) == 10 * 1800
+    print("✅ 过期区间被淘汰")
+
+
+def test_load_skips_sessions_closed_while_loading():
+    """启动加载读到"充电中"记录之前会话已实时结束：补成已结束的区间，不留下进行中的区间"""
+    class _Row:
+        def __init__(self, session_id, status, start, end=None):
+            self.session_id, self.pile_id, self.status = session_id, 'A', status
+            self.start_time, self.end_time = start, end
+
+    index = PileBusyIndex()
+    index.close('A', 's1', BASE + timedelta(hours=2))
+    assert index.load([_Row('s1', ChargingStatus.CHARGING, BASE)]) == 1
+    later = BASE + timedelta(hours=6)
+    assert index.stats()['open'] == 0
+    assert index.busy_seconds('A', BASE, later, later) == 2 * 3600
+
+    # 加载完成后不再记录结束的会话
+    index.close('A', 's2', later)
+    assert index._closed is None
+    print("✅ 启动加载不重新打开已结束的会话")
+
+
+if __name__ == "__main__":
+    test_busy_seconds_matches_brute_force()
+    test_fed_by_state_machine()
+    test_open_interval_without_closed_ones()
+    test_retention_prunes_old_intervals()
+    test_load_skips_sessions_closed_while_loading()
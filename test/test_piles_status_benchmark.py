@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+充电桩状态接口基准：Redis 一次管道、数据库固定查询次数，每桩耗时不随充电桩数量增长
+
+在项目根目录直接运行输出 5 ~ 5000 个充电桩的耗时表：PYTHONPATH=. python test/test_piles_status_benchmark.py
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+sys.path.append('scheduler_core')
+
+from flask import Flask
+from sqlalchemy import event
+
+import scheduler_core
+from scheduler_core import PileType, Pile, store
+from models.user import db
+from models.billing import ChargingPile
+from models.charging import ChargingSession, ChargingStatus, ChargingMode
+from services.charging_service import ChargingService
+from api.admin import admin_bp
+
+
+class _CountingRedis:
+    """只实现接口用到的命令，统计往返次数"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.round_trips = 0
+
+    def hgetall(self, key):
+        self.round_trips += 1
+        return dict(self.hashes.get(key, {}))
+
+    def pipeline(self, transaction=True):
+        return _CountingPipeline(self)
+
+
+class _CountingPipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.keys = []
+
+    def hgetall(self, key):
+        self.keys.append(key)
+        return self
+
+    def execute(self):
+        self.redis_client.round_trips += 1
+        return [dict(self.redis_client.hashes.get(key, {})) for key in self.keys]
+
+
+def _make_app(pile_count):
+    path = os.path.join(tempfile.mkdtemp(), 'piles.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+
+    service = ChargingService()
+    service.redis_client = _CountingRedis()
+    app.extensions['charging_service'] = service
+
+    store.reset()
+    now = datetime.now()
+    with app.app_context():
+        db.create_all()
+        piles, sessions = [], []
+        for i in range(pile_count):
+            pile_id = f'P{i:05d}'
+            piles.append(dict(id=pile_id, name=f'充电桩{i}', pile_type='fast', power_rating=30,
+                              status='available', total_charges=0, total_power=0, total_revenue=0))
+            scheduler_core.add_pile(Pile(pile_id=pile_id, type=PileType.D, max_kw=30.0))
+            status = {'status': 'available'}
+            if i % 2 == 0:
+                session_id = f's{i}'
+                sessions.append(dict(session_id=session_id, user_id=i, pile_id=pile_id,
+                                     charging_mode=ChargingMode.FAST.name, requested_amount=10,
+                                     status=ChargingStatus.CHARGING.name, start_time=now))
+                status = {'status': 'occupied', 'current_charging_session_id': session_id}
+            service.redis_client.hashes[f'pile_status:{pile_id}'] = status
+        db.session.execute(ChargingPile.__table__.insert(), piles)
+        db.session.execute(ChargingSession.__table__.insert(), sessions)
+        db.session.commit()
+    return app, service
+
+
+def _measure(pile_count):
+    """返回 (耗时秒, SQL 条数, Redis 往返次数, 响应)"""
+    app, service = _make_app(pile_count)
+    client = app.test_client()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        started = time.perf_counter()
+        response = client.get('/api/admin/piles/status')
+        elapsed = time.perf_counter() - started
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return elapsed, len(statements), service.redis_client.round_trips, response.get_json()
+
+
+def test_constant_io_per_request():
+    """充电桩数量增加时 SQL 条数与 Redis 往返次数不变"""
+    results = {count: _measure(count) for count in (5, 500)}
+    for count, (_, sql_count, round_trips, body) in results.items():
+        assert body['success'] and body['data']['total_piles'] == count
+        assert sql_count <= 2, f"{count} 个充电桩执行了 {sql_count} 条SQL"
+        assert round_trips == 1
+
+    piles = results[500][3]['data']['piles']
+    assert piles[0]['current_session']['session_id'] == 's0'
+    assert piles[0]['engine_status'] == 'IDLE' and piles[1]['current_session'] is None
+    store.reset()
+    print("✅ 充电桩状态接口：2 条SQL + 1 次Redis往返，与充电桩数量无关")
+
+
+if __name__ == "__main__":
+    test_constant_io_per_request()
+    print(f"{'充电桩数':>8} {'总耗时(ms)':>12} {'每桩(us)':>10} {'SQL':>5} {'Redis':>6}")
+    for count in (5, 50, 500, 5000):
+        elapsed, sql_count, round_trips, _ = _measure(count)
+        print(f"{count:>8} {elapsed * 1000:>12.1f} {elapsed / count * 1e6:>10.1f} {sql_count:>5} {round_trips:>6}")
+    store.reset()
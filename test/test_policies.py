@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+测试可插拔调度策略：短作业优先、批量排程、故障请求优先、运行时切换与策略对比仿真
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+import scheduler_core
+from scheduler_core import PileType, PileStatus, Pile, ChargeRequest, ManualClock, set_clock, store
+from scheduler_core.simulation import compare_policies, format_comparison, load_workload
+
+START = datetime(2030, 1, 1, 8, 0)
+
+
+def _setup(piles, kwhs, policy):
+    """piles: [(pile_id, max_kw, 忙碌剩余分钟或 None)]；按顺序入队 kwhs"""
+    store.reset()
+    scheduler_core.set_policy(policy)
+    for pile_id, max_kw, busy_minutes in piles:
+        pile = Pile(pile_id=pile_id, type=PileType.D, max_kw=max_kw)
+        if busy_minutes is not None:
+            pile.status, pile.current_req_id = PileStatus.BUSY, f"busy-{pile_id}"
+            pile.estimated_end = START + timedelta(minutes=busy_minutes)
+        scheduler_core.add_pile(pile)
+    for i, kwh in enumerate(kwhs, start=1):
+        scheduler_core.enqueue_request(ChargeRequest(req_id=f"r{i}", queue_no=f"D{i}", user_id=str(i),
+                                                     pile_type=PileType.D, kwh=kwh))
+
+
+def _dispatch_all():
+    results = []
+    while True:
+        result = scheduler_core.dispatch_next(PileType.D.value)
+        if result is None:
+            return results
+        results.append((result.req_id, result.pile_id))
+
+
+def test_sjf_and_batch_order():
+    """短作业优先按电量选请求，等待过久的队首优先；批量排程会为更快的忙碌桩保留请求"""
+    clock = ManualClock(START)
+    previous_clock = set_clock(clock)
+    try:
+        _setup([("F1", 30.0, None)], [40, 10, 10], "fifo")
+        assert _dispatch_all() == [("r1", "F1")]
+
+        _setup([("F1", 30.0, None)], [40, 10, 20], "sjf")
+        assert _dispatch_all() == [("r2", "F1")]
+        _setup([("F1", 30.0, None)], [40, 10, 20], "sjf")
+        clock.advance(timedelta(minutes=31))
+        assert _dispatch_all() == [("r1", "F1")]
+        clock.set(START)
+
+        # 一台桩：按短作业优先排程，完成时间之和 3 小时（先到先服务为 5 小时）
+        _setup([("F1", 30.0, None)], [40, 10, 10], "batch")
+        plan = scheduler_core.get_policy().plan(store.peek_queue("D", -1), scheduler_core.get_all_piles(), START)
+        assert [req.req_id for req in plan["F1"]] == ["r2", "r3", "r1"]
+        assert _dispatch_all() == [("r2", "F1")]
+
+        # 快桩 1 分钟后空闲，比慢桩立即开始更早完成：批量排程本轮不派发，先到先服务上慢桩
+        _setup([("F1", 30.0, 1), ("S1", 3.0, None)], [10], "batch")
+        assert _dispatch_all() == []
+        _setup([("F1", 30.0, 1), ("S1", 3.0, None)], [10], "fifo")
+        assert _dispatch_all() == [("r1", "S1")]
+    finally:
+        store.reset()
+        scheduler_core.set_policy("fifo")
+        set_clock(previous_clock)
+    print("✅ 短作业优先与批量排程的调度顺序正确")
+
+
+def test_fault_priority_and_switching():
+    """故障转回的请求优先调度；策略按名称切换，未知名称报错"""
+    _setup([("F1", 30.0, None), ("F2", 30.0, None)], [10, 20], "fault_priority")
+    assert _dispatch_all() == [("r1", "F1"), ("r2", "F2")]
+    scheduler_core.enqueue_request(ChargeRequest(req_id="r3", queue_no="D3", user_id="3",
+                                                 pile_type=PileType.D, kwh=5))
+    scheduler_core.mark_fault("F1")
+    queued = store.peek_queue("D", -1)
+    assert [req.req_id for req in queued] == ["r1", "r3"] and queued[0].redispatched
+    assert ChargeRequest.from_dict(queued[0].to_dict()).redispatched
+
+    scheduler_core.end_charging("F2")
+    assert _dispatch_all() == [("r1", "F2")]
+
+    previous = scheduler_core.set_policy("sjf")
+    assert previous.name == "fault_priority" and scheduler_core.get_policy().name == "sjf"
+    try:
+        scheduler_core.set_policy("random")
+        assert False, "未知策略应报错"
+    except ValueError:
+        pass
+    assert scheduler_core.get_policy().name == "sjf"
+    scheduler_core.set_policy("fifo")
+    store.reset()
+    print("✅ 故障请求优先与运行时切换策略正确")
+
+
+def test_policy_benchmark():
+    """同一份工作负载对比各策略；批量排程的平均等待不高于先到先服务"""
+    path = os.path.join(tempfile.mkdtemp(), 'workload.csv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("arrived_at,pile_type,kwh\n")
+        for i in range(60):
+            f.write(f"{(START + timedelta(minutes=7 * i)).isoformat()},{'D' if i % 3 else 'A'},{10 + (i * 13) % 30}\n")
+    workload = load_workload(path)
+    assert workload[0] == (0.0, "D" if 0 % 3 else "A", 10.0) and workload[-1][0] == 7 * 59 * 60
+
+    reports = compare_policies(["fifo", "sjf", "batch"], hours=12, workload=workload)
+    by_policy = {report.policy: report for report in reports}
+    assert all(report.arrivals == 60 for report in reports)
+    assert by_policy["fifo"].fifo_violations == 0
+    assert by_policy["batch"].mean_wait_minutes <= by_policy["fifo"].mean_wait_minutes
+    assert scheduler_core.get_policy().name == "fifo"
+    print(format_comparison(reports))
+    print("✅ 调度策略对比仿真")
+
+
+if __name__ == "__main__":
+    test_sjf_and_batch_order()
+    test_fault_priority_and_switching()
+    test_policy_benchmark()
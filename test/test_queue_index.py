@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+测试调度引擎队列的 ID 索引（排队位置查询）
+"""
+import random
+import sys
+from itertools import count
+sys.path.append('scheduler_core')
+
+import scheduler_core
+from scheduler_core import PileType, ChargeRequest
+from scheduler_core.indexed_queue import IndexedQueue
+
+
+def _req(req_id, ptype=PileType.D, kwh=10.0):
+    return ChargeRequest(req_id=req_id, queue_no=f"Q-{req_id}", user_id="u",
+                         pile_type=ptype, kwh=kwh)
+
+
+def test_indexed_queue_position():
+    """入队 / 出队后位置保持正确"""
+    q = IndexedQueue()
+    for i in range(200):
+        q.append(_req(f"r{i}"))
+
+    assert len(q) == 200
+    assert q.position("r0") == 1
+    assert q.position("r150") == 151
+
+    for i in range(100):
+        assert q.popleft().req_id == f"r{i}"
+
+    assert q.position("r0") is None
+    assert q.position("r100") == 1
+    assert q.position("r199") == 100
+    assert [r.req_id for r in q.peek(3)] == ["r100", "r101", "r102"]
+    assert len(q.peek()) == 100
+    print("✅ IndexedQueue 位置索引正确")
+
+
+def test_indexed_queue_remove():
+    """按 ID 删除：墓碑跳过、位置修正、压缩后一致"""
+    q = IndexedQueue()
+    for i in range(10):
+        q.append(_req(f"r{i}"))
+
+    assert q.remove("r3").req_id == "r3"
+    assert q.remove("r3") is None
+    assert len(q) == 9
+    assert q.position("r4") == 4
+    assert [r.req_id for r in q.peek(4)] == ["r0", "r1", "r2", "r4"]
+
+    for _ in range(3):
+        q.popleft()
+    assert q.popleft().req_id == "r4"       # 跳过墓碑 r3
+    assert q.position("r9") == 5
+
+    # 大量删除触发压缩
+    for i in range(10, 300):
+        q.append(_req(f"r{i}"))
+    for i in range(10, 300, 2):
+        q.remove(f"r{i}")
+    assert len(q) == 5 + 145
+    assert q.position("r11") == 6
+    assert q.position("r299") == 150
+    assert len(q.peek()) == 150
+    print("✅ IndexedQueue 墓碑删除与压缩正确")
+
+
+def test_indexed_queue_matches_list_model():
+    """随机入队 / 优先插队 / 出队 / 删除，位置、按偏移读取与电量之和都和普通列表一致"""
+    rng = random.Random(7)
+    priority = count(-(1 << 62))
+    q = IndexedQueue()
+    model = []                               # [(票号, req_id)]，按票号升序
+    for step in range(5000):
+        op = rng.random()
+        if op < 0.45:
+            req_id = f"n{step}"
+            model.append((q.append(_req(req_id, kwh=rng.randint(1, 60))), req_id))
+        elif op < 0.55:
+            req_id = f"p{step}"
+            ticket = q.append(_req(req_id), ticket=next(priority))
+            model.append((ticket, req_id))
+            model.sort()
+        elif op < 0.75:
+            req = q.popleft()
+            assert (req.req_id if req else None) == (model.pop(0)[1] if model else None)
+        elif model:
+            _, req_id = model.pop(rng.randrange(len(model)))
+            assert q.remove(req_id).req_id == req_id
+        if step % 50 == 0 and model:
+            ids = [req_id for _, req_id in model]
+            offset = rng.randrange(len(ids))
+            assert [r.req_id for r in q.peek(5, offset)] == ids[offset:offset + 5]
+            probe = rng.choice(ids)
+            assert q.position(probe) == ids.index(probe) + 1
+            q.set_kwh(probe, 5.0)
+            assert q.total_kwh == sum(q.get(req_id).kwh for req_id in ids)
+    assert [r.req_id for r in q.peek()] == [req_id for _, req_id in model]
+    print("✅ IndexedQueue 随机操作与列表模型一致")
+
+
+def test_engine_cancel_request():
+    """取消后的请求不会再被取出调度"""
+    scheduler_core.enqueue_request(_req("cancel_test_1", PileType.A))
+    assert scheduler_core.cancel_request("cancel_test_1") is True
+    assert scheduler_core.cancel_request("cancel_test_1") is False
+    assert scheduler_core.get_queue_position("cancel_test_1") is None
+
+    fetched = []
+    while True:
+        req = scheduler_core.fetch_next_request(PileType.A.value)
+        if req is None:
+            break
+        fetched.append(req.req_id)
+    assert "cancel_test_1" not in fetched
+    print("✅ 引擎取消请求正确")
+
+
+def test_engine_update_request():
+    """原地修改电量；换类型后按原到达次序插入目标队列"""
+    for tp in (PileType.D.value, PileType.A.value):
+        while scheduler_core.fetch_next_request(tp):
+            pass
+
+    scheduler_core.enqueue_request(_req("upd_d1", PileType.D))
+    scheduler_core.enqueue_request(_req("upd_a1", PileType.A))
+    scheduler_core.enqueue_request(_req("upd_d2", PileType.D, kwh=10.0))
+    scheduler_core.enqueue_request(_req("upd_a2", PileType.A))
+
+    req = scheduler_core.update_request("upd_d2", kwh=42.0)
+    assert req.kwh == 42.0
+    assert scheduler_core.get_queue_kwh(PileType.D.value) == 52.0
+    assert scheduler_core.get_queue_position("upd_d2") == (PileType.D.value, 2)
+
+    req = scheduler_core.update_request("upd_d2", pile_type=PileType.A.value)
+    assert req.pile_type == PileType.A and req.queue_no.startswith("A")
+    assert req.kwh == 42.0
+    assert [r.req_id for r in scheduler_core.get_waiting_list(PileType.A.value)] == \
+        ["upd_a1", "upd_d2", "upd_a2"]
+    assert scheduler_core.get_queue_length(PileType.D.value) == 1
+    assert scheduler_core.get_queue_kwh(PileType.D.value) == 10.0
+
+    assert scheduler_core.update_request("not_queued", kwh=1.0) is None
+    print("✅ 引擎原地修改请求正确")
+
+
+def test_engine_queue_position():
+    """引擎对外接口：按 req_id 查询位置 / 队列长度"""
+    base = scheduler_core.get_queue_length(PileType.A.value)
+    for i in range(3):
+        scheduler_core.enqueue_request(_req(f"pos_test_{i}", PileType.A))
+
+    assert scheduler_core.get_queue_length(PileType.A.value) == base + 3
+    assert scheduler_core.get_queue_position("pos_test_2") == (PileType.A.value, base + 3)
+    assert scheduler_core.get_queue_position("not_queued") is None
+    assert len(scheduler_core.get_waiting_list(PileType.A.value, n=-1)) == base + 3
+    print("✅ 引擎排队位置查询正确")
+
+
+if __name__ == "__main__":
+    test_indexed_queue_position()
+    test_indexed_queue_remove()
+    test_indexed_queue_matches_list_model()
+    test_engine_cancel_request()
+    test_engine_update_request()
+    test_engine_queue_position()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+测试管理端队列信息：分区分页、分批读取、预计等待时长、NDJSON 流式输出
+"""
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+sys.path.append('scheduler_core')
+
+import fakeredis
+from flask import Flask
+
+import scheduler_core
+from scheduler_core import PileType, Pile, ChargeRequest, ManualClock, clock, set_clock, store
+from models.user import db
+from models.charging import ChargingSession
+from services.charging_service import ChargingService
+from services.queue_report import QueueReport
+from services.session_state import SessionStateMachine
+from services.station_waiting_area import StationWaitingArea
+from utils.coalescing_worker import CoalescingWorker
+from api.admin import admin_bp
+
+START = datetime(2030, 1, 1, 8, 0)
+
+
+def _make_app(station_count=0, engine_count=0):
+    path = os.path.join(tempfile.mkdtemp(), 'queue.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    with app.app_context():
+        db.create_all()
+
+    service = ChargingService()
+    service.waiting_area = StationWaitingArea(fakeredis.FakeRedis(decode_responses=True))
+    app.extensions['charging_service'] = service
+
+    store.reset()
+    scheduler_core.add_pile(Pile(pile_id='F1', type=PileType.D, max_kw=30.0))
+    scheduler_core.add_pile(Pile(pile_id='F2', type=PileType.D, max_kw=30.0))
+    created = (clock.utcnow() - timedelta(minutes=30)).isoformat()
+    for i in range(engine_count):
+        scheduler_core.enqueue_request(ChargeRequest(req_id=f'e{i}', queue_no=f'F{i}', user_id=str(i),
+                                                     pile_type=PileType.D, kwh=15.0))
+    for i in range(station_count):
+        service.waiting_area.push('fast', {'session_id': f's{i}', 'user_id': i, 'requested_amount': 30.0,
+                                           'created_at': created})
+    return app, service
+
+
+def test_section_paging_and_estimated_wait():
+    """分页结果与整体顺序一致；预计等待按前方电量累加，等候区排在引擎队列之后"""
+    app, service = _make_app(station_count=1234, engine_count=10)
+    with app.app_context():
+        report = QueueReport(service, batch_size=100)
+        totals = report.totals()
+        assert totals['station_fast'] == 1234 and totals['engine_fast'] == 10 and totals['charging'] == 0
+
+        page = report.page('station_fast', 1200, 50, totals['station_fast'])
+        assert [item['position'] for item in page['items']] == list(range(1201, 1235))
+        assert page['items'][0]['session_id'] == 's1200' and not page['has_more']
+
+        # 2 台 30kW 快充桩空闲：引擎队列 10 × 15 度 + 等候区前 1200 × 30 度
+        kwh_ahead = 10 * 15.0 + 1200 * 30.0
+        assert page['items'][0]['estimated_wait_minutes'] == round(kwh_ahead / 30.0 / 2 * 60, 1)
+        assert 29 <= page['items'][0]['waiting_time_minutes'] <= 31
+
+        engine = report.page('engine_fast', 0, 4, totals['engine_fast'])
+        assert [item['estimated_wait_minutes'] for item in engine['items']] == [0.0, 15.0, 30.0, 45.0]
+        assert engine['has_more']
+        assert report.page('engine_trickle', 0, 4, 0)['items'] == []
+    store.reset()
+    print("✅ 分区分页与预计等待时长正确")
+
+
+def test_endpoint_limits_and_ndjson_stream():
+    """JSON 响应每个分区受 limit 限制；NDJSON 逐行输出全部条目"""
+    app, _ = _make_app(station_count=1500, engine_count=3)
+    client = app.test_client()
+
+    body = client.get('/api/admin/queue/info').get_json()
+    data = body['data']
+    assert len(data['queue_info']['station_waiting_area']['fast']) == 200
+    assert data['summary']['fast_waiting_station'] == 1500
+    assert data['pagination']['station_fast'] == {'offset': 0, 'limit': 200, 'total': 1500, 'has_more': True}
+
+    body = client.get('/api/admin/queue/info?section=engine_fast&limit=2&offset=1').get_json()
+    assert [item['session_id'] for item in body['data']['queue_info']['engine_dispatch_queues']['fast']] == ['e1', 'e2']
+    assert body['data']['queue_info']['station_waiting_area']['fast'] == []
+    assert client.get('/api/admin/queue/info?section=bogus').status_code == 400
+
+    response = client.get('/api/admin/queue/info?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]['type'] == 'summary' and lines[-1] == {'type': 'end'}
+    items = [line for line in lines if line['type'] == 'item']
+    assert len(items) == 1503
+    assert [item['section'] for item in items[:4]] == ['station_fast', 'station_fast', 'station_fast', 'station_fast']
+    store.reset()
+    print("✅ 队列信息接口分页与 NDJSON 输出正确")
+
+
+def test_waiting_time_with_submitted_requests():
+    """UTC+8 下经服务提交、出队进入引擎的请求：等候区与调度队列的已等待时长都等于实际等待时间"""
+    manual = ManualClock(START, utc_offset=timedelta(hours=8))
+    previous = set_clock(manual)
+    app, service = _make_app()
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    service.config = SimpleNamespace(CHARGING_QUEUE_LEN=1, WAITING_AREA_SIZE=10)
+    service.redis_client = redis_client
+    service.waiting_area = StationWaitingArea(redis_client)
+    service.sessions = SessionStateMachine(cache=service.session_cache, busy_index=service.pile_busy)
+    service.queue_worker = CoalescingWorker(lambda: None, name='test')
+    service._initialized = True
+    try:
+        with app.app_context():
+            for user_id in (1, 2, 3):
+                assert service.submit_charging_request(user_id, 'fast', 30.0)['success']
+            # 2 台快充桩、每桩 1 个位置：前两个进入调度队列，第三个留在等候区
+            service.process_station_waiting_area_to_engine()
+            manual.advance(timedelta(minutes=20))
+
+            report = QueueReport(service)
+            engine = report.page('engine_fast', 0, 10, 2)['items']
+            station = report.page('station_fast', 0, 10, 1)['items']
+            assert [item['user_id'] for item in engine] == [1, 2] and station[0]['user_id'] == 3
+            assert all(item['waiting_time_minutes'] == 20.0 for item in engine + station)
+    finally:
+        store.reset()
+        set_clock(previous)
+    print("✅ 经服务提交的请求已等待时长正确")
+
+
+if __name__ == "__main__":
+    test_section_paging_and_estimated_wait()
+    test_endpoint_limits_and_ndjson_stream()
+    test_waiting_time_with_submitted_requests()
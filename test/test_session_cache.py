@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+测试活跃会话缓存：写穿、终态淘汰、墓碑防止旧状态回填、容量上限
+"""
+import sys
+sys.path.append('scheduler_core')
+
+from models.charging import ChargingStatus, ChargingMode
+from services.session_cache import ActiveSessionCache, CachedSession
+from services.session_state import SessionStateMachine
+
+
+def _session(session_id, user_id, status=ChargingStatus.STATION_WAITING):
+    return CachedSession(session_id=session_id, user_id=user_id, status=status,
+                         charging_mode=ChargingMode.FAST, requested_amount=10)
+
+
+class _NoopStateMachine(SessionStateMachine):
+    """只验证写穿，不落库"""
+
+    def _enqueue(self, *args, **kwargs):
+        return 0
+
+
+def test_write_through_and_terminal_eviction():
+    """状态机变更同步写入缓存，终态会话移出且按用户查询命中"无活跃会话" """
+    cache = ActiveSessionCache()
+    sessions = _NoopStateMachine(cache=cache)
+    session = _session('s1', 7)
+    cache.write(session)
+
+    sessions.transition(session, ChargingStatus.ENGINE_QUEUED, queue_number='D1')
+    cached = cache.get('s1')
+    assert cached.status == ChargingStatus.ENGINE_QUEUED and cached.queue_number == 'D1'
+    assert cache.lookup_user(7)[1].session_id == 's1'
+
+    # 返回副本，调用方修改不影响缓存
+    cached.status = ChargingStatus.CHARGING
+    assert cache.get('s1').status == ChargingStatus.ENGINE_QUEUED
+
+    sessions.transition(session, ChargingStatus.CANCELLED)
+    assert cache.get('s1') is None
+    assert cache.lookup_user(7) == (True, None)
+    print("✅ 写穿与终态淘汰正确")
+
+
+def test_stale_fill_is_ignored():
+    """数据库中读到的旧状态不会覆盖 / 复活缓存条目"""
+    cache = ActiveSessionCache()
+    cache.write(_session('s1', 1, ChargingStatus.CHARGING))
+    cache.fill(_session('s1', 1, ChargingStatus.ENGINE_QUEUED))
+    assert cache.get('s1').status == ChargingStatus.CHARGING
+
+    cache.write(_session('s1', 1, ChargingStatus.COMPLETED))
+    cache.fill(_session('s1', 1, ChargingStatus.CHARGING))
+    assert cache.get('s1') is None
+
+    # "无活跃会话"不会覆盖新提交的会话
+    cache.write(_session('s2', 2))
+    cache.fill_user(2, None)
+    assert cache.lookup_user(2)[1].session_id == 's2'
+    print("✅ 旧状态回填被忽略")
+
+
+def test_bounded_size():
+    """超出容量按 LRU 淘汰，淘汰后按未命中处理"""
+    cache = ActiveSessionCache(max_size=100)
+    for i in range(250):
+        cache.write(_session(f's{i}', i))
+    stats = cache.stats()
+    assert stats['sessions'] == 100 and stats['users'] == 100
+    assert cache.get('s0') is None and cache.get('s249') is not None
+    assert cache.lookup_user(0) == (False, None)
+    print("✅ 缓存容量受限")
+
+
+def test_disabled_cache_always_misses():
+    """关闭缓存（集群模式）时写穿与补入都不生效，读取一律未命中"""
+    cache = ActiveSessionCache(enabled=False)
+    sessions = _NoopStateMachine(cache=cache)
+    session = _session('s1', 7)
+    cache.write(session)
+    sessions.transition(session, ChargingStatus.ENGINE_QUEUED, queue_number='D1')
+    cache.fill(_session('s2', 8))
+    cache.fill_user(9, None)
+
+    assert cache.get('s1') is None and cache.get_many(['s1', 's2']) == {}
+    assert cache.lookup_user(7) == (False, None) and cache.lookup_user(9) == (False, None)
+    assert cache.stats()['sessions'] == 0 and cache.stats()['enabled'] is False
+    print("✅ 关闭缓存后读取一律未命中")
+
+
+if __name__ == "__main__":
+    test_write_through_and_terminal_eviction()
+    test_stale_fill_is_ignored()
+    test_bounded_size()
+    test_disabled_cache_always_misses()
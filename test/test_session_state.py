@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+测试会话状态机：状态转换校验、只追加的事件记录、并发请求共享组提交、批次失败逐条重试、时间戳取自引擎时钟
+"""
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+sys.path.append('scheduler_core')
+
+from flask import Flask
+
+from models.user import db
+import models.billing  # noqa: F401  注册外键引用的表
+from models.charging import ChargingSession, ChargingSessionEvent, ChargingStatus, ChargingMode
+from services.session_cache import ActiveSessionCache
+from services.session_state import SessionStateMachine, InvalidTransition, SessionPersistError, can_transition
+from scheduler_core import ManualClock, set_clock
+
+
+def _make_app():
+    path = os.path.join(tempfile.mkdtemp(), 'sessions.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _new_session(session_id, user_id=1):
+    return ChargingSession(session_id=session_id, user_id=user_id, charging_mode=ChargingMode.FAST,
+                           requested_amount=10, status=ChargingStatus.STATION_WAITING)
+
+
+def test_transition_table():
+    """合法路径可以转换，终态与跳步转换被拒绝"""
+    assert can_transition(ChargingStatus.STATION_WAITING, ChargingStatus.ENGINE_QUEUED)
+    assert can_transition(ChargingStatus.CHARGING, ChargingStatus.FAULT_COMPLETED)
+    assert not can_transition(ChargingStatus.STATION_WAITING, ChargingStatus.CHARGING)
+    assert not can_transition(ChargingStatus.COMPLETED, ChargingStatus.CANCELLED)
+
+    app = _make_app()
+    sessions = SessionStateMachine()
+    with app.app_context():
+        sessions.create(_new_session('s1'))
+        sessions.flush()
+        session = ChargingSession.query.filter_by(session_id='s1').first()
+
+        try:
+            sessions.transition(session, ChargingStatus.COMPLETED)
+            assert False, "跳过充电直接完成应被拒绝"
+        except InvalidTransition:
+            pass
+
+        sessions.transition(session, ChargingStatus.ENGINE_QUEUED, reason='dequeued', queue_number='D1')
+        sessions.transition(session, ChargingStatus.CANCELLED, reason='user_cancel')
+        # 内存中的对象立即反映新状态，且没有被标记为脏
+        assert session.status == ChargingStatus.CANCELLED
+        assert not db.session.dirty
+        sessions.flush()
+
+        db.session.expire_all()
+        stored = ChargingSession.query.filter_by(session_id='s1').first()
+        assert stored.status == ChargingStatus.CANCELLED and stored.queue_number == 'D1'
+
+        events = ChargingSessionEvent.query.filter_by(session_id='s1').order_by(ChargingSessionEvent.id).all()
+        assert [(e.from_status, e.to_status) for e in events] == [
+            (None, 'station_waiting'), ('station_waiting', 'engine_queued'), ('engine_queued', 'cancelled')]
+        assert events[1].payload == {'queue_number': 'D1'}
+    print("✅ 状态转换校验与事件记录正确")
+
+
+def test_concurrent_requests_share_commits():
+    """并发请求的变更合并为少量几次提交"""
+    app = _make_app()
+    sessions = SessionStateMachine(flush_interval=0.02)
+    sessions.start(app)
+    barrier = threading.Barrier(20)
+    errors = []
+
+    def submit(i):
+        try:
+            with app.app_context():
+                barrier.wait()
+                sessions.create(_new_session(f'c{i}', user_id=i))
+                sessions.flush()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sessions.stop()
+
+    assert not errors
+    with app.app_context():
+        assert ChargingSession.query.count() == 20
+    stats = sessions.stats()
+    assert stats['events'] == 20
+    assert stats['commits'] < 10
+    print(f"✅ 20 个并发请求共 {stats['commits']} 次提交")
+
+
+def test_discard_removes_unadmitted_session():
+    """准入失败的新建会话连同事件一起撤销"""
+    app = _make_app()
+    sessions = SessionStateMachine()
+    with app.app_context():
+        sessions.create(_new_session('d1'))
+        sessions.flush()
+        sessions.discard('d1')
+        sessions.flush()
+        assert ChargingSession.query.filter_by(session_id='d1').count() == 0
+        assert ChargingSessionEvent.query.filter_by(session_id='d1').count() == 0
+    print("✅ 撤销新建会话")
+
+
+def test_failed_op_does_not_drop_batch():
+    """批次中一条变更写不进去时，其余变更逐条重试写入，失败会话的缓存条目回退"""
+    app = _make_app()
+    cache = ActiveSessionCache()
+    sessions = SessionStateMachine(cache=cache)
+    with app.app_context():
+        sessions.create(_new_session('ok1', user_id=1))
+        sessions.flush()
+        ok1 = ChargingSession.query.filter_by(session_id='ok1').first()
+
+        bad = _new_session('bad', user_id=2)
+        bad.requested_amount = None          # NOT NULL 列缺失，插入失败
+        sessions.create(bad)
+        sessions.transition(bad, ChargingStatus.ENGINE_QUEUED, queue_number='D9')
+        sessions.create(_new_session('ok2', user_id=3))
+        sessions.transition(ok1, ChargingStatus.ENGINE_QUEUED, queue_number='D1')
+        assert cache.get('bad') is not None
+        try:
+            sessions.flush()
+            assert False, "包含失败变更的 flush 应抛出 SessionPersistError"
+        except SessionPersistError:
+            pass
+
+        db.session.expire_all()
+        assert ChargingSession.query.filter_by(session_id='ok2').count() == 1
+        assert ChargingSession.query.filter_by(session_id='ok1').first().queue_number == 'D1'
+        assert ChargingSession.query.filter_by(session_id='bad').count() == 0
+        assert cache.get('bad') is None and cache.lookup_user(2) == (False, None)
+        assert cache.get('ok1').status == ChargingStatus.ENGINE_QUEUED
+        assert sessions.stats()['failed'] == 2
+    print("✅ 批次失败时只丢弃写不进去的变更")
+
+
+def test_create_timestamps_follow_clock():
+    """新建会话补齐的时间戳取自可注入时钟的 UTC 时间，与模型默认值同一基准"""
+    start = datetime(2030, 1, 1, 8, 0)
+    previous = set_clock(ManualClock(start, utc_offset=timedelta(hours=8)))
+    app = _make_app()
+    sessions = SessionStateMachine()
+    try:
+        with app.app_context():
+            session = _new_session('t1')
+            sessions.create(session)
+            sessions.flush()
+            assert session.created_at == session.updated_at == start
+            assert ChargingSession.query.filter_by(session_id='t1').first().created_at == start
+    finally:
+        set_clock(previous)
+    print("✅ 新建会话时间戳取自引擎时钟")
+
+
+if __name__ == "__main__":
+    test_transition_table()
+    test_concurrent_requests_share_commits()
+    test_discard_removes_unadmitted_session()
+    test_failed_op_does_not_drop_batch()
+    test_create_timestamps_follow_clock()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+测试启动流水线：并发执行、依赖顺序、延后阶段、就绪检查
+"""
+import sys
+import time
+sys.path.append('scheduler_core')
+
+from utils.startup import StartupPipeline, wait_until
+
+
+def test_independent_phases_run_concurrently():
+    """互不依赖的阶段并发执行，依赖阶段在其后执行"""
+    order = []
+    pipeline = StartupPipeline('测试')
+    pipeline.add('a', lambda: (time.sleep(0.2), order.append('a')))
+    pipeline.add('b', lambda: (time.sleep(0.2), order.append('b')))
+    pipeline.add('c', lambda: order.append('c'), depends=('a', 'b'))
+
+    started = time.perf_counter()
+    timings = pipeline.run()
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.35
+    assert order[-1] == 'c'
+    assert set(timings) == {'a', 'b', 'c'} and timings['a'] >= 190
+    print("✅ 启动阶段并发执行")
+
+
+def test_deferred_phase_does_not_block():
+    """延后阶段不阻塞 run()，随后在后台完成"""
+    done = []
+    pipeline = StartupPipeline('测试')
+    pipeline.add('core', lambda: done.append('core'))
+    pipeline.add('seed', lambda: (time.sleep(0.3), done.append('seed')), depends=('core',), deferred=True)
+
+    started = time.perf_counter()
+    pipeline.run()
+    assert time.perf_counter() - started < 0.2
+    assert done == ['core']
+
+    pipeline.wait_deferred(2.0)
+    assert done == ['core', 'seed']
+    assert 'seed' in pipeline.timings()
+    print("✅ 延后阶段后台执行")
+
+
+def test_critical_failure_raises():
+    """关键阶段失败时 run() 抛出异常，依赖它的阶段不执行"""
+    ran = []
+    pipeline = StartupPipeline('测试')
+    pipeline.add('broken', lambda: 1 / 0)
+    pipeline.add('after', lambda: ran.append('after'), depends=('broken',))
+    try:
+        pipeline.run()
+        assert False, "应抛出异常"
+    except ZeroDivisionError:
+        pass
+    assert ran == []
+    print("✅ 关键阶段失败时中止启动")
+
+
+def test_wait_until():
+    """就绪检查轮询直到成功，超时抛出 TimeoutError"""
+    ready_at = time.perf_counter() + 0.1
+    waited = wait_until(lambda: time.perf_counter() >= ready_at, timeout=1.0, interval=0.01)
+    assert 0.05 <= waited < 0.5
+
+    try:
+        wait_until(lambda: False, timeout=0.05, interval=0.01, name='不存在的服务')
+        assert False, "应超时"
+    except TimeoutError:
+        pass
+    print("✅ 就绪检查正确")
+
+
+def test_app_seed_data_on_critical_path():
+    """管理员账户与计费配置在对外服务前完成，不作为延后阶段"""
+    from flask import Flask
+    import app as app_module
+
+    pipeline = app_module.build_startup_pipeline(Flask(__name__), None)
+    deferred = {name for name, phase in pipeline._phases.items() if phase.deferred}
+    assert not deferred & {'admin_account', 'billing_config'}
+    print("✅ 管理员账户与计费配置在关键路径上")
+
+
+if __name__ == "__main__":
+    test_independent_phases_run_concurrently()
+    test_deferred_phase_does_not_block()
+    test_critical_failure_raises()
+    test_wait_until()
+    test_app_seed_data_on_critical_path()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+测试充电站等候区的原子准入（真实 Lua 脚本，跑在 fakeredis 上）
+"""
+import sys
+import threading
+sys.path.append('scheduler_core')
+
+import fakeredis
+
+from services.station_waiting_area import StationWaitingArea
+
+
+def _request(session_id, mode='fast', amount=10.0):
+    return {'session_id': session_id, 'user_id': 1, 'charging_mode': mode,
+            'requested_amount': amount, 'created_at': '2025-01-01T00:00:00'}
+
+
+def _area(server=None):
+    return StationWaitingArea(fakeredis.FakeRedis(server=server, decode_responses=True))
+
+
+def test_admit_respects_capacity():
+    """两种模式合计达到上限后拒绝准入，并写入会话状态"""
+    area = _area()
+    assert area.admit('fast', _request('s1'), 3, status={'status': 'station_waiting', 'pile_id': ''}) == 1
+    assert area.admit('trickle', _request('s2', 'trickle'), 3) == 2
+    assert area.admit('fast', _request('s3'), 3) == 3
+    assert area.admit('trickle', _request('s4', 'trickle'), 3) is None
+
+    assert area.sizes() == {'fast': 2, 'trickle': 1}
+    assert area.redis_client.hgetall('session_status:s1') == {'status': 'station_waiting', 'pile_id': ''}
+    assert not area.redis_client.exists('session_status:s2')
+    assert not area.redis_client.exists('session_status:s4')
+    assert area.get('fast', 's1')['requested_amount'] == 10.0
+    assert area.get('trickle', 's4') is None
+    print("✅ 等候区准入容量检查正确")
+
+
+def test_admit_concurrent():
+    """多个连接并发准入不会超出容量"""
+    server = fakeredis.FakeServer()
+    admitted = []
+
+    def worker(i):
+        if _area(server).admit('fast' if i % 2 else 'trickle', _request(f"c{i}"), 6) is not None:
+            admitted.append(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(admitted) == 6
+    assert sum(_area(server).sizes().values()) == 6
+    print("✅ 并发准入不超出容量")
+
+
+def test_order_move_and_requeue():
+    """出队保持票号顺序；换模式沿用原票号；放回的请求回到原位置"""
+    area = _area()
+    for i in range(4):
+        area.push('fast', _request(f"m{i}"))
+    area.push('trickle', _request('t0', 'trickle'))
+
+    assert area.move('m1', 'fast', 'trickle', requested_amount=20.0)
+    assert area.position('trickle', 'm1') == 1
+    assert area.get('trickle', 'm1')['requested_amount'] == 20.0
+    assert [item['session_id'] for item in area.items('fast')] == ['m0', 'm2', 'm3']
+    assert [item['session_id'] for item in area.pop_many('trickle', 5)] == ['m1', 't0']
+    assert area.remove('fast', 'm2') and not area.remove('fast', 'm2')
+
+    popped = area.pop_many('fast', 1)
+    area.push('fast', _request('m4'))
+    area.requeue('fast', popped)
+    assert [item['session_id'] for item in area.items('fast')] == ['m0', 'm3', 'm4']
+    print("✅ 等候区顺序、迁移与放回正确")
+
+
+def test_update_and_move_after_dequeue():
+    """已出队的会话修改 / 换模式返回 False 且不留下孤立条目；按会话ID出队跳过不在队列中的会话"""
+    area = _area()
+    for i in range(3):
+        area.push('fast', _request(f"u{i}"))
+
+    assert area.head('fast', 2) == ['u0', 'u1']
+    taken = area.take('fast', ['u1', 'u0', 'gone'])
+    assert [(item['session_id'], item['ticket']) for item in taken] == [('u0', 1), ('u1', 2)]
+
+    assert not area.update('fast', 'u0', requested_amount=50.0)
+    assert not area.move('u1', 'fast', 'trickle', requested_amount=50.0)
+    assert area.sizes() == {'fast': 1, 'trickle': 0}
+    assert area.get('fast', 'u0') is None and area.get('trickle', 'u1') is None
+
+    assert area.update('fast', 'u2', requested_amount=50.0)
+    assert area.move('u2', 'fast', 'trickle')
+    assert area.get('trickle', 'u2')['requested_amount'] == 50.0
+    assert area.take('fast', ['u2']) == []
+    print("✅ 出队后的修改不留下孤立条目")
+
+
+if __name__ == "__main__":
+    test_admit_respects_capacity()
+    test_admit_concurrent()
+    test_order_move_and_requeue()
+    test_update_and_move_after_dequeue()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+测试调度引擎的预写日志与崩溃恢复
+"""
+import json
+import os
+import sys
+import tempfile
+sys.path.append('scheduler_core')
+
+import scheduler_core
+from scheduler_core import PileType, PileStatus, Pile, ChargeRequest, store
+from scheduler_core.wal import WriteAheadLog, WAL_FILE, OLD_WAL_FILE
+
+
+def _req(req_id, ptype=PileType.D, kwh=10.0):
+    return ChargeRequest(req_id=req_id, queue_no=scheduler_core.generate_queue_number(ptype.value),
+                         user_id="u", pile_type=ptype, kwh=kwh)
+
+
+def _state():
+    snap = store.snapshot()
+    snap["counters"] = sorted(snap["counters"])
+    snap["piles"] = sorted(snap["piles"], key=lambda p: p["pile_id"])
+    return snap
+
+
+def _crash():
+    """模拟进程崩溃：只落盘已写入的日志，丢弃内存状态"""
+    store._wal.wait_snapshot()
+    store._wal.sync()
+    store._wal._stop_flag.set()
+    store._wal = None
+    store.reset()
+
+
+def test_replay_rebuilds_exact_state():
+    """重启后队列顺序、充电桩分配、计数器与崩溃前完全一致"""
+    with tempfile.TemporaryDirectory() as wal_dir:
+        store.reset()
+        info = scheduler_core.enable_persistence(wal_dir)
+        assert info["recovered"] is False
+
+        scheduler_core.add_pile(Pile("F1", PileType.D, 30.0))
+        scheduler_core.add_pile(Pile("F2", PileType.D, 30.0))
+        scheduler_core.add_pile(Pile("T1", PileType.A, 7.0))
+        for i in range(5):
+            scheduler_core.enqueue_request(_req(f"d{i}"))
+        scheduler_core.enqueue_request(_req("a0", PileType.A))
+        scheduler_core.enqueue_request(_req("a1", PileType.A))
+
+        while scheduler_core.dispatch_next(PileType.D.value):
+            pass
+        scheduler_core.dispatch_next(PileType.A.value)
+        scheduler_core.end_charging("F1")
+        scheduler_core.dispatch_next(PileType.D.value)
+        scheduler_core.mark_fault("F2")
+        scheduler_core.cancel_request("d4")
+        scheduler_core.update_request("a1", kwh=3.0)
+
+        before = _state()
+        _crash()
+        assert store.queue_len(PileType.D.value) == 0
+
+        info = scheduler_core.enable_persistence(wal_dir)
+        try:
+            assert info["recovered"] is True
+            assert info["replayed_records"] > 0
+            assert _state() == before
+            f2 = store.get_pile("F2")
+            assert f2.status == PileStatus.FAULT and f2.current_req_id is None
+            assert store.get_pile("F1").current_req_id == "d2"
+        finally:
+            scheduler_core.disable_persistence()
+            store.reset()
+    print("✅ WAL 重放恢复状态一致")
+
+
+def test_snapshot_compaction_and_torn_tail():
+    """后台写快照后删除旧日志；末尾写了一半的记录被忽略"""
+    with tempfile.TemporaryDirectory() as wal_dir:
+        store.reset()
+        wal = WriteAheadLog(wal_dir, snapshot_every=10)
+        store.enable_wal(wal)
+        scheduler_core.add_pile(Pile("F1", PileType.D, 30.0, status=PileStatus.FAULT))
+        for i in range(25):
+            scheduler_core.enqueue_request(_req(f"c{i}"))
+        wal.wait_snapshot()
+        with open(wal.snapshot_path, encoding="utf-8") as f:
+            assert json.load(f)["seq"] >= 10
+        assert not os.path.exists(os.path.join(wal_dir, OLD_WAL_FILE))
+
+        before = _state()
+        _crash()
+        with open(os.path.join(wal_dir, WAL_FILE), "a", encoding="utf-8") as f:
+            f.write('{"op":"enqueue","req":{"req_id"')
+
+        scheduler_core.enable_persistence(wal_dir)
+        try:
+            assert _state() == before
+            assert [r.req_id for r in scheduler_core.get_waiting_list(PileType.D.value, n=3)] == ["c0", "c1", "c2"]
+        finally:
+            scheduler_core.disable_persistence()
+            store.reset()
+    print("✅ WAL 快照压缩与截断记录处理正确")
+
+
+class _StalledSnapshotWal(WriteAheadLog):
+    """后台快照迟迟写不完：模拟在快照落盘前崩溃"""
+
+    def _compact(self, state, seq):
+        self.stalled_seq = seq
+
+
+def test_crash_before_background_snapshot():
+    """压缩时只在锁内换日志文件；快照写完前崩溃，旧日志 + 新日志仍能完整重放"""
+    with tempfile.TemporaryDirectory() as wal_dir:
+        store.reset()
+        wal = _StalledSnapshotWal(wal_dir, snapshot_every=10)
+        store.enable_wal(wal)
+        scheduler_core.add_pile(Pile("F1", PileType.D, 30.0, status=PileStatus.FAULT))
+        for i in range(25):
+            scheduler_core.enqueue_request(_req(f"s{i}"))
+        assert os.path.exists(os.path.join(wal_dir, OLD_WAL_FILE))
+        assert wal.stalled_seq < wal.seq
+
+        before = _state()
+        _crash()
+        scheduler_core.enable_persistence(wal_dir)
+        try:
+            assert _state() == before
+            assert not os.path.exists(os.path.join(wal_dir, OLD_WAL_FILE))
+        finally:
+            scheduler_core.disable_persistence()
+            store.reset()
+    print("✅ 后台快照写完前崩溃可完整恢复")
+
+
+if __name__ == "__main__":
+    test_replay_rebuilds_exact_state()
+    test_snapshot_compaction_and_torn_tail()
+    test_crash_before_background_snapshot()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class CoalescingWorker:
+    """合并触发的后台工作线程
+
+    任意多个线程调用 trigger()，只由一个常驻线程执行任务；
+    合并窗口(delay)内的多次触发只执行一次，线程数不随负载增长。
+    sleep 用于等待合并窗口，测试可注入以精确控制窗口何时结束。
+    """
+
+    def __init__(self, func, delay: float = 0.1, name: str = 'CoalescingWorker', sleep=time.sleep):
+        self.func = func
+        self.delay = delay
+        self.name = name
+        self._sleep = sleep
+        self._pending = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._state_lock = threading.Lock()
+        self.trigger_count = 0
+        self.run_count = 0
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        with self._state_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+            self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """停止工作线程"""
+        self._stopped.set()
+        self._pending.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        """请求执行一次任务；已有待执行的任务时直接合并"""
+        with self._state_lock:
+            self.trigger_count += 1
+        self._pending.set()
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'alive': bool(self._thread and self._thread.is_alive()),
+            'triggers': self.trigger_count,
+            'runs': self.run_count
+        }
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            if self._stopped.is_set():
+                return
+
+            # 合并窗口：窗口内的触发都由本次执行覆盖
+            self._sleep(self.delay)
+            self._pending.clear()
+
+            try:
+                self.func()
+            except Exception as e:
+                print(f"❌ 后台任务 {self.name} 执行失败: {e}")
+                import traceback
+                traceback.print_exc()
+
+            with self._state_lock:
+                self.run_count += 1
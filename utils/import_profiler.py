@@ -0,0 +1,156 @@
+"""
+模块导入耗时分析
+
+在子进程中执行 `python -X importtime -c "import <模块>"`，把 stderr 输出解析成
+按缩进嵌套的模块耗时树，便于找出拖慢启动的重量级依赖。
+
+用法：
+    python -m utils.import_profiler app                 # 输出耗时最高的模块与导入树
+    python -m utils.import_profiler app --top 30 --depth 3
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ImportNode:
+    """导入树节点，耗时单位为微秒"""
+
+    def __init__(self, name: str, self_us: int = 0, cumulative_us: int = 0, depth: int = 0):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.depth = depth
+        self.children: List['ImportNode'] = []
+
+    @property
+    def cumulative_ms(self) -> float:
+        return round(self.cumulative_us / 1000, 2)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'self_ms': round(self.self_us / 1000, 2),
+            'cumulative_ms': self.cumulative_ms,
+            'children': [c.to_dict() for c in self.children],
+        }
+
+
+class ImportProfile:
+    """一次导入的分析结果"""
+
+    def __init__(self, target: str, root: ImportNode, wall_ms: float):
+        self.target = target
+        self.root = root
+        self.wall_ms = wall_ms
+
+    @property
+    def total_ms(self) -> float:
+        return self.root.cumulative_ms
+
+    def modules(self) -> Dict[str, ImportNode]:
+        """模块名 -> 节点（本次导入中首次加载的模块）"""
+        result = {}
+        stack = list(self.root.children)
+        while stack:
+            node = stack.pop()
+            result[node.name] = node
+            stack.extend(node.children)
+        return result
+
+    def is_imported(self, module: str) -> bool:
+        """module 或其子模块是否被导入"""
+        prefix = module + '.'
+        return any(name == module or name.startswith(prefix) for name in self.modules())
+
+    def top(self, n: int = 20, top_level_only: bool = True) -> List[ImportNode]:
+        """按累计耗时排序；top_level_only 时只统计顶层包（如 flask_socketio 而非其子模块）"""
+        nodes = self.modules().values()
+        if top_level_only:
+            nodes = [node for node in nodes if '.' not in node.name]
+        return sorted(nodes, key=lambda node: node.cumulative_us, reverse=True)[:n]
+
+    def format_tree(self, max_depth: int = 2, min_ms: float = 5.0) -> str:
+        lines = []
+
+        def walk(node: ImportNode, level: int):
+            for child in sorted(node.children, key=lambda c: c.cumulative_us, reverse=True):
+                if child.cumulative_ms < min_ms:
+                    continue
+                lines.append(f"{'  ' * level}{child.name}: {child.cumulative_ms} ms")
+                if level + 1 < max_depth:
+                    walk(child, level + 1)
+
+        walk(self.root, 0)
+        return '\n'.join(lines)
+
+
+def parse_importtime(output: str) -> ImportNode:
+    """
+    解析 -X importtime 输出。子模块的行先于父模块输出、缩进更深，
+    因此用栈收集：遇到缩进更浅的行时，把栈中更深的节点挂为其子节点。
+    """
+    root = ImportNode('<root>', depth=-1)
+    pending: List[ImportNode] = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        depth = (len(indent) - 1) // 2
+        node = ImportNode(name, int(self_us), int(cumulative_us), depth)
+        while pending and pending[-1].depth > depth:
+            node.children.insert(0, pending.pop())
+        pending.append(node)
+
+    root.children = pending
+    root.cumulative_us = sum(node.cumulative_us for node in pending)
+    root.self_us = 0
+    return root
+
+
+def profile_import(target: str, cwd: Optional[str] = None, env: Optional[dict] = None,
+                   timeout: float = 120) -> ImportProfile:
+    """在全新的解释器里导入 target（模块名或 import 语句），返回耗时树"""
+    statement = target if target.startswith(('import ', 'from ')) else f'import {target}'
+    run_env = dict(os.environ)
+    run_env.update(env or {})
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=cwd or _ROOT, env=run_env, capture_output=True, text=True, timeout=timeout,
+    )
+    wall_ms = round((time.perf_counter() - started) * 1000, 2)
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"导入 {target} 失败:\n" + '\n'.join(errors[-20:]))
+    return ImportProfile(target, parse_importtime(proc.stderr), wall_ms)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='模块导入耗时分析')
+    parser.add_argument('target', nargs='?', default='app', help='要分析的模块或 import 语句')
+    parser.add_argument('--top', type=int, default=20, help='输出累计耗时最高的前 N 个顶层包')
+    parser.add_argument('--depth', type=int, default=2, help='导入树的最大展示深度')
+    parser.add_argument('--min-ms', type=float, default=5.0, help='导入树中忽略低于该耗时的模块')
+    args = parser.parse_args(argv)
+
+    profile = profile_import(args.target)
+    print(f"⏱️ 导入 {profile.target}: 累计 {profile.total_ms} ms（子进程总耗时 {profile.wall_ms} ms）")
+    print(f"\n📊 累计耗时最高的 {args.top} 个顶层包:")
+    for node in profile.top(args.top):
+        print(f"   {node.cumulative_ms:>9.2f} ms  {node.name}")
+    print("\n🌲 导入树:")
+    print(profile.format_tree(args.depth, args.min_ms))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+
+class LockStats:
+    """锁的等待 / 持有时间统计（秒）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_hold = 0.0
+        self.max_hold = 0.0
+
+    def record(self, wait: float, hold: float):
+        with self._lock:
+            self.acquisitions += 1
+            self.total_wait += wait
+            self.total_hold += hold
+            self.max_wait = max(self.max_wait, wait)
+            self.max_hold = max(self.max_hold, hold)
+
+    def merge(self, other: 'LockStats'):
+        with other._lock:
+            self.acquisitions += other.acquisitions
+            self.total_wait += other.total_wait
+            self.total_hold += other.total_hold
+            self.max_wait = max(self.max_wait, other.max_wait)
+            self.max_hold = max(self.max_hold, other.max_hold)
+
+    def to_dict(self) -> Dict:
+        count = self.acquisitions or 1
+        return {
+            'acquisitions': self.acquisitions,
+            'avg_wait_ms': round(self.total_wait / count * 1000, 3),
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+            'avg_hold_ms': round(self.total_hold / count * 1000, 3),
+            'max_hold_ms': round(self.max_hold * 1000, 3)
+        }
+
+
+class InstrumentedLock:
+    """记录等待与持有时间的互斥锁（不可重入）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = LockStats()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def acquire(self):
+        wait_start = time.perf_counter()
+        self._lock.acquire()
+        acquired_at = time.perf_counter()
+        self._local.wait = acquired_at - wait_start
+        self._local.acquired_at = acquired_at
+
+    def release(self):
+        hold = time.perf_counter() - self._local.acquired_at
+        wait = self._local.wait
+        self._lock.release()
+        self.stats.record(wait, hold)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class StripedLock:
+    """分段锁：按键哈希到固定数量的锁上，不同键之间大多互不阻塞
+
+    同时需要多个键时使用 hold_many()，按分段序号升序加锁以避免死锁。
+    """
+
+    def __init__(self, name: str, stripes: int = 64):
+        self.name = name
+        self._locks = [InstrumentedLock(f"{name}[{i}]") for i in range(stripes)]
+
+    def _index(self, key) -> int:
+        return hash(str(key)) % len(self._locks)
+
+    def for_key(self, key) -> InstrumentedLock:
+        return self._locks[self._index(key)]
+
+    @contextmanager
+    def hold_many(self, keys: Iterable):
+        locks: List[InstrumentedLock] = [self._locks[i] for i in sorted({self._index(k) for k in keys})]
+        acquired = []
+        try:
+            for lock in locks:
+                lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    def stats(self) -> Dict:
+        total = LockStats()
+        for lock in self._locks:
+            total.merge(lock.stats)
+        data = total.to_dict()
+        data['stripes'] = len(self._locks)
+        return data
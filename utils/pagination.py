@@ -0,0 +1,117 @@
+"""
+游标（keyset）分页
+
+按 (排序列..., id) 倒序取数，下一页的条件是"严格排在上一页最后一行之后"，
+不使用 OFFSET，也不必 COUNT(*)，因此第 N 页与第 1 页的代价相同（需配合相同列顺序的联合索引）。
+游标是上一页最后一行排序键的 base64 编码，对调用方不透明。
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, false, func, or_, select
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析或与当前排序不匹配"""
+
+
+def encode_cursor(values: Sequence) -> str:
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append({'dt': value.isoformat()})
+        elif isinstance(value, Decimal):
+            payload.append(str(value))
+        else:
+            payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor('无效的分页游标') from e
+    if not isinstance(payload, list) or len(payload) != size:
+        raise InvalidCursor('无效的分页游标')
+    values = []
+    for value in payload:
+        if isinstance(value, dict) and 'dt' in value:
+            try:
+                values.append(datetime.fromisoformat(value['dt']))
+            except (TypeError, ValueError) as e:
+                raise InvalidCursor('无效的分页游标') from e
+        else:
+            values.append(value)
+    return values
+
+
+def _after(columns, values):
+    """倒序下严格排在 values 之后的条件；可为空的列按 NULL 最小处理（倒序时排在最后）"""
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column < value if value is not None else None
+
+    rest = _after(columns[1:], values[1:])
+    if value is None:
+        return and_(column.is_(None), rest) if rest is not None else None
+    conditions = [column < value, column.is_(None)]
+    if rest is not None:
+        conditions.append(and_(column == value, rest))
+    return or_(*conditions)
+
+
+def keyset_paginate(query, columns: Sequence, per_page: int, cursor: Optional[str] = None,
+                    with_total: bool = False, total_cap: int = 1000) -> Dict:
+    """
+    对已加好过滤条件的 query 做游标分页（按 columns 倒序，最后一列须唯一，一般为 id）。
+
+    返回 {'items': [...], 'next_cursor': str|None, 'has_next': bool,
+          'total': int（仅 with_total）, 'total_capped': bool}；
+    total 最多数到 total_cap，超过时 total_capped 为 True（近似值，代价与历史总量无关）。
+    """
+    page_query = query
+    if cursor:
+        condition = _after(list(columns), decode_cursor(cursor, len(columns)))
+        if condition is None:
+            page_query = page_query.filter(false())
+        else:
+            page_query = page_query.filter(condition)
+
+    rows = page_query.order_by(*[column.desc() for column in columns]).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    items = rows[:per_page]
+
+    result = {
+        'items': items,
+        'next_cursor': None,
+        'has_next': has_next,
+    }
+    if has_next:
+        last = items[-1]
+        result['next_cursor'] = encode_cursor([getattr(last, column.key) for column in columns])
+
+    if with_total:
+        limited = query.order_by(None).with_entities(columns[-1]).limit(total_cap + 1).subquery()
+        counted = query.session.execute(select(func.count()).select_from(limited)).scalar()
+        result['total'] = min(counted, total_cap)
+        result['total_capped'] = counted > total_cap
+    return result
+
+
+def cursor_pagination_info(page: Dict, per_page: int) -> Dict:
+    """接口响应中的分页信息"""
+    info = {
+        'per_page': per_page,
+        'next_cursor': page['next_cursor'],
+        'has_next': page['has_next'],
+    }
+    if 'total' in page:
+        info['total'] = page['total']
+        info['total_capped'] = page['total_capped']
+    return info
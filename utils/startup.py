@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional
+
+
+def wait_until(check: Callable[[], bool], timeout: float = 5.0, interval: float = 0.05,
+               name: str = '依赖服务') -> float:
+    """轮询就绪检查直到成功，返回等待秒数；超时抛出 TimeoutError（代替固定 sleep）"""
+    started = time.perf_counter()
+    last_error = None
+    while True:
+        try:
+            if check():
+                return time.perf_counter() - started
+        except Exception as e:
+            last_error = e
+        if time.perf_counter() - started >= timeout:
+            raise TimeoutError(f"{name} 在 {timeout} 秒内未就绪: {last_error}")
+        time.sleep(interval)
+
+
+class _Phase:
+    def __init__(self, name, func, depends, deferred):
+        self.name = name
+        self.func = func
+        self.depends = list(depends)
+        self.deferred = deferred
+        self.elapsed_ms: Optional[float] = None
+        self.error: Optional[Exception] = None
+
+
+class StartupPipeline:
+    """启动流水线
+
+    用 add() 声明阶段及其依赖：互不依赖的阶段并发执行，deferred=True 的阶段
+    （非关键的数据初始化）在 run() 返回后于后台线程执行，不阻塞服务就绪。
+    context 为每个阶段执行时进入的上下文（如 app.app_context），各线程独立进入。
+    """
+
+    def __init__(self, name: str = '启动', context: Optional[Callable] = None, max_workers: int = 4):
+        self.name = name
+        self.context = context
+        self.max_workers = max_workers
+        self._phases: Dict[str, _Phase] = {}
+        self.total_ms: Optional[float] = None
+        self._deferred_thread: Optional[threading.Thread] = None
+
+    def add(self, name: str, func: Callable[[], None], depends: tuple = (), deferred: bool = False):
+        for dep in depends:
+            if dep not in self._phases:
+                raise ValueError(f"阶段 {name} 依赖未声明的阶段 {dep}")
+        self._phases[name] = _Phase(name, func, depends, deferred)
+        return self
+
+    def _execute(self, phase: _Phase):
+        started = time.perf_counter()
+        try:
+            if self.context:
+                with self.context():
+                    phase.func()
+            else:
+                phase.func()
+        except Exception as e:
+            phase.error = e
+        finally:
+            phase.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _run_phases(self, phases: List[_Phase], raise_on_error: bool):
+        pending = {p.name: p for p in phases}
+        done = {name for name, p in self._phases.items() if p.elapsed_ms is not None and not p.error}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='Startup') as pool:
+            while pending or running:
+                for name, phase in list(pending.items()):
+                    if all(dep in done for dep in phase.depends):
+                        running[pool.submit(self._execute, phase)] = phase
+                        del pending[name]
+
+                if not running:
+                    # 剩余阶段的依赖失败，无法继续
+                    for phase in pending.values():
+                        phase.error = RuntimeError('依赖的阶段失败')
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    phase = running.pop(future)
+                    if phase.error is None:
+                        done.add(phase.name)
+                    else:
+                        print(f"❌ {self.name}阶段 {phase.name} 失败: {phase.error}")
+                        if raise_on_error:
+                            for f in running:
+                                f.cancel()
+                            raise phase.error
+
+    def run(self) -> Dict[str, float]:
+        """执行全部关键阶段（失败则抛出），启动后台的延后阶段，返回各阶段耗时（毫秒）"""
+        started = time.perf_counter()
+        self._run_phases([p for p in self._phases.values() if not p.deferred], raise_on_error=True)
+        self.total_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        deferred = [p for p in self._phases.values() if p.deferred]
+        if deferred:
+            self._deferred_thread = threading.Thread(
+                target=self._run_deferred, args=(deferred,), daemon=True, name='StartupDeferred')
+            self._deferred_thread.start()
+
+        self.report()
+        return self.timings()
+
+    def _run_deferred(self, phases: List[_Phase]):
+        self._run_phases(phases, raise_on_error=False)
+        for phase in phases:
+            if phase.error is None:
+                print(f"⏱️ {self.name}延后阶段 {phase.name}: {phase.elapsed_ms} ms")
+
+    def wait_deferred(self, timeout: Optional[float] = None):
+        if self._deferred_thread:
+            self._deferred_thread.join(timeout)
+
+    def timings(self) -> Dict[str, float]:
+        return {name: p.elapsed_ms for name, p in self._phases.items() if p.elapsed_ms is not None}
+
+    def report(self):
+        print(f"⏱️ {self.name}完成，总耗时 {self.total_ms} ms")
+        for name, p in self._phases.items():
+            if p.deferred:
+                print(f"   - {name}: 延后执行")
+            elif p.elapsed_ms is not None:
+                print(f"   - {name}: {p.elapsed_ms} ms")